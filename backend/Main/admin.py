@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import StandardFile, AuxiliaryFile, Vehicle, SPN, PGN, VehicleSPN, VehiclePGN, Category
+from .models import (
+    StandardFile, AuxiliaryFile, Vehicle, SPN, PGN, VehicleSPN, VehiclePGN, Category, ColumnTemplate, LogCheckpoint, IngestJob, UploadSession, ContentBlob, CompressedFile, IdempotencyKey,
+    J1939ParameterDefinition, DefinitionVersion, VehicleJ1939Mapping, RemapJob
+)
+from .definitions import publish_definition_version, schedule_definition_publish
 
 
 @admin.register(StandardFile)
@@ -40,3 +44,110 @@ class PGNAdmin(admin.ModelAdmin):
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'created_at']
     search_fields = ['name']
+
+
+@admin.register(ColumnTemplate)
+class ColumnTemplateAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'signature', 'hit_count', 'last_used_at']
+    search_fields = ['name', 'signature']
+    readonly_fields = ['signature', 'hit_count', 'created_at', 'last_used_at']
+
+
+@admin.register(LogCheckpoint)
+class LogCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['source', 'encoding', 'byte_offset', 'lines', 'updated_at']
+    search_fields = ['source']
+    readonly_fields = ['head_hash', 'layout', 'pgn_counts', 'partial_line', 'updated_at']
+
+
+@admin.register(IngestJob)
+class IngestJobAdmin(admin.ModelAdmin):
+    list_display = ['source_file', 'status', 'detected_format', 'byte_offset', 'rows_consumed', 'chunks_done', 'vehicle', 'updated_at']
+    list_filter = ['status', 'detected_format']
+    search_fields = ['source_file', 'content_hash']
+    readonly_fields = ['state', 'created_at', 'updated_at']
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'status', 'received_bytes', 'total_size', 'ingest_job', 'updated_at']
+    list_filter = ['status']
+    search_fields = ['filename', 'sha256']
+    readonly_fields = ['id', 'spool_file', 'created_at', 'updated_at']
+
+
+@admin.register(ContentBlob)
+class ContentBlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'size', 'ref_count', 'created_at']
+    search_fields = ['sha256', 'names__name']
+    readonly_fields = ['sha256', 'size', 'ref_count', 'created_at']
+
+
+@admin.register(CompressedFile)
+class CompressedFileAdmin(admin.ModelAdmin):
+    list_display = ['name', 'algorithm', 'size', 'compressed_size', 'created_at']
+    search_fields = ['name']
+    readonly_fields = ['name', 'algorithm', 'size', 'compressed_size', 'frame_bytes', 'frame_offsets', 'created_at']
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'scope', 'status', 'status_code', 'user', 'created_at']
+    list_filter = ['scope', 'status']
+    search_fields = ['key']
+    readonly_fields = ['key', 'scope', 'request_fingerprint', 'status', 'status_code', 'response_body', 'user', 'created_at']
+
+
+@admin.register(J1939ParameterDefinition)
+class J1939ParameterDefinitionAdmin(admin.ModelAdmin):
+    """
+    Changes publish a new DefinitionVersion (see Main/definitions.py): single
+    edits are coalesced, bulk deletes publish at once.
+    """
+    list_display = ['SPN_Number', 'PGN_DEC', 'PGN_HEX', 'SPN_Description', 'Unit', 'Resolution', 'Offset']
+    list_filter = ['PGN_DEC']
+    search_fields = ['SPN_Number', 'SPN_Description', 'PGN_HEX']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        schedule_definition_publish('admin')
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        schedule_definition_publish('admin')
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        publish_definition_version('admin')
+
+
+@admin.register(DefinitionVersion)
+class DefinitionVersionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'content_hash', 'definition_count', 'source', 'created_at']
+    list_filter = ['source']
+    exclude = ['definitions']
+    readonly_fields = ['content_hash', 'definition_count', 'source', 'created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(VehicleJ1939Mapping)
+class VehicleJ1939MappingAdmin(admin.ModelAdmin):
+    list_display = ['vehicle', 'definition_version', 'pgn_count', 'updated_at']
+    list_filter = ['definition_version']
+    readonly_fields = ['vehicle', 'definition_version', 'pgn_count', 'spns', 'updated_at']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(RemapJob)
+class RemapJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'definition_version', 'status', 'vehicles_remapped', 'vehicles_retagged', 'created_at']
+    list_filter = ['status']
+    readonly_fields = ['definition_version', 'changed_pgns', 'vehicles_remapped', 'vehicles_retagged', 'error',
+                       'created_at', 'updated_at']
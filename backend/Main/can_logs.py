@@ -0,0 +1,329 @@
+"""
+Streaming parsers for raw CAN capture formats.
+
+Supports Linux candump logs, Vector ASC and PCAN-View TRC traces. Each
+parser consumes decoded text lines and yields frames in batches of NumPy
+arrays:
+
+    {
+        'timestamp': float64 seconds (as written in the log),
+        'can_id':    uint32 arbitration id,
+        'extended':  bool, True for 29-bit identifiers,
+        'dlc':       uint8 data length code,
+        'data':      uint8 array of shape (n, 8), zero padded
+    }
+
+PGN counting works on whole batches, so captures with millions of frames
+are never held as per-line Python objects.
+"""
+
+import codecs
+import re
+from collections import Counter
+
+import numpy as np
+
+from .formats import FORMAT_CANDUMP, FORMAT_VECTOR_ASC, FORMAT_PCAN_TRC
+
+CAN_LOG_FORMATS = (FORMAT_CANDUMP, FORMAT_VECTOR_ASC, FORMAT_PCAN_TRC)
+
+# Frames per yielded batch
+BATCH_SIZE = 65536
+
+# Classic CAN payload width; longer CAN FD payloads are truncated
+FRAME_BYTES = 8
+
+# (1609459200.123456) can0 18FEF100#FFFFFFFF20FFFFFF   (CAN FD uses '##<flags>')
+_CANDUMP_LOG_RE = re.compile(
+    r'^\s*\((\d+(?:\.\d+)?)\)\s+\S+\s+([0-9A-Fa-f]{1,8})#(#[0-9A-Fa-f])?(R)?([0-9A-Fa-f]*)'
+)
+# (1609459200.123456)  can0  18FEF100   [8]  FF FF FF FF 20 FF FF FF
+_CANDUMP_TEXT_RE = re.compile(
+    r'^\s*(?:\((\d+(?:\.\d+)?)\)\s+)?\S+\s+([0-9A-Fa-f]{1,8})\s+\[(\d+)\]\s+((?:[0-9A-Fa-f]{2}\s*)*)'
+)
+#    0.015991 1  18FEF100x       Rx   d 8 FF FF FF FF 20 FF FF FF
+_ASC_FRAME_RE = re.compile(
+    r'^\s*(\d+(?:\.\d+)?)\s+\d+\s+([0-9A-Fa-f]+)(x?)\s+(?:Rx|Tx)\s+d\s+(\d+)\s*((?:[0-9A-Fa-f]{2}\s*)*)',
+    re.IGNORECASE
+)
+_ASC_BASE_RE = re.compile(r'^\s*base\s+(hex|dec)\b', re.IGNORECASE)
+# v1.x:      1)      1059.9  Rx     18FEF100  8  FF FF ...   (v1.3 adds bus and '-')
+_TRC_V1_RE = re.compile(
+    r'^\s*\d+\)\s+(\d+(?:\.\d+)?)\s+(?:\d+\s+)?(?:Rx|Tx)\s+([0-9A-Fa-f]+)\s+(?:-\s+)?(\d+)\s+((?:[0-9A-Fa-f]{2}\s*)*)',
+    re.IGNORECASE
+)
+# v2.x:      1      1059.900 DT 1     18FEF100 Rx -  8    FF FF ...
+_TRC_V2_RE = re.compile(
+    r'^\s*\d+\s+(\d+(?:\.\d+)?)\s+(?:DT|FD|FB|FE|BI)\s+(?:\d+\s+)?([0-9A-Fa-f]+)\s+(?:Rx|Tx)\s+(?:-\s+)?(\d+)\s+((?:[0-9A-Fa-f]{2}\s*)*)',
+    re.IGNORECASE
+)
+
+
+def iter_lines(chunks, encoding='utf-8'):
+    """
+    Decode an iterable of byte chunks and yield complete text lines.
+    A trailing partial line is carried over to the next chunk.
+    """
+    decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    pending = ''
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+class _BatchBuilder:
+    """Accumulates frames into preallocated arrays and flushes full batches."""
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self._reset()
+
+    def _reset(self):
+        self.timestamp = np.zeros(self.batch_size, dtype=np.float64)
+        self.can_id = np.zeros(self.batch_size, dtype=np.uint32)
+        self.extended = np.zeros(self.batch_size, dtype=bool)
+        self.dlc = np.zeros(self.batch_size, dtype=np.uint8)
+        self.data = np.zeros((self.batch_size, FRAME_BYTES), dtype=np.uint8)
+        self.size = 0
+
+    def add(self, timestamp, can_id, extended, dlc, payload):
+        i = self.size
+        self.timestamp[i] = timestamp
+        self.can_id[i] = can_id
+        self.extended[i] = extended
+        self.dlc[i] = min(dlc, 255)
+        if payload:
+            payload = payload[:FRAME_BYTES]
+            self.data[i, :len(payload)] = np.frombuffer(payload, dtype=np.uint8)
+        self.size += 1
+        return self.size >= self.batch_size
+
+    def flush(self):
+        n = self.size
+        batch = {
+            'timestamp': self.timestamp[:n],
+            'can_id': self.can_id[:n],
+            'extended': self.extended[:n],
+            'dlc': self.dlc[:n],
+            'data': self.data[:n],
+        }
+        self._reset()
+        return batch
+
+
+def _hex_payload(text):
+    return bytes.fromhex(''.join(text.split()))
+
+
+def parse_candump(lines, batch_size=BATCH_SIZE):
+    """Parse candump log ('#' separated) or text ('[dlc]') output."""
+    builder = _BatchBuilder(batch_size)
+    for line in lines:
+        match = _CANDUMP_LOG_RE.match(line)
+        if match:
+            ts, can_id, fd_flags, remote, data = match.groups()
+            payload = b'' if remote else bytes.fromhex(data[:len(data) // 2 * 2])
+            dlc = len(payload)
+        else:
+            match = _CANDUMP_TEXT_RE.match(line)
+            if not match:
+                continue
+            ts, can_id, dlc, data = match.groups()
+            payload = _hex_payload(data)
+            dlc = int(dlc)
+        full = builder.add(float(ts or 0.0), int(can_id, 16), len(can_id) > 3, dlc, payload)
+        if full:
+            yield builder.flush()
+    if builder.size:
+        yield builder.flush()
+
+
+def parse_vector_asc(lines, batch_size=BATCH_SIZE):
+    """Parse classic CAN data frames from a Vector ASC trace."""
+    builder = _BatchBuilder(batch_size)
+    base = 16
+    for line in lines:
+        match = _ASC_FRAME_RE.match(line)
+        if not match:
+            base_match = _ASC_BASE_RE.match(line)
+            if base_match:
+                base = 16 if base_match.group(1).lower() == 'hex' else 10
+            continue
+        ts, can_id, ext_flag, dlc, data = match.groups()
+        can_id = int(can_id, base)
+        full = builder.add(float(ts), can_id, bool(ext_flag) or can_id > 0x7FF, int(dlc), _hex_payload(data))
+        if full:
+            yield builder.flush()
+    if builder.size:
+        yield builder.flush()
+
+
+def parse_pcan_trc(lines, batch_size=BATCH_SIZE):
+    """Parse data frames from a PCAN-View TRC trace (v1.x and v2.x)."""
+    builder = _BatchBuilder(batch_size)
+    for line in lines:
+        if line.lstrip().startswith(';'):
+            continue
+        match = _TRC_V2_RE.match(line) or _TRC_V1_RE.match(line)
+        if not match:
+            continue
+        ts, can_id_text, dlc, data = match.groups()
+        can_id = int(can_id_text, 16)
+        # TRC offsets are in milliseconds
+        full = builder.add(float(ts) / 1000.0, can_id, len(can_id_text) > 4 or can_id > 0x7FF, int(dlc), _hex_payload(data))
+        if full:
+            yield builder.flush()
+    if builder.size:
+        yield builder.flush()
+
+
+_FRAME_PATTERNS = {
+    FORMAT_CANDUMP: (_CANDUMP_LOG_RE, _CANDUMP_TEXT_RE),
+    FORMAT_VECTOR_ASC: (_ASC_FRAME_RE,),
+    FORMAT_PCAN_TRC: (_TRC_V2_RE, _TRC_V1_RE),
+}
+
+
+def header_length(head, fmt):
+    """
+    Length in bytes of the header lines before the first frame, e.g. the ASC
+    'date'/'base' lines. Prepending them to a later slice of the file makes
+    the slice parse the same way as in a full scan.
+    Returns 0 when no frame line is found in head.
+    """
+    pos = 0
+    for raw in head.split(b'\n')[:-1]:
+        line = raw.decode('latin1')
+        if any(pattern.match(line) for pattern in _FRAME_PATTERNS[fmt]):
+            return pos
+        pos += len(raw) + 1
+    return 0
+
+
+PARSERS = {
+    FORMAT_CANDUMP: parse_candump,
+    FORMAT_VECTOR_ASC: parse_vector_asc,
+    FORMAT_PCAN_TRC: parse_pcan_trc,
+}
+
+
+def pgns_from_can_ids(can_ids):
+    """Vectorised form of extract_pgn_from_can_id: (CAN_ID >> 8) & 0xFFFF."""
+    return (can_ids >> 8) & 0xFFFF
+
+
+def count_pgns_in_batches(batches, counter=None):
+    """
+    Count PGN occurrences (keyed by upper-case hex, as in the text analyzer)
+    over extended-id frames.
+
+    Returns:
+        tuple (counter, frame_count)
+    """
+    counter = counter if counter is not None else Counter()
+    frames = 0
+    for batch in batches:
+        frames += len(batch['can_id'])
+        pgns = pgns_from_can_ids(batch['can_id'][batch['extended']])
+        values, counts = np.unique(pgns, return_counts=True)
+        for pgn, count in zip(values.tolist(), counts.tolist()):
+            counter[f"{pgn:04X}"] += count
+    return counter, frames
+
+
+def analyze_can_log(chunks, fmt, encoding='utf-8'):
+    """
+    Analyze a raw CAN capture given as byte chunks.
+
+    Returns:
+        dict with 'counter', 'lines', 'frames', 'warnings' and 'method',
+        shaped like log_analysis.analyze_lines()
+    """
+    line_count = [0]
+
+    def counted(lines):
+        for line in lines:
+            line_count[0] += 1
+            yield line
+
+    batches = PARSERS[fmt](counted(iter_lines(chunks, encoding)))
+    counter, frames = count_pgns_in_batches(batches)
+    return {
+        'counter': counter,
+        'lines': line_count[0],
+        'frames': frames,
+        'warnings': [],
+        'method': fmt,
+    }
+
+
+# Leading non-frame lines kept and replayed in front of every later block
+MAX_HEADER_LINES = 100
+
+
+class StreamingCanLogAnalyzer:
+    """
+    Push-style analyze_can_log(): feed() raw bytes as they arrive and close()
+    returns the same result as analyze_can_log() over the whole capture.
+
+    Complete lines are parsed block by block. The header lines before the
+    first frame (e.g. the ASC 'base hex' line) are parsed again in front of
+    every block, so parser state set by the header carries over.
+    """
+
+    def __init__(self, fmt, encoding='utf-8'):
+        self.fmt = fmt
+        self.counter = Counter()
+        self.frames = 0
+        self.lines = 0
+        self._decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+        self._pending = ''
+        self._header = []
+        self._in_header = True
+
+    def feed(self, data):
+        self._pending += self._decoder.decode(data)
+        lines = self._pending.split('\n')
+        self._pending = lines.pop()
+        self._parse(lines)
+
+    def _parse(self, lines):
+        if not lines:
+            return
+        self.lines += len(lines)
+        header = list(self._header)
+        if self._in_header:
+            patterns = _FRAME_PATTERNS[self.fmt]
+            first_frame = next(
+                (i for i, line in enumerate(lines) if any(pattern.match(line) for pattern in patterns)), None)
+            self._header += lines if first_frame is None else lines[:first_frame]
+            if first_frame is not None or len(self._header) >= MAX_HEADER_LINES:
+                self._in_header = False
+                self._header = self._header[:MAX_HEADER_LINES]
+        block = header + lines
+        batches = PARSERS[self.fmt](block, batch_size=min(BATCH_SIZE, len(block)))
+        _, frames = count_pgns_in_batches(batches, self.counter)
+        self.frames += frames
+
+    def close(self):
+        """
+        Returns:
+            dict shaped like analyze_can_log()
+        """
+        self._pending += self._decoder.decode(b'', final=True)
+        if self._pending:
+            self._parse([self._pending])
+            self._pending = ''
+        return {
+            'counter': self.counter,
+            'lines': self.lines,
+            'frames': self.frames,
+            'warnings': [],
+            'method': self.fmt,
+        }
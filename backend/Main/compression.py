@@ -0,0 +1,333 @@
+"""
+Compression at rest for archived J1939 uploads.
+
+Text logs in j1939_uploads/ compress 10-20x. A compressed upload keeps its
+storage name but holds a seekable gzip stream: the log is cut into frames of
+FRAME_BYTES and every frame is written as its own gzip member (with a zero
+mtime, so identical logs compress to identical bytes and still deduplicate
+in the content-addressed store). Any gunzip reads the whole file; the
+CompressedFile row records each frame's compressed offset, so a reader can
+seek to any uncompressed offset by decompressing one frame.
+
+Readers go through open_stored() (a decompressing, seekable stream for
+downloads) or mapped_stored_file() (bytes or an mmap for the parsers), which
+handle compressed and plain files alike.
+
+zstd would compress faster, but it is not a dependency of this project;
+gzip is in the standard library.
+"""
+
+import contextlib
+import gzip
+import hashlib
+import io
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import zlib
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .formats import sniff_format, SNIFF_BYTES, KIND_TEXT
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM_GZIP = 'gzip'
+
+# Uncompressed bytes per gzip member; the unit of random access
+FRAME_BYTES = 1024 * 1024
+
+# Directory under MEDIA_ROOT for compressed bodies on their way into storage
+TEMP_DIR = 'tmp'
+
+# zlib window bits for a gzip member
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def compress_stream(src, dst, level=6, frame_bytes=FRAME_BYTES):
+    """
+    Write src as a sequence of independent gzip members to dst.
+
+    Returns:
+        dict with 'size' (uncompressed), 'compressed_size' and
+        'frame_offsets' (compressed offset of every frame)
+    """
+    offsets = []
+    size = compressed = 0
+    while True:
+        block = _read_full(src, frame_bytes)
+        if not block:
+            break
+        member = gzip.compress(block, compresslevel=level, mtime=0)
+        offsets.append(compressed)
+        dst.write(member)
+        size += len(block)
+        compressed += len(member)
+    return {'size': size, 'compressed_size': compressed, 'frame_offsets': offsets}
+
+
+def _read_full(src, length):
+    chunks = []
+    while length:
+        data = src.read(length)
+        if not data:
+            break
+        chunks.append(data)
+        length -= len(data)
+    return b''.join(chunks)
+
+
+class FrameReader(io.RawIOBase):
+    """
+    Seekable read-only view of the uncompressed content of a framed gzip
+    file. Only the frame holding the current position is decompressed.
+    """
+
+    def __init__(self, raw, entry):
+        self._raw = raw
+        self._size = entry.size
+        self._frame_bytes = entry.frame_bytes
+        self._offsets = list(entry.frame_offsets) + [entry.compressed_size]
+        self._pos = 0
+        self._frame_index = None
+        self._frame = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def _load_frame(self, index):
+        if index != self._frame_index:
+            start, end = self._offsets[index], self._offsets[index + 1]
+            self._raw.seek(start)
+            self._frame = zlib.decompress(self._raw.read(end - start), _GZIP_WBITS)
+            self._frame_index = index
+        return self._frame
+
+    def readinto(self, buffer):
+        if self._pos >= self._size:
+            return 0
+        index = self._pos // self._frame_bytes
+        frame = self._load_frame(index)
+        start = self._pos - index * self._frame_bytes
+        data = frame[start:start + len(buffer)]
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError('negative seek position')
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._raw.close()
+        super().close()
+
+
+def compression_entry(name):
+    """CompressedFile row for a storage name, or None for a plain file."""
+    from .models import CompressedFile
+    return CompressedFile.objects.filter(name=name).first()
+
+
+def stored_size(name):
+    """Uncompressed size of a stored file."""
+    entry = compression_entry(name)
+    return entry.size if entry else default_storage.size(name)
+
+
+def open_stored(name):
+    """
+    Open a stored file for reading its original bytes.
+
+    Returns:
+        a seekable binary file object (decompressing when compressed)
+    """
+    entry = compression_entry(name)
+    raw = default_storage.open(name, 'rb')
+    if entry is None:
+        return raw
+    return io.BufferedReader(FrameReader(raw, entry), buffer_size=entry.frame_bytes)
+
+
+@contextlib.contextmanager
+def mapped_stored_file(name):
+    """
+    Yield a stored file's original bytes as an mmap (b'' when empty).
+
+    A plain file is mapped directly. A compressed one is decompressed frame
+    by frame into an anonymous temp file, which is mapped, so the parsers
+    never hold the whole log in memory.
+    """
+    entry = compression_entry(name)
+    with contextlib.ExitStack() as stack:
+        if entry is None:
+            fh = stack.enter_context(open(default_storage.path(name), 'rb'))
+        else:
+            fh = stack.enter_context(tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR))
+            with open_stored(name) as src:
+                for chunk in iter(lambda: src.read(entry.frame_bytes), b''):
+                    fh.write(chunk)
+            fh.flush()
+        if not os.fstat(fh.fileno()).st_size:
+            # mmap cannot map an empty file
+            yield b''
+            return
+        content = stack.enter_context(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+        yield content
+
+
+def is_compressible(head, name=''):
+    """Text logs (CSV, candump, ASC, TRC...) compress well; workbooks are already zipped."""
+    return bool(head) and sniff_format(head[:SNIFF_BYTES], name)['kind'] == KIND_TEXT
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def compress_stored(name, level=None):
+    """
+    Compress a stored plain file in place, keeping its storage name.
+
+    Returns:
+        the CompressedFile row, or None when the file was left as is
+        (already compressed, empty, or not a text log)
+    """
+    from .models import CompressedFile
+    if compression_entry(name) is not None:
+        return None
+    level = settings.J1939_UPLOAD_COMPRESSION_LEVEL if level is None else level
+
+    with default_storage.open(name, 'rb') as src:
+        if not is_compressible(src.read(SNIFF_BYTES), name):
+            return None
+
+    # The compressed body is written next to the original and swapped in
+    # with os.replace; a link to the original is kept until the database
+    # rows are committed, so a failure at any step leaves the log intact
+    path = default_storage.path(name)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.gz-tmp')
+    backup_path = f'{path}.orig-tmp'
+    orphan = None
+    try:
+        with os.fdopen(fd, 'wb') as tmp, default_storage.open(name, 'rb') as src:
+            index = compress_stream(src, tmp, level)
+        _link_or_copy(path, backup_path)
+        os.replace(tmp_path, path)
+        try:
+            with transaction.atomic():
+                entry = CompressedFile.objects.create(
+                    name=name,
+                    algorithm=ALGORITHM_GZIP,
+                    frame_bytes=FRAME_BYTES,
+                    **index
+                )
+                # Content-addressed storage: re-point the name at the new body
+                replaced = getattr(default_storage, 'replaced', None)
+                if replaced is not None:
+                    orphan = replaced(name)
+        except BaseException:
+            os.replace(backup_path, path)
+            raise
+    finally:
+        for leftover in (tmp_path, backup_path):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(leftover)
+    if orphan is not None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(orphan)
+    logger.info('Compressed %s: %d -> %d bytes', name, entry.size, entry.compressed_size)
+    return entry
+
+
+class _HashingWriter:
+    """File wrapper that SHA-256 hashes what is written through it."""
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.fh.write(data)
+
+
+class _CompressedTempFile(File):
+    """
+    A compressed body already on disk. Storages move a file exposing
+    temporary_file_path() into place instead of copying it, and
+    ContentAddressedStorage uses content_hash instead of re-hashing it.
+    """
+
+    def __init__(self, path, name, content_hash):
+        super().__init__(open(path, 'rb'), name=name)
+        self.content_hash = content_hash
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def _temp_dir():
+    """Spool directory under MEDIA_ROOT, so storing the file is a rename."""
+    try:
+        tmp_dir = default_storage.path(TEMP_DIR)
+    except NotImplementedError:
+        return settings.FILE_UPLOAD_TEMP_DIR
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tmp_dir
+
+
+def save_compressed(name, fileobj, level=None):
+    """
+    Save an upload compressed when it is a text log, plainly otherwise.
+
+    The upload is read once: it is compressed (and the result hashed) into a
+    temp file under MEDIA_ROOT that the storage renames into place, so no
+    further copy of the upload is written.
+
+    Returns:
+        the saved storage name
+    """
+    from .models import CompressedFile
+    level = settings.J1939_UPLOAD_COMPRESSION_LEVEL if level is None else level
+    fileobj.seek(0)
+    if not is_compressible(fileobj.read(SNIFF_BYTES), name):
+        fileobj.seek(0)
+        return default_storage.save(name, fileobj)
+    fileobj.seek(0)
+    fd, tmp_path = tempfile.mkstemp(dir=_temp_dir(), suffix='.gz-tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            writer = _HashingWriter(tmp)
+            index = compress_stream(fileobj, writer, level)
+        with _CompressedTempFile(tmp_path, os.path.basename(name), writer.sha256.hexdigest()) as compressed:
+            with transaction.atomic():
+                saved = default_storage.save(name, compressed)
+                CompressedFile.objects.filter(name=saved).delete()
+                CompressedFile.objects.create(name=saved, algorithm=ALGORITHM_GZIP, frame_bytes=FRAME_BYTES, **index)
+    finally:
+        # Left behind only when the storage copied it or saving failed
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+    return saved
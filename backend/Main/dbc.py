@@ -0,0 +1,152 @@
+"""
+J1939 parameter definitions from DBC files.
+
+OEM and tool vendors describe signal layouts in DBC files. parse_dbc() reads
+one line at a time, keeps only the extended-id messages (BO_), their signals
+(SG_) and the J1939 `SPN` signal attribute (BA_ "SPN" SG_ ...), and returns
+{SPN_Number: fields} shaped like spn_master.parse_spn_master(), so the result
+goes through the same bulk import (spn_master.import_spn_master()).
+
+Field mapping for a signal `SG_ name : start|length@1+ (factor,offset) [min|max] "unit"`
+in `BO_ id name: dlc ...`:
+
+    PGN_DEC            J1939 PGN of the 29-bit id; the destination byte of
+                       PDU1 (PF < 240) ids is cleared
+    SPN_Description    signal name
+    Data_Length_Bytes  message DLC, as the DL column of the CSV
+    Start_Byte/Bit     start bit as 1-based byte and bit within it
+    Bit_Length         length
+    Resolution/Offset  factor/offset
+    Min/Max_Value      [min|max]; [0|0] means no range
+
+J1939 signals are little-endian (@1). The definition model has no byte
+order, so big-endian (@0) signals are reported as errors rather than loaded
+with a wrong layout. Signals without an SPN attribute are not J1939
+parameters and are skipped.
+"""
+
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Extended (29-bit) frame flag in DBC message ids
+EXTENDED_ID_FLAG = 0x80000000
+# Pseudo message holding signals not assigned to any message
+INDEPENDENT_SIGNALS_ID = 0xC0000000
+
+_BO_RE = re.compile(r'^BO_\s+(\d+)\s+(\w+)\s*:\s*(\d+)')
+_SG_RE = re.compile(
+    r'^SG_\s+(\w+)\s*(?:\w+\s*)?:\s*(\d+)\|(\d+)@([01])([+-])\s*'
+    r'\(\s*([^,\s]+)\s*,\s*([^)\s]+)\s*\)\s*\[\s*([^|\s]*)\s*\|\s*([^\]\s]*)\s*\]\s*"([^"]*)"'
+)
+_SPN_ATTRIBUTE_RE = re.compile(r'^BA_\s+"SPN"\s+SG_\s+(\d+)\s+(\w+)\s+(\d+)\s*;')
+
+# Model field sizes (J1939ParameterDefinition)
+_DESCRIPTION_LENGTH = 255
+_UNIT_LENGTH = 50
+
+
+def pgn_from_message_id(message_id):
+    """
+    J1939 PGN of an extended DBC message id, or None for standard ids.
+    """
+    if not message_id & EXTENDED_ID_FLAG:
+        return None
+    can_id = message_id & 0x1FFFFFFF
+    pgn = (can_id >> 8) & 0x3FFFF
+    if (pgn >> 8) & 0xFF < 240:
+        # PDU1: the PS byte is a destination address, not part of the PGN
+        pgn &= 0x3FF00
+    return pgn
+
+
+def _decode(line):
+    if isinstance(line, str):
+        return line
+    try:
+        return line.decode('utf-8')
+    except UnicodeDecodeError:
+        # CANdb++ writes Windows-1252
+        return line.decode('cp1252', errors='replace')
+
+
+def _limit(value):
+    return float(value) if value not in ('', None) else None
+
+
+def parse_dbc(lines):
+    """
+    Parse a DBC file line by line.
+
+    Args:
+        lines: Iterable of lines, str or bytes (UTF-8 or Windows-1252), such
+               as an open file or an UploadedFile
+
+    Returns:
+        tuple (definitions, errors): {SPN_Number: fields} with the last
+        signal winning for a repeated SPN, and 'Line N: ...' messages for
+        signals that could not be used
+    """
+    messages = {}
+    signals = {}
+    spns = {}
+    errors = []
+    message_id = None
+
+    for line_num, raw in enumerate(lines, start=1):
+        line = _decode(raw).strip()
+        if line.startswith('BO_ '):
+            match = _BO_RE.match(line)
+            message_id = int(match.group(1)) if match else None
+            if match:
+                messages[message_id] = int(match.group(3))
+        elif line.startswith('SG_ '):
+            if message_id is None or message_id == INDEPENDENT_SIGNALS_ID:
+                continue
+            match = _SG_RE.match(line)
+            if not match:
+                errors.append(f'Line {line_num}: malformed signal')
+                continue
+            signals[(message_id, match.group(1))] = (line_num, match.groups())
+        elif line.startswith('BA_ "SPN"'):
+            match = _SPN_ATTRIBUTE_RE.match(line)
+            if match:
+                spns[(int(match.group(1)), match.group(2))] = int(match.group(3))
+
+    definitions = {}
+    skipped = 0
+    for key, (line_num, groups) in signals.items():
+        spn_number = spns.get(key)
+        pgn = pgn_from_message_id(key[0])
+        if not spn_number or pgn is None:
+            skipped += 1
+            continue
+        name, start, length, byte_order, _, factor, offset, minimum, maximum, unit = groups
+        if byte_order == '0':
+            errors.append(f'Line {line_num}: signal {name} (SPN {spn_number}) is big-endian, not supported')
+            continue
+        try:
+            start, minimum, maximum = int(start), _limit(minimum), _limit(maximum)
+            fields = {
+                'PGN_DEC': pgn,
+                'PGN_HEX': f'0x{pgn:04X}',
+                'SPN_Description': name[:_DESCRIPTION_LENGTH],
+                'Unit': unit[:_UNIT_LENGTH],
+                'Data_Length_Bytes': messages[key[0]],
+                'Start_Byte': start // 8 + 1,
+                'Start_Bit': start % 8,
+                'Bit_Length': int(length),
+                'Resolution': float(factor),
+                'Offset': float(offset),
+                'Min_Value': None if minimum == maximum == 0 else minimum,
+                'Max_Value': None if minimum == maximum == 0 else maximum,
+            }
+        except ValueError as exc:
+            errors.append(f'Line {line_num}: signal {name}: {exc}')
+            continue
+        definitions[spn_number] = fields
+
+    logger.info('Parsed DBC: %d messages, %d signals, %d SPN definitions, %d signals without SPN skipped',
+                len(messages), len(signals), len(definitions), skipped)
+    return definitions, errors
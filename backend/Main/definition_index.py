@@ -0,0 +1,285 @@
+"""
+Shared, memory-mapped lookup index of a DefinitionVersion.
+
+map_j1939_spns() and the other definition lookups need every definition of
+a PGN and the decode parameters of an SPN. Building dicts of the snapshot in
+each gunicorn worker costs memory per worker and a slow first request, so a
+version is compiled once into NumPy arrays saved under
+J1939_DEFINITION_INDEX_DIR, named by the version's content hash:
+
+    <hash>.npy        one ROW_DTYPE record per SPN, sorted by (PGN, SPN);
+                      the definitions of a PGN are the contiguous range
+                      found with searchsorted on the 'pgn' column
+    <hash>.spn.npy    row numbers ordered by SPN, for SPN lookups
+    <hash>.text.npy   UTF-8 pool holding PGN_HEX, description and unit
+
+Processes open them with np.load(mmap_mode='r'), so the arrays are read
+zero-copy from the page cache and shared by every worker (point the
+directory at /dev/shm to keep it in shared memory). gunicorn.conf.py
+preloads the app and calls warm_definition_index() in the master before it
+forks, so workers inherit the mapping and start warm.
+
+Hot swap: publish_definition_version() builds the files of a new version
+when its transaction commits; each process notices the new current version
+on its next lookup and maps the new files. `kill -HUP` on the gunicorn
+master re-warms it for the workers it forks next. Files are immutable and
+can be deleted at any time; a missing index is rebuilt on demand.
+"""
+
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+
+from .definitions import SNAPSHOT_FIELDS, current_definition_version
+
+logger = logging.getLogger(__name__)
+
+ROW_DTYPE = np.dtype([
+    ('pgn', '<u4'),
+    ('spn', '<u4'),
+    ('start_byte', '<u2'),
+    ('start_bit', '<u1'),
+    ('bit_length', '<u2'),
+    ('data_length_bytes', '<u2'),
+    ('resolution', '<f8'),
+    ('offset', '<f8'),
+    # NaN when the definition has no limit
+    ('min_value', '<f8'),
+    ('max_value', '<f8'),
+    ('text_offset', '<u4'),
+    ('pgn_hex_length', '<u2'),
+    ('description_length', '<u2'),
+    ('unit_length', '<u2'),
+])
+
+# Indexes kept open per process, by content hash
+_INDEX_CACHE_SIZE = 4
+_indexes = OrderedDict()
+
+_FIELD = {name: position for position, name in enumerate(SNAPSHOT_FIELDS)}
+
+
+def index_dir():
+    """Directory holding the compiled indexes."""
+    return settings.J1939_DEFINITION_INDEX_DIR or os.path.join(settings.MEDIA_ROOT, 'definition_index')
+
+
+def _nan(value):
+    return np.nan if value is None else value
+
+
+def compile_rows(rows):
+    """
+    Compile snapshot rows (DefinitionVersion.definitions) to index arrays.
+
+    Returns:
+        tuple (table, by_spn, text) of NumPy arrays
+    """
+    rows = sorted(rows, key=lambda row: (row[_FIELD['PGN_DEC']], row[_FIELD['SPN_Number']]))
+    table = np.zeros(len(rows), dtype=ROW_DTYPE)
+    text = bytearray()
+    for position, row in enumerate(rows):
+        value = dict(zip(SNAPSHOT_FIELDS, row))
+        strings = [str(value[name] or '').encode('utf-8') for name in ('PGN_HEX', 'SPN_Description', 'Unit')]
+        table[position] = (
+            value['PGN_DEC'], value['SPN_Number'], value['Start_Byte'], value['Start_Bit'],
+            value['Bit_Length'], value['Data_Length_Bytes'], value['Resolution'], value['Offset'] or 0.0,
+            _nan(value['Min_Value']), _nan(value['Max_Value']),
+            len(text), len(strings[0]), len(strings[1]), len(strings[2]),
+        )
+        for data in strings:
+            text.extend(data)
+    by_spn = np.argsort(table['spn'], kind='stable').astype('<u4')
+    return table, by_spn, np.frombuffer(bytes(text), dtype=np.uint8)
+
+
+class DefinitionIndex:
+    """
+    Lookups over the compiled arrays of one DefinitionVersion.
+
+    Definitions are returned as dicts keyed by SNAPSHOT_FIELDS names, like
+    definitions.snapshot_definitions().
+    """
+
+    def __init__(self, content_hash, table, by_spn, text):
+        self.content_hash = content_hash
+        self.table = table
+        self.by_spn = by_spn
+        self.text = text
+        self._pgns = table['pgn']
+        self._spns = table['spn'][by_spn]
+        self._summary = None
+
+    def __len__(self):
+        return len(self.table)
+
+    def _range(self, pgn):
+        return (
+            int(np.searchsorted(self._pgns, pgn, side='left')),
+            int(np.searchsorted(self._pgns, pgn, side='right')),
+        )
+
+    def has_pgn(self, pgn):
+        start, end = self._range(pgn)
+        return end > start
+
+    def pgn_count(self):
+        """Number of distinct PGNs."""
+        if not len(self._pgns):
+            return 0
+        return int(np.count_nonzero(np.diff(self._pgns))) + 1
+
+    def pgn_summary(self, pgn_min=None, pgn_max=None):
+        """
+        [{'pgn', 'spn_count', 'spns'}] per PGN, ascending, optionally limited
+        to pgn_min..pgn_max (inclusive).
+
+        Built in one pass over the sorted table the first time it is asked
+        for and kept with the index, so it lives as long as the version.
+        Callers must not modify the returned dicts.
+        """
+        if self._summary is None:
+            pgns, starts, counts = np.unique(self._pgns, return_index=True, return_counts=True)
+            spns = self.table['spn']
+            self._summary = (pgns, [
+                {'pgn': int(pgn), 'spn_count': int(count), 'spns': spns[start:start + count].tolist()}
+                for pgn, start, count in zip(pgns, starts, counts)
+            ])
+        pgns, summary = self._summary
+        start = int(np.searchsorted(pgns, pgn_min, side='left')) if pgn_min is not None else 0
+        end = int(np.searchsorted(pgns, pgn_max, side='right')) if pgn_max is not None else len(summary)
+        return summary[start:end]
+
+    def _definition(self, position):
+        record = self.table[position]
+        start = int(record['text_offset'])
+        strings = []
+        for length in (record['pgn_hex_length'], record['description_length'], record['unit_length']):
+            strings.append(self.text[start:start + int(length)].tobytes().decode('utf-8'))
+            start += int(length)
+        return {
+            'SPN_Number': int(record['spn']),
+            'PGN_DEC': int(record['pgn']),
+            'PGN_HEX': strings[0],
+            'SPN_Description': strings[1],
+            'Unit': strings[2],
+            'Data_Length_Bytes': int(record['data_length_bytes']),
+            'Start_Byte': int(record['start_byte']),
+            'Start_Bit': int(record['start_bit']),
+            'Bit_Length': int(record['bit_length']),
+            'Resolution': float(record['resolution']),
+            'Offset': float(record['offset']),
+            'Min_Value': None if np.isnan(record['min_value']) else float(record['min_value']),
+            'Max_Value': None if np.isnan(record['max_value']) else float(record['max_value']),
+        }
+
+    def spns_for_pgn(self, pgn):
+        """SPN numbers of a PGN, ascending."""
+        start, end = self._range(pgn)
+        return self.table['spn'][start:end].tolist()
+
+    def definitions_for_pgn(self, pgn):
+        """Definitions of a PGN, ordered by SPN."""
+        start, end = self._range(pgn)
+        return [self._definition(position) for position in range(start, end)]
+
+    def definition(self, spn):
+        """Definition of an SPN, or None."""
+        position = int(np.searchsorted(self._spns, spn))
+        if position < len(self._spns) and self._spns[position] == spn:
+            return self._definition(int(self.by_spn[position]))
+        return None
+
+
+def _paths(content_hash, directory):
+    base = os.path.join(directory, content_hash)
+    return base + '.npy', base + '.spn.npy', base + '.text.npy'
+
+
+def _save(path, array):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            np.save(fh, array, allow_pickle=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def build_index(content_hash, rows):
+    """
+    Write the index files of a version (a no-op if they exist).
+
+    Returns:
+        DefinitionIndex over the mapped files, or over in-memory arrays when
+        the directory is not writable
+    """
+    directory = index_dir()
+    paths = _paths(content_hash, directory)
+    if not all(os.path.exists(path) for path in paths):
+        arrays = compile_rows(rows)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # The table is written last: readers treat it as the complete marker
+            for path, array in reversed(list(zip(paths, arrays))):
+                _save(path, array)
+        except OSError as exc:
+            logger.warning('Cannot write definition index to %s (%s); keeping it in memory', directory, exc)
+            return DefinitionIndex(content_hash, *arrays)
+        logger.info('Built definition index %s: %d SPNs', content_hash[:12], len(arrays[0]))
+    return _open(content_hash, paths)
+
+
+def _open(content_hash, paths):
+    table, by_spn, text = (np.load(path, mmap_mode='r', allow_pickle=False) for path in paths)
+    return DefinitionIndex(content_hash, table, by_spn, text)
+
+
+def definition_index(version_id):
+    """
+    DefinitionIndex of a DefinitionVersion, mapped once per process.
+
+    Keyed by content hash: versions are immutable, ids can be reused after
+    a rolled-back insert, and versions with identical content share one
+    index.
+    """
+    from .models import DefinitionVersion
+    content_hash = DefinitionVersion.objects.values_list('content_hash', flat=True).get(pk=version_id)
+    index = _indexes.get(content_hash)
+    if index is not None:
+        _indexes.move_to_end(content_hash)
+        return index
+    paths = _paths(content_hash, index_dir())
+    if all(os.path.exists(path) for path in paths):
+        index = _open(content_hash, paths)
+    else:
+        rows = DefinitionVersion.objects.values_list('definitions', flat=True).get(pk=version_id)
+        index = build_index(content_hash, rows)
+    _indexes[content_hash] = index
+    while len(_indexes) > _INDEX_CACHE_SIZE:
+        _indexes.popitem(last=False)
+    return index
+
+
+def warm_definition_index():
+    """
+    Map the current version's index in this process.
+
+    Called by gunicorn.conf.py in the master before workers are forked; the
+    database connection it used is closed so no worker inherits it.
+
+    Returns:
+        DefinitionIndex
+    """
+    try:
+        index = definition_index(current_definition_version().id)
+    finally:
+        connections.close_all()
+    logger.info('Definition index %s warm: %d SPNs', index.content_hash[:12], len(index))
+    return index
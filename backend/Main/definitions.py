@@ -0,0 +1,213 @@
+"""
+Versioned snapshots of the J1939 parameter definitions.
+
+J1939ParameterDefinition rows are edited in place (SPN master imports, the
+definition API, the admin, seed_j1939_parameters). publish_definition_version()
+hashes the whole table and, when the content changed, stores an immutable
+DefinitionVersion holding a copy of every row. Imports and seeding call it
+directly; single-row edits (admin, API) go through
+schedule_definition_publish(), which coalesces the edits made within
+J1939_DEFINITION_PUBLISH_DELAY_SECONDS into one publish. So:
+
+- a vehicle records the version it was mapped against
+  (Vehicle.definition_version), and its mapping can be reproduced later;
+- caches derived from the definitions (the lookup index in
+  Main/definition_index.py, the snapshot blobs below) are keyed by version
+  (its content hash), so a new version invalidates them exactly and an
+  unchanged table never does.
+
+Edits made outside those paths (a shell, raw SQL), or whose delayed publish
+was lost with its worker, are picked up by `manage.py publish_definitions`
+or the next import.
+
+snapshot_blob() renders a whole version, or the delta from an older one,
+as gzip-compressed JSON for GET /api/j1939/parameter-definitions/snapshot/.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Column order of DefinitionVersion.definitions rows
+SNAPSHOT_FIELDS = [
+    'SPN_Number', 'PGN_DEC', 'PGN_HEX', 'SPN_Description', 'Unit', 'Data_Length_Bytes', 'Start_Byte',
+    'Start_Bit', 'Bit_Length', 'Resolution', 'Offset', 'Min_Value', 'Max_Value',
+]
+
+# Rendered snapshot blobs kept in memory, by (content hash, since hash)
+_BLOB_CACHE_SIZE = 8
+_snapshot_blobs = OrderedDict()
+
+# Pending delayed publish of this process (schedule_definition_publish)
+_publish_lock = threading.Lock()
+_publish_timer = None
+
+
+def definition_rows():
+    """Current definitions as canonical rows, ordered by SPN."""
+    from .models import J1939ParameterDefinition
+    return [
+        list(row) for row in J1939ParameterDefinition.objects.order_by('SPN_Number').values_list(*SNAPSHOT_FIELDS)
+    ]
+
+
+def rows_hash(rows):
+    """SHA-256 of definition rows in their canonical JSON form."""
+    payload = json.dumps(rows, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def publish_definition_version(source=''):
+    """
+    Snapshot the definition table if it changed since the latest version.
+
+    Returns:
+        the current DefinitionVersion (newly created or the latest one)
+    """
+    from .models import DefinitionVersion
+    with transaction.atomic():
+        latest = DefinitionVersion.objects.select_for_update().order_by('-id').first()
+        rows = definition_rows()
+        content_hash = rows_hash(rows)
+        if latest is not None and latest.content_hash == content_hash:
+            return latest
+        version = DefinitionVersion.objects.create(
+            content_hash=content_hash,
+            definition_count=len(rows),
+            source=source,
+            definitions=rows,
+        )
+        # Have the lookup index ready before workers ask for it, then bring
+        # stored vehicle mappings onto the new version
+        transaction.on_commit(lambda: _published(version, rows, latest))
+    logger.info('Published parameter definitions v%d (%d SPNs, %s) from %s',
+                version.id, version.definition_count, content_hash[:12], source or 'unknown')
+    return version
+
+
+def _published(version, rows, previous):
+    """After commit: build the lookup index and queue re-mapping of stored vehicles."""
+    from .definition_index import build_index
+    from .remap import schedule_remap
+    try:
+        build_index(version.content_hash, rows)
+    except Exception:
+        # Rebuilt on demand by the first lookup
+        logger.exception('Could not build definition index %s', version.content_hash[:12])
+    if previous is not None:
+        schedule_remap(version, previous)
+
+
+def schedule_definition_publish(source=''):
+    """
+    Publish the definitions after a single-row edit. Edits committed within
+    J1939_DEFINITION_PUBLISH_DELAY_SECONDS of the first one share one
+    publish, run by a daemon timer thread; with a delay of 0 the version is
+    published at once.
+    """
+    delay = settings.J1939_DEFINITION_PUBLISH_DELAY_SECONDS
+    if delay <= 0:
+        publish_definition_version(source)
+        return
+    transaction.on_commit(lambda: _start_publish_timer(source, delay))
+
+
+def _start_publish_timer(source, delay):
+    global _publish_timer
+    with _publish_lock:
+        if _publish_timer is not None:
+            return
+        _publish_timer = threading.Timer(delay, _publish_in_thread, args=(source,))
+        _publish_timer.name = 'publish-definitions'
+        _publish_timer.daemon = True
+        _publish_timer.start()
+
+
+def _publish_in_thread(source):
+    global _publish_timer
+    # Cleared first: an edit committed while this publish reads the table
+    # starts a new timer instead of being missed
+    with _publish_lock:
+        _publish_timer = None
+    try:
+        publish_definition_version(source)
+    except Exception:
+        logger.exception('Delayed publish of parameter definitions failed')
+    finally:
+        connection.close()
+
+
+def current_definition_version():
+    """Latest DefinitionVersion, publishing the first one if there is none."""
+    from .models import DefinitionVersion
+    # The rows are loaded only when a version's index or snapshot is built
+    latest = DefinitionVersion.objects.defer('definitions').order_by('-id').first()
+    return latest if latest is not None else publish_definition_version('initial')
+
+
+def snapshot_definitions(version_id):
+    """Definition dicts of a version, keyed by SNAPSHOT_FIELDS names."""
+    from .models import DefinitionVersion
+    rows = DefinitionVersion.objects.values_list('definitions', flat=True).get(pk=version_id)
+    return [dict(zip(SNAPSHOT_FIELDS, row)) for row in rows]
+
+
+def snapshot_payload(version, since=None):
+    """
+    JSON-ready dictionary snapshot of a version.
+
+    Args:
+        version: DefinitionVersion to render
+        since: Older DefinitionVersion the client already has, or None for
+               the complete dictionary
+
+    Returns:
+        dict with 'version', 'content_hash', 'since', 'fields' (column
+        names of the rows), 'definitions' (all rows, or only those added or
+        changed since `since`) and 'deleted' (SPNs removed since `since`)
+    """
+    rows = version.definitions
+    deleted = []
+    if since is not None:
+        previous = {row[0]: row for row in since.definitions}
+        current = {row[0] for row in rows}
+        rows = [row for row in rows if previous.get(row[0]) != row]
+        deleted = sorted(spn for spn in previous if spn not in current)
+    return {
+        'version': version.id,
+        'content_hash': version.content_hash,
+        'since': since.id if since is not None else None,
+        'fields': SNAPSHOT_FIELDS,
+        'definitions': rows,
+        'deleted': deleted,
+    }
+
+
+def snapshot_blob(version, since=None):
+    """
+    snapshot_payload() as gzip-compressed JSON.
+
+    Versions are immutable, so a blob is rendered once per (version, since)
+    pair and served from memory afterwards.
+    """
+    key = (version.content_hash, since.content_hash if since is not None else None)
+    blob = _snapshot_blobs.get(key)
+    if blob is not None:
+        _snapshot_blobs.move_to_end(key)
+        return blob
+    payload = json.dumps(snapshot_payload(version, since), separators=(',', ':'), ensure_ascii=False)
+    blob = gzip.compress(payload.encode('utf-8'), mtime=0)
+    _snapshot_blobs[key] = blob
+    while len(_snapshot_blobs) > _BLOB_CACHE_SIZE:
+        _snapshot_blobs.popitem(last=False)
+    logger.info('Rendered definitions v%d snapshot%s: %d bytes gzipped',
+                version.id, f' since v{since.id}' if since is not None else '', len(blob))
+    return blob
@@ -0,0 +1,160 @@
+"""
+Streaming downloads of stored files with HTTP Range and ETag support.
+
+serve_stored_file() answers a GET for a storage name:
+
+- the ETag is the file's SHA-256 (from the content-addressed store, see
+  Main/storage.py), so it is strong and identical across every name that
+  shares a body; If-None-Match answers 304 without touching the file;
+- a single `Range: bytes=...` is answered with 206 and only that slice,
+  honouring If-Range; several ranges get the whole file, as RFC 9110
+  allows;
+- the body is streamed in DOWNLOAD_CHUNK_BYTES pieces through
+  compression.open_stored(), so compressed uploads are inflated on the fly
+  and a seek only decompresses the frame it lands in.
+
+With MEDIA_ACCEL_REDIRECT set, plain files are not streamed by Django at
+all: the response carries X-Accel-Redirect (nginx) or X-Sendfile (Apache
+mod_xsendfile, lighttpd) and the front proxy sends the file, handling Range
+itself, so a large document never occupies a Python worker. Compressed
+files are always streamed here, since the proxy would send the gzip bytes.
+"""
+
+import logging
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_etags
+
+from .compression import compression_entry, open_stored
+from .storage import stored_content_hash
+
+logger = logging.getLogger(__name__)
+
+ACCEL_NGINX = 'nginx'
+ACCEL_SENDFILE = 'sendfile'
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Parse a Range header against a file of `size` bytes.
+
+    Returns:
+        (start, end) inclusive byte positions, None when the header is
+        absent, malformed or lists several ranges (serve the whole file)
+
+    Raises:
+        ValueError: the range cannot be satisfied (416)
+    """
+    match = _RANGE_RE.match((header or '').replace(' ', ''))
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('empty suffix range')
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise ValueError('range not satisfiable')
+    return start, end
+
+
+def _iter_slice(fh, start, length, chunk_bytes):
+    try:
+        fh.seek(start)
+        while length > 0:
+            data = fh.read(min(chunk_bytes, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        fh.close()
+
+
+def _accel_headers(name):
+    mode = settings.MEDIA_ACCEL_REDIRECT
+    if mode == ACCEL_NGINX:
+        return {'X-Accel-Redirect': settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + quote(name)}
+    if mode == ACCEL_SENDFILE:
+        return {'X-Sendfile': default_storage.path(name)}
+    return None
+
+
+def serve_stored_file(request, name, filename=None, content_hash=None):
+    """
+    Response streaming the stored file `name` as an attachment.
+
+    Args:
+        request: The request (for Range/If-None-Match/If-Range)
+        name: Storage name of the file
+        filename: Download file name (defaults to the stored base name)
+        content_hash: SHA-256 of the original bytes when the caller knows it
+                      (e.g. Vehicle.content_hash); otherwise the storage's
+
+    Raises:
+        FileNotFoundError: the file is not in storage
+    """
+    if not name or not default_storage.exists(name):
+        raise FileNotFoundError(name)
+    entry = compression_entry(name)
+    size = entry.size if entry else default_storage.size(name)
+    filename = filename or os.path.basename(name)
+
+    content_hash = content_hash or stored_content_hash(name)
+    if content_hash:
+        etag = f'"{content_hash}"'
+    else:
+        # Storage without content hashes: fall back to a weak validator
+        etag = f'W/"{size:x}-{int(default_storage.get_modified_time(name).timestamp()):x}"'
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    headers = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': content_disposition_header(True, filename),
+        'Last-Modified': http_date(default_storage.get_modified_time(name).timestamp()),
+    }
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    accel = _accel_headers(name) if entry is None else None
+    if accel:
+        return HttpResponse(content_type=content_type, headers=dict(headers, **accel))
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    # A range is only applied while the client's copy is still current
+    if not if_range or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            return HttpResponse(status=416, headers={'Content-Range': f'bytes */{size}', 'ETag': etag})
+
+    start, end = byte_range if byte_range else (0, size - 1)
+    length = max(0, end - start + 1)
+    response = StreamingHttpResponse(
+        _iter_slice(open_stored(name), start, length, settings.DOWNLOAD_CHUNK_BYTES),
+        status=206 if byte_range else 200,
+        content_type=content_type,
+        headers=headers,
+    )
+    response['Content-Length'] = str(length)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
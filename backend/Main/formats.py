@@ -0,0 +1,225 @@
+"""
+Content-based format detection for uploaded J1939 files.
+
+Uploads used to be routed by file extension, so a misnamed workbook or a
+binary capture went through every CSV encoding attempt before failing.
+These helpers look at the first few KB of the file instead (magic bytes,
+byte-order marks and simple line heuristics) so each upload can be sent
+straight to the right parser, or rejected immediately when it is a binary
+format we cannot read.
+"""
+
+import re
+
+# Number of bytes inspected when sniffing a file
+SNIFF_BYTES = 8192
+
+# Format identifiers returned in the 'format' key
+FORMAT_XLSX = 'xlsx'
+FORMAT_XLS = 'xls'
+FORMAT_CSV = 'csv'
+FORMAT_CANDUMP = 'candump'
+FORMAT_VECTOR_ASC = 'vector_asc'
+FORMAT_PCAN_TRC = 'pcan_trc'
+
+# Handler kinds returned in the 'kind' key
+KIND_EXCEL = 'excel'
+KIND_TEXT = 'text'
+KIND_UNSUPPORTED = 'unsupported'
+
+# Binary signatures we recognise but cannot parse: (magic, format, label)
+_BINARY_SIGNATURES = [
+    (b'LOGG', 'vector_blf', 'Vector BLF binary log'),
+    (b'MDF     ', 'mdf', 'ASAM MDF measurement file'),
+    (b'UnFinMF ', 'mdf', 'ASAM MDF measurement file (unfinalized)'),
+    (b'\xd4\xc3\xb2\xa1', 'pcap', 'PCAP capture'),
+    (b'\xa1\xb2\xc3\xd4', 'pcap', 'PCAP capture'),
+    (b'\x4d\x3c\xb2\xa1', 'pcap', 'PCAP capture'),
+    (b'\xa1\xb2\x3c\x4d', 'pcap', 'PCAP capture'),
+    (b'\x0a\x0d\x0d\x0a', 'pcapng', 'PCAPNG capture'),
+    (b'\x1f\x8b', 'gzip', 'gzip archive'),
+    (b'%PDF', 'pdf', 'PDF document'),
+    (b'\x89PNG', 'png', 'PNG image'),
+    (b'\xff\xd8\xff', 'jpeg', 'JPEG image'),
+    (b'Rar!', 'rar', 'RAR archive'),
+    (b'7z\xbc\xaf\x27\x1c', '7z', '7-Zip archive'),
+]
+
+_ZIP_MAGIC = b'PK\x03\x04'
+_OLE2_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+_BOMS = [
+    (b'\xef\xbb\xbf', 'utf-8-sig'),
+    (b'\xff\xfe', 'utf-16'),
+    (b'\xfe\xff', 'utf-16'),
+]
+
+# Line patterns for the raw CAN text log formats
+_CANDUMP_RE = re.compile(r'^\(\d+\.\d+\)\s+\S+\s+[0-9A-Fa-f]{3,8}#')
+_ASC_HEADER_RE = re.compile(r'^(date\s|base\s+(hex|dec)\b|internal events logged|begin triggerblock)', re.IGNORECASE)
+_ASC_FRAME_RE = re.compile(r'^\s*\d+\.\d+\s+\d+\s+[0-9A-Fa-f]{1,8}x?\s+(Rx|Tx)\s+d\s+\d', re.IGNORECASE)
+_TRC_HEADER_RE = re.compile(r'^;\s*\$(FILEVERSION|STARTTIME|COLUMNS)', re.IGNORECASE)
+_TRC_FRAME_RE = re.compile(r'^\s*\d+\)\s+\d+(\.\d+)?\s+(\d+\s+)?(Rx|Tx|DT)\s+[0-9A-Fa-f]{3,8}\s', re.IGNORECASE)
+
+_TEXT_LABELS = {
+    FORMAT_CSV: 'Delimited text log',
+    FORMAT_CANDUMP: 'Linux candump log',
+    FORMAT_VECTOR_ASC: 'Vector ASC log',
+    FORMAT_PCAN_TRC: 'PCAN-View TRC log',
+}
+
+
+def _result(fmt, kind, label, encoding=None):
+    return {
+        'format': fmt,
+        'kind': kind,
+        'label': label,
+        'encoding': encoding,
+    }
+
+
+def _guess_text_encoding(head):
+    """
+    Guess the encoding of a text head without a BOM.
+    Returns the encoding name or None if the bytes do not look like text.
+    """
+    if not head:
+        return 'utf-8'
+
+    sample = head[:SNIFF_BYTES]
+    if b'\x00' in sample:
+        # UTF-16 without BOM: every other byte is NUL for ASCII content
+        even_nuls = sample[0::2].count(0)
+        odd_nuls = sample[1::2].count(0)
+        half = max(len(sample) // 2, 1)
+        if odd_nuls / half > 0.3 and even_nuls / half < 0.05:
+            return 'utf-16-le'
+        if even_nuls / half > 0.3 and odd_nuls / half < 0.05:
+            return 'utf-16-be'
+        return None
+
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as exc:
+        # A multi-byte sequence cut off at the end of the sniff window is fine
+        if exc.start >= len(sample) - 3:
+            return 'utf-8'
+
+    # Control characters other than whitespace mean binary content
+    control = sum(1 for b in sample if b < 0x20 and b not in (0x09, 0x0a, 0x0d, 0x0c))
+    if control / len(sample) > 0.05:
+        return None
+    # Let the decoder fallback chain pick between the legacy code pages
+    return 'latin1'
+
+
+def _classify_text(text):
+    """Classify decoded text as one of the known CAN log formats or CSV."""
+    lines = [line for line in text.splitlines()[:50] if line.strip()]
+    for line in lines:
+        if _TRC_HEADER_RE.match(line):
+            return FORMAT_PCAN_TRC
+    for line in lines[:10]:
+        if _ASC_HEADER_RE.match(line.strip()):
+            return FORMAT_VECTOR_ASC
+
+    candump = asc = trc = 0
+    for line in lines:
+        if _CANDUMP_RE.match(line.strip()):
+            candump += 1
+        elif _ASC_FRAME_RE.match(line):
+            asc += 1
+        elif _TRC_FRAME_RE.match(line):
+            trc += 1
+
+    best = max(candump, asc, trc)
+    # Require the pattern on most non-empty lines so CSV logs are not misread
+    if best and best >= len(lines) // 2:
+        if best == candump:
+            return FORMAT_CANDUMP
+        if best == asc:
+            return FORMAT_VECTOR_ASC
+        return FORMAT_PCAN_TRC
+    return FORMAT_CSV
+
+
+def sniff_format(head, filename=''):
+    """
+    Detect the format of an upload from its first bytes.
+
+    Args:
+        head: The first SNIFF_BYTES (or fewer) bytes of the file
+        filename: Original file name, only used to break ties
+
+    Returns:
+        dict with 'format', 'kind' (excel/text/unsupported), 'label'
+        and 'encoding' (a decoding hint for text formats, else None)
+    """
+    head = head or b''
+    name = (filename or '').lower()
+
+    if head.startswith(_ZIP_MAGIC):
+        if b'xl/' in head or (b'[Content_Types].xml' in head and b'word/' not in head and b'ppt/' not in head):
+            return _result(FORMAT_XLSX, KIND_EXCEL, 'Excel workbook (OOXML)')
+        if b'word/' in head or b'ppt/' in head:
+            return _result('ooxml', KIND_UNSUPPORTED, 'Office document (not a workbook)')
+        if name.endswith('.xlsx'):
+            # Some writers put the workbook parts after the first few KB
+            return _result(FORMAT_XLSX, KIND_EXCEL, 'Excel workbook (OOXML)')
+        return _result('zip', KIND_UNSUPPORTED, 'ZIP archive')
+
+    if head.startswith(_OLE2_MAGIC):
+        return _result(FORMAT_XLS, KIND_EXCEL, 'Excel 97-2003 workbook (OLE2)')
+
+    encoding = None
+    body = head
+    for bom, bom_encoding in _BOMS:
+        if head.startswith(bom):
+            encoding = bom_encoding
+            body = head[len(bom):]
+            break
+
+    if encoding is None:
+        for magic, fmt, label in _BINARY_SIGNATURES:
+            if head.startswith(magic):
+                return _result(fmt, KIND_UNSUPPORTED, label)
+        encoding = _guess_text_encoding(head)
+        if encoding is None:
+            return _result('binary', KIND_UNSUPPORTED, 'Unrecognised binary data')
+
+    if encoding == 'utf-16':
+        text = head.decode('utf-16', errors='ignore')
+    else:
+        text = body.decode(encoding, errors='ignore')
+    fmt = _classify_text(text)
+    return _result(fmt, KIND_TEXT, _TEXT_LABELS[fmt], encoding)
+
+
+def sniff_upload(uploaded_file):
+    """
+    Sniff an uploaded file object without consuming it.
+    The file position is reset to the start afterwards.
+    """
+    try:
+        uploaded_file.seek(0)
+    except Exception:
+        pass
+    head = uploaded_file.read(SNIFF_BYTES)
+    try:
+        uploaded_file.seek(0)
+    except Exception:
+        pass
+    if isinstance(head, str):
+        head = head.encode('utf-8')
+    return sniff_format(head, getattr(uploaded_file, 'name', ''))
+
+
+def encodings_for(detected, fallbacks):
+    """
+    Order a list of candidate encodings so the sniffed one is tried first.
+    """
+    hint = (detected or {}).get('encoding')
+    if not hint or hint == 'latin1':
+        return list(fallbacks)
+    return [hint] + [enc for enc in fallbacks if enc != hint]
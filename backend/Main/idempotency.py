@@ -0,0 +1,131 @@
+"""
+Idempotency-Key support for the upload endpoints.
+
+A client that sends `Idempotency-Key: <unique value>` with an upload can
+retry it (after a timeout, a dropped connection or a double-click) without
+creating a second vehicle: the first request's response is stored and the
+retry gets it back, marked with `Idempotent-Replayed: true`. The key is
+checked before the request body is parsed, so a replayed upload is not
+read, hashed or parsed again.
+
+- A retry that arrives while the first request is still running gets 409.
+  A claim still pending after IDEMPOTENCY_PENDING_TIMEOUT_SECONDS belongs
+  to a worker that died before answering; the next retry takes it over.
+- Reusing a key for a different request (another endpoint path or body
+  size) gets 422.
+- 5xx responses and unhandled errors are not stored, so they can be
+  retried with the same key.
+
+Keys expire after IDEMPOTENCY_KEY_TTL_HOURS.
+"""
+
+import functools
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+REPLAY_HEADER = 'Idempotent-Replayed'
+
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    """Hash of what identifies a request without reading its body."""
+    signature = f"{request.method} {request.path} {request.META.get('CONTENT_LENGTH', '')}"
+    return hashlib.sha256(signature.encode('utf-8')).hexdigest()
+
+
+def claim_key(scope, key, fingerprint, user=None):
+    """
+    Reserve an idempotency key, or find the request that already used it.
+
+    Returns:
+        tuple (record, created); created is False when the key was seen
+        before (the record may still be pending). An abandoned pending
+        claim is taken over and returned as created.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    abandoned = now - timedelta(seconds=settings.IDEMPOTENCY_PENDING_TIMEOUT_SECONDS)
+    with transaction.atomic():
+        IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+        record, created = IdempotencyKey.objects.select_for_update().get_or_create(
+            scope=scope, key=key,
+            defaults={'request_fingerprint': fingerprint, 'user': user, 'claimed_at': now}
+        )
+        if not created and record.status == IdempotencyKey.STATUS_PENDING and record.claimed_at < abandoned:
+            logger.warning('Reclaiming %s Idempotency-Key %s pending since %s', scope, key, record.claimed_at)
+            record.request_fingerprint = fingerprint
+            record.user = user
+            record.claimed_at = now
+            record.save(update_fields=['request_fingerprint', 'user', 'claimed_at'])
+            created = True
+        return record, created
+
+
+def _replay(record, fingerprint, user):
+    if record.status == IdempotencyKey.STATUS_PENDING:
+        return Response(
+            {'detail': 'A request with this Idempotency-Key is still being processed'},
+            status=status.HTTP_409_CONFLICT
+        )
+    if record.request_fingerprint != fingerprint or record.user_id != (user.pk if user else None):
+        return Response(
+            {'detail': 'Idempotency-Key was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    logger.info('Replaying %s response for Idempotency-Key %s', record.scope, record.key)
+    return Response(record.response_body, status=record.status_code, headers={REPLAY_HEADER: 'true'})
+
+
+def idempotent(scope):
+    """
+    Decorate an APIView handler to honour the Idempotency-Key header.
+
+    Args:
+        scope: Name of the endpoint; a key is unique per scope
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.META.get('HTTP_IDEMPOTENCY_KEY', '').strip()
+            if not key:
+                return handler(view, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {'detail': f'Idempotency-Key longer than {MAX_KEY_LENGTH} characters'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            user = request.user if request.user.is_authenticated else None
+            fingerprint = request_fingerprint(request)
+            record, created = claim_key(scope, key, fingerprint, user)
+            if not created:
+                return _replay(record, fingerprint, user)
+
+            try:
+                response = handler(view, request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+            if response.status_code >= 500 or not hasattr(response, 'data'):
+                # Not replayable: let the client retry with the same key
+                record.delete()
+                return response
+            record.status = IdempotencyKey.STATUS_COMPLETE
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.save(update_fields=['status', 'status_code', 'response_body'])
+            return response
+        return wrapper
+    return decorator
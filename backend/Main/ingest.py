@@ -0,0 +1,1087 @@
+"""
+Per-file J1939 ingestion steps shared by the upload and re-analysis views.
+
+A file goes through three stages:
+
+    read_sheets()          bytes -> sheets (or PGN counts for raw CAN logs)
+    extract_vehicle_data() sheets -> vehicle name, brand, PGNs and SPNs
+    link_vehicle()         PGNs/SPNs -> PGN, SPN, VehiclePGN and VehicleSPN rows
+
+save_j1939_mapping() then stores the SPNs the J1939 standard defines for the
+vehicle's PGNs, so responses and views read the mapping instead of
+recomputing it.
+
+The content may be a bytes object or an mmap of a stored upload, so a
+re-analysis never copies the whole file into memory.
+"""
+
+import hashlib
+import io
+import logging
+import mmap
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .can_logs import CAN_LOG_FORMATS, analyze_can_log
+from .compression import save_compressed, mapped_stored_file
+from .definitions import current_definition_version
+from .definition_index import definition_index
+from .formats import sniff_format, encodings_for, SNIFF_BYTES, KIND_EXCEL, KIND_UNSUPPORTED, FORMAT_XLS
+from .layouts import (
+    header_signature, resolve_column_roles, scan_metadata_cells, read_metadata,
+    find_template, learn_template, mark_template_used
+)
+from .models import Vehicle, SPN, PGN, VehicleSPN, VehiclePGN, VehicleJ1939Mapping, CompressedFile
+
+# See views.py: pandas is optional, openpyxl/csv are the fallbacks
+pd = None
+try:
+    import pandas as pd  # type: ignore
+except Exception:
+    pd = None
+
+logger = logging.getLogger(__name__)
+
+# Slice size when streaming a buffer to the CAN log parsers, and when hashing
+CHUNK_BYTES = 1024 * 1024
+
+
+class MappedFile(io.RawIOBase):
+    """
+    Read-only file object over a bytes-like buffer such as an mmap.
+    pandas and openpyxl only accept real file objects, and wrapping the
+    buffer in BytesIO would copy it.
+    """
+
+    def __init__(self, buf):
+        self._buf = buf
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._buf[self._pos:self._pos + len(b)]
+        n = len(data)
+        b[:n] = data
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._buf)
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+def as_file(content):
+    """Return a fresh file object positioned at the start of the content."""
+    if isinstance(content, (bytes, bytearray)):
+        return io.BytesIO(content)
+    return io.BufferedReader(MappedFile(content))
+
+
+def iter_chunks(content, size=CHUNK_BYTES):
+    """Yield the content in byte slices of at most `size` bytes."""
+    for start in range(0, len(content), size):
+        yield content[start:start + size]
+
+
+# Column types pandas must not infer (see read_sheets)
+CSV_DTYPES = {'PGN(H)': str}
+
+
+def read_sheets(fname, content, detected, can_analysis=None):
+    """
+    Parse file content into sheets according to the sniffed format.
+
+    Args:
+        fname: Original file name, used for the sheet name and logging
+        content: File bytes or an mmap of the stored file
+        detected: Result of formats.sniff_format()
+        can_analysis: analyze_can_log() result for a raw CAN capture that was
+                      already analyzed while it was uploaded; content is
+                      then not read
+
+    Returns:
+        dict with 'df_dict' (sheet name -> DataFrame or column dict) and the
+        PGN(H) stats 'total_pgn_count', 'unique_pgn_count' and 'unique_pgn_list'
+    """
+    total_pgn_count = 0
+    unique_pgn_count = 0
+    unique_pgn_list = []
+    is_excel_file = detected['kind'] == KIND_EXCEL
+
+    if detected['format'] in CAN_LOG_FORMATS:
+        # Raw CAN capture: decode frames natively, there are no sheets
+        if can_analysis is None:
+            can_analysis = analyze_can_log(iter_chunks(content), detected['format'], detected['encoding'])
+        total_pgn_count = sum(can_analysis['counter'].values())
+        unique_pgn_count = len(can_analysis['counter'])
+        unique_pgn_list = sorted(can_analysis['counter'])
+        logger.info(f"{detected['label']} {fname}: {can_analysis['frames']} frames, Unique PGNs={unique_pgn_count}")
+        df_dict = {}
+    elif not is_excel_file:
+        # CSV/TXT/LOG: read as single-sheet structure with multi-encoding support
+
+        # Try multiple encodings for CSV files, starting with the sniffed one
+        encodings_to_try = encodings_for(detected, [
+            'utf-8', 'utf-8-sig', 'gb2312', 'gbk', 'gb18030',
+            'big5', 'utf-16', 'utf-16-le', 'latin1', 'cp1252', 'iso-8859-1'])
+
+        df = None
+        decoded_text = None
+        encoding_used = None
+
+        if pd is not None:
+            # Try pandas with multiple encodings. PGN(H) is always read as
+            # text: inferred per parse, a digit-only value such as 0100 would
+            # become the number 100 in an ingest job chunk without hex letters
+            for encoding in encodings_to_try:
+                try:
+                    df = pd.read_csv(as_file(content), encoding=encoding, dtype=CSV_DTYPES)
+                    encoding_used = encoding
+                    logger.info(f"CSV {fname} parsed successfully with encoding: {encoding}")
+                    break
+                except (UnicodeDecodeError, UnicodeError):
+                    continue
+                except Exception as enc_err:
+                    # Try next encoding
+                    continue
+
+            # Last resort: use latin1 which accepts any byte
+            if df is None:
+                try:
+                    df = pd.read_csv(as_file(content), encoding='latin1', on_bad_lines='skip', dtype=CSV_DTYPES)
+                    encoding_used = 'latin1-fallback'
+                    logger.info(f"CSV {fname} parsed with latin1 fallback")
+                except Exception as final_err:
+                    logger.error(f"All encoding attempts failed for {fname}: {final_err}")
+                    raise
+
+            # Calculate PGN counts using pandas (matching the exact Python logic)
+            # Filter for main message rows where Index is not NaN
+            total_pgn_count = 0
+            unique_pgn_count = 0
+            unique_pgn_list = []
+
+            if df is not None and 'Index' in df.columns and 'PGN(H)' in df.columns:
+                # Filter for rows where Index is not NaN (main message rows only)
+                message_df = df[df['Index'].notna()]
+                # Total: count of non-null PGN(H) values in filtered rows
+                total_pgn_count = int(message_df['PGN(H)'].count())
+                # Unique: count of distinct PGN(H) values
+                unique_pgn_count = int(message_df['PGN(H)'].nunique())
+                # Get list of unique PGN values
+                unique_pgn_list = message_df['PGN(H)'].dropna().unique().tolist()
+                unique_pgn_list = [str(x).upper() for x in unique_pgn_list if pd.notna(x)]
+                logger.info(f"PGN counts for {fname}: Total={total_pgn_count}, Unique={unique_pgn_count}")
+
+            df_dict = {os.path.splitext(fname)[0]: df}
+        else:
+            # Fallback CSV parser with multi-encoding support
+            for encoding in encodings_to_try:
+                try:
+                    decoded_text = bytes(content).decode(encoding)
+                    encoding_used = encoding
+                    break
+                except (UnicodeDecodeError, UnicodeError):
+                    continue
+
+            # Final fallback
+            if decoded_text is None:
+                decoded_text = bytes(content).decode('latin1', errors='replace')
+                encoding_used = 'latin1-fallback'
+
+            import csv as _csv
+            rows = list(_csv.reader(decoded_text.splitlines()))
+            if not rows:
+                df_dict = {os.path.splitext(fname)[0]: {}}
+            else:
+                headers = rows[0]
+                data_rows = rows[1:]
+                sheet_data = {}
+                for col_idx, header in enumerate(headers):
+                    sheet_data[header] = [r[col_idx] if col_idx < len(r) else None for r in data_rows]
+                df_dict = {os.path.splitext(fname)[0]: sheet_data}
+    else:
+        # Excel file (.xlsx, .xls)
+        if pd is not None:
+            # Use pandas for better Excel parsing
+            # Try openpyxl first for .xlsx, xlrd for .xls
+            try:
+                if detected['format'] == FORMAT_XLS:
+                    # Old .xls format - try xlrd engine
+                    try:
+                        df_dict = pd.read_excel(as_file(content), sheet_name=None, engine='xlrd')
+                    except Exception:
+                        # Fallback to openpyxl
+                        df_dict = pd.read_excel(as_file(content), sheet_name=None, engine='openpyxl')
+                else:
+                    # .xlsx format
+                    df_dict = pd.read_excel(as_file(content), sheet_name=None, engine='openpyxl')
+
+                logger.info(f"Excel {fname} parsed successfully")
+
+                # Calculate PGN counts for Excel files (same logic as CSV)
+                for sheet_name, sheet_df in df_dict.items():
+                    if sheet_df is not None and not sheet_df.empty:
+                        if 'Index' in sheet_df.columns and 'PGN(H)' in sheet_df.columns:
+                            # Filter for rows where Index is not NaN (main message rows only)
+                            message_df = sheet_df[sheet_df['Index'].notna()]
+                            # Total: count of non-null PGN(H) values in filtered rows
+                            total_pgn_count = int(message_df['PGN(H)'].count())
+                            # Unique: count of distinct PGN(H) values
+                            unique_pgn_count = int(message_df['PGN(H)'].nunique())
+                            # Get list of unique PGN values
+                            unique_pgn_list = message_df['PGN(H)'].dropna().unique().tolist()
+                            unique_pgn_list = [str(x).upper() for x in unique_pgn_list if pd.notna(x)]
+                            logger.info(f"PGN counts for {fname} (sheet: {sheet_name}): Total={total_pgn_count}, Unique={unique_pgn_count}")
+                            break  # Use first sheet with valid data
+
+            except Exception as excel_err:
+                logger.error(f"Excel parsing error for {fname}: {excel_err}")
+                raise
+        else:
+            # Fallback to openpyxl - convert to simple data structure
+            wb = load_workbook(filename=as_file(content), data_only=True)
+            df_dict = {}
+            for sheet_name in wb.sheetnames:
+                sheet = wb[sheet_name]
+                # Convert sheet to list of lists for processing
+                data = []
+                headers = None
+                for row_idx, row in enumerate(sheet.iter_rows(values_only=True)):
+                    if row_idx == 0:
+                        headers = [str(cell) if cell is not None else f'Col{i}' for i, cell in enumerate(row)]
+                    else:
+                        data.append(list(row))
+                # Create a simple dict-like structure for compatibility
+                if headers and data:
+                    # Store as dict with column names as keys
+                    sheet_data = {}
+                    for col_idx, header in enumerate(headers):
+                        sheet_data[header] = [row[col_idx] if col_idx < len(row) else None for row in data]
+                    df_dict[sheet_name] = sheet_data
+                else:
+                    df_dict[sheet_name] = {}
+
+    return {
+        'df_dict': df_dict,
+        'total_pgn_count': total_pgn_count,
+        'unique_pgn_count': unique_pgn_count,
+        'unique_pgn_list': unique_pgn_list,
+    }
+
+
+def extract_vehicle_data(fname, df_dict, detected, unique_pgn_list, explicit_template=None,
+                         current_pgn=None, read_vehicle_metadata=True):
+    """
+    Extract vehicle name, brand, PGNs and SPNs from parsed sheets.
+
+    Column layouts come from the explicit template, a cached template for
+    the header, or alias detection (see layouts.py).
+
+    Args:
+        current_pgn: PGN carried over from the previous chunk of the same
+                     sheet, for SPN rows that follow their PGN row
+        read_vehicle_metadata: False for later chunks of a file, whose top
+                               rows are not the sheet's top rows
+
+    Returns:
+        dict with 'vehicle_name', 'brand', 'pgns' (set of decimal PGNs),
+        'spns_data' ({(pgn, spn): description}), 'layouts_to_learn',
+        'templates_used' and 'current_pgn' (last PGN seen)
+    """
+    initial_pgn = current_pgn
+    # Extract vehicle information
+    vehicle_name = None
+    brand = None
+    # PGNs decoded from a raw CAN capture need no sheet extraction
+    pgns = {int(pgn_hex, 16) for pgn_hex in unique_pgn_list} if detected['format'] in CAN_LOG_FORMATS else set()
+    spns_data = {}  # {(pgn, spn): description}
+    layouts_to_learn = []  # (columns, roles, metadata cells) for new layouts
+    templates_used = []
+
+    # Try to extract from all sheets
+    for sheet_name, df in df_dict.items():
+        # Handle both pandas DataFrame and dict structure
+        if df is None:
+            continue
+
+        # Check if it's a pandas DataFrame
+        is_dataframe = pd is not None and isinstance(df, pd.DataFrame)
+        if is_dataframe and df.empty:
+            continue
+
+        # For dict structure, check if it's empty
+        if not is_dataframe and (not df or len(df) == 0):
+            continue
+
+        # Resolve the column layout: an explicit template from the client,
+        # a cached template for this header, or full alias detection
+        columns = list(df.columns) if is_dataframe else list(df.keys())
+        template = explicit_template or find_template(header_signature(columns))
+        if template is not None:
+            roles = template.roles_for(len(columns))
+            metadata_cells = template.metadata_cells
+            templates_used.append(template)
+        else:
+            roles = resolve_column_roles(columns)
+            # Search the first rows and columns for vehicle name and brand
+            metadata_cells = scan_metadata_cells(df, is_dataframe) if read_vehicle_metadata else {}
+            layouts_to_learn.append((columns, roles, metadata_cells))
+
+        # Extract vehicle name and brand
+        metadata = read_metadata(df, metadata_cells if read_vehicle_metadata else {}, is_dataframe)
+        if not vehicle_name:
+            vehicle_name = metadata['vehicle_name']
+        if not brand:
+            brand = metadata['brand']
+
+        # Extract PGNs and SPNs
+        # Priority: 'PGN(H)' column for hex PGN values, then other aliases
+        index_col_idx = roles.get('index')  # For Index column to identify main message rows
+        pgn_h_col_idx = roles.get('pgn_h')  # For PGN(H) hex column
+        pgn_col_idx = roles.get('pgn')
+        spn_col_idx = roles.get('spn')
+        desc_col_idx = roles.get('desc')
+
+        # The dict structure is accessed by column name
+        def _col_name(idx):
+            return columns[idx] if idx is not None and not is_dataframe else None
+        index_col_name = _col_name(index_col_idx)
+        pgn_h_col_name = _col_name(pgn_h_col_idx)
+        pgn_col_name = _col_name(pgn_col_idx)
+        spn_col_name = _col_name(spn_col_idx)
+        desc_col_name = _col_name(desc_col_idx)
+
+        # Lists to track PGN(H) values for counting
+        all_pgn_h_values = []  # All non-empty PGN(H) values (for total count)
+        unique_pgn_h_values = set()  # Unique PGN(H) values
+
+        # Extract data from rows
+        num_rows = len(df) if is_dataframe else max([len(v) for v in df.values()] if isinstance(df, dict) else [0])
+        current_pgn = initial_pgn  # Track current PGN for rows without explicit PGN
+
+        for row_idx in range(num_rows):
+            try:
+                pgn_value = None
+                pgn_h_value = None  # For PGN(H) hex value
+                spn_value = None
+                desc_value = ''
+
+                # Check if this is a main message row (Index column has value)
+                # In J1939 log files, only rows with Index value are main messages
+                # Detail rows (SPNs) have NaN in the Index column
+                is_main_message_row = True  # Default to True if no Index column
+
+                if is_dataframe and index_col_idx is not None:
+                    try:
+                        index_val = df.iloc[row_idx, index_col_idx]
+                        is_main_message_row = pd is not None and pd.notna(index_val)
+                    except:
+                        pass
+                elif not is_dataframe and index_col_name and index_col_name in df:
+                    try:
+                        index_val = df[index_col_name][row_idx] if row_idx < len(df[index_col_name]) else None
+                        is_main_message_row = index_val is not None and str(index_val).strip().lower() not in ['', 'nan', 'none', 'null']
+                    except:
+                        pass
+
+                # Get PGN(H) - hex PGN column (priority)
+                # Only count for PGN stats if this is a main message row
+                if is_dataframe:
+                    if pgn_h_col_idx is not None:
+                        try:
+                            pgn_h_val = df.iloc[row_idx, pgn_h_col_idx]
+                            if pd is not None and pd.notna(pgn_h_val):
+                                pgn_h_str = str(pgn_h_val).strip().upper()
+                                if pgn_h_str and pgn_h_str.lower() not in ['', 'nan', 'none', 'null', 'n/a', 'pgn(h)', 'pgn']:
+                                    # Only count PGN for stats if this is a main message row
+                                    if is_main_message_row:
+                                        all_pgn_h_values.append(pgn_h_str)
+                                        unique_pgn_h_values.add(pgn_h_str)
+                                    # Also convert to decimal for PGN set
+                                    try:
+                                        pgn_dec = int(pgn_h_str, 16)
+                                        if is_main_message_row:
+                                            pgns.add(pgn_dec)
+                                        current_pgn = pgn_dec
+                                        pgn_value = pgn_dec
+                                    except ValueError:
+                                        pass
+                        except:
+                            pass
+                else:
+                    if pgn_h_col_name and pgn_h_col_name in df:
+                        try:
+                            pgn_h_val = df[pgn_h_col_name][row_idx] if row_idx < len(df[pgn_h_col_name]) else None
+                            if pgn_h_val is not None:
+                                pgn_h_str = str(pgn_h_val).strip().upper()
+                                if pgn_h_str and pgn_h_str.lower() not in ['', 'nan', 'none', 'null', 'n/a', 'pgn(h)', 'pgn']:
+                                    if is_main_message_row:
+                                        all_pgn_h_values.append(pgn_h_str)
+                                        unique_pgn_h_values.add(pgn_h_str)
+                                    try:
+                                        pgn_dec = int(pgn_h_str, 16)
+                                        if is_main_message_row:
+                                            pgns.add(pgn_dec)
+                                        current_pgn = pgn_dec
+                                        pgn_value = pgn_dec
+                                    except ValueError:
+                                        pass
+                        except:
+                            pass
+
+                # Get PGN (decimal column, fallback if no PGN(H))
+                if pgn_value is None:
+                    if is_dataframe:
+                        if pgn_col_idx is not None:
+                            try:
+                                pgn_val = df.iloc[row_idx, pgn_col_idx]
+                                if pd is not None and pd.notna(pgn_val):
+                                    pgn_value = int(float(str(pgn_val)))
+                                    if 100 <= pgn_value <= 999999:
+                                        if is_main_message_row:
+                                            pgns.add(pgn_value)
+                                        current_pgn = pgn_value
+                                elif pgn_val is not None:
+                                    pgn_value = int(float(str(pgn_val)))
+                                    if 100 <= pgn_value <= 999999:
+                                        if is_main_message_row:
+                                            pgns.add(pgn_value)
+                                        current_pgn = pgn_value
+                            except:
+                                pass
+                    else:
+                        if pgn_col_name and pgn_col_name in df:
+                            try:
+                                pgn_val = df[pgn_col_name][row_idx] if row_idx < len(df[pgn_col_name]) else None
+                                if pgn_val is not None:
+                                    pgn_value = int(float(str(pgn_val)))
+                                    if 100 <= pgn_value <= 999999:
+                                        if is_main_message_row:
+                                            pgns.add(pgn_value)
+                                        current_pgn = pgn_value
+                            except:
+                                pass
+
+                # Get SPN
+                if is_dataframe:
+                    if spn_col_idx is not None:
+                        try:
+                            spn_val = df.iloc[row_idx, spn_col_idx]
+                            if pd is not None and pd.notna(spn_val):
+                                spn_value = int(float(str(spn_val)))
+                            elif spn_val is not None:
+                                spn_value = int(float(str(spn_val)))
+                        except:
+                            pass
+                else:
+                    if spn_col_name and spn_col_name in df:
+                        try:
+                            spn_val = df[spn_col_name][row_idx] if row_idx < len(df[spn_col_name]) else None
+                            if spn_val is not None:
+                                spn_value = int(float(str(spn_val)))
+                        except:
+                            pass
+
+                # Get description
+                if is_dataframe:
+                    if desc_col_idx is not None:
+                        try:
+                            desc_val = df.iloc[row_idx, desc_col_idx]
+                            if pd is not None and pd.notna(desc_val):
+                                desc_value = str(desc_val).strip()
+                            elif desc_val is not None:
+                                desc_value = str(desc_val).strip()
+                        except:
+                            pass
+                else:
+                    if desc_col_name and desc_col_name in df:
+                        try:
+                            desc_val = df[desc_col_name][row_idx] if row_idx < len(df[desc_col_name]) else None
+                            if desc_val is not None:
+                                desc_value = str(desc_val).strip()
+                        except:
+                            pass
+
+                # Store SPN with PGN relationship
+                if spn_value is not None:
+                    # Use PGN from current row, or fallback to last seen PGN
+                    final_pgn = pgn_value if pgn_value else current_pgn
+
+                    if final_pgn:
+                        spns_data[(final_pgn, spn_value)] = desc_value
+                    else:
+                        # Store without PGN if not found
+                        spns_data[(None, spn_value)] = desc_value
+
+            except Exception as row_exc:
+                logger.debug('Error processing row %d: %s', row_idx, str(row_exc))
+                continue
+
+    # Fallback: extract from filename if vehicle name not found
+    if not vehicle_name:
+        # Try to extract from filename (remove extension)
+        vehicle_name = os.path.splitext(fname)[0].strip()
+        if not vehicle_name or vehicle_name == '<unknown>':
+            vehicle_name = 'Unknown'
+
+    # Default brand if not found
+    if not brand:
+        brand = ''
+
+    return {
+        'vehicle_name': vehicle_name,
+        'brand': brand,
+        'pgns': pgns,
+        'spns_data': spns_data,
+        'layouts_to_learn': layouts_to_learn,
+        'templates_used': templates_used,
+        'current_pgn': current_pgn,
+    }
+
+
+def remember_layouts(layouts_to_learn, templates_used):
+    """
+    Store new layouts and count template hits once a parse has succeeded.
+
+    Returns:
+        sorted list of the template ids involved
+    """
+    learned = [learn_template(*layout) for layout in layouts_to_learn]
+    for template in templates_used:
+        mark_template_used(template)
+    return sorted({t.id for t in templates_used + learned if t is not None})
+
+
+def link_vehicle(vehicle, pgns, spns_data):
+    """
+    Create PGN/SPN records and link them to the vehicle.
+
+    Returns:
+        tuple (vehicle_pgns, vehicle_spns) for the response
+    """
+    # Create PGN records and associations
+    vehicle_pgns = []
+    for pgn_num in sorted(pgns):
+        pgn_obj, _ = PGN.objects.get_or_create(pgn_number=int(pgn_num))
+        VehiclePGN.objects.get_or_create(vehicle=vehicle, pgn=pgn_obj)
+        vehicle_pgns.append(pgn_num)
+
+    # Create SPN records and associations with PGN relationships
+    vehicle_spns = []
+    for (pgn_num, spn_num), description in spns_data.items():
+        try:
+            pgn_obj = None
+            if pgn_num:
+                pgn_obj, _ = PGN.objects.get_or_create(pgn_number=int(pgn_num))
+
+            spn_obj, _ = SPN.objects.get_or_create(
+                spn_number=int(spn_num),
+                defaults={'description': description or ''}
+            )
+            # Update description if it was empty
+            if description and not spn_obj.description:
+                spn_obj.description = description
+                spn_obj.save()
+
+            vspn, created = VehicleSPN.objects.get_or_create(
+                vehicle=vehicle,
+                spn=spn_obj,
+                defaults={'pgn': pgn_obj}
+            )
+            if not created and pgn_obj and vspn.pgn != pgn_obj:
+                vspn.pgn = pgn_obj
+            if description:
+                vspn.value = description
+                vspn.supported = True
+            if pgn_obj and not vspn.pgn:
+                vspn.pgn = pgn_obj
+            vspn.save()
+
+            # Store for response (use PGN if available, otherwise None)
+            vehicle_spns.append({
+                'pgn': pgn_num if pgn_num else None,
+                'spn': spn_num,
+                'description': description or spn_obj.description or ''
+            })
+        except Exception as spn_exc:
+            logger.error('Error creating SPN %d: %s', spn_num, str(spn_exc))
+            continue
+
+    return vehicle_pgns, vehicle_spns
+
+
+def store_upload(fname, fileobj, when, compress=None):
+    """
+    Save an uploaded file under j1939_uploads/<Y>/<M>/<D>/ for auditing.
+    Text logs are compressed at rest (see Main/compression.py) unless
+    compress is False; compress defaults to J1939_COMPRESS_UPLOADS.
+
+    Returns:
+        the storage path, or None when saving failed (processing continues)
+    """
+    if compress is None:
+        compress = settings.J1939_COMPRESS_UPLOADS
+    try:
+        file_path = f'j1939_uploads/{when.year}/{when.month:02d}/{when.day:02d}/{fname}'
+        if compress:
+            saved_path = save_compressed(file_path, fileobj)
+        else:
+            saved_path = default_storage.save(file_path, fileobj)
+        logger.info('Saved Excel file for auditing: %s', saved_path)
+        return saved_path
+    except Exception as save_exc:
+        logger.warning('Failed to save Excel file for auditing: %s', str(save_exc))
+        return None
+
+
+def persist_vehicle(fname, parsed, excel_file_path, uploaded_by=None, content_hash='', summary=None):
+    """
+    Create the Vehicle for a parsed file with its PGN/SPN links and record
+    the column layouts it used.
+
+    Args:
+        summary: upload_summary() of the file, kept so a duplicate upload
+                 can be answered without parsing it (see duplicate_vehicle)
+
+    Returns:
+        tuple (vehicle, template_ids, vehicle_pgns, vehicle_spns)
+    """
+    # Remember new layouts and count template hits now that the parse succeeded
+    template_ids = remember_layouts(parsed['layouts_to_learn'], parsed['templates_used'])
+
+    vehicle = Vehicle.objects.create(
+        name=str(parsed['vehicle_name']),
+        brand=str(parsed['brand']),
+        uploaded_by=uploaded_by,
+        source_file=fname,
+        excel_file=excel_file_path if excel_file_path else None,
+        content_hash=content_hash,
+        upload_summary=dict(summary, template_ids=template_ids) if summary is not None else {},
+        definition_version=current_definition_version()
+    )
+
+    vehicle_pgns, vehicle_spns = link_vehicle(vehicle, parsed['pgns'], parsed['spns_data'])
+    save_j1939_mapping(vehicle, vehicle_pgns, vehicle.definition_version)
+    return vehicle, template_ids, vehicle_pgns, vehicle_spns
+
+
+def sheet_rows(df):
+    """Number of data rows in a parsed sheet (DataFrame or column dict)."""
+    if df is None:
+        return 0
+    if pd is not None and isinstance(df, pd.DataFrame):
+        return len(df)
+    return max([len(v) for v in df.values()] or [0])
+
+
+def upload_sha256(uploaded_file):
+    """SHA-256 hex digest of an uploaded file, read in chunks."""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file on disk, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_path(path, skip_hashes=()):
+    """
+    Parse a file on disk up to (but not including) persistence.
+
+    Safe to run in a worker process: the only database access is the
+    read-only column template lookup. The file is memory-mapped.
+
+    Args:
+        path: File to parse
+        skip_hashes: Content hashes already ingested; matching files are
+                     not parsed
+
+    Returns:
+        dict with 'path', 'fname', 'content_hash', 'size', 'status'
+        ('parsed', 'skipped' or 'error') and, when parsed, 'detected',
+        'rows' and 'parsed' (see extract_vehicle_data); 'error' on failure
+    """
+    fname = os.path.basename(path)
+    result = {'path': path, 'fname': fname, 'content_hash': '', 'size': 0, 'status': 'error'}
+    try:
+        result['size'] = os.path.getsize(path)
+        result['content_hash'] = file_sha256(path)
+        if result['content_hash'] in skip_hashes:
+            result['status'] = 'skipped'
+            return result
+
+        with open(path, 'rb') as fh:
+            content = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if result['size'] else b''
+            try:
+                detected = sniff_format(content[:SNIFF_BYTES], fname)
+                if detected['kind'] == KIND_UNSUPPORTED:
+                    result['error'] = f"Unsupported file format: {detected['label']}"
+                    return result
+                sheets = read_sheets(fname, content, detected)
+            finally:
+                if isinstance(content, mmap.mmap):
+                    content.close()
+
+        parsed = extract_vehicle_data(fname, sheets['df_dict'], detected, sheets['unique_pgn_list'])
+        rows = sum(sheet_rows(df) for df in sheets['df_dict'].values())
+        result.update({
+            'status': 'parsed',
+            'detected': detected,
+            'rows': rows or sheets['total_pgn_count'],
+            'parsed': parsed,
+        })
+    except Exception as exc:
+        result['error'] = f'Failed to parse file: {str(exc)}'
+    return result
+
+
+class BatchWriter:
+    """
+    Persist parse_path() results from a single process, one transaction per
+    batch. When a batch fails it is retried one file at a time so a single
+    bad file does not hold back the others.
+
+    Each file is stored once, before the batch transaction: a rollback
+    cannot undo files on disk, so the stored path is kept on the result and
+    reused by the retry, and the file is deleted when its result fails.
+    """
+
+    def __init__(self, batch_size=50):
+        self.batch_size = max(1, batch_size)
+        self.pending = []
+
+    def add(self, result):
+        """
+        Queue a parsed result.
+
+        Returns:
+            tuple (written, failed) as from flush() when the batch filled up,
+            otherwise two empty lists
+        """
+        self.pending.append(result)
+        if len(self.pending) >= self.batch_size:
+            return self.flush()
+        return [], []
+
+    def flush(self):
+        """
+        Write all queued results.
+
+        Returns:
+            tuple (written, failed); failed results carry an 'error' message
+        """
+        batch, self.pending = self.pending, []
+        if not batch:
+            return [], []
+        for result in batch:
+            self._store(result)
+        try:
+            with transaction.atomic():
+                for result in batch:
+                    self._persist(result)
+            return batch, []
+        except Exception as exc:
+            logger.warning('Batch write of %d files failed (%s), retrying one by one', len(batch), str(exc))
+
+        written, failed = [], []
+        for result in batch:
+            try:
+                with transaction.atomic():
+                    self._persist(result)
+                written.append(result)
+            except Exception as exc:
+                result['error'] = f'Error processing file: {str(exc)}'
+                self._discard(result)
+                failed.append(result)
+        return written, failed
+
+    def _store(self, result):
+        if 'stored_path' not in result:
+            fname = result['fname']
+            with open(result['path'], 'rb') as fh:
+                result['stored_path'] = store_upload(fname, File(fh, name=fname), timezone.now().date())
+
+    def _discard(self, result):
+        stored_path = result.pop('stored_path', None)
+        if stored_path:
+            try:
+                with transaction.atomic():
+                    CompressedFile.objects.filter(name=stored_path).delete()
+                    default_storage.delete(stored_path)
+            except Exception as exc:
+                logger.warning('Could not remove %s: %s', stored_path, str(exc))
+
+    def _persist(self, result):
+        result['vehicle'], _, _, _ = persist_vehicle(
+            result['fname'], result['parsed'], result['stored_path'], content_hash=result['content_hash']
+        )
+
+
+def spn_detail(pgn_num, spn_def):
+    """j1939_spn_details entry for a definition (see map_j1939_spns)."""
+    return {
+        'pgn': pgn_num,
+        'pgn_hex': spn_def['PGN_HEX'],
+        'spn': spn_def['SPN_Number'],
+        'description': spn_def['SPN_Description'],
+        'unit': spn_def['Unit'],
+        'resolution': float(spn_def['Resolution']) if spn_def['Resolution'] else None,
+        'offset': float(spn_def['Offset']) if spn_def['Offset'] else 0,
+        'start_byte': spn_def['Start_Byte'],
+        'start_bit': spn_def['Start_Bit'],
+        'bit_length': spn_def['Bit_Length'],
+        'data_length_bytes': spn_def['Data_Length_Bytes']
+    }
+
+
+def map_j1939_spns(vehicle_pgns, version_id=None):
+    """
+    Map the vehicle PGNs to the SPNs defined in J1939ParameterDefinition.
+
+    Args:
+        vehicle_pgns: PGN numbers
+        version_id: DefinitionVersion to map against (default: the current one)
+
+    Returns:
+        tuple (set of SPN numbers, list of SPN detail dicts)
+    """
+    # Map PGNs to SPNs from the versioned definition index (J1939 Standard)
+    index = definition_index(version_id or current_definition_version().id)
+    j1939_mapped_spns = set()
+    j1939_spn_details = []
+
+    matching_pgns = {pgn_num for pgn_num in set(vehicle_pgns) if index.has_pgn(pgn_num)}
+    logger.info('SPN Mapping: %d vehicle PGNs, %d in DB, %d matching',
+                len(vehicle_pgns), index.pgn_count(), len(matching_pgns))
+
+    for pgn_num in vehicle_pgns:
+        if pgn_num not in matching_pgns:
+            continue
+        # All SPNs defined for this PGN in the J1939 standard
+        for spn_def in index.definitions_for_pgn(pgn_num):
+            j1939_mapped_spns.add(spn_def['SPN_Number'])
+            j1939_spn_details.append(spn_detail(pgn_num, spn_def))
+
+    logger.info('SPN Mapping Result: %d unique SPNs found from %d matching PGNs',
+                len(j1939_mapped_spns), len(matching_pgns))
+
+    return j1939_mapped_spns, j1939_spn_details
+
+
+def save_j1939_mapping(vehicle, vehicle_pgns, version=None):
+    """
+    Map a vehicle's PGNs and store the result, tagged with the version.
+
+    The vehicle's definition_version is moved to the same version.
+
+    Args:
+        vehicle: The Vehicle
+        vehicle_pgns: Its PGN numbers, in the order the details are listed
+        version: DefinitionVersion (default: the vehicle's, else the current one)
+
+    Returns:
+        the VehicleJ1939Mapping
+    """
+    if version is None:
+        version = vehicle.definition_version if vehicle.definition_version_id else current_definition_version()
+    spns, details = map_j1939_spns(vehicle_pgns, version.id)
+    mapping, _ = VehicleJ1939Mapping.objects.update_or_create(
+        vehicle=vehicle,
+        defaults={
+            'definition_version': version,
+            'pgn_count': len({detail['pgn'] for detail in details}),
+            'spns': [detail['spn'] for detail in details],
+        }
+    )
+    if vehicle.definition_version_id != version.id:
+        vehicle.definition_version = version
+        vehicle.save(update_fields=['definition_version'])
+    return mapping
+
+
+def j1939_mapping_details(mapping):
+    """j1939_spn_details of a stored mapping, read from its definition index."""
+    index = definition_index(mapping.definition_version_id)
+    details = []
+    for spn_num in mapping.spns:
+        spn_def = index.definition(spn_num)
+        if spn_def is not None:
+            details.append(spn_detail(spn_def['PGN_DEC'], spn_def))
+    return details
+
+
+def vehicle_j1939_mapping(vehicle, vehicle_pgns=None):
+    """
+    The stored mapping of a vehicle, computed and saved first for vehicles
+    ingested before mappings were stored.
+
+    Args:
+        vehicle_pgns: The vehicle's PGNs when the caller has them (default:
+                      read from its VehiclePGN links)
+    """
+    try:
+        return vehicle.j1939_mapping
+    except VehicleJ1939Mapping.DoesNotExist:
+        pass
+    if vehicle_pgns is None:
+        vehicle_pgns = list(VehiclePGN.objects.filter(vehicle=vehicle).order_by(
+            'pgn__pgn_number').values_list('pgn__pgn_number', flat=True))
+    return save_j1939_mapping(vehicle, vehicle_pgns)
+
+
+def vehicle_result(vehicle, detected, sheets, template_ids, template_source, vehicle_pgns, vehicle_spns):
+    """Build the per-vehicle response dict returned by the upload views."""
+    mapping = vehicle_j1939_mapping(vehicle, vehicle_pgns)
+    j1939_spn_details = j1939_mapping_details(mapping)
+    j1939_mapped_spns = set(mapping.spns)
+    return {
+        'id': vehicle.id,
+        'definition_version': mapping.definition_version_id,
+        'name': vehicle.name,
+        'brand': vehicle.brand,
+        'source_file': vehicle.source_file,
+        'detected_format': detected['format'],
+        'template_ids': template_ids,
+        'template_source': template_source,
+        'pgns': vehicle_pgns,
+        'spns': vehicle_spns,
+        'pgn_count': len(vehicle_pgns),
+        'spn_count': len(vehicle_spns),
+        # PGN(H) column stats - calculated from pandas filtering by Index column
+        'total_pgn_messages': sheets['total_pgn_count'],
+        'unique_pgn_count': sheets['unique_pgn_count'],
+        'unique_pgn_list': sheets['unique_pgn_list'],
+        # J1939 Standard SPN mapping (based on PGNs in file)
+        'j1939_unique_spn_count': len(j1939_mapped_spns),
+        'j1939_spn_list': sorted(list(j1939_mapped_spns)),
+        'j1939_spn_details': j1939_spn_details
+    }
+
+
+def upload_summary(detected, sheets, template_source):
+    """
+    Part of vehicle_result() that is not stored in the link tables. The
+    template ids are added by persist_vehicle() once layouts are learned.
+    """
+    return {
+        'detected_format': detected['format'],
+        'template_source': template_source,
+        'total_pgn_count': sheets['total_pgn_count'],
+        'unique_pgn_count': sheets['unique_pgn_count'],
+        'unique_pgn_list': list(sheets['unique_pgn_list']),
+    }
+
+
+def duplicate_vehicle(content_hash):
+    """Most recent vehicle created from a file with this SHA-256, or None."""
+    if not content_hash:
+        return None
+    return Vehicle.objects.filter(content_hash=content_hash).order_by('-upload_date', '-id').first()
+
+
+def existing_vehicle_result(vehicle, detected):
+    """
+    vehicle_result() for a vehicle that already exists, built from its links
+    and upload_summary instead of parsing the file again. Vehicles created
+    before summaries were kept report their linked PGNs as the unique list.
+    """
+    summary = vehicle.upload_summary or {}
+    vehicle_pgns = sorted(VehiclePGN.objects.filter(vehicle=vehicle).values_list('pgn__pgn_number', flat=True))
+    vehicle_spns = [
+        {'pgn': pgn, 'spn': spn, 'description': value or description or ''}
+        for pgn, spn, value, description in VehicleSPN.objects.filter(vehicle=vehicle).order_by('id').values_list(
+            'pgn__pgn_number', 'spn__spn_number', 'value', 'spn__description')
+    ]
+    unique_pgn_list = summary.get('unique_pgn_list', vehicle_pgns)
+    sheets = {
+        'total_pgn_count': summary.get('total_pgn_count', 0),
+        'unique_pgn_count': summary.get('unique_pgn_count', len(unique_pgn_list)),
+        'unique_pgn_list': unique_pgn_list,
+    }
+    detected = dict(detected, format=summary.get('detected_format', detected['format']))
+    result = vehicle_result(
+        vehicle, detected, sheets, summary.get('template_ids', []), summary.get('template_source', 'detected'),
+        vehicle_pgns, vehicle_spns
+    )
+    result['duplicate_of'] = vehicle.id
+    return result
+
+
+def reanalyze_vehicle(vehicle):
+    """
+    Re-run extraction on a vehicle's stored upload and update its PGN/SPN
+    links in place.
+
+    The stored file is memory-mapped rather than read, so large uploads are
+    paged in by the OS as the parsers walk them (a compressed upload is
+    decompressed to a temp file first, see compression.mapped_stored_file).
+    Vehicle name and brand are left untouched; links that the new parse no
+    longer produces are removed.
+
+    Raises:
+        FileNotFoundError: the vehicle has no stored upload on disk
+        ValueError: the stored file cannot be parsed
+    """
+    if not vehicle.excel_file:
+        raise FileNotFoundError(f'Vehicle {vehicle.id} has no stored upload')
+    name = vehicle.excel_file.name
+    fname = vehicle.source_file or os.path.basename(name)
+
+    with mapped_stored_file(name) as content:
+        detected = sniff_format(content[:SNIFF_BYTES], fname)
+        if detected['kind'] == KIND_UNSUPPORTED:
+            raise ValueError(f"Unsupported file format: {detected['label']}")
+        try:
+            sheets = read_sheets(fname, content, detected)
+            parsed = extract_vehicle_data(fname, sheets['df_dict'], detected, sheets['unique_pgn_list'])
+        except Exception as exc:
+            raise ValueError(f'Failed to parse file: {str(exc)}') from exc
+
+    spn_numbers = {int(spn_num) for (_, spn_num) in parsed['spns_data']}
+    with transaction.atomic():
+        removed_pgns, _ = VehiclePGN.objects.filter(vehicle=vehicle).exclude(
+            pgn__pgn_number__in=parsed['pgns']).delete()
+        removed_spns, _ = VehicleSPN.objects.filter(vehicle=vehicle).exclude(
+            spn__spn_number__in=spn_numbers).delete()
+        template_ids = remember_layouts(parsed['layouts_to_learn'], parsed['templates_used'])
+        vehicle_pgns, vehicle_spns = link_vehicle(vehicle, parsed['pgns'], parsed['spns_data'])
+        template_source = 'cached' if parsed['templates_used'] else 'detected'
+        vehicle.upload_summary = dict(upload_summary(detected, sheets, template_source), template_ids=template_ids)
+        vehicle.save(update_fields=['upload_summary'])
+        # Re-mapped against the current definitions
+        save_j1939_mapping(vehicle, vehicle_pgns, current_definition_version())
+
+    logger.info('Re-analyzed vehicle %s from %s: %d PGNs, %d SPNs (%d/%d stale links removed)',
+                vehicle.id, fname, len(vehicle_pgns), len(vehicle_spns), removed_pgns, removed_spns)
+
+    result = vehicle_result(vehicle, detected, sheets, template_ids, template_source, vehicle_pgns, vehicle_spns)
+    result['removed_pgn_links'] = removed_pgns
+    result['removed_spn_links'] = removed_spns
+    return result
@@ -0,0 +1,270 @@
+"""
+Compiled, memory-mapped form of the J1939 PGN→SPN map.
+
+Main/j1939_map.json is convenient to edit, but loading it builds a nested
+dict with string keys in every worker. `manage.py compile_j1939_map`
+compiles it into Main/j1939_map.bin, which workers mmap read-only: the pages
+come from the OS page cache and are shared by every process, nothing is
+parsed at start-up, and lookups take an integer PGN.
+
+Layout (little-endian):
+
+    header    8s magic, H format version, H reserved,
+              I pgn count, I spn count, I string pool size
+    pgns      pgn count x I, sorted ascending (binary searched)
+    records   pgn count x (I name offset, I name length,
+                           I first spn index, I spn count)
+    spns      spn count x (I spn number, I name offset, I name length)
+    strings   UTF-8 pool the offsets point into
+
+Source shape, as before:
+
+    {
+      "61444": {"pgn_name": "...", "spns": [{"spn": 190, "name": "Engine Speed"}, ...]},
+      "F004": {...}
+    }
+
+Keys made of digits are decimal PGNs; keys with a 0x prefix or A-F digits
+are hex. When both forms name the same PGN the hex entry wins, as it did in
+the old string lookup.
+"""
+
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'J1939MAP'
+FORMAT_VERSION = 1
+
+SOURCE_PATH = os.path.join(os.path.dirname(__file__), 'j1939_map.json')
+COMPILED_PATH = os.path.join(os.path.dirname(__file__), 'j1939_map.bin')
+
+_HEADER = struct.Struct('<8sHHIII')
+_PGN = struct.Struct('<I')
+_RECORD = struct.Struct('<IIII')
+_SPN = struct.Struct('<III')
+
+_DECIMAL_RE = re.compile(r'^\d+$')
+
+
+def parse_pgn_key(key):
+    """
+    Integer PGN for a map key.
+
+    Returns:
+        tuple (pgn, is_hex)
+
+    Raises:
+        ValueError: the key is not a PGN
+    """
+    key = str(key).strip()
+    if _DECIMAL_RE.match(key):
+        return int(key), False
+    return int(key[2:] if key.lower().startswith('0x') else key, 16), True
+
+
+def compile_map(source):
+    """
+    Compile a PGN→SPN map to the binary format.
+
+    Args:
+        source: The map as loaded from j1939_map.json
+
+    Returns:
+        tuple (bytes, skipped keys)
+    """
+    entries = {}
+    skipped = []
+    for key, entry in source.items():
+        try:
+            pgn, is_hex = parse_pgn_key(key)
+        except ValueError:
+            skipped.append(key)
+            continue
+        if pgn in entries and not is_hex:
+            continue
+        entries[pgn] = entry
+
+    strings = bytearray()
+
+    def add_string(value):
+        data = str(value or '').encode('utf-8')
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    pgns = sorted(entries)
+    records = []
+    spns = []
+    for pgn in pgns:
+        entry = entries[pgn]
+        first = len(spns)
+        for spn in entry.get('spns', []):
+            number = spn.get('spn')
+            if number in (None, 0):
+                continue
+            spns.append((int(number),) + add_string(spn.get('name', f'SPN_{number}')))
+        records.append(add_string(entry.get('pgn_name', '')) + (first, len(spns) - first))
+
+    parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(pgns), len(spns), len(strings))]
+    parts.extend(_PGN.pack(pgn) for pgn in pgns)
+    parts.extend(_RECORD.pack(*record) for record in records)
+    parts.extend(_SPN.pack(*spn) for spn in spns)
+    parts.append(bytes(strings))
+    return b''.join(parts), skipped
+
+
+def compile_map_file(source_path=SOURCE_PATH, output_path=COMPILED_PATH):
+    """
+    Compile a JSON map file, replacing output_path atomically.
+
+    Returns:
+        dict with 'pgns', 'spns', 'bytes' and 'skipped' (keys that are not PGNs)
+    """
+    with open(source_path, 'r', encoding='utf-8') as fh:
+        data, skipped = compile_map(json.load(fh))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(output_path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    _, _, _, pgn_count, spn_count, _ = _HEADER.unpack_from(data)
+    logger.info('Compiled %s: %d PGNs, %d SPNs, %d bytes', output_path, pgn_count, spn_count, len(data))
+    return {'pgns': pgn_count, 'spns': spn_count, 'bytes': len(data), 'skipped': skipped}
+
+
+class J1939Map:
+    """
+    Read-only view of a compiled map.
+
+    Args:
+        buffer: The compiled bytes, or an mmap of a compiled file
+
+    Raises:
+        ValueError: buffer is not a compiled map of this format version
+    """
+
+    def __init__(self, buffer):
+        if len(buffer) < _HEADER.size:
+            raise ValueError('compiled J1939 map is truncated')
+        magic, version, _, self.pgn_count, self.spn_count, strings_size = _HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('not a compiled J1939 map (version %d)' % FORMAT_VERSION)
+        self._buffer = buffer
+        self._pgns_at = _HEADER.size
+        self._records_at = self._pgns_at + self.pgn_count * _PGN.size
+        self._spns_at = self._records_at + self.pgn_count * _RECORD.size
+        self._strings_at = self._spns_at + self.spn_count * _SPN.size
+        if len(buffer) < self._strings_at + strings_size:
+            raise ValueError('compiled J1939 map is truncated')
+
+    def __len__(self):
+        return self.pgn_count
+
+    def __contains__(self, pgn):
+        return self._find(pgn) is not None
+
+    def _string(self, offset, length):
+        start = self._strings_at + offset
+        return bytes(self._buffer[start:start + length]).decode('utf-8')
+
+    def _find(self, pgn):
+        lo, hi = 0, self.pgn_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = _PGN.unpack_from(self._buffer, self._pgns_at + mid * _PGN.size)[0]
+            if value < pgn:
+                lo = mid + 1
+            elif value > pgn:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def lookup(self, pgn):
+        """
+        Name and SPNs of a PGN.
+
+        Args:
+            pgn: Integer PGN
+
+        Returns:
+            tuple (pgn_name, [(spn, name), ...]), or None if the PGN is not mapped
+        """
+        index = self._find(pgn)
+        if index is None:
+            return None
+        name_offset, name_length, first, count = _RECORD.unpack_from(
+            self._buffer, self._records_at + index * _RECORD.size
+        )
+        spns = []
+        for position in range(self._spns_at + first * _SPN.size, self._spns_at + (first + count) * _SPN.size, _SPN.size):
+            spn, offset, length = _SPN.unpack_from(self._buffer, position)
+            spns.append((spn, self._string(offset, length)))
+        return self._string(name_offset, name_length), spns
+
+    def pgns(self):
+        """All mapped PGNs, ascending."""
+        return [
+            _PGN.unpack_from(self._buffer, self._pgns_at + index * _PGN.size)[0]
+            for index in range(self.pgn_count)
+        ]
+
+
+def open_map(path=COMPILED_PATH):
+    """
+    mmap a compiled map file.
+
+    Returns:
+        J1939Map, or None when the file is missing or empty
+
+    Raises:
+        ValueError: the file is not a compiled map
+    """
+    try:
+        with open(path, 'rb') as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                return None
+            # The mapping stays valid after the file is closed
+            return J1939Map(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+    except FileNotFoundError:
+        return None
+
+
+def _is_stale(source_path, compiled_path):
+    if not os.path.exists(source_path):
+        return False
+    return not os.path.exists(compiled_path) or os.path.getmtime(compiled_path) < os.path.getmtime(source_path)
+
+
+def load_map(source_path=SOURCE_PATH, compiled_path=COMPILED_PATH):
+    """
+    The compiled map, compiling the JSON source first if it is newer.
+
+    Deployments should run `manage.py compile_j1939_map` at build time; the
+    compile here only keeps a development checkout working after the JSON
+    is edited.
+
+    Returns:
+        J1939Map, or None when there is no map
+    """
+    if _is_stale(source_path, compiled_path):
+        logger.warning('%s is missing or older than %s; compiling it now', compiled_path, source_path)
+        try:
+            compile_map_file(source_path, compiled_path)
+        except (OSError, ValueError) as exc:
+            logger.error('Could not compile %s: %s', source_path, exc)
+    try:
+        return open_map(compiled_path)
+    except ValueError as exc:
+        logger.error('Ignoring %s: %s', compiled_path, exc)
+        return None
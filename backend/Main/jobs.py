@@ -0,0 +1,444 @@
+"""
+Checkpointed ingestion of large uploads.
+
+A large file is stored first and ingested by an IngestJob in line-aligned
+chunks of job.chunk_bytes. After each chunk the byte offset, row count and
+partial aggregates (PGNs, SPNs, PGN(H) stats, vehicle metadata) are
+committed with the job, so a job interrupted by a crash resumes from its
+last checkpoint. The Vehicle and its PGN/SPN links are only created at the
+end, in the same transaction that marks the job done, so an interrupted
+job never leaves a half-created vehicle behind.
+
+Chunk boundaries depend only on the file and job.chunk_bytes, so a resumed
+job ends in exactly the state of an uninterrupted one.
+
+Text formats are chunked when their encoding can be split on newline bytes
+(see log_analysis.can_split_by_bytes); every chunk is parsed with the
+file's header lines in front of it. Workbooks are ingested in one chunk.
+
+Jobs never run inside the request that created them: schedule_ingest_job()
+starts them in a background thread (J1939_INGEST_IN_BACKGROUND) or leaves
+them to `manage.py resume_ingest_jobs`, and clients poll
+GET /api/j1939/ingest/jobs/<id>/ (job_status()).
+
+A run claims its job under a row lock (claimed_by, heartbeat_at) and
+re-checks the claim at every checkpoint, so a job is processed by one run
+at a time: another run gets IngestJobBusy unless the heartbeat is older
+than J1939_INGEST_STALE_SECONDS, in which case it takes the job over and
+the old run stops at its next checkpoint.
+"""
+
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .can_logs import CAN_LOG_FORMATS, header_length
+from .compression import mapped_stored_file
+from .formats import sniff_format, SNIFF_BYTES, KIND_UNSUPPORTED, FORMAT_CSV
+from .ingest import (
+    read_sheets, extract_vehicle_data, persist_vehicle, sheet_rows, store_upload, upload_sha256, upload_summary,
+    vehicle_result
+)
+from .layouts import get_template_by_id
+from .log_analysis import can_split_by_bytes, HEADER_SEARCH_BYTES
+from .models import IngestJob
+
+logger = logging.getLogger(__name__)
+
+
+class IngestJobBusy(Exception):
+    """The job is held by another live run (or this run lost its claim)."""
+
+
+def create_ingest_job(fname, stored_path, content_hash='', uploaded_by=None, template=None):
+    """Create a pending IngestJob for a file already saved to storage."""
+    return IngestJob.objects.create(
+        source_file=fname,
+        stored_file=stored_path,
+        content_hash=content_hash,
+        uploaded_by=uploaded_by,
+        chunk_bytes=settings.J1939_INGEST_CHUNK_BYTES,
+        state={'explicit_template_id': template.id} if template is not None else {},
+    )
+
+
+def start_upload_job(uploaded_file, fname, when, uploaded_by=None, template=None, content_hash=None):
+    """
+    Hash and store a large upload without reading it into memory, then
+    create its IngestJob. Pass content_hash when the upload was already
+    hashed while it was received.
+
+    Raises:
+        ValueError: the file could not be stored
+    """
+    if content_hash is None:
+        content_hash = upload_sha256(uploaded_file)
+    # Stored plain so the job can map it; compress_uploads compresses it later
+    stored_path = store_upload(fname, uploaded_file, when, compress=False)
+    if not stored_path:
+        raise ValueError('Could not store the upload for checkpointed ingestion')
+    return create_ingest_job(fname, stored_path, content_hash, uploaded_by, template)
+
+
+def schedule_ingest_job(job):
+    """
+    Run a pending job in a daemon thread once the current transaction
+    commits, when J1939_INGEST_IN_BACKGROUND is on; otherwise it waits for
+    `manage.py resume_ingest_jobs`.
+
+    Returns:
+        the job
+    """
+    if settings.J1939_INGEST_IN_BACKGROUND:
+        transaction.on_commit(lambda: threading.Thread(
+            target=_run_in_thread, args=(job.id,), name=f'ingest-{job.id}', daemon=True
+        ).start())
+    return job
+
+
+def _run_in_thread(job_id):
+    try:
+        run_ingest_job(IngestJob.objects.get(pk=job_id))
+    except ValueError:
+        # Already logged and recorded on the job
+        pass
+    except IngestJobBusy as exc:
+        logger.info('Ingest job %s not run: %s', job_id, exc)
+    except Exception:
+        logger.exception('Ingest job %s failed', job_id)
+    finally:
+        connection.close()
+
+
+def job_template_source(job):
+    """'explicit', 'cached' or 'detected', as reported by the upload views."""
+    if job.state.get('explicit_template_id'):
+        return 'explicit'
+    return 'cached' if job.state.get('template_ids') else 'detected'
+
+
+def job_status(job):
+    """
+    Serializable state of an ingest job; once it is done, 'vehicle' holds the
+    per-vehicle result of the upload views.
+    """
+    result = {
+        'ingest_job_id': job.id,
+        'source_file': job.source_file,
+        'status': job.status,
+        'detected_format': job.detected_format,
+        'byte_offset': job.byte_offset,
+        'rows_consumed': job.rows_consumed,
+        'chunks_done': job.chunks_done,
+        'vehicle_id': job.vehicle_id,
+        'error': job.error,
+        'vehicle': None,
+    }
+    if job.status == IngestJob.STATUS_DONE and job.vehicle_id:
+        result['vehicle'] = job_vehicle_result(job, {'format': job.detected_format}, job_template_source(job))
+    return result
+
+
+def job_vehicle_result(job, detected, template_source):
+    """Per-vehicle response dict (see ingest.vehicle_result) for a finished job."""
+    state = job.state
+    vehicle_spns = [
+        {'pgn': pgn if pgn else None, 'spn': spn, 'description': desc or ''}
+        for pgn, spn, desc in state['spns']
+    ]
+    result = vehicle_result(
+        job.vehicle, detected, job_sheets(job), state['template_ids'], template_source,
+        list(state['pgns']), vehicle_spns
+    )
+    result['ingest_job_id'] = job.id
+    return result
+
+
+def _is_chunked(detected):
+    if detected['format'] in CAN_LOG_FORMATS:
+        return can_split_by_bytes(detected['encoding'])
+    return detected['format'] == FORMAT_CSV and can_split_by_bytes(detected['encoding'])
+
+
+def _header_end(content, detected):
+    """Byte offset where the data after the header lines starts."""
+    if detected['format'] in CAN_LOG_FORMATS:
+        return header_length(content[:HEADER_SEARCH_BYTES], detected['format'])
+    # CSV: pandas takes the first line as the header
+    newline = content.find(b'\n')
+    return newline + 1 if newline != -1 else len(content)
+
+
+def _initial_state(job, content, detected):
+    header_end = _header_end(content, detected) if _is_chunked(detected) else 0
+    return {
+        'explicit_template_id': job.state.get('explicit_template_id'),
+        'header_end': header_end,
+        'vehicle_name': None,
+        'brand': '',
+        'pgns': [],
+        'spns': [],
+        'current_pgn': None,
+        'total_pgn_count': 0,
+        'unique_pgn_list': [],
+        'layouts_to_learn': [],
+        'template_ids': [],
+    }
+
+
+def _chunk_end(content, start, chunk_bytes):
+    """End of the chunk starting at `start`, extended to the next line end."""
+    end = start + chunk_bytes
+    if end >= len(content):
+        return len(content)
+    newline = content.rfind(b'\n', start, end)
+    if newline == -1:
+        # A single line longer than the chunk
+        newline = content.find(b'\n', end)
+        return newline + 1 if newline != -1 else len(content)
+    return newline + 1
+
+
+def _merge_chunk(state, sheets, parsed, first):
+    """Fold one chunk's sheets/extraction into the job state."""
+    if first:
+        state['vehicle_name'] = parsed['vehicle_name']
+        state['brand'] = parsed['brand']
+        state['layouts_to_learn'] = [
+            [[str(col) for col in columns], roles, cells] for columns, roles, cells in parsed['layouts_to_learn']
+        ]
+        state['template_ids'] = [template.id for template in parsed['templates_used']]
+    state['pgns'] = sorted(set(state['pgns']) | parsed['pgns'])
+    spns = {(pgn, spn): desc for pgn, spn, desc in state['spns']}
+    spns.update(parsed['spns_data'])
+    state['spns'] = [[pgn, spn, desc] for (pgn, spn), desc in spns.items()]
+    state['current_pgn'] = parsed['current_pgn']
+    state['total_pgn_count'] += sheets['total_pgn_count']
+    known = set(state['unique_pgn_list'])
+    state['unique_pgn_list'] += [pgn for pgn in sheets['unique_pgn_list'] if pgn not in known]
+
+
+def job_sheets(job):
+    """PGN(H) stats of a job in the shape returned by read_sheets()."""
+    state = job.state
+    unique = state.get('unique_pgn_list', [])
+    if job.detected_format in CAN_LOG_FORMATS:
+        unique = sorted(unique)
+    return {
+        'total_pgn_count': state.get('total_pgn_count', 0),
+        'unique_pgn_count': len(unique),
+        'unique_pgn_list': unique,
+    }
+
+
+def _stale_before():
+    return timezone.now() - timedelta(seconds=settings.J1939_INGEST_STALE_SECONDS)
+
+
+def _lock(job, token):
+    """
+    Lock the job row inside the current transaction and check that `token`
+    still holds it.
+
+    Raises:
+        IngestJobBusy: another run has taken the job over
+    """
+    locked = IngestJob.objects.select_for_update().get(pk=job.pk)
+    if locked.claimed_by != token:
+        raise IngestJobBusy(f'ingest job {job.id} was taken over by another run')
+    return locked
+
+
+def claim_ingest_job(job):
+    """
+    Claim a job for one run. Refreshes `job` from the database.
+
+    Returns:
+        the claim token, or None when the job is already done
+
+    Raises:
+        IngestJobBusy: a live run (fresh heartbeat) holds the job
+    """
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        locked = IngestJob.objects.select_for_update().get(pk=job.pk)
+        if locked.status == IngestJob.STATUS_DONE:
+            job.refresh_from_db()
+            return None
+        if (locked.status == IngestJob.STATUS_RUNNING and locked.claimed_by
+                and locked.heartbeat_at and locked.heartbeat_at >= _stale_before()):
+            raise IngestJobBusy(f'ingest job {job.id} is being processed by another run')
+        if locked.claimed_by:
+            logger.warning('Taking over ingest job %s, last checkpoint at %s', job.id, locked.heartbeat_at)
+        IngestJob.objects.filter(pk=job.pk).update(
+            status=IngestJob.STATUS_RUNNING, error='', claimed_by=token, heartbeat_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+    job.refresh_from_db()
+    return token
+
+
+def _release(job, token, **fields):
+    """Give the claim up (optionally setting status/error) if this run still holds it."""
+    IngestJob.objects.filter(pk=job.pk, claimed_by=token).update(
+        claimed_by='', heartbeat_at=None, updated_at=timezone.now(), **fields
+    )
+
+
+def _finalize(job, token):
+    """
+    Create the vehicle from the aggregates and mark the job done.
+
+    Idempotent: under the job's row lock, a job that already has its
+    vehicle is not persisted again.
+    """
+    state = job.state
+    templates = [get_template_by_id(template_id) for template_id in state['template_ids']]
+    parsed = {
+        'vehicle_name': state['vehicle_name'],
+        'brand': state['brand'],
+        'pgns': set(state['pgns']),
+        'spns_data': {(pgn, spn): desc for pgn, spn, desc in state['spns']},
+        'layouts_to_learn': [tuple(layout) for layout in state['layouts_to_learn']],
+        'templates_used': [template for template in templates if template is not None],
+    }
+    template_source = 'explicit' if state.get('explicit_template_id') else (
+        'cached' if parsed['templates_used'] else 'detected')
+    summary = upload_summary({'format': job.detected_format}, job_sheets(job), template_source)
+    with transaction.atomic():
+        locked = _lock(job, token)
+        if locked.vehicle_id is not None:
+            job.refresh_from_db()
+            return
+        vehicle, template_ids, _, _ = persist_vehicle(
+            job.source_file, parsed, job.stored_file.name, job.uploaded_by, job.content_hash, summary
+        )
+        job.vehicle = vehicle
+        job.state = dict(state, template_ids=template_ids)
+        job.status = IngestJob.STATUS_DONE
+        job.claimed_by = ''
+        job.heartbeat_at = None
+        job.save()
+    logger.info('Ingest job %s done: vehicle %s, %d rows in %d chunks',
+                job.id, vehicle.id, job.rows_consumed, job.chunks_done)
+
+
+def run_ingest_job(job, max_chunks=None):
+    """
+    Run (or resume) an ingest job from its last checkpoint.
+
+    Args:
+        job: The IngestJob
+        max_chunks: Stop after this many chunks, leaving the job running
+                    and unclaimed (for tests and time-sliced workers)
+
+    Returns:
+        the job; job.vehicle is set once it is done
+
+    Raises:
+        ValueError: the file cannot be parsed; the job is marked failed
+        IngestJobBusy: another run holds the job, or took it over while
+                       this one was running; the job is left to that run
+    """
+    token = claim_ingest_job(job)
+    if token is None:
+        return job
+
+    try:
+        with mapped_stored_file(job.stored_file.name) as content:
+            chunks_run = _run_chunks(job, content, max_chunks, token)
+        if chunks_run is None:
+            _release(job, token)
+            job.refresh_from_db()
+            return job
+        _finalize(job, token)
+    except IngestJobBusy:
+        raise
+    except Exception as exc:
+        _release(job, token, status=IngestJob.STATUS_FAILED, error=str(exc))
+        job.refresh_from_db()
+        logger.error('Ingest job %s failed at byte %d: %s', job.id, job.byte_offset, str(exc))
+        if isinstance(exc, ValueError):
+            raise
+        raise ValueError(str(exc)) from exc
+    return job
+
+
+def _run_chunks(job, content, max_chunks, token):
+    """
+    Parse and checkpoint chunks until the end of the file.
+    Returns None when stopped early by max_chunks.
+
+    Raises:
+        IngestJobBusy: the claim was lost; nothing of the chunk is saved
+    """
+    detected = sniff_format(content[:SNIFF_BYTES], job.source_file)
+    if detected['kind'] == KIND_UNSUPPORTED:
+        raise ValueError(f"Unsupported file format: {detected['label']}")
+    if 'header_end' not in job.state:
+        job.detected_format = detected['format']
+        job.encoding = detected['encoding'] or ''
+        job.state = _initial_state(job, content, detected)
+        job.byte_offset = job.state['header_end']
+
+    state = job.state
+    explicit_template = get_template_by_id(state['explicit_template_id']) if state.get('explicit_template_id') else None
+    header = content[:state['header_end']]
+    chunked = _is_chunked(detected)
+    chunks_run = 0
+    # At least one chunk runs, so an empty file still yields a vehicle
+    while job.chunks_done == 0 or job.byte_offset < len(content):
+        if max_chunks is not None and chunks_run >= max_chunks:
+            return None
+        start = job.byte_offset
+        end = _chunk_end(content, start, job.chunk_bytes) if chunked else len(content)
+        body = content[start:end]
+        chunk = header + body if chunked else content
+
+        first = job.chunks_done == 0
+        try:
+            sheets = read_sheets(job.source_file, chunk, detected)
+            parsed = extract_vehicle_data(
+                job.source_file, sheets['df_dict'], detected, sheets['unique_pgn_list'], explicit_template,
+                current_pgn=state['current_pgn'], read_vehicle_metadata=first
+            )
+        except Exception as exc:
+            raise ValueError(f'Failed to parse file: {str(exc)}') from exc
+        _merge_chunk(state, sheets, parsed, first)
+
+        rows = sum(sheet_rows(df) for df in sheets['df_dict'].values()) if sheets['df_dict'] else body.count(b'\n')
+        with transaction.atomic():
+            _lock(job, token)
+            job.byte_offset = end
+            job.rows_consumed += rows
+            job.chunks_done += 1
+            job.state = state
+            job.heartbeat_at = timezone.now()
+            job.save()
+        chunks_run += 1
+    return chunks_run
+
+
+def resumable_jobs():
+    """
+    Jobs waiting for a run: pending ones, and running ones that no live run
+    holds (unclaimed, or heartbeat older than J1939_INGEST_STALE_SECONDS,
+    e.g. left by a worker that died).
+    """
+    abandoned = Q(claimed_by='') | Q(heartbeat_at__isnull=True) | Q(heartbeat_at__lt=_stale_before())
+    return IngestJob.objects.filter(
+        Q(status=IngestJob.STATUS_PENDING) | (Q(status=IngestJob.STATUS_RUNNING) & abandoned)
+    ).order_by('created_at')
+
+
+def unfinished_jobs():
+    """Jobs pending or running, whether or not a run holds them."""
+    return IngestJob.objects.filter(
+        status__in=[IngestJob.STATUS_PENDING, IngestJob.STATUS_RUNNING]
+    ).order_by('created_at')
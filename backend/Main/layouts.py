@@ -0,0 +1,185 @@
+"""
+Column-layout detection for J1939 spreadsheet and CSV exports.
+
+Exports from the same tool always share a header row, so the resolved
+column roles and the position of the vehicle name/brand cells are stored
+as a ColumnTemplate keyed by a hash of the normalized header. Later uploads
+with the same header reuse the template instead of re-running the alias
+matching and the metadata cell scan.
+"""
+
+import hashlib
+import logging
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Header aliases used to resolve column roles
+PGN_H_ALIASES = ['pgn(h)', 'pgn_h', 'pgn h', 'pgn(hex)', 'pgn_hex']
+PGN_ALIASES = ['pgn', 'pgn number', 'pgn_no', 'pgn_number', 'parameter group number']
+SPN_ALIASES = ['spn', 'spn number', 'spn_no', 'spn_number', 'suspect parameter number']
+INDEX_ALIASES = ['index', 'idx', 'no', 'no.', 'row', 'row_no']
+
+# Cell labels searched for vehicle metadata
+VEHICLE_NAME_ALIASES = ['vehicle name', 'veh name', 'vehicle', 'veh', 'unit name', 'name']
+BRAND_ALIASES = ['brand', 'make', 'manufacturer', 'manufacturer name']
+
+COLUMN_ROLES = ('index', 'pgn_h', 'pgn', 'spn', 'desc')
+
+# Size of the top-left block searched for metadata labels
+METADATA_SCAN_ROWS = 10
+METADATA_SCAN_COLS = 10
+
+_EMPTY_VALUES = ['nan', 'none', '']
+
+
+def normalize_header(columns):
+    """Normalize header cells for hashing: stripped, lower-case strings."""
+    return [str(col).strip().lower() for col in columns]
+
+
+def header_signature(columns):
+    """SHA-256 of the normalized header row, used as the template key."""
+    joined = '\x1f'.join(normalize_header(columns))
+    return hashlib.sha256(joined.encode('utf-8')).hexdigest()
+
+
+def resolve_column_roles(columns):
+    """
+    Resolve which column holds each role from the header names.
+
+    Returns:
+        dict mapping each of COLUMN_ROLES to a column index or None
+    """
+    roles = dict.fromkeys(COLUMN_ROLES)
+    for col_idx, col_str in enumerate(normalize_header(columns)):
+        # Index column identifies main message rows
+        if col_str in INDEX_ALIASES or col_str == 'index':
+            roles['index'] = col_idx
+        # PGN(H) hex column takes priority over decimal PGN columns
+        if any(alias == col_str for alias in PGN_H_ALIASES):
+            roles['pgn_h'] = col_idx
+        elif any(alias in col_str for alias in PGN_ALIASES):
+            roles['pgn'] = col_idx
+        if any(alias in col_str for alias in SPN_ALIASES):
+            roles['spn'] = col_idx
+        if 'description' in col_str or 'desc' in col_str:
+            roles['desc'] = col_idx
+    return roles
+
+
+def _num_rows(df, is_dataframe):
+    if is_dataframe:
+        return len(df)
+    return max([len(v) for v in df.values()] if isinstance(df, dict) and df else [0])
+
+
+def read_cell(df, row_idx, col_idx, is_dataframe):
+    """
+    Read a cell as a stripped string from a DataFrame or a column dict.
+    Returns None for missing or empty cells.
+    """
+    try:
+        if is_dataframe:
+            if row_idx >= len(df) or col_idx >= len(df.columns):
+                return None
+            value = str(df.iloc[row_idx, col_idx]).strip()
+        else:
+            col_names = list(df.keys())
+            if col_idx >= len(col_names):
+                return None
+            column = df[col_names[col_idx]]
+            value = str(column[row_idx] if row_idx < len(column) else '').strip()
+    except Exception:
+        return None
+    if value.lower() in _EMPTY_VALUES:
+        return None
+    return value
+
+
+def scan_metadata_cells(df, is_dataframe):
+    """
+    Search the top-left block of a sheet for vehicle name and brand labels.
+
+    A label cell matches when it contains one of the aliases; the value is
+    taken from the cell to its right.
+
+    Returns:
+        dict with 'vehicle_name' and 'brand' set to [row, col] of the value
+        cell, or None when not found
+    """
+    found = {'vehicle_name': None, 'brand': None}
+    max_rows = _num_rows(df, is_dataframe)
+    max_cols = len(df.columns) if is_dataframe else len(df)
+
+    for row_idx in range(min(METADATA_SCAN_ROWS, max_rows)):
+        for col_idx in range(min(METADATA_SCAN_COLS, max_cols)):
+            label = read_cell(df, row_idx, col_idx, is_dataframe)
+            if not label or col_idx + 1 >= max_cols:
+                continue
+            label = label.lower()
+            for key, aliases in (('vehicle_name', VEHICLE_NAME_ALIASES), ('brand', BRAND_ALIASES)):
+                if found[key] is not None:
+                    continue
+                if any(alias in label for alias in aliases):
+                    if read_cell(df, row_idx, col_idx + 1, is_dataframe):
+                        found[key] = [row_idx, col_idx + 1]
+        if found['vehicle_name'] is not None and found['brand'] is not None:
+            break
+    return found
+
+
+def read_metadata(df, cells, is_dataframe):
+    """Read vehicle name/brand values at the positions from scan_metadata_cells."""
+    values = {}
+    for key in ('vehicle_name', 'brand'):
+        pos = (cells or {}).get(key)
+        values[key] = read_cell(df, pos[0], pos[1], is_dataframe) if pos else None
+    return values
+
+
+def find_template(signature):
+    """Return the stored ColumnTemplate for a header signature, if any."""
+    from .models import ColumnTemplate
+    return ColumnTemplate.objects.filter(signature=signature).first()
+
+
+def get_template_by_id(template_id):
+    """Return the ColumnTemplate with the given id, or None."""
+    from .models import ColumnTemplate
+    try:
+        return ColumnTemplate.objects.get(pk=int(template_id))
+    except (ColumnTemplate.DoesNotExist, TypeError, ValueError):
+        return None
+
+
+def learn_template(columns, roles, metadata_cells):
+    """
+    Persist a layout after a successful parse.
+    Layouts without any PGN or SPN column are not worth remembering.
+    """
+    from .models import ColumnTemplate
+    if roles.get('pgn_h') is None and roles.get('pgn') is None and roles.get('spn') is None:
+        return None
+    template, created = ColumnTemplate.objects.get_or_create(
+        signature=header_signature(columns),
+        defaults={
+            'header': normalize_header(columns),
+            'column_roles': roles,
+            'metadata_cells': metadata_cells or {},
+        }
+    )
+    if created:
+        logger.info('Learned column template %s for header %s', template.id, template.header)
+    return template
+
+
+def mark_template_used(template):
+    """Record a template hit."""
+    from .models import ColumnTemplate
+    from django.db.models import F
+    ColumnTemplate.objects.filter(pk=template.pk).update(
+        hit_count=F('hit_count') + 1,
+        last_used_at=timezone.now()
+    )
@@ -0,0 +1,652 @@
+"""
+Line-oriented PGN extraction for J1939 text logs.
+
+These helpers hold the parsing logic used by analyze_j1939_files. They do
+not depend on Django so they can run inside worker processes: large logs
+saved to disk are split into newline-aligned byte ranges, and each range is
+parsed in a process pool against its own mmap view of the file. The header
+row is detected once in the parent and shared with every worker, and the
+per-range PGN counters are summed, so the result matches a sequential scan.
+
+Logs that keep growing can also be analyzed incrementally: analyze_increment()
+resumes from a checkpoint and only parses the bytes appended since the
+previous call, and uploads can be analyzed while they are still being
+received with StreamingLogAnalyzer.
+"""
+
+import hashlib
+import mmap
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# Number of leading lines searched for a header row
+HEADER_SEARCH_LINES = 20
+
+# Bytes read from the start of a file to detect the header row
+HEADER_SEARCH_BYTES = 64 * 1024
+
+# Bytes decoded at a time by a worker while walking its range
+RANGE_CHUNK_BYTES = 8 * 1024 * 1024
+
+# Leading bytes hashed to recognise the same growing file between calls
+CHECKPOINT_HEAD_BYTES = 4096
+
+# Maximum number of per-line warnings kept per file
+MAX_LINE_WARNINGS = 10
+
+# Encodings in which a 0x0A byte is always a line feed, so a file can be
+# split on raw newline bytes without decoding it first
+BYTE_SPLITTABLE_ENCODINGS = {
+    'utf-8', 'utf-8-sig', 'ascii', 'latin1', 'iso-8859-1', 'cp1252',
+    'gb2312', 'gbk', 'gb18030', 'big5',
+}
+
+_EMPTY_PGN_VALUES = ['', 'null', 'none', 'n/a', 'pgn', 'pgn(h)']
+
+
+def extract_pgn_from_can_id(can_id_value):
+    """
+    Extract PGN from CAN ID according to J1939 specification.
+    PGN = (CAN_ID >> 8) & 0x3FFFF for extended frames
+    
+    For standard J1939:
+    - 29-bit CAN ID: Priority (3 bits) + Reserved (1 bit) + Data Page (1 bit) + PDU Format (8 bits) + 
+                     PDU Specific/Destination (8 bits) + Source Address (8 bits)
+    - PGN = bits 8-25 (18 bits max), but commonly 16 bits: (CAN_ID >> 8) & 0xFFFF
+    
+    Args:
+        can_id_value: CAN ID as int, hex string, or decimal string
+        
+    Returns:
+        tuple: (pgn_int, pgn_hex_str) or (None, None) if invalid
+    """
+    try:
+        # Convert to integer
+        if isinstance(can_id_value, int):
+            can_id = can_id_value
+        elif isinstance(can_id_value, str):
+            can_id_str = can_id_value.strip().upper()
+            # Remove common prefixes
+            for prefix in ['0X', '0H', 'H', 'X']:
+                if can_id_str.startswith(prefix):
+                    can_id_str = can_id_str[len(prefix):]
+            
+            if not can_id_str:
+                return None, None
+            
+            # Try hex first if it looks like hex
+            if re.match(r'^[0-9A-F]+$', can_id_str):
+                # Determine if it's hex or decimal
+                # If contains A-F, definitely hex
+                if re.search(r'[A-F]', can_id_str):
+                    can_id = int(can_id_str, 16)
+                # If length > 8 digits, likely hex
+                elif len(can_id_str) > 8:
+                    can_id = int(can_id_str, 16)
+                # Try as decimal first for pure numeric
+                else:
+                    try:
+                        can_id = int(can_id_str, 10)
+                        # If result is unreasonably large, try hex
+                        if can_id > 0x1FFFFFFF:  # Max 29-bit CAN ID
+                            can_id = int(can_id_str, 16)
+                    except ValueError:
+                        can_id = int(can_id_str, 16)
+            else:
+                # Pure decimal
+                can_id = int(can_id_str, 10)
+        else:
+            return None, None
+        
+        # Validate CAN ID range (29-bit max)
+        if can_id < 0 or can_id > 0x1FFFFFFF:
+            return None, None
+        
+        # Extract PGN: (CAN_ID >> 8) & 0xFFFF (16-bit PGN)
+        # For J1939, PGN is typically in bits 8-23
+        pgn = (can_id >> 8) & 0xFFFF
+        
+        # Format as hex string (uppercase, no prefix)
+        pgn_hex = f"{pgn:04X}"
+        
+        return pgn, pgn_hex
+        
+    except (ValueError, TypeError) as e:
+        return None, None
+
+
+def find_can_id_column(headers):
+    """
+    Find the column index that likely contains CAN ID.
+    Returns column index or None.
+    """
+    can_id_patterns = [
+        r'^can\s*id$', r'^canid$', r'^id$', r'^can_id$',
+        r'^message\s*id$', r'^msg\s*id$', r'^msgid$',
+        r'^arbitration\s*id$', r'^arb\s*id$',
+        r'^identifier$', r'^frame\s*id$',
+        r'^id\(h\)$', r'^id_h$', r'^id\s*\(hex\)$'
+    ]
+    
+    for idx, header in enumerate(headers):
+        header_clean = header.strip().lower()
+        for pattern in can_id_patterns:
+            if re.match(pattern, header_clean):
+                return idx
+    return None
+
+
+def find_pgn_column(headers):
+    """
+    Find the column index that contains PGN values directly.
+    Returns column index or None.
+    """
+    pgn_patterns = [
+        r'^pgn\s*\(h\)$', r'^pgn_h$', r'^pgn\s*\(hex\)$', r'^pgn\s*hex$',
+        r'^pgn$', r'^pgn_dec$', r'^pgn\s*\(d\)$', r'^pgn\s*\(dec\)$'
+    ]
+    
+    for idx, header in enumerate(headers):
+        header_clean = header.strip().lower()
+        for pattern in pgn_patterns:
+            if re.match(pattern, header_clean):
+                return idx
+    return None
+
+
+def parse_line_for_can_id(line, delimiter=None):
+    """
+    Parse a line and try to extract CAN ID from various formats.
+    Handles CSV, space-separated, and raw CAN frame formats.
+    
+    Returns list of potential CAN IDs found.
+    """
+    can_ids = []
+    
+    # Try different delimiters
+    delimiters_to_try = [delimiter] if delimiter else [',', ';', '\t', ' ', '|']
+    
+    for delim in delimiters_to_try:
+        if delim is None:
+            continue
+        parts = [p.strip() for p in line.split(delim) if p.strip()]
+        
+        for part in parts:
+            # Check if part looks like a CAN ID (hex or decimal)
+            part_clean = part.upper().strip()
+            
+            # Remove common prefixes
+            for prefix in ['0X', '0H', 'H']:
+                if part_clean.startswith(prefix):
+                    part_clean = part_clean[len(prefix):]
+            
+            # Check if it's a valid hex/decimal number in CAN ID range
+            if re.match(r'^[0-9A-F]+$', part_clean):
+                try:
+                    # Try as hex first
+                    if re.search(r'[A-F]', part_clean):
+                        val = int(part_clean, 16)
+                    else:
+                        # Pure numeric - could be decimal or hex
+                        val = int(part_clean, 10)
+                        if val > 0x1FFFFFFF:
+                            val = int(part_clean, 16)
+                    
+                    # CAN ID reasonable range (J1939 29-bit extended)
+                    if 0x100 <= val <= 0x1FFFFFFF:
+                        can_ids.append(val)
+                except ValueError:
+                    continue
+    
+    return can_ids
+
+
+def detect_log_layout(lines):
+    """
+    Find the header row and delimiter of a delimited text log.
+
+    Args:
+        lines: The first lines of the file (already decoded)
+
+    Returns:
+        dict with 'delimiter', 'headers', 'pgn_col_idx', 'can_id_col_idx'
+        and 'header_index' (position of the header in lines, or None)
+    """
+    layout = {
+        'delimiter': ',',
+        'headers': [],
+        'pgn_col_idx': None,
+        'can_id_col_idx': None,
+        'header_index': None,
+    }
+
+    for i, line in enumerate(lines[:HEADER_SEARCH_LINES]):
+        line = line.strip()
+        if not line:
+            continue
+
+        # Detect delimiter
+        for delim in [',', ';', '\t', '|']:
+            if delim in line:
+                layout['delimiter'] = delim
+                break
+
+        columns = [col.strip() for col in line.split(layout['delimiter'])]
+
+        # Check if this looks like a header row
+        pgn_idx = find_pgn_column(columns)
+        can_idx = find_can_id_column(columns)
+
+        if pgn_idx is not None or can_idx is not None:
+            layout['headers'] = columns
+            layout['pgn_col_idx'] = pgn_idx
+            layout['can_id_col_idx'] = can_idx
+            layout['header_index'] = i
+            break
+
+    return layout
+
+
+def extraction_method(layout):
+    """Name of the PGN extraction method a layout resolves to."""
+    if layout['pgn_col_idx'] is not None:
+        return 'pgn_column'
+    if layout['can_id_col_idx'] is not None:
+        return 'can_id_column'
+    return 'auto_detect'
+
+
+def pgn_hex_from_line(line, layout):
+    """
+    Extract the PGN (as upper-case hex) from one data line.
+    Returns None when the line carries no PGN.
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    delimiter = layout['delimiter']
+    pgn_col_idx = layout['pgn_col_idx']
+    can_id_col_idx = layout['can_id_col_idx']
+    columns = [col.strip() for col in line.split(delimiter)]
+
+    # Method 1: Direct PGN column
+    if pgn_col_idx is not None and pgn_col_idx < len(columns):
+        pgn_value = columns[pgn_col_idx].strip()
+        if pgn_value and pgn_value.lower() not in _EMPTY_PGN_VALUES:
+            # Normalize PGN value to hex
+            pgn_clean = pgn_value.upper()
+            for prefix in ['0X', '0H', 'H']:
+                if pgn_clean.startswith(prefix):
+                    pgn_clean = pgn_clean[len(prefix):]
+
+            if re.match(r'^[0-9A-F]+$', pgn_clean):
+                # Pad to at least 4 characters
+                return pgn_clean.zfill(4).upper()
+        return None
+
+    # Method 2: Extract PGN from CAN ID column
+    if can_id_col_idx is not None and can_id_col_idx < len(columns):
+        pgn_int, pgn_hex = extract_pgn_from_can_id(columns[can_id_col_idx].strip())
+        return pgn_hex
+
+    # Method 3: Try to find CAN ID anywhere in the line
+    for can_id in parse_line_for_can_id(line, delimiter)[:1]:  # Take first valid CAN ID per line
+        pgn_int, pgn_hex = extract_pgn_from_can_id(can_id)
+        if pgn_hex:
+            return pgn_hex
+    return None
+
+
+def count_pgns(lines, layout, counter, warnings, line_offset=0):
+    """
+    Count PGN occurrences in data lines into counter (a Counter of PGN hex).
+    Per-line failures are recorded in warnings, capped at MAX_LINE_WARNINGS.
+    """
+    for line_num, line in enumerate(lines):
+        try:
+            pgn_hex = pgn_hex_from_line(line, layout)
+            if pgn_hex:
+                counter[pgn_hex] += 1
+        except Exception as line_error:
+            # Log but continue processing
+            if len(warnings) < MAX_LINE_WARNINGS:
+                warnings.append(f"Line {line_offset + line_num}: {str(line_error)[:50]}")
+    return counter
+
+
+def analyze_lines(decoded_text):
+    """
+    Analyze an in-memory decoded log.
+
+    Returns:
+        dict with 'counter', 'lines' (number of data lines), 'warnings'
+        and 'layout'
+    """
+    lines = decoded_text.split('\n')
+    layout = detect_log_layout(lines)
+    if layout['header_index'] is not None:
+        # Start processing from the line after the header
+        lines = lines[layout['header_index'] + 1:]
+
+    counter = Counter()
+    warnings = []
+    count_pgns(lines, layout, counter, warnings)
+    return {
+        'counter': counter,
+        'lines': len(lines),
+        'warnings': warnings,
+        'layout': layout,
+    }
+
+
+def can_split_by_bytes(encoding):
+    """Whether a file in this encoding can be split on raw newline bytes."""
+    return (encoding or '').lower() in BYTE_SPLITTABLE_ENCODINGS
+
+
+def _detect_file_layout(mm, encoding):
+    """
+    Detect the layout from the head of a mapped file.
+    Returns (layout, data_start) where data_start is the byte offset of the
+    first data line.
+    """
+    head = mm[:HEADER_SEARCH_BYTES]
+    raw_lines = head.split(b'\n')
+    if len(head) == HEADER_SEARCH_BYTES and len(raw_lines) > 1:
+        # The last piece may be a partial line
+        raw_lines = raw_lines[:-1]
+    lines = [raw.decode(encoding, errors='replace') for raw in raw_lines]
+    layout = detect_log_layout(lines)
+
+    data_start = 0
+    if layout['header_index'] is not None:
+        for raw in raw_lines[:layout['header_index'] + 1]:
+            data_start += len(raw) + 1
+    return layout, min(data_start, len(mm))
+
+
+def split_byte_ranges(mm, start, end, parts):
+    """
+    Split [start, end) into up to `parts` ranges that each begin at a line start.
+    """
+    if end <= start:
+        return []
+    parts = max(1, parts)
+    step = max(1, (end - start) // parts)
+    bounds = [start]
+    for i in range(1, parts):
+        target = start + i * step
+        if target <= bounds[-1]:
+            continue
+        nl = mm.find(b'\n', target, end)
+        if nl == -1:
+            break
+        boundary = nl + 1
+        if bounds[-1] < boundary < end:
+            bounds.append(boundary)
+    bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def count_pgns_in_range(path, start, end, encoding, layout):
+    """
+    Worker: count PGNs in the byte range [start, end) of a file.
+
+    The range must begin at a line start. The file is mapped read-only and
+    decoded in chunks that end on a newline.
+
+    Returns:
+        tuple (counter, newline_count, warnings)
+    """
+    counter = Counter()
+    warnings = []
+    newlines = 0
+    with open(path, 'rb') as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = start
+            while pos < end:
+                chunk_end = min(end, pos + RANGE_CHUNK_BYTES)
+                if chunk_end < end:
+                    nl = mm.rfind(b'\n', pos, chunk_end)
+                    if nl != -1:
+                        chunk_end = nl + 1
+                chunk = mm[pos:chunk_end]
+                text = chunk.decode(encoding, errors='replace')
+                count_pgns(text.split('\n'), layout, counter, warnings, line_offset=newlines)
+                newlines += chunk.count(b'\n')
+                pos = chunk_end
+    return counter, newlines, warnings
+
+
+def _count_range_task(args):
+    return count_pgns_in_range(*args)
+
+
+def analyze_log_file(path, encoding, workers=None):
+    """
+    Analyze a log saved on disk, parsing byte ranges in parallel.
+
+    Args:
+        path: Path of the saved file
+        encoding: A byte-splittable encoding (see can_split_by_bytes)
+        workers: Number of worker processes (defaults to the CPU count);
+                 1 parses in the calling process
+
+    Returns:
+        dict with 'counter', 'lines', 'warnings', 'layout' and 'workers',
+        identical to analyze_lines() on the fully decoded file
+    """
+    workers = workers or os.cpu_count() or 1
+    counter = Counter()
+    warnings = []
+
+    if os.path.getsize(path) == 0:
+        layout = detect_log_layout([])
+        return {'counter': counter, 'lines': 1, 'warnings': warnings, 'layout': layout, 'workers': 0}
+
+    with open(path, 'rb') as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            layout, data_start = _detect_file_layout(mm, encoding)
+            ranges = split_byte_ranges(mm, data_start, len(mm), workers)
+
+    tasks = [(path, start, end, encoding, layout) for start, end in ranges]
+    if len(tasks) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(_count_range_task, tasks))
+    else:
+        results = [_count_range_task(task) for task in tasks]
+
+    # Merge in range order so line numbers in warnings stay absolute
+    lines_before = 0
+    for range_counter, newlines, range_warnings in results:
+        counter.update(range_counter)
+        for warning in range_warnings:
+            if len(warnings) >= MAX_LINE_WARNINGS:
+                break
+            label, _, message = warning.partition(': ')
+            line_num = int(label.split()[-1]) + lines_before
+            warnings.append(f"Line {line_num}: {message}")
+        lines_before += newlines
+
+    return {
+        'counter': counter,
+        # Same as len(text.split('\n')) over the data region
+        'lines': lines_before + 1,
+        'warnings': warnings,
+        'layout': layout,
+        'workers': len(tasks),
+    }
+
+
+class StreamingLogAnalyzer:
+    """
+    Push-style analyze_log_file(): feed() the bytes of a log as they arrive
+    (e.g. from an upload handler) and close() returns the same result as
+    analyze_log_file() on the whole file.
+
+    Only the header search window, then the trailing partial line, is
+    buffered; complete lines are counted as soon as they are received.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.layout = None
+        self.counter = Counter()
+        self.warnings = []
+        self.newlines = 0
+        self.size = 0
+        self._buffer = b''
+
+    def feed(self, data):
+        self.size += len(data)
+        self._buffer += data
+        if self.layout is None:
+            if len(self._buffer) < HEADER_SEARCH_BYTES:
+                return
+            self._detect_layout()
+        self._count(final=False)
+
+    def _detect_layout(self):
+        self.layout, data_start = _detect_file_layout(self._buffer, self.encoding)
+        self._buffer = self._buffer[data_start:]
+
+    def _count(self, final):
+        if final:
+            chunk, self._buffer = self._buffer, b''
+        else:
+            newline = self._buffer.rfind(b'\n')
+            if newline == -1:
+                return
+            chunk, self._buffer = self._buffer[:newline + 1], self._buffer[newline + 1:]
+        text = chunk.decode(self.encoding, errors='replace')
+        count_pgns(text.split('\n'), self.layout, self.counter, self.warnings, line_offset=self.newlines)
+        self.newlines += chunk.count(b'\n')
+
+    def close(self):
+        """
+        Returns:
+            dict with 'counter', 'lines', 'warnings' and 'layout'
+        """
+        if self.size == 0:
+            return {'counter': Counter(), 'lines': 1, 'warnings': [], 'layout': detect_log_layout([])}
+        if self.layout is None:
+            self._detect_layout()
+        self._count(final=True)
+        return {
+            'counter': self.counter,
+            'lines': self.newlines + 1,
+            'warnings': self.warnings,
+            'layout': self.layout,
+        }
+
+
+def _head_hash(content, length):
+    return hashlib.sha256(content[:length]).hexdigest()
+
+
+def new_checkpoint(encoding):
+    """Empty incremental-analysis state for a log in the given encoding."""
+    return {
+        'encoding': encoding,
+        'byte_offset': 0,
+        'head_hash': '',
+        'layout': None,
+        'layout_final': False,
+        'counts': {},
+        'lines': 0,
+        'partial_line': '',
+    }
+
+
+def analyze_increment(content, checkpoint):
+    """
+    Analyze only the part of a growing log not covered by the checkpoint.
+
+    The checkpoint stores the byte offset of the first line not yet
+    committed, the detected layout, the PGN counts and line count of all
+    committed (newline-terminated) lines, and the trailing partial line.
+    The partial line is counted in the returned totals but not committed:
+    it is parsed again from the file once it has been completed, so the
+    totals always match analyze_lines() over the whole file.
+
+    The checkpoint is discarded when the file no longer starts with the
+    bytes it was taken from (rotated or truncated log), or while the layout
+    may still change because the header search window is not yet full.
+
+    Args:
+        content: The whole file as bytes or an mmap
+        checkpoint: State from new_checkpoint() or a previous call; the
+                    encoding must be byte-splittable (see can_split_by_bytes)
+
+    Returns:
+        tuple (result, checkpoint) where result is shaped like
+        analyze_lines() plus 'start_offset', 'bytes_processed' and 'reset'
+    """
+    encoding = checkpoint['encoding']
+    offset = checkpoint['byte_offset']
+    head_length = min(offset, CHECKPOINT_HEAD_BYTES)
+    reset = bool(offset) and (
+        len(content) < offset or _head_hash(content, head_length) != checkpoint['head_hash'])
+    if reset or not checkpoint['layout_final']:
+        checkpoint = new_checkpoint(encoding)
+        offset = 0
+
+    counter = Counter(checkpoint['counts'])
+    warnings = []
+    lines = checkpoint['lines']
+    layout = checkpoint['layout']
+    layout_final = checkpoint['layout_final']
+    if offset == 0:
+        layout, offset = _detect_file_layout(content, encoding)
+        # The layout is fixed once the header line is complete, or once the
+        # whole header search window has been seen without a header
+        head = content[:HEADER_SEARCH_BYTES]
+        if layout['header_index'] is not None:
+            layout_final = content[:offset].endswith(b'\n')
+        else:
+            layout_final = len(head) == HEADER_SEARCH_BYTES or head.count(b'\n') >= HEADER_SEARCH_LINES
+    start_offset = offset
+
+    # Commit every newline-terminated line after the checkpoint
+    last_newline = content.rfind(b'\n', offset)
+    if last_newline != -1:
+        pos = offset
+        while pos <= last_newline:
+            chunk_end = min(last_newline + 1, pos + RANGE_CHUNK_BYTES)
+            if chunk_end <= last_newline:
+                chunk_end = content.rfind(b'\n', pos, chunk_end) + 1 or last_newline + 1
+            text = content[pos:chunk_end].decode(encoding, errors='replace')
+            complete = text.split('\n')[:-1]
+            count_pgns(complete, layout, counter, warnings, line_offset=lines)
+            lines += len(complete)
+            pos = chunk_end
+        offset = last_newline + 1
+
+    # The trailing partial line counts towards this result only
+    partial_line = content[offset:].decode(encoding, errors='replace')
+    totals = Counter(counter)
+    count_pgns([partial_line], layout, totals, warnings, line_offset=lines)
+
+    checkpoint = {
+        'encoding': encoding,
+        'byte_offset': offset,
+        'head_hash': _head_hash(content, min(offset, CHECKPOINT_HEAD_BYTES)),
+        'layout': layout,
+        'layout_final': layout_final,
+        'counts': dict(counter),
+        'lines': lines,
+        'partial_line': partial_line,
+    }
+    result = {
+        'counter': totals,
+        'lines': lines + 1,
+        'warnings': warnings,
+        'layout': layout,
+        'start_offset': start_offset,
+        'bytes_processed': len(content) - start_offset,
+        'reset': reset,
+    }
+    return result, checkpoint
@@ -0,0 +1,40 @@
+"""
+Management command that compiles Main/j1939_map.json into the memory-mapped
+binary map read by load_j1939_map() (see Main/j1939_map.py).
+
+Run it as a build step whenever the JSON map changes:
+
+    python manage.py compile_j1939_map
+    python manage.py compile_j1939_map /path/to/map.json --output /path/to/map.bin
+"""
+
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Main.j1939_map import SOURCE_PATH, COMPILED_PATH, compile_map_file
+
+
+class Command(BaseCommand):
+    help = 'Compile the J1939 PGN→SPN map to its binary form'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', nargs='?', default=SOURCE_PATH,
+                            help='JSON map to compile (default: Main/j1939_map.json)')
+        parser.add_argument('--output', default=COMPILED_PATH,
+                            help='Compiled file to write (default: Main/j1939_map.bin)')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if not os.path.isfile(source):
+            raise CommandError(f'File not found: {source}')
+        try:
+            result = compile_map_file(source, options['output'])
+        except (ValueError, json.JSONDecodeError) as exc:
+            raise CommandError(f'{source} is not a valid J1939 map: {exc}')
+        for key in result['skipped']:
+            self.stderr.write(f'Skipped key {key!r}: not a PGN')
+        self.stdout.write(self.style.SUCCESS(
+            f"Compiled {options['output']}: {result['pgns']} PGNs, {result['spns']} SPNs, {result['bytes']} bytes"
+        ))
@@ -0,0 +1,85 @@
+"""
+Management command that compresses the existing J1939 upload archive in
+place (see Main/compression.py).
+
+Text logs under MEDIA_ROOT/j1939_uploads/ are rewritten as framed gzip
+under the same storage name, so Vehicle.excel_file and IngestJob paths stay
+valid. Workbooks, files already compressed and files of ingest jobs that
+are still pending or running are skipped, so the command can be re-run.
+
+    python manage.py compress_uploads
+    python manage.py compress_uploads --dry-run
+    python manage.py compress_uploads --level 9
+"""
+
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from Main.compression import compress_stored, is_compressible
+from Main.formats import SNIFF_BYTES
+from Main.jobs import unfinished_jobs
+from Main.models import CompressedFile
+
+UPLOAD_DIR = 'j1939_uploads'
+
+
+class Command(BaseCommand):
+    help = 'Compress archived J1939 uploads in place'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List the files that would be compressed without changing anything')
+        parser.add_argument('--level', type=int, default=None,
+                            help='gzip level 1-9 (default: J1939_UPLOAD_COMPRESSION_LEVEL)')
+
+    def handle(self, *args, **options):
+        level = options['level']
+        if level is not None and not 1 <= level <= 9:
+            raise CommandError('--level must be between 1 and 9')
+        root = default_storage.path(UPLOAD_DIR)
+        if not os.path.isdir(root):
+            self.stdout.write(f'No uploads under {root}')
+            return
+
+        # Jobs map their file while they run; leave those for a later pass
+        skip = set(CompressedFile.objects.values_list('name', flat=True))
+        skip.update(job.stored_file.name for job in unfinished_jobs())
+
+        compressed = failed = 0
+        before = after = 0
+        for directory, dirs, files in os.walk(root):
+            dirs.sort()
+            for fname in sorted(files):
+                path = os.path.join(directory, fname)
+                name = f'{UPLOAD_DIR}/' + os.path.relpath(path, root).replace(os.sep, '/')
+                if name in skip:
+                    continue
+                if options['dry_run']:
+                    with open(path, 'rb') as fh:
+                        if is_compressible(fh.read(SNIFF_BYTES), name):
+                            self.stdout.write(f'Would compress {name}')
+                            compressed += 1
+                            before += os.path.getsize(path)
+                    continue
+                try:
+                    entry = compress_stored(name, level)
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{name}: {exc}')
+                    continue
+                if entry is not None:
+                    compressed += 1
+                    before += entry.size
+                    after += entry.compressed_size
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Would compress {compressed} files ({before / (1024 * 1024):.1f} MB)'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Compressed {compressed} files, {failed} failed '
+            f'({(before - after) / (1024 * 1024):.1f} MB reclaimed)'
+        ))
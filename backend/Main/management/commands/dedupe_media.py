@@ -0,0 +1,59 @@
+"""
+Management command that moves files already under MEDIA_ROOT into the
+content-addressed store (Main/storage.py).
+
+Each file is hashed and replaced by a hard link to its blob, so duplicates
+uploaded before the store was enabled stop using extra disk. Paths stay the
+same; files already tracked are skipped, so the command can be re-run.
+
+    python manage.py dedupe_media
+    python manage.py dedupe_media --dry-run
+"""
+
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from Main.storage import BLOB_DIR, hash_path
+from Main.uploads import SPOOL_DIR
+
+
+class Command(BaseCommand):
+    help = 'Deduplicate existing media files into the content-addressed store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the disk that would be saved without changing anything')
+
+    def handle(self, *args, **options):
+        if not hasattr(default_storage, 'adopt'):
+            raise CommandError('The default storage is not content addressed (see CONTENT_ADDRESSED_MEDIA)')
+        root = str(settings.MEDIA_ROOT)
+        skip = {os.path.join(root, BLOB_DIR), os.path.join(root, SPOOL_DIR)}
+
+        seen = set()
+        adopted = duplicates = saved = 0
+        for directory, dirs, files in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if os.path.join(directory, d) not in skip)
+            for fname in sorted(files):
+                path = os.path.join(directory, fname)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                if default_storage.content_hash(name):
+                    continue
+                content_hash = hash_path(path)
+                blob_exists = content_hash in seen or os.path.exists(
+                    default_storage.path(default_storage.blob_name(content_hash)))
+                if blob_exists:
+                    duplicates += 1
+                    saved += os.path.getsize(path)
+                seen.add(content_hash)
+                if not options['dry_run']:
+                    default_storage.adopt(name, content_hash)
+                adopted += 1
+
+        action = 'Would adopt' if options['dry_run'] else 'Adopted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {adopted} files, {duplicates} duplicates ({saved / (1024 * 1024):.1f} MB reclaimed)'
+        ))
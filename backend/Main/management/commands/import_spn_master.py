@@ -0,0 +1,63 @@
+"""
+Management command to load an SPN master CSV or a DBC file into
+J1939ParameterDefinition.
+
+The file is diffed against the stored definitions and applied with bulk
+inserts/updates in one transaction (see Main/spn_master.py), so re-running
+it on an unchanged file writes nothing.
+
+    python manage.py import_spn_master
+    python manage.py import_spn_master /path/to/j1939_71.csv --dry-run
+    python manage.py import_spn_master /path/to/vehicle.dbc
+"""
+
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Main.dbc import parse_dbc
+from Main.spn_master import parse_spn_master, import_spn_master
+
+
+class Command(BaseCommand):
+    help = 'Bulk import an SPN master CSV or a DBC file (default: data/j1939_spn_master.csv)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=os.path.join(settings.BASE_DIR, 'data', 'j1939_spn_master.csv'),
+                            help='CSV or DBC file to import')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would change without writing anything')
+        parser.add_argument('--show-changes', action='store_true',
+                            help='List every created SPN and changed field')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'File not found: {path}')
+        with open(path, 'rb') as fh:
+            try:
+                if path.lower().endswith('.dbc'):
+                    definitions, errors = parse_dbc(fh)
+                else:
+                    definitions, errors = parse_spn_master(fh.read())
+            except UnicodeDecodeError as exc:
+                raise CommandError(f'{path} is not UTF-8: {exc}')
+        for error in errors:
+            self.stderr.write(error)
+
+        result = import_spn_master(definitions, dry_run=options['dry_run'])
+        if options['show_changes']:
+            for spn in result['created_spns']:
+                self.stdout.write(f'+ SPN {spn}')
+            for spn, changed in result['changes'].items():
+                for name, (old, new) in changed.items():
+                    self.stdout.write(f'~ SPN {spn} {name}: {old!r} -> {new!r}')
+
+        action = 'Would import' if options['dry_run'] else 'Imported'
+        version = result['definition_version']
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {path}: {result['created']} created, {result['updated']} updated, "
+            f"{result['unchanged']} unchanged, {len(errors)} rows skipped "
+            f"(definitions v{version['id']}, {version['content_hash'][:12]})"
+        ))
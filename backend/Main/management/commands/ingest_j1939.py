@@ -0,0 +1,127 @@
+"""
+Management command to bulk-ingest a directory of J1939 logs and workbooks.
+
+Uses the same parsing and persistence steps as J1939UploadView
+(Main/ingest.py) without going through HTTP. Files are parsed in a process
+pool; results are written by this process alone through a BatchWriter, one
+transaction per batch. Files whose SHA-256 already belongs to a Vehicle are
+skipped, so an interrupted run can simply be started again.
+
+    python manage.py ingest_j1939 /data/archive --workers 8 --batch-size 50
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from Main.ingest import BatchWriter, parse_path
+from Main.models import Vehicle
+
+# Content hashes known when the pool started, set in each worker
+_skip_hashes = frozenset()
+
+
+def _init_worker(skip_hashes):
+    global _skip_hashes
+    _skip_hashes = skip_hashes
+
+
+def _parse_task(path):
+    return parse_path(path, _skip_hashes)
+
+
+def collect_paths(directory, recursive=True):
+    """Regular, non-hidden files under directory, sorted for a stable order."""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.')) if recursive else []
+        for name in sorted(files):
+            if not name.startswith('.'):
+                paths.append(os.path.join(root, name))
+    return paths
+
+
+class Command(BaseCommand):
+    help = 'Parse and ingest every J1939 file in a directory (skips files already ingested)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory containing the files to ingest')
+        parser.add_argument('--workers', type=int, default=settings.J1939_PARALLEL_WORKERS,
+                            help='Parser processes (1 parses in this process)')
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Vehicles written per database transaction')
+        parser.add_argument('--no-recursive', action='store_false', dest='recursive',
+                            help='Only ingest files directly inside the directory')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if not os.path.isdir(directory):
+            raise CommandError(f'Not a directory: {directory}')
+
+        paths = collect_paths(directory, options['recursive'])
+        known_hashes = set(Vehicle.objects.exclude(content_hash='').values_list('content_hash', flat=True))
+        self.stdout.write(f'Found {len(paths)} files ({len(known_hashes)} hashes already ingested)')
+
+        self.stats = {'ingested': 0, 'skipped': 0, 'failed': 0, 'rows': 0, 'done': 0}
+        self.total = len(paths)
+        self.started = time.monotonic()
+        writer = BatchWriter(options['batch_size'])
+        workers = max(1, options['workers'])
+
+        for result in self._parse_all(paths, known_hashes, workers):
+            self.stats['done'] += 1
+            if result['status'] == 'parsed' and result['content_hash'] in known_hashes:
+                # Same content seen earlier in this run
+                result['status'] = 'skipped'
+            if result['status'] == 'skipped':
+                self.stats['skipped'] += 1
+            elif result['status'] == 'error':
+                self.stats['failed'] += 1
+                self.stderr.write(f"{result['path']}: {result.get('error')}")
+            else:
+                known_hashes.add(result['content_hash'])
+                written, failed = writer.add(result)
+                if written or failed:
+                    self._record(written, failed)
+        written, failed = writer.flush()
+        if written or failed:
+            self._record(written, failed)
+
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✅ Ingestion finished in {elapsed:.1f}s"
+            f"\n   Ingested: {self.stats['ingested']}"
+            f"\n   Skipped (already ingested): {self.stats['skipped']}"
+            f"\n   Failed: {self.stats['failed']}"
+            f"\n   Throughput: {self.stats['done'] / elapsed:.1f} files/s, {self.stats['rows'] / elapsed:.0f} rows/s"
+        ))
+
+    def _parse_all(self, paths, known_hashes, workers):
+        """Yield parse results in path order."""
+        if workers == 1 or len(paths) < 2:
+            for path in paths:
+                yield parse_path(path, known_hashes)
+            return
+        # Forked workers must not share this process's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(frozenset(known_hashes),)) as pool:
+            yield from pool.map(_parse_task, paths)
+
+    def _record(self, written, failed):
+        """Update the counters after a batch write and report progress."""
+        self.stats['ingested'] += len(written)
+        self.stats['failed'] += len(failed)
+        self.stats['rows'] += sum(result['rows'] for result in written)
+        for result in failed:
+            self.stderr.write(f"{result['path']}: {result['error']}")
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        self.stdout.write(
+            f"[{self.stats['done']}/{self.total}] "
+            f"{self.stats['done'] / elapsed:.1f} files/s, {self.stats['rows'] / elapsed:.0f} rows/s "
+            f"(ingested {self.stats['ingested']}, skipped {self.stats['skipped']}, failed {self.stats['failed']})"
+        )
@@ -0,0 +1,27 @@
+"""
+Management command that snapshots the J1939 parameter definitions as a new
+DefinitionVersion when they changed (see Main/definitions.py).
+
+The import, API, admin and seed paths publish on their own; run this after
+editing J1939ParameterDefinition any other way (shell, SQL, fixtures).
+
+    python manage.py publish_definitions
+"""
+
+from django.core.management.base import BaseCommand
+
+from Main.definitions import publish_definition_version
+
+
+class Command(BaseCommand):
+    help = 'Publish a parameter definition version if the definitions changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default='manual',
+                            help='Recorded as the version source (default: manual)')
+
+    def handle(self, *args, **options):
+        version = publish_definition_version(options['source'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Definitions v{version.id}: {version.definition_count} SPNs, {version.content_hash}'
+        ))
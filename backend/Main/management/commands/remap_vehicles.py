@@ -0,0 +1,45 @@
+"""
+Management command to run vehicle re-mapping jobs (Main/remap.py) left
+pending or running, e.g. when J1939_REMAP_IN_BACKGROUND is off or a worker
+was restarted mid-job.
+
+    python manage.py remap_vehicles
+    python manage.py remap_vehicles --current
+"""
+
+from django.core.management.base import BaseCommand
+
+from Main.definitions import current_definition_version
+from Main.models import RemapJob
+from Main.remap import create_remap_job, run_remap_job, unfinished_jobs
+
+
+class Command(BaseCommand):
+    help = 'Re-map stored vehicle J1939 mappings onto newer parameter definitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--current', action='store_true',
+                            help='First queue a job onto the current definition version')
+
+    def handle(self, *args, **options):
+        if options['current']:
+            job = create_remap_job(current_definition_version())
+            self.stdout.write(f'Queued remap job {job.id} onto definitions v{job.definition_version_id}')
+
+        done = failed = 0
+        for job in unfinished_jobs():
+            self.stdout.write(f'Running remap job {job.id} onto definitions v{job.definition_version_id}')
+            try:
+                run_remap_job(job)
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'Remap job {job.id}: {exc}')
+                continue
+            if job.status == RemapJob.STATUS_SUPERSEDED:
+                self.stdout.write(f'Job {job.id} superseded by a newer job')
+                continue
+            done += 1
+            self.stdout.write(f'Job {job.id} done: {job.vehicles_remapped} re-mapped, '
+                              f'{job.vehicles_retagged} re-tagged')
+
+        self.stdout.write(self.style.SUCCESS(f'Remap jobs done: {done}, failed: {failed}'))
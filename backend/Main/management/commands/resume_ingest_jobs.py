@@ -0,0 +1,50 @@
+"""
+Management command to resume checkpointed ingest jobs (Main/jobs.py) left
+pending or running, e.g. by a web worker that was killed mid-upload.
+
+Each job continues from its last committed chunk. Jobs a live run still
+holds (heartbeat newer than J1939_INGEST_STALE_SECONDS) are skipped.
+
+    python manage.py resume_ingest_jobs
+    python manage.py resume_ingest_jobs --job 12 --include-failed
+"""
+
+from django.core.management.base import BaseCommand
+
+from Main.jobs import IngestJobBusy, resumable_jobs, run_ingest_job
+from Main.models import IngestJob
+
+
+class Command(BaseCommand):
+    help = 'Resume interrupted J1939 ingest jobs from their last checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', type=int, action='append', dest='job_ids',
+                            help='Only resume this job id (repeatable)')
+        parser.add_argument('--include-failed', action='store_true',
+                            help='Also retry failed jobs')
+
+    def handle(self, *args, **options):
+        jobs = resumable_jobs()
+        if options['include_failed']:
+            jobs = IngestJob.objects.exclude(status=IngestJob.STATUS_DONE).order_by('created_at')
+        if options['job_ids']:
+            jobs = jobs.filter(id__in=options['job_ids'])
+
+        done = failed = busy = 0
+        for job in jobs:
+            self.stdout.write(f'Resuming job {job.id} ({job.source_file}) at byte {job.byte_offset}')
+            try:
+                run_ingest_job(job)
+            except ValueError as exc:
+                failed += 1
+                self.stderr.write(f'Job {job.id} ({job.source_file}): {exc}')
+                continue
+            except IngestJobBusy as exc:
+                busy += 1
+                self.stdout.write(f'Job {job.id} skipped: {exc}')
+                continue
+            done += 1
+            self.stdout.write(f'Job {job.id} done: vehicle {job.vehicle_id}, {job.rows_consumed} rows')
+
+        self.stdout.write(self.style.SUCCESS(f'Resumed: {done}, failed: {failed}, busy: {busy}'))
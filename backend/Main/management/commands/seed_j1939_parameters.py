@@ -7,6 +7,7 @@ SPNs: 4191, 84, 959, 960, 961, 962, 963, 964, 182
 """
 
 from django.core.management.base import BaseCommand
+from Main.definitions import publish_definition_version
 from Main.models import J1939ParameterDefinition
 
 
@@ -176,8 +177,11 @@ class Command(BaseCommand):
                     self.style.WARNING(f"Updated: SPN {param['SPN_Number']} - {param['SPN_Description']}")
                 )
 
+        version = publish_definition_version('seed')
+
         self.stdout.write(self.style.SUCCESS(
             f"\n✅ J1939 Parameter Definitions seeded successfully!"
+            f"\n   Definitions version: v{version.id} ({version.content_hash[:12]})"
             f"\n   Created: {created_count}"
             f"\n   Updated: {updated_count}"
             f"\n   Total: {created_count + updated_count}"
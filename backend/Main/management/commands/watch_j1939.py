@@ -0,0 +1,213 @@
+"""
+Management command that watches a gateway drop directory and ingests new
+J1939 files as they arrive.
+
+Completed files (see Main/watcher.py) are parsed by a bounded pool of
+worker processes and written in batches by this process through the same
+BatchWriter as ingest_j1939. Each processed file is then moved to
+<archive>/<Y>/<M>/<D>/, or to <archive>/failed/<Y>/<M>/<D>/ when it could
+not be ingested. Files whose content was already ingested are archived
+without creating another vehicle.
+
+Queue depth (files waiting, being parsed or waiting to be written) and lag
+(age of the oldest waiting file) are logged and written to
+J1939_WATCH_STATUS_FILE, which /api/j1939/ingest/watch-status/ serves.
+
+    python manage.py watch_j1939 /srv/j1939/drop --archive /srv/j1939/archive
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from Main.ingest import BatchWriter, parse_path
+from Main.models import Vehicle
+from Main.watcher import DirectoryWatcher
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Watch a drop directory and ingest J1939 files as they arrive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', nargs='?', default=settings.J1939_WATCH_DIR,
+                            help='Drop directory (default: J1939_WATCH_DIR)')
+        parser.add_argument('--archive', default=settings.J1939_WATCH_ARCHIVE_DIR,
+                            help='Archive directory (default: J1939_WATCH_ARCHIVE_DIR or <directory>/archive)')
+        parser.add_argument('--workers', type=int, default=settings.J1939_WATCH_WORKERS,
+                            help='Files parsed concurrently (1 parses in this process)')
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Vehicles written per database transaction')
+        parser.add_argument('--settle-seconds', type=float, default=settings.J1939_WATCH_SETTLE_SECONDS)
+        parser.add_argument('--poll-interval', type=float, default=settings.J1939_WATCH_POLL_SECONDS)
+        parser.add_argument('--status-file', default=settings.J1939_WATCH_STATUS_FILE)
+        parser.add_argument('--poll', action='store_true', help='Poll even where inotify is available')
+        parser.add_argument('--once', action='store_true',
+                            help='Ingest the files that are complete now, then exit')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if not directory or not os.path.isdir(directory):
+            raise CommandError(f'Not a directory: {directory!r} (pass one or set J1939_WATCH_DIR)')
+        self.directory = os.path.abspath(directory)
+        self.archive = os.path.abspath(options['archive'] or os.path.join(self.directory, 'archive'))
+        self.status_file = options['status_file']
+        workers = max(1, options['workers'])
+
+        watcher = DirectoryWatcher(
+            self.directory,
+            settle_seconds=options['settle_seconds'],
+            poll_interval=options['poll_interval'],
+            exclude=[self.archive],
+            use_inotify=not options['poll'],
+        )
+        self.stdout.write(f'Watching {self.directory} ({watcher.mode}), archiving to {self.archive}')
+
+        known_hashes = set(Vehicle.objects.exclude(content_hash='').values_list('content_hash', flat=True))
+        writer = BatchWriter(options['batch_size'])
+        self.stats = {'ingested': 0, 'skipped': 0, 'failed': 0}
+        queued = []        # completed files not yet handed to a worker
+        in_flight = {}     # future -> path
+        handled = set()    # every path queued and not yet archived
+
+        pool = None
+        if workers > 1:
+            # Forked workers must not share this process's database connections
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            while True:
+                ready, writing = watcher.completed_files()
+                for path in ready:
+                    if path not in handled:
+                        handled.add(path)
+                        queued.append(path)
+
+                # Bounded concurrency: never more than `workers` files in flight
+                results = []
+                while queued and len(in_flight) < workers:
+                    path = queued.pop(0)
+                    if pool is None:
+                        results.append(parse_path(path, known_hashes))
+                    else:
+                        in_flight[pool.submit(parse_path, path, frozenset(known_hashes))] = path
+                if in_flight:
+                    done, _ = wait(list(in_flight), timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path = in_flight.pop(future)
+                        try:
+                            results.append(future.result())
+                        except Exception as exc:
+                            results.append({'path': path, 'status': 'error', 'error': str(exc)})
+
+                for result in results:
+                    self._handle_result(result, writer, known_hashes, handled, watcher)
+
+                idle = not queued and not in_flight
+                if idle and writer.pending:
+                    # Nothing else arriving right now: do not wait for a full batch
+                    self._archive_written(*writer.flush(), handled=handled, watcher=watcher)
+
+                self._report(queued, in_flight, writer, writing)
+                if options['once'] and idle and not writer.pending:
+                    break
+                if idle:
+                    watcher.wait()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping watcher')
+        finally:
+            self._archive_written(*writer.flush(), handled=handled, watcher=watcher)
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            watcher.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested: {self.stats['ingested']}, skipped: {self.stats['skipped']}, failed: {self.stats['failed']}"
+        ))
+
+    def _handle_result(self, result, writer, known_hashes, handled, watcher):
+        if result['status'] == 'parsed' and result['content_hash'] in known_hashes:
+            # Same content arrived earlier in this session
+            result['status'] = 'skipped'
+        if result['status'] == 'skipped':
+            self.stats['skipped'] += 1
+            self._archive(result['path'], handled, watcher)
+        elif result['status'] == 'error':
+            self._archive_failed(result, handled, watcher)
+        else:
+            known_hashes.add(result['content_hash'])
+            self._archive_written(*writer.add(result), handled=handled, watcher=watcher)
+
+    def _archive_written(self, written, failed, handled, watcher):
+        for result in written:
+            self.stats['ingested'] += 1
+            logger.info('Ingested %s as vehicle %s', result['path'], result['vehicle'].id)
+            self._archive(result['path'], handled, watcher)
+        for result in failed:
+            self._archive_failed(result, handled, watcher)
+
+    def _archive_failed(self, result, handled, watcher):
+        self.stats['failed'] += 1
+        self.stderr.write(f"{result['path']}: {result.get('error')}")
+        self._archive(result['path'], handled, watcher, failed=True)
+
+    def _archive(self, path, handled, watcher, failed=False):
+        """Move a processed file to the archive tree, keeping its relative path."""
+        today = timezone.now().date()
+        parts = [self.archive] + (['failed'] if failed else [])
+        parts += [f'{today.year}', f'{today.month:02d}', f'{today.day:02d}']
+        target = os.path.join(*parts, os.path.relpath(path, self.directory))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        base, ext = os.path.splitext(target)
+        suffix = 1
+        while os.path.exists(target):
+            target = f'{base}_{suffix}{ext}'
+            suffix += 1
+        try:
+            shutil.move(path, target)
+        except OSError as exc:
+            logger.error('Could not archive %s: %s', path, exc)
+        handled.discard(path)
+        watcher.forget(path)
+
+    def _report(self, queued, in_flight, writer, writing):
+        """Log and publish queue depth and lag."""
+        waiting = list(queued) + list(in_flight.values()) + [r['path'] for r in writer.pending]
+        now = time.time()
+        mtimes = []
+        for path in waiting:
+            try:
+                mtimes.append(os.path.getmtime(path))
+            except OSError:
+                continue
+        status = {
+            'directory': self.directory,
+            'queue_depth': len(waiting),
+            'in_flight': len(in_flight),
+            'files_being_written': writing,
+            'lag_seconds': round(now - min(mtimes), 3) if mtimes else 0.0,
+            'ingested': self.stats['ingested'],
+            'skipped': self.stats['skipped'],
+            'failed': self.stats['failed'],
+            'updated_at': timezone.now().isoformat(),
+        }
+        if waiting:
+            logger.info('Watch queue depth=%d lag=%.1fs', status['queue_depth'], status['lag_seconds'])
+        if not self.status_file:
+            return
+        tmp_path = f'{self.status_file}.tmp'
+        try:
+            with open(tmp_path, 'w') as fh:
+                json.dump(status, fh)
+            os.replace(tmp_path, self.status_file)
+        except OSError as exc:
+            logger.warning('Could not write watch status to %s: %s', self.status_file, exc)
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.17 on 2026-10-18 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ColumnTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(help_text='SHA-256 of the normalized header row', max_length=64, unique=True)),
+                ('name', models.CharField(blank=True, help_text='Optional label, e.g. the exporting tool', max_length=200)),
+                ('header', models.JSONField(default=list, help_text='Normalized header cells')),
+                ('column_roles', models.JSONField(default=dict, help_text='Column index per role (index, pgn_h, pgn, spn, desc)')),
+                ('metadata_cells', models.JSONField(default=dict, help_text='[row, col] of the vehicle name and brand value cells')),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-hit_count', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.17 on 2026-10-18 23:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0003_column_template'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Gateway/source key, defaults to the file name', max_length=255, unique=True)),
+                ('encoding', models.CharField(max_length=32)),
+                ('byte_offset', models.BigIntegerField(default=0, help_text='Offset of the first line not yet committed')),
+                ('head_hash', models.CharField(blank=True, help_text='SHA-256 of the leading bytes, to detect rotation', max_length=64)),
+                ('layout', models.JSONField(blank=True, help_text='Detected delimiter, header and PGN/CAN ID columns', null=True)),
+                ('layout_final', models.BooleanField(default=False)),
+                ('pgn_counts', models.JSONField(default=dict, help_text='PGN hex -> occurrences in committed lines')),
+                ('lines', models.BigIntegerField(default=0, help_text='Committed data lines')),
+                ('partial_line', models.TextField(blank=True, help_text='Trailing line without a newline, re-read next time')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-18 23:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0004_log_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the uploaded file', max_length=64),
+        ),
+    ]
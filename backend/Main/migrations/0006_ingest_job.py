@@ -0,0 +1,41 @@
+# Generated by Django 4.2.17 on 2026-10-18 23:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('Main', '0005_vehicle_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_file', models.CharField(max_length=512)),
+                ('stored_file', models.FileField(upload_to='j1939_uploads/%Y/%m/%d/')),
+                ('content_hash', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('detected_format', models.CharField(blank=True, max_length=32)),
+                ('encoding', models.CharField(blank=True, max_length=32)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('chunk_bytes', models.BigIntegerField(help_text='Chunk size fixed at creation so resumed runs split the file identically')),
+                ('byte_offset', models.BigIntegerField(default=0, help_text='Bytes consumed and checkpointed')),
+                ('rows_consumed', models.BigIntegerField(default=0)),
+                ('chunks_done', models.PositiveIntegerField(default=0)),
+                ('state', models.JSONField(default=dict, help_text='Partial aggregates (PGNs, SPNs, PGN(H) stats, vehicle metadata)')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('uploaded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('vehicle', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='Main.vehicle')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.17 on 2026-10-18 23:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0008_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompressedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Storage name of the compressed file', max_length=512, unique=True)),
+                ('algorithm', models.CharField(default='gzip', max_length=16)),
+                ('size', models.BigIntegerField(help_text='Uncompressed size')),
+                ('compressed_size', models.BigIntegerField()),
+                ('frame_bytes', models.PositiveIntegerField(help_text='Uncompressed bytes per frame')),
+                ('frame_offsets', models.JSONField(default=list, help_text='Compressed offset of every frame')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.17 on 2026-10-19 00:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0010_upload_idempotency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DefinitionVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(db_index=True, help_text='SHA-256 of the canonical definition rows', max_length=64)),
+                ('definition_count', models.PositiveIntegerField()),
+                ('source', models.CharField(blank=True, help_text='What published the version (import, api, admin...)', max_length=50)),
+                ('definitions', models.JSONField(default=list, help_text='[SPN_Number, PGN_DEC, ...] rows, see definitions.SNAPSHOT_FIELDS')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='definition_version',
+            field=models.ForeignKey(blank=True, help_text='Parameter definition snapshot the vehicle was mapped against', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='vehicles', to='Main.definitionversion'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.17 on 2026-10-19 00:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0011_definition_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleJ1939Mapping',
+            fields=[
+                ('vehicle', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='j1939_mapping', serialize=False, to='Main.vehicle')),
+                ('pgn_count', models.PositiveIntegerField(default=0, help_text='Vehicle PGNs that have definitions')),
+                ('spns', models.JSONField(default=list, help_text='Mapped SPN numbers, in vehicle PGN order')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('definition_version', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='vehicle_mappings', to='Main.definitionversion')),
+            ],
+        ),
+    ]
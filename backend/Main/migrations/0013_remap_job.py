@@ -0,0 +1,31 @@
+# Generated by Django 4.2.17 on 2026-10-19 00:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0012_vehicle_j1939_mapping'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RemapJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('changed_pgns', models.JSONField(default=list, help_text='PGNs whose definitions differ from the previous version')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('vehicles_remapped', models.PositiveIntegerField(default=0)),
+                ('vehicles_retagged', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('definition_version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='remap_jobs', to='Main.definitionversion')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
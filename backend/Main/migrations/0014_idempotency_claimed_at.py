@@ -0,0 +1,19 @@
+# Generated by Django 4.2.17 on 2026-10-19 00:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0013_remap_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='claimed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When the request now processing the key claimed it; a pending claim older than IDEMPOTENCY_PENDING_TIMEOUT_SECONDS is abandoned'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.17 on 2026-10-19 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0014_idempotency_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='claimed_by',
+            field=models.CharField(blank=True, help_text='Token of the run processing the job; empty when no run holds it', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Refreshed by the claiming run after every chunk; older than J1939_INGEST_STALE_SECONDS means the run died', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-19 00:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0015_ingest_job_claim'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='remapjob',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('superseded', 'Superseded by a newer job')], default='pending', max_length=16),
+        ),
+    ]
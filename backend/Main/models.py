@@ -1,5 +1,9 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
 
 User = get_user_model()
 
@@ -11,6 +15,12 @@ class Vehicle(models.Model):
 	excel_file = models.FileField(upload_to='j1939_uploads/%Y/%m/%d/', blank=True, null=True, help_text='Original Excel file for auditing')
 	uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 	upload_date = models.DateTimeField(auto_now_add=True)
+	content_hash = models.CharField(max_length=64, blank=True, db_index=True, help_text='SHA-256 of the uploaded file')
+	upload_summary = models.JSONField(default=dict, blank=True, help_text='Format and PGN(H) stats of the upload, replayed for duplicate uploads')
+	definition_version = models.ForeignKey(
+		'DefinitionVersion', on_delete=models.PROTECT, null=True, blank=True, related_name='vehicles',
+		help_text='Parameter definition snapshot the vehicle was mapped against'
+	)
 
 	def __str__(self):
 		return f"{self.brand} {self.name}" if self.brand else self.name
@@ -58,6 +68,205 @@ class VehiclePGN(models.Model):
 		return f"{self.vehicle} - PGN {self.pgn.pgn_number}"
 
 
+class ColumnTemplate(models.Model):
+	"""Learned column layout for a known export header, keyed by header hash"""
+	signature = models.CharField(max_length=64, unique=True, help_text='SHA-256 of the normalized header row')
+	name = models.CharField(max_length=200, blank=True, help_text='Optional label, e.g. the exporting tool')
+	header = models.JSONField(default=list, help_text='Normalized header cells')
+	column_roles = models.JSONField(default=dict, help_text='Column index per role (index, pgn_h, pgn, spn, desc)')
+	metadata_cells = models.JSONField(default=dict, help_text='[row, col] of the vehicle name and brand value cells')
+	hit_count = models.PositiveIntegerField(default=0)
+	created_at = models.DateTimeField(auto_now_add=True)
+	last_used_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		ordering = ['-hit_count', 'id']
+
+	def __str__(self):
+		return self.name or f"Template {self.signature[:12]}"
+
+	def roles_for(self, column_count):
+		"""Column roles, dropping any index outside a sheet with column_count columns"""
+		return {
+			role: (idx if isinstance(idx, int) and idx < column_count else None)
+			for role, idx in self.column_roles.items()
+		}
+
+
+class LogCheckpoint(models.Model):
+	"""Incremental analysis state of a growing text log, keyed by source"""
+	source = models.CharField(max_length=255, unique=True, help_text='Gateway/source key, defaults to the file name')
+	encoding = models.CharField(max_length=32)
+	byte_offset = models.BigIntegerField(default=0, help_text='Offset of the first line not yet committed')
+	head_hash = models.CharField(max_length=64, blank=True, help_text='SHA-256 of the leading bytes, to detect rotation')
+	layout = models.JSONField(null=True, blank=True, help_text='Detected delimiter, header and PGN/CAN ID columns')
+	layout_final = models.BooleanField(default=False)
+	pgn_counts = models.JSONField(default=dict, help_text='PGN hex -> occurrences in committed lines')
+	lines = models.BigIntegerField(default=0, help_text='Committed data lines')
+	partial_line = models.TextField(blank=True, help_text='Trailing line without a newline, re-read next time')
+	updated_at = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return f"{self.source} @ {self.byte_offset}"
+
+	def state(self):
+		"""Checkpoint dict as used by log_analysis.analyze_increment()"""
+		return {
+			'encoding': self.encoding,
+			'byte_offset': self.byte_offset,
+			'head_hash': self.head_hash,
+			'layout': self.layout,
+			'layout_final': self.layout_final,
+			'counts': self.pgn_counts,
+			'lines': self.lines,
+			'partial_line': self.partial_line,
+		}
+
+	def update_from(self, state):
+		"""Store a checkpoint dict returned by analyze_increment()"""
+		self.encoding = state['encoding']
+		self.byte_offset = state['byte_offset']
+		self.head_hash = state['head_hash']
+		self.layout = state['layout']
+		self.layout_final = state['layout_final']
+		self.pgn_counts = state['counts']
+		self.lines = state['lines']
+		self.partial_line = state['partial_line']
+		self.save()
+
+
+class IngestJob(models.Model):
+	"""Checkpointed ingestion of one stored upload, resumable after a crash"""
+	STATUS_PENDING = 'pending'
+	STATUS_RUNNING = 'running'
+	STATUS_DONE = 'done'
+	STATUS_FAILED = 'failed'
+	STATUS_CHOICES = [
+		(STATUS_PENDING, 'Pending'),
+		(STATUS_RUNNING, 'Running'),
+		(STATUS_DONE, 'Done'),
+		(STATUS_FAILED, 'Failed'),
+	]
+
+	source_file = models.CharField(max_length=512)
+	stored_file = models.FileField(upload_to='j1939_uploads/%Y/%m/%d/')
+	content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+	detected_format = models.CharField(max_length=32, blank=True)
+	encoding = models.CharField(max_length=32, blank=True)
+	status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+	chunk_bytes = models.BigIntegerField(help_text='Chunk size fixed at creation so resumed runs split the file identically')
+	byte_offset = models.BigIntegerField(default=0, help_text='Bytes consumed and checkpointed')
+	rows_consumed = models.BigIntegerField(default=0)
+	chunks_done = models.PositiveIntegerField(default=0)
+	state = models.JSONField(default=dict, help_text='Partial aggregates (PGNs, SPNs, PGN(H) stats, vehicle metadata)')
+	vehicle = models.ForeignKey(Vehicle, on_delete=models.SET_NULL, null=True, blank=True)
+	uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+	error = models.TextField(blank=True)
+	claimed_by = models.CharField(max_length=64, blank=True, help_text='Token of the run processing the job; empty when no run holds it')
+	heartbeat_at = models.DateTimeField(null=True, blank=True, help_text='Refreshed by the claiming run after every chunk; older than J1939_INGEST_STALE_SECONDS means the run died')
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		ordering = ['-created_at']
+
+	def __str__(self):
+		return f"{self.source_file} ({self.status}, {self.byte_offset} bytes)"
+
+
+class UploadSession(models.Model):
+	"""Chunked, resumable upload of one large file, spooled under MEDIA_ROOT"""
+	STATUS_OPEN = 'open'
+	STATUS_COMPLETE = 'complete'
+	STATUS_FAILED = 'failed'
+	STATUS_CHOICES = [
+		(STATUS_OPEN, 'Open'),
+		(STATUS_COMPLETE, 'Complete'),
+		(STATUS_FAILED, 'Failed'),
+	]
+
+	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	filename = models.CharField(max_length=512)
+	total_size = models.BigIntegerField()
+	received_bytes = models.BigIntegerField(default=0, help_text='Contiguous bytes written to the spool file')
+	sha256 = models.CharField(max_length=64, blank=True, help_text='Expected SHA-256 of the whole file')
+	spool_file = models.CharField(max_length=255)
+	template_id = models.CharField(max_length=64, blank=True)
+	status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_OPEN)
+	ingest_job = models.ForeignKey(IngestJob, on_delete=models.SET_NULL, null=True, blank=True)
+	uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+	error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		ordering = ['-created_at']
+
+	def __str__(self):
+		return f"{self.filename} ({self.status}, {self.received_bytes}/{self.total_size} bytes)"
+
+
+class ContentBlob(models.Model):
+	"""One stored file body, kept once per SHA-256 (see Main/storage.py)"""
+	sha256 = models.CharField(max_length=64, primary_key=True)
+	size = models.BigIntegerField()
+	ref_count = models.PositiveIntegerField(default=0, help_text='Logical file names pointing at this blob')
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self):
+		return f"{self.sha256[:12]} ({self.ref_count} refs)"
+
+
+class ContentName(models.Model):
+	"""Logical storage name (a FileField path) and the blob it holds"""
+	name = models.CharField(max_length=512, unique=True)
+	blob = models.ForeignKey(ContentBlob, on_delete=models.PROTECT, related_name='names')
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self):
+		return self.name
+
+
+class CompressedFile(models.Model):
+	"""Frame index of a stored upload kept compressed at rest (see Main/compression.py)"""
+	name = models.CharField(max_length=512, unique=True, help_text='Storage name of the compressed file')
+	algorithm = models.CharField(max_length=16, default='gzip')
+	size = models.BigIntegerField(help_text='Uncompressed size')
+	compressed_size = models.BigIntegerField()
+	frame_bytes = models.PositiveIntegerField(help_text='Uncompressed bytes per frame')
+	frame_offsets = models.JSONField(default=list, help_text='Compressed offset of every frame')
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self):
+		return f"{self.name} ({self.size} -> {self.compressed_size} bytes)"
+
+
+class IdempotencyKey(models.Model):
+	"""Response stored for an Idempotency-Key, replayed when the client retries"""
+	STATUS_PENDING = 'pending'
+	STATUS_COMPLETE = 'complete'
+	STATUS_CHOICES = [
+		(STATUS_PENDING, 'Pending'),
+		(STATUS_COMPLETE, 'Complete'),
+	]
+
+	key = models.CharField(max_length=255)
+	scope = models.CharField(max_length=100, help_text='Endpoint the key was used on')
+	request_fingerprint = models.CharField(max_length=64, help_text='Hash of the request line and size, to catch a key reused for another request')
+	status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+	status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+	response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+	user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+	created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+	claimed_at = models.DateTimeField(default=timezone.now, help_text='When the request now processing the key claimed it; a pending claim older than IDEMPOTENCY_PENDING_TIMEOUT_SECONDS is abandoned')
+
+	class Meta:
+		unique_together = ('scope', 'key')
+
+	def __str__(self):
+		return f"{self.scope}: {self.key} ({self.status})"
+
+
 class StandardFile(models.Model):
 	"""Standard J1939 files (e.g., J1939-71, J1939-73, etc.)"""
 	Standard_No = models.CharField(max_length=100, unique=True)  # e.g., "J1939-71 MAR2011"
@@ -301,59 +510,89 @@ class J1939ParameterDefinition(models.Model):
 		"""
 		Analyze a stream of PGN messages and count unique SPNs
 		
+		Messages are tallied first and the definitions resolved in one bulk
+		query (see Main/spn_counts.py); use UniqueSPNCounter directly to
+		count a stream in batches.
+		
 		Args:
-			pgn_data_stream: List of dicts with 'pgn' and optional 'spns' keys
+			pgn_data_stream: Iterable of dicts with 'pgn' and optional 'spns' keys
 		
 		Returns:
-			dict with 'count', 'unique_spns', and 'spn_details'
-		"""
-		unique_spns = set()
-		spn_occurrences = {}
+			dict with 'count', 'unique_spns', 'spn_details' and 'spn_occurrences'
 		
-		for message in pgn_data_stream:
-			pgn = message.get('pgn')
-			spns = message.get('spns', [])
-			
-			# If SPNs are provided directly
-			if spns:
-				for spn in spns:
-					spn_num = spn if isinstance(spn, int) else spn.get('spn_number', spn.get('spn'))
-					if spn_num:
-						unique_spns.add(spn_num)
-						spn_occurrences[spn_num] = spn_occurrences.get(spn_num, 0) + 1
-			
-			# Otherwise, look up SPNs by PGN from our definitions
-			elif pgn:
-				definitions = cls.get_definitions_for_pgn(pgn)
-				for defn in definitions:
-					unique_spns.add(defn.SPN_Number)
-					spn_occurrences[defn.SPN_Number] = spn_occurrences.get(defn.SPN_Number, 0) + 1
-		
-		# Get SPN details
-		spn_details = []
-		for spn_num in sorted(unique_spns):
-			defn = cls.get_definition_for_spn(spn_num)
-			if defn:
-				spn_details.append({
-					'spn_number': spn_num,
-					'description': defn.SPN_Description,
-					'unit': defn.Unit,
-					'pgn': defn.PGN_DEC,
-					'occurrences': spn_occurrences.get(spn_num, 0)
-				})
-			else:
-				spn_details.append({
-					'spn_number': spn_num,
-					'description': 'Unknown SPN',
-					'unit': 'N/A',
-					'pgn': None,
-					'occurrences': spn_occurrences.get(spn_num, 0)
-				})
-		
-		return {
-			'count': len(unique_spns),
-			'unique_spns': sorted(list(unique_spns)),
-			'spn_details': spn_details,
-			'spn_occurrences': spn_occurrences
-		}
+		Raises:
+			ValueError: a PGN or SPN is not a number
+		"""
+		from .spn_counts import UniqueSPNCounter
+		return UniqueSPNCounter().update(pgn_data_stream).result()
+
 
+class DefinitionVersion(models.Model):
+	"""
+	Immutable snapshot of the J1939ParameterDefinition table, published by
+	every write path (see Main/definitions.py). Mapping caches are keyed by
+	its content hash.
+	"""
+	content_hash = models.CharField(max_length=64, db_index=True, help_text='SHA-256 of the canonical definition rows')
+	definition_count = models.PositiveIntegerField()
+	source = models.CharField(max_length=50, blank=True, help_text='What published the version (import, api, admin...)')
+	definitions = models.JSONField(default=list, help_text='[SPN_Number, PGN_DEC, ...] rows, see definitions.SNAPSHOT_FIELDS')
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		ordering = ['-id']
+
+	def __str__(self):
+		return f"v{self.id} ({self.definition_count} SPNs, {self.content_hash[:12]})"
+
+
+class VehicleJ1939Mapping(models.Model):
+	"""
+	SPNs the J1939 standard defines for a vehicle's PGNs, computed at ingest
+	against definition_version and stored so views do not map again (see
+	ingest.save_j1939_mapping). Only SPN numbers are kept; their details come
+	from the version's definition index.
+	"""
+	vehicle = models.OneToOneField(Vehicle, on_delete=models.CASCADE, primary_key=True, related_name='j1939_mapping')
+	definition_version = models.ForeignKey(DefinitionVersion, on_delete=models.PROTECT, related_name='vehicle_mappings')
+	pgn_count = models.PositiveIntegerField(default=0, help_text='Vehicle PGNs that have definitions')
+	spns = models.JSONField(default=list, help_text='Mapped SPN numbers, in vehicle PGN order')
+	updated_at = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return f"{self.vehicle} - {len(self.spns)} SPNs (definitions v{self.definition_version_id})"
+
+
+class RemapJob(models.Model):
+	"""
+	Re-mapping of stored vehicle mappings onto a new DefinitionVersion (see
+	Main/remap.py). Only vehicles carrying a PGN whose definitions changed
+	are mapped again; the others are re-tagged in bulk.
+	"""
+	STATUS_PENDING = 'pending'
+	STATUS_RUNNING = 'running'
+	STATUS_DONE = 'done'
+	STATUS_FAILED = 'failed'
+	STATUS_SUPERSEDED = 'superseded'
+	STATUS_CHOICES = [
+		(STATUS_PENDING, 'Pending'),
+		(STATUS_RUNNING, 'Running'),
+		(STATUS_DONE, 'Done'),
+		(STATUS_FAILED, 'Failed'),
+		(STATUS_SUPERSEDED, 'Superseded by a newer job'),
+	]
+
+	definition_version = models.ForeignKey(DefinitionVersion, on_delete=models.CASCADE, related_name='remap_jobs')
+	changed_pgns = models.JSONField(default=list, help_text='PGNs whose definitions differ from the previous version')
+	status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+	vehicles_remapped = models.PositiveIntegerField(default=0)
+	vehicles_retagged = models.PositiveIntegerField(default=0)
+	error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		ordering = ['-created_at']
+
+	def __str__(self):
+		return f"Remap to v{self.definition_version_id} ({self.status}, {self.vehicles_remapped} remapped)"
@@ -0,0 +1,228 @@
+"""
+Incremental re-mapping of stored vehicle mappings after the definitions change.
+
+A vehicle's J1939 mapping (VehicleJ1939Mapping) only depends on the
+definitions of the PGNs it carries. When a new DefinitionVersion is
+published, changed_pgns() diffs it against the version a mapping was made
+with, the VehiclePGN links (indexed by PGN, so they are the PGN -> vehicles
+reverse index) give the vehicles carrying one of those PGNs, and only those
+are mapped again. Every other mapping is still correct and is re-tagged to
+the new version with a single UPDATE.
+
+publish_definition_version() queues a RemapJob once the new version is
+committed and, with J1939_REMAP_IN_BACKGROUND, runs it in a background
+thread. Vehicles are re-mapped in batches of BATCH_SIZE, each batch written
+with bulk_update in its own transaction, so an interrupted job keeps its
+progress; `manage.py remap_vehicles` runs jobs left unfinished.
+
+Jobs run one at a time: queueing a job supersedes the unfinished jobs onto
+the same or an older version (the new job covers every mapping they would
+have touched), and a superseded job that is still running stops at its next
+batch. Each batch re-reads and locks the mappings still older than the
+job's version, so a slower job can never move a mapping back to an older
+version.
+"""
+
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .definition_index import definition_index
+from .definitions import SNAPSHOT_FIELDS
+from .models import DefinitionVersion, RemapJob, Vehicle, VehicleJ1939Mapping, VehiclePGN
+
+logger = logging.getLogger(__name__)
+
+# Vehicles re-mapped per transaction
+BATCH_SIZE = 500
+
+_PGN = SNAPSHOT_FIELDS.index('PGN_DEC')
+
+
+def changed_pgns(old_version, new_version):
+    """
+    PGNs with an SPN added, removed or changed between two versions. A SPN
+    moved to another PGN counts for both.
+
+    Returns:
+        set of PGN numbers
+    """
+    old = {row[0]: row for row in old_version.definitions}
+    new = {row[0]: row for row in new_version.definitions}
+    changed = set()
+    for spn in old.keys() | new.keys():
+        before, after = old.get(spn), new.get(spn)
+        if before == after:
+            continue
+        if before is not None:
+            changed.add(before[_PGN])
+        if after is not None:
+            changed.add(after[_PGN])
+    return changed
+
+
+def vehicles_with_pgns(pgns):
+    """Ids of the vehicles carrying any of the PGNs."""
+    return VehiclePGN.objects.filter(pgn__pgn_number__in=pgns).values_list('vehicle_id', flat=True).distinct()
+
+
+class RemapJobSuperseded(Exception):
+    """A newer job was queued while this one was running."""
+
+
+def create_remap_job(version, previous=None):
+    """
+    Queue a RemapJob onto `version`, recording the PGNs changed since
+    `previous`. Unfinished jobs onto the same or an older version are
+    marked superseded.
+    """
+    pgns = sorted(changed_pgns(previous, version)) if previous is not None else []
+    with transaction.atomic():
+        superseded = RemapJob.objects.select_for_update().filter(
+            status__in=[RemapJob.STATUS_PENDING, RemapJob.STATUS_RUNNING], definition_version_id__lte=version.id
+        ).update(status=RemapJob.STATUS_SUPERSEDED, updated_at=timezone.now())
+        job = RemapJob.objects.create(definition_version=version, changed_pgns=pgns)
+    if superseded:
+        logger.info('Remap job %s supersedes %d unfinished jobs', job.id, superseded)
+    return job
+
+
+def schedule_remap(version, previous):
+    """
+    Queue a RemapJob for a newly published version and, with
+    J1939_REMAP_IN_BACKGROUND, start it in a daemon thread.
+
+    Returns:
+        the RemapJob, or None when no vehicle mapping needs it
+    """
+    if not VehicleJ1939Mapping.objects.filter(definition_version_id__lt=version.id).exists():
+        return None
+    job = create_remap_job(version, previous)
+    logger.info('Queued remap job %s onto definitions v%d (%d changed PGNs)',
+                job.id, version.id, len(job.changed_pgns))
+    if settings.J1939_REMAP_IN_BACKGROUND:
+        threading.Thread(target=_run_in_thread, args=(job.id,), name=f'remap-{job.id}', daemon=True).start()
+    return job
+
+
+def _run_in_thread(job_id):
+    try:
+        run_remap_job(RemapJob.objects.get(pk=job_id))
+    except Exception:
+        logger.exception('Remap job %s failed', job_id)
+    finally:
+        connection.close()
+
+
+def _check_current(job):
+    """
+    Lock the job row inside the current transaction.
+
+    Raises:
+        RemapJobSuperseded: a newer job was queued
+    """
+    status = RemapJob.objects.select_for_update().values_list('status', flat=True).get(pk=job.pk)
+    if status == RemapJob.STATUS_SUPERSEDED:
+        raise RemapJobSuperseded(f'remap job {job.id} was superseded')
+
+
+def _remap_batch(job, vehicle_ids, index, version):
+    """
+    Map the batch's vehicles still on an older version against `index` and
+    bulk-write the result.
+    """
+    pgns_by_vehicle = defaultdict(list)
+    for vehicle_id, pgn_num in VehiclePGN.objects.filter(vehicle_id__in=vehicle_ids).order_by(
+            'pgn__pgn_number').values_list('vehicle_id', 'pgn__pgn_number'):
+        pgns_by_vehicle[vehicle_id].append(pgn_num)
+
+    with transaction.atomic():
+        _check_current(job)
+        # Mappings another job already brought to this version or a newer
+        # one are left alone
+        mappings = list(VehicleJ1939Mapping.objects.select_for_update().filter(
+            vehicle_id__in=vehicle_ids, definition_version_id__lt=version.id))
+        now = timezone.now()
+        for mapping in mappings:
+            spns = []
+            pgn_count = 0
+            for pgn_num in pgns_by_vehicle[mapping.vehicle_id]:
+                pgn_spns = index.spns_for_pgn(pgn_num)
+                if pgn_spns:
+                    pgn_count += 1
+                    spns.extend(pgn_spns)
+            mapping.definition_version = version
+            mapping.pgn_count = pgn_count
+            mapping.spns = spns
+            # bulk_update does not apply auto_now
+            mapping.updated_at = now
+        VehicleJ1939Mapping.objects.bulk_update(
+            mappings, ['definition_version', 'pgn_count', 'spns', 'updated_at'], batch_size=BATCH_SIZE
+        )
+        Vehicle.objects.filter(id__in=[mapping.vehicle_id for mapping in mappings]).update(definition_version=version)
+    return len(mappings)
+
+
+def run_remap_job(job):
+    """
+    Bring every older vehicle mapping onto the job's version.
+
+    Returns:
+        the job, with vehicles_remapped and vehicles_retagged counted; a job
+        superseded by a newer one stops early with that status
+    """
+    finished = [RemapJob.STATUS_DONE, RemapJob.STATUS_SUPERSEDED]
+    # Conditional update, so a job superseded meanwhile is not revived
+    started = RemapJob.objects.filter(pk=job.pk).exclude(status__in=finished).update(
+        status=RemapJob.STATUS_RUNNING, error='', updated_at=timezone.now())
+    job.refresh_from_db()
+    if not started:
+        return job
+    version = job.definition_version
+    try:
+        index = definition_index(version.id)
+        old_ids = VehicleJ1939Mapping.objects.filter(definition_version_id__lt=version.id).values_list(
+            'definition_version_id', flat=True).distinct().order_by('definition_version_id')
+        for old_id in list(old_ids):
+            old = DefinitionVersion.objects.get(pk=old_id)
+            pgns = changed_pgns(old, version)
+            affected = list(VehicleJ1939Mapping.objects.filter(
+                definition_version=old, vehicle_id__in=vehicles_with_pgns(pgns)
+            ).values_list('vehicle_id', flat=True))
+            for start in range(0, len(affected), BATCH_SIZE):
+                job.vehicles_remapped += _remap_batch(job, affected[start:start + BATCH_SIZE], index, version)
+                job.save(update_fields=['vehicles_remapped', 'updated_at'])
+
+            # The remaining mappings do not involve a changed PGN
+            with transaction.atomic():
+                _check_current(job)
+                Vehicle.objects.filter(j1939_mapping__definition_version=old).update(definition_version=version)
+                job.vehicles_retagged += VehicleJ1939Mapping.objects.filter(definition_version=old).update(
+                    definition_version=version, updated_at=timezone.now())
+                job.save(update_fields=['vehicles_retagged', 'updated_at'])
+            logger.info('Remap job %s: v%d -> v%d, %d changed PGNs, %d vehicles re-mapped',
+                        job.id, old.id, version.id, len(pgns), len(affected))
+        with transaction.atomic():
+            _check_current(job)
+            job.status = RemapJob.STATUS_DONE
+            job.save(update_fields=['status', 'updated_at'])
+    except RemapJobSuperseded:
+        job.status = RemapJob.STATUS_SUPERSEDED
+        logger.info('Remap job %s stopped: superseded by a newer job', job.id)
+    except Exception as exc:
+        job.status = RemapJob.STATUS_FAILED
+        job.error = str(exc)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        raise
+    return job
+
+
+def unfinished_jobs():
+    """Remap jobs left pending or running, oldest first."""
+    return RemapJob.objects.filter(
+        status__in=[RemapJob.STATUS_PENDING, RemapJob.STATUS_RUNNING]
+    ).order_by('created_at')
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Vehicle, SPN, PGN, VehicleSPN, VehiclePGN, StandardFile, AuxiliaryFile, Category, J1939ParameterDefinition
+from django.urls import reverse
+from .models import Vehicle, SPN, PGN, VehicleSPN, VehiclePGN, StandardFile, AuxiliaryFile, Category, J1939ParameterDefinition, ColumnTemplate, DefinitionVersion
 
 
 class VehicleSerializer(serializers.ModelSerializer):
@@ -39,30 +40,54 @@ class VehicleSummarySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'brand', 'pgns', 'spns', 'source_file']
 
 
+class ColumnTemplateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ColumnTemplate
+        fields = ['id', 'name', 'signature', 'header', 'column_roles', 'metadata_cells', 'hit_count', 'created_at', 'last_used_at']
+        read_only_fields = ['signature', 'hit_count', 'created_at', 'last_used_at']
+
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'description', 'created_at']
 
 
-class StandardFileSerializer(serializers.ModelSerializer):
+class DownloadUrlMixin:
+    """`download_url`: the streaming download endpoint (see Main/downloads.py)"""
+    download_url_name = None
+
+    def get_download_url(self, obj):
+        if not obj.pk or not obj.File:
+            return None
+        url = reverse(self.download_url_name, args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class StandardFileSerializer(DownloadUrlMixin, serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+    download_url_name = 'standard-files-download'
+
     class Meta:
         model = StandardFile
         fields = [
             'id', 'Standard_No', 'Standard_Name', 'Issued_Date', 
-            'Revised_Date', 'Resource', 'File', 'Note', 'created_at', 'updated_at'
+            'Revised_Date', 'Resource', 'File', 'download_url', 'Note', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class AuxiliaryFileSerializer(serializers.ModelSerializer):
+class AuxiliaryFileSerializer(DownloadUrlMixin, serializers.ModelSerializer):
     Linked_Standard_No = serializers.CharField(source='Linked_Standard.Standard_No', read_only=True)
+    download_url = serializers.SerializerMethodField()
+    download_url_name = 'auxiliary-files-download'
     
     class Meta:
         model = AuxiliaryFile
         fields = [
             'id', 'Title', 'Description', 'Published_Date', 'Resource', 
-            'File', 'Linked_Standard', 'Linked_Standard_No', 'Category', 
+            'File', 'download_url', 'Linked_Standard', 'Linked_Standard_No', 'Category', 
             'Note', 'uploaded_by', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
@@ -116,3 +141,11 @@ class UniqueSPNCountSerializer(serializers.Serializer):
     unique_spns = serializers.ListField(child=serializers.IntegerField())
     spn_details = serializers.ListField(child=serializers.DictField())
     spn_occurrences = serializers.DictField()
+
+
+class DefinitionVersionSerializer(serializers.ModelSerializer):
+    """Published parameter definition snapshot (without its rows)"""
+    class Meta:
+        model = DefinitionVersion
+        fields = ['id', 'content_hash', 'definition_count', 'source', 'created_at']
+        read_only_fields = fields
@@ -0,0 +1,157 @@
+"""
+Unique SPN counting over streams of J1939 messages.
+
+UniqueSPNCounter only tallies while messages arrive: SPNs given on a message
+are counted directly, and messages without them are counted per PGN in a
+Counter. result() then resolves every PGN and SPN seen with one bulk query
+on J1939ParameterDefinition, so the cost no longer grows with the number of
+messages. Counters can be fed in any number of batches (add(), update(),
+add_pgn_counts()) and read at any time.
+
+Used by J1939ParameterDefinition.count_unique_spns() and
+POST /api/j1939/unique-spn-count/.
+"""
+
+import logging
+from collections import Counter
+
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+
+def _number(value, name):
+    """
+    PGN or SPN as an int (numbers or decimal strings), so keys match the
+    integer PGN_DEC/SPN_Number of the definitions.
+
+    Raises:
+        ValueError: the value is not a whole number
+    """
+    if isinstance(value, bool):
+        raise ValueError(f'Invalid {name}: {value!r}')
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid {name}: {value!r}') from None
+    if number != value and not isinstance(value, str):
+        # 65265.5 would silently truncate
+        raise ValueError(f'Invalid {name}: {value!r}')
+    return number
+
+
+def _spn_number(spn):
+    if isinstance(spn, dict):
+        spn = spn.get('spn_number', spn.get('spn'))
+    return _number(spn, 'SPN') if spn is not None else None
+
+
+class UniqueSPNCounter:
+    """
+    Incremental count of the SPNs in a message stream.
+
+    Messages are dicts with 'pgn' and optional 'spns' (SPN numbers or dicts
+    with 'spn_number'/'spn'), as taken by count_unique_spns(). PGNs and SPNs
+    may be given as numbers or decimal strings; they are counted as ints.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        # Messages without SPNs, by PGN
+        self.pgn_counts = Counter()
+        # SPNs given on the messages
+        self.spn_counts = Counter()
+
+    def add(self, message):
+        """
+        Count one message.
+
+        Raises:
+            ValueError: 'pgn' or an SPN is not a number, or 'spns' is not a
+                        list; nothing is counted
+        """
+        spns = message.get('spns') or []
+        if not isinstance(spns, (list, tuple)):
+            raise ValueError(f'Invalid spns: {spns!r} (expected a list)')
+        if spns:
+            spn_nums = [_spn_number(spn) for spn in spns]
+            for spn_num in spn_nums:
+                if spn_num:
+                    self.spn_counts[spn_num] += 1
+        elif message.get('pgn'):
+            self.pgn_counts[_number(message['pgn'], 'PGN')] += 1
+        self.messages += 1
+
+    def update(self, messages):
+        """
+        Count a batch of messages. Returns the counter.
+
+        Raises:
+            ValueError: as add(), prefixed with the message's position in
+                        the batch; the messages before it are counted
+        """
+        for position, message in enumerate(messages):
+            try:
+                self.add(message)
+            except ValueError as exc:
+                raise ValueError(f'Message {position}: {exc}') from None
+        return self
+
+    def add_pgn_counts(self, pgn_counts):
+        """
+        Count messages already tallied per PGN (e.g. the PGN counter of a
+        parsed CAN capture). Returns the counter.
+
+        Raises:
+            ValueError: a PGN is not a number
+        """
+        for pgn, count in pgn_counts.items():
+            if pgn:
+                self.pgn_counts[_number(pgn, 'PGN')] += count
+                self.messages += count
+        return self
+
+    def result(self):
+        """
+        Resolve the counts against the parameter definitions (one query).
+
+        Returns:
+            dict with 'count', 'unique_spns', 'spn_details' and
+            'spn_occurrences', see count_unique_spns()
+        """
+        from .models import J1939ParameterDefinition
+
+        occurrences = Counter(self.spn_counts)
+        definitions = {}
+        if self.pgn_counts or self.spn_counts:
+            rows = J1939ParameterDefinition.objects.filter(
+                Q(PGN_DEC__in=list(self.pgn_counts)) | Q(SPN_Number__in=list(self.spn_counts))
+            ).values_list('SPN_Number', 'PGN_DEC', 'SPN_Description', 'Unit')
+            for spn_num, pgn, description, unit in rows:
+                definitions[spn_num] = (pgn, description, unit)
+                # Every message of the PGN carries each SPN defined for it
+                if pgn in self.pgn_counts:
+                    occurrences[spn_num] += self.pgn_counts[pgn]
+
+        spn_details = []
+        for spn_num in sorted(occurrences):
+            if spn_num in definitions:
+                pgn, description, unit = definitions[spn_num]
+            else:
+                pgn, description, unit = None, 'Unknown SPN', 'N/A'
+            spn_details.append({
+                'spn_number': spn_num,
+                'description': description,
+                'unit': unit,
+                'pgn': pgn,
+                'occurrences': occurrences[spn_num]
+            })
+
+        logger.info('Counted %d unique SPNs in %d messages (%d PGNs)',
+                    len(occurrences), self.messages, len(self.pgn_counts))
+        return {
+            'count': len(occurrences),
+            'unique_spns': sorted(occurrences),
+            'spn_details': spn_details,
+            'spn_occurrences': dict(occurrences)
+        }
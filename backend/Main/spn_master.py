@@ -0,0 +1,184 @@
+"""
+Bulk import of the SPN master list into J1939ParameterDefinition.
+
+The CSV is parsed whole, diffed in memory against the definitions already
+stored, and only the differences are written: new SPNs with bulk_create,
+changed ones with bulk_update, in a single transaction. A full J1939-71
+dictionary therefore costs a handful of queries instead of two or three
+per SPN, and a failure leaves the table as it was.
+
+Used by UploadSPNMasterView (POST /api/j1939/upload-spn-master/) and the
+`import_spn_master` management command, for CSV files and for DBC files
+parsed by Main/dbc.py.
+
+CSV columns: PGN_DEC, PGN_HEX, SPN_Number, SPN_Name, DL, SPB, Length_Bits,
+Unit; optional Resolution, Offset, Min_Value, Max_Value, Start_Bit. The
+aliases accepted by the original per-row import (SPN, PGN, Description,
+Data_Length, Start_Byte, Bit_Length) still work.
+"""
+
+import csv
+import io
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from .definitions import current_definition_version, publish_definition_version
+from .models import J1939ParameterDefinition
+
+logger = logging.getLogger(__name__)
+
+# Fields compared and written by the import
+DEFINITION_FIELDS = [
+    'PGN_DEC', 'PGN_HEX', 'SPN_Description', 'Unit', 'Data_Length_Bytes', 'Start_Byte',
+    'Start_Bit', 'Bit_Length', 'Resolution', 'Offset', 'Min_Value', 'Max_Value',
+]
+
+# Rows per INSERT/UPDATE statement
+BATCH_SIZE = 500
+
+# Per-SPN entries returned in a diff; counts are always complete
+DIFF_LIMIT = 1000
+
+
+def _optional_float(value):
+    return float(value) if value not in (None, '') else None
+
+
+def _text_lengths():
+    """max_length of the text fields, checked per row so bulk writes cannot fail on them."""
+    return {
+        name: J1939ParameterDefinition._meta.get_field(name).max_length
+        for name in ('PGN_HEX', 'SPN_Description', 'Unit')
+    }
+
+
+def parse_row(row):
+    """
+    Definition fields for one CSV row.
+
+    Raises:
+        ValueError: a required number is missing or malformed, or a text
+                    field is longer than its column
+    """
+    spn_number = int(row.get('SPN_Number', row.get('SPN', 0)))
+    pgn_dec = int(row.get('PGN_DEC', row.get('PGN', 0)))
+    # SPB may be a byte range such as "2-3"
+    spb = str(row.get('SPB', row.get('Start_Byte', '1')))
+    fields = {
+        'PGN_DEC': pgn_dec,
+        'PGN_HEX': row.get('PGN_HEX') or f'0x{pgn_dec:04X}',
+        'SPN_Description': row.get('SPN_Name', row.get('Description', '')) or '',
+        'Unit': row.get('Unit', '') or '',
+        'Data_Length_Bytes': int(row.get('DL', row.get('Data_Length', 1))),
+        'Start_Byte': int(spb.split('-')[0]),
+        'Start_Bit': int(row.get('Start_Bit') or 0),
+        'Bit_Length': int(row.get('Length_Bits', row.get('Bit_Length', 8))),
+        'Resolution': float(row.get('Resolution') or 1.0),
+        'Offset': float(row.get('Offset') or 0.0),
+        'Min_Value': _optional_float(row.get('Min_Value')),
+        'Max_Value': _optional_float(row.get('Max_Value')),
+    }
+    for name, max_length in _text_lengths().items():
+        if len(fields[name]) > max_length:
+            raise ValueError(f'{name} is longer than {max_length} characters')
+    return spn_number, fields
+
+
+def parse_spn_master(content):
+    """
+    Parse an SPN master CSV.
+
+    Args:
+        content: CSV text or bytes (UTF-8, with or without a BOM)
+
+    Returns:
+        tuple (definitions, errors): {SPN_Number: fields} with the last row
+        winning for a repeated SPN, and 'Row N: ...' messages for rows that
+        could not be parsed
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    definitions = {}
+    errors = []
+    for row_num, row in enumerate(csv.DictReader(io.StringIO(content)), start=2):
+        try:
+            spn_number, fields = parse_row(row)
+        except (TypeError, ValueError) as exc:
+            errors.append(f'Row {row_num}: {exc}')
+            continue
+        definitions[spn_number] = fields
+    return definitions, errors
+
+
+def diff_definitions(definitions):
+    """
+    Compare parsed definitions with the stored ones.
+
+    Returns:
+        tuple (to_create, to_update, changes, unchanged): model instances to
+        insert, stored instances with new values assigned, {SPN_Number:
+        {field: [old, new]}} for the updated ones, and the unchanged count
+    """
+    existing = J1939ParameterDefinition.objects.in_bulk(list(definitions))
+    to_create, to_update = [], []
+    changes = {}
+    unchanged = 0
+    for spn_number, fields in definitions.items():
+        current = existing.get(spn_number)
+        if current is None:
+            to_create.append(J1939ParameterDefinition(SPN_Number=spn_number, **fields))
+            continue
+        changed = {
+            name: [getattr(current, name), value]
+            for name, value in fields.items() if getattr(current, name) != value
+        }
+        if not changed:
+            unchanged += 1
+            continue
+        for name, (_, value) in changed.items():
+            setattr(current, name, value)
+        to_update.append(current)
+        changes[spn_number] = changed
+    return to_create, to_update, changes, unchanged
+
+
+def import_spn_master(definitions, dry_run=False):
+    """
+    Insert and update parameter definitions in one transaction.
+
+    Args:
+        definitions: {SPN_Number: fields}, see parse_spn_master()
+        dry_run: Only compute the diff
+
+    Returns:
+        dict with 'created', 'updated' and 'unchanged' counts, 'dry_run',
+        'definition_version' (the version published, or the current one
+        for a dry run) and the diff: 'created_spns' and 'changes' (at most
+        DIFF_LIMIT entries each)
+    """
+    with transaction.atomic():
+        to_create, to_update, changes, unchanged = diff_definitions(definitions)
+        if not dry_run:
+            J1939ParameterDefinition.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+            if to_update:
+                # bulk_update does not apply auto_now
+                now = timezone.now()
+                for definition in to_update:
+                    definition.updated_at = now
+                fields = sorted({name for changed in changes.values() for name in changed}) + ['updated_at']
+                J1939ParameterDefinition.objects.bulk_update(to_update, fields, batch_size=BATCH_SIZE)
+        # Unchanged imports keep the current version
+        version = publish_definition_version('import') if not dry_run else current_definition_version()
+    logger.info('SPN master import%s: %d created, %d updated, %d unchanged',
+                ' (dry run)' if dry_run else '', len(to_create), len(to_update), unchanged)
+    return {
+        'created': len(to_create),
+        'updated': len(to_update),
+        'unchanged': unchanged,
+        'dry_run': dry_run,
+        'definition_version': {'id': version.id, 'content_hash': version.content_hash},
+        'created_spns': sorted(definition.SPN_Number for definition in to_create)[:DIFF_LIMIT],
+        'changes': {spn: changes[spn] for spn in sorted(changes)[:DIFF_LIMIT]},
+    }
@@ -0,0 +1,235 @@
+"""
+Content-addressed media storage.
+
+ContentAddressedStorage keeps every file body once, under
+MEDIA_ROOT/blobs/<aa>/<bb>/<sha256>, however many times it is uploaded.
+FileField paths (j1939_uploads/..., standard_files/..., auxiliary_files/...)
+stay the logical names: each one is a hard link to its blob, so path(),
+url(), mmap and media serving work exactly as with FileSystemStorage while
+duplicates cost no extra disk.
+
+ContentBlob rows count the names pointing at each blob and ContentName maps
+a logical name to its blob, which makes the SHA-256 of any stored file
+available without reading it (content_hash()). Deleting a name drops its
+reference; the blob is removed with its last reference.
+
+Blobs must not be modified in place: every name sharing one would change.
+Files written outside the storage (older media, renamed spool files) are
+brought in with adopt().
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = 'blobs'
+
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def hash_path(path):
+    """SHA-256 of a file on disk, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(_HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that deduplicates file bodies by SHA-256.
+
+    A file saved with a `content_hash` attribute (set by
+    upload_handlers.StreamingAnalysisUploadHandler) and a temporary file path
+    is not read again: the temp file is moved into place as the blob.
+    """
+
+    def blob_name(self, sha256):
+        return f'{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+    def _save(self, name, content):
+        temp_path = getattr(content, 'temporary_file_path', None)
+        content_hash = getattr(content, 'content_hash', None)
+        spooled = None
+        if temp_path is not None:
+            source = temp_path()
+            content_hash = content_hash or hash_path(source)
+        else:
+            # Spool to a temp file next to the blobs while hashing, so the
+            # final rename into the blob tree never crosses filesystems
+            tmp_dir = self.path(f'{BLOB_DIR}/tmp')
+            os.makedirs(tmp_dir, exist_ok=True)
+            digest = hashlib.sha256()
+            with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as fh:
+                spooled = source = fh.name
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode('utf-8')
+                    digest.update(chunk)
+                    fh.write(chunk)
+            content_hash = digest.hexdigest()
+        try:
+            return self._store(name, source, content_hash)
+        finally:
+            if spooled and os.path.exists(spooled):
+                os.remove(spooled)
+
+    def _store(self, name, source, content_hash):
+        """Move or link `source` into the blob store and link `name` to it."""
+        from .models import ContentBlob
+        size = os.path.getsize(source)
+        blob_path = self.path(self.blob_name(content_hash))
+        with transaction.atomic():
+            blob, _ = ContentBlob.objects.select_for_update().get_or_create(
+                sha256=content_hash, defaults={'size': size})
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                file_move_safe(source, blob_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(blob_path, self.file_permissions_mode)
+            name = self._link(name, blob_path)
+            self._add_reference(name, blob)
+        return name
+
+    def _link(self, name, blob_path):
+        """Create the logical name as a hard link to the blob (a copy if linking fails)."""
+        while True:
+            full_path = self.path(name)
+            directory = os.path.dirname(full_path)
+            if self.directory_permissions_mode is not None:
+                old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+                try:
+                    os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+                finally:
+                    os.umask(old_umask)
+            else:
+                os.makedirs(directory, exist_ok=True)
+            try:
+                os.link(blob_path, full_path)
+            except FileExistsError:
+                name = self.get_available_name(name)
+                continue
+            except OSError as exc:
+                logger.warning('Cannot hard-link %s (%s), storing a copy', name, exc)
+                try:
+                    with open(blob_path, 'rb') as src, open(full_path, 'xb') as dst:
+                        shutil.copyfileobj(src, dst)
+                except FileExistsError:
+                    name = self.get_available_name(name)
+                    continue
+            return name.replace('\\', '/')
+
+    def _add_reference(self, name, blob):
+        from .models import ContentBlob, ContentName
+        previous = ContentName.objects.filter(name=name).first()
+        if previous is not None:
+            if previous.blob_id == blob.pk:
+                return
+            # The file behind a stale entry was replaced outside the storage
+            self._drop_reference(previous)
+        ContentName.objects.create(name=name, blob=blob)
+        ContentBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+    def _drop_reference(self, entry, remove_file=True):
+        """Drop a name's reference. Returns the blob path when it lost its last reference."""
+        from .models import ContentBlob
+        blob = ContentBlob.objects.select_for_update().get(pk=entry.blob_id)
+        entry.delete()
+        blob.ref_count = max(0, blob.ref_count - 1)
+        if blob.ref_count:
+            blob.save(update_fields=['ref_count'])
+            return None
+        blob_path = self.path(self.blob_name(blob.sha256))
+        if remove_file:
+            try:
+                os.remove(blob_path)
+            except FileNotFoundError:
+                pass
+        blob.delete()
+        return blob_path
+
+    def delete(self, name):
+        from .models import ContentName
+        with transaction.atomic():
+            entry = ContentName.objects.filter(name=name).first()
+            super().delete(name)
+            if entry is not None:
+                self._drop_reference(entry)
+
+    def content_hash(self, name):
+        """SHA-256 of a stored file, or None when it is not tracked."""
+        from .models import ContentName
+        return ContentName.objects.filter(name=name).values_list('blob_id', flat=True).first()
+
+    def adopt(self, name, content_hash=None):
+        """
+        Bring a file already at `name` (written outside the storage) into the
+        blob store, replacing it with a link to the blob.
+
+        Returns:
+            the file's SHA-256
+        """
+        from .models import ContentBlob
+        known = self.content_hash(name)
+        if known:
+            return known
+        full_path = self.path(name)
+        content_hash = content_hash or hash_path(full_path)
+        blob_path = self.path(self.blob_name(content_hash))
+        with transaction.atomic():
+            blob, _ = ContentBlob.objects.select_for_update().get_or_create(
+                sha256=content_hash, defaults={'size': os.path.getsize(full_path)})
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.link(full_path, blob_path)
+            elif not os.path.samefile(full_path, blob_path):
+                # Duplicate body: swap the file for a link to the existing blob
+                tmp_path = f'{full_path}.cas-tmp'
+                os.link(blob_path, tmp_path)
+                os.replace(tmp_path, full_path)
+            self._add_reference(name, blob)
+        return content_hash
+
+
+    def replaced(self, name):
+        """
+        Track `name` again after its file was swapped outside the storage
+        (rewritten with os.replace): its old reference is dropped and the new
+        body adopted.
+
+        Returns:
+            the path of the old blob when it lost its last reference, for the
+            caller to remove once the transaction has committed, or None
+        """
+        from .models import ContentName
+        orphan = None
+        with transaction.atomic():
+            entry = ContentName.objects.filter(name=name).first()
+            if entry is not None:
+                orphan = self._drop_reference(entry, remove_file=False)
+            self.adopt(name)
+        return orphan
+
+
+def stored_content_hash(name):
+    """SHA-256 of a stored file when the default storage tracks it, else None."""
+    content_hash = getattr(default_storage, 'content_hash', None)
+    return content_hash(name) if content_hash else None
+
+
+def register_stored_file(name, content_hash=None):
+    """Adopt a file written directly under MEDIA_ROOT, if the default storage is content addressed."""
+    adopt = getattr(default_storage, 'adopt', None)
+    return adopt(name, content_hash) if adopt else None
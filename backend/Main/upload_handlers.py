@@ -0,0 +1,116 @@
+"""
+Upload handler that analyzes J1939 logs while they are being received.
+
+Django normally buffers an upload (in memory or a temp file) and the view
+then reads it again to hash and parse it. StreamingAnalysisUploadHandler
+still spools the file to a temp file (the parsers need the plain bytes), but
+it also:
+
+- hashes every chunk (SHA-256),
+- sniffs the format from the first SNIFF_BYTES, and
+- feeds each chunk to a push-style analyzer (can_logs.StreamingCanLogAnalyzer
+  or log_analysis.StreamingLogAnalyzer),
+
+so the analysis is complete when the last byte arrives. The result is
+attached to the uploaded file as `stream_analysis`:
+
+    {'detected': <sniff_format() result>, 'sha256': '<hex>',
+     'analysis': <analyze_can_log()/analyze_log_file()-shaped dict or None>}
+
+'analysis' is None for workbooks, text in encodings that cannot be split on
+newline bytes, or when the analyzer failed; views then fall back to parsing
+the stored file as before.
+
+Archiving the spool costs at most one more write: plain files (workbooks, or
+J1939_COMPRESS_UPLOADS off) are moved into place by default_storage.save(),
+and text logs are compressed into a temp file under MEDIA_ROOT that is
+renamed into place (compression.save_compressed()).
+"""
+
+import hashlib
+import logging
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+from .can_logs import CAN_LOG_FORMATS, StreamingCanLogAnalyzer
+from .formats import sniff_format, SNIFF_BYTES, KIND_TEXT
+from .log_analysis import StreamingLogAnalyzer, can_split_by_bytes
+
+logger = logging.getLogger(__name__)
+
+
+def stream_analyzer_for(detected, analyze_text=True):
+    """Push-style analyzer for a sniffed format, or None if it cannot stream."""
+    if detected['kind'] != KIND_TEXT:
+        return None
+    if detected['format'] in CAN_LOG_FORMATS:
+        return StreamingCanLogAnalyzer(detected['format'], detected['encoding'])
+    if analyze_text and can_split_by_bytes(detected['encoding']):
+        return StreamingLogAnalyzer(detected['encoding'])
+    return None
+
+
+class StreamingAnalysisUploadHandler(TemporaryFileUploadHandler):
+    """
+    TemporaryFileUploadHandler that also hashes and analyzes each chunk.
+
+    Args:
+        analyze_text: Also analyze delimited text logs, not only raw CAN
+                      captures (J1939UploadView parses CSVs with pandas, so
+                      it only streams CAN captures)
+    """
+
+    def __init__(self, request=None, analyze_text=True):
+        super().__init__(request)
+        self.analyze_text = analyze_text
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._sha256 = hashlib.sha256()
+        self._head = b''
+        self._detected = None
+        self._analyzer = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self._sha256.update(raw_data)
+        if self._detected is None:
+            self._head += raw_data
+            if len(self._head) >= SNIFF_BYTES:
+                self._start_analysis()
+        elif self._analyzer is not None:
+            self._feed(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def _start_analysis(self):
+        self._detected = sniff_format(self._head[:SNIFF_BYTES], self.file_name or '')
+        self._analyzer = stream_analyzer_for(self._detected, self.analyze_text)
+        head, self._head = self._head, b''
+        if self._analyzer is not None:
+            self._feed(head)
+
+    def _feed(self, data):
+        try:
+            self._analyzer.feed(data)
+        except Exception as exc:
+            logger.warning('Streaming analysis of %s stopped: %s', self.file_name, str(exc))
+            self._analyzer = None
+
+    def file_complete(self, file_size):
+        if self._detected is None:
+            # Smaller than the sniff window
+            self._start_analysis()
+        analysis = None
+        if self._analyzer is not None:
+            try:
+                analysis = self._analyzer.close()
+            except Exception as exc:
+                logger.warning('Streaming analysis of %s failed: %s', self.file_name, str(exc))
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.stream_analysis = {
+            'detected': self._detected,
+            'sha256': self._sha256.hexdigest(),
+            'analysis': analysis,
+        }
+        # Lets storage.ContentAddressedStorage store the file without re-hashing it
+        uploaded_file.content_hash = uploaded_file.stream_analysis['sha256']
+        return uploaded_file
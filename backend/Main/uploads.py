@@ -0,0 +1,281 @@
+"""
+Chunked, resumable uploads for multi-gigabyte logs.
+
+A client opens an UploadSession with the file name and size, PUTs the
+bytes in chunks at explicit offsets, then finalizes with the file's
+SHA-256:
+
+    POST /api/j1939/uploads/                      {"filename", "size", "sha256"?, "template_id"?}
+    PUT  /api/j1939/uploads/<id>/chunk/?offset=N  raw bytes
+    GET  /api/j1939/uploads/<id>/                 received_bytes, to resume after a failure
+    POST /api/j1939/uploads/<id>/complete/        {"sha256"?}
+
+Chunks are streamed from the request into a temp file and then copied into
+a spool file under MEDIA_ROOT/j1939_spool/, so neither a chunk nor the file
+is held in memory. Chunks must arrive in order; re-sending a chunk that was already
+received is accepted and ignored, so a client that lost a response can
+simply retry. On finalize the spool file is hashed from disk, renamed into
+j1939_uploads/<Y>/<M>/<D>/ and queued as an IngestJob (Main/jobs.py), which
+memory-maps it rather than reading it again; the client polls
+GET /api/j1939/ingest/jobs/<id>/ for the result.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .formats import sniff_format, SNIFF_BYTES, KIND_UNSUPPORTED
+from .ingest import CHUNK_BYTES
+from .jobs import create_ingest_job, schedule_ingest_job
+from .layouts import get_template_by_id
+from .models import UploadSession
+from .storage import register_stored_file
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = 'j1939_spool'
+
+# Bytes copied from the request body per read
+_COPY_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    """A request that does not fit the session's state (mapped to 4xx by the views)."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def session_status(session):
+    """Serializable state of an upload session, returned by every endpoint."""
+    return {
+        'upload_id': str(session.id),
+        'filename': session.filename,
+        'size': session.total_size,
+        'received_bytes': session.received_bytes,
+        'status': session.status,
+        'chunk_size': settings.J1939_UPLOAD_CHUNK_BYTES,
+        'ingest_job_id': session.ingest_job_id,
+        'vehicle_id': session.ingest_job.vehicle_id if session.ingest_job_id else None,
+        'error': session.error,
+    }
+
+
+def create_session(filename, size, sha256='', template_id='', uploaded_by=None):
+    """
+    Open an upload session and create its empty spool file.
+
+    Raises:
+        UploadError: invalid name, size, hash or template
+    """
+    filename = os.path.basename(filename or '')
+    if not filename:
+        raise UploadError('filename is required')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('size must be an integer')
+    if size <= 0:
+        raise UploadError('size must be positive')
+    sha256 = (sha256 or '').lower()
+    if sha256 and len(sha256) != 64:
+        raise UploadError('sha256 must be 64 hex characters')
+    if template_id and get_template_by_id(template_id) is None:
+        raise UploadError(f'Unknown template_id: {template_id}')
+
+    session = UploadSession(
+        filename=filename,
+        total_size=size,
+        sha256=sha256,
+        template_id=str(template_id or ''),
+        uploaded_by=uploaded_by,
+    )
+    session.spool_file = f'{SPOOL_DIR}/{session.id}.part'
+    spool_path = default_storage.path(session.spool_file)
+    os.makedirs(os.path.dirname(spool_path), exist_ok=True)
+    open(spool_path, 'wb').close()
+    session.save()
+    logger.info('Opened upload %s for %s (%d bytes)', session.id, filename, size)
+    return session
+
+
+def _check_chunk(session, offset, length):
+    """
+    Check a chunk against the session's state.
+
+    Returns:
+        True when the chunk was already received (a retry to ignore)
+
+    Raises:
+        UploadError: session closed, out-of-order offset or chunk past the end
+    """
+    if session.status != UploadSession.STATUS_OPEN:
+        raise UploadError(f'Upload is {session.status}', status_code=409)
+    if offset + length <= session.received_bytes:
+        return True
+    if offset != session.received_bytes:
+        raise UploadError(f'Expected offset {session.received_bytes}', status_code=409)
+    if offset + length > session.total_size:
+        raise UploadError(f'Chunk ends past the declared size ({session.total_size} bytes)')
+    return False
+
+
+def _copy(src, dst, length):
+    """Copy up to `length` bytes; returns the number copied."""
+    copied = 0
+    while copied < length:
+        data = src.read(min(_COPY_BYTES, length - copied))
+        if not data:
+            break
+        dst.write(data)
+        copied += len(data)
+    return copied
+
+
+def write_chunk(session_id, offset, stream, length):
+    """
+    Append `length` bytes read from `stream` at `offset`.
+
+    The chunk is first read from the client into a temp file next to the
+    spool, without holding any lock, so a slow client does not block the
+    session. The session row is then locked only to re-check the offset,
+    copy the chunk into the spool and advance received_bytes, so concurrent
+    PUTs for one upload are still applied one after the other.
+
+    Returns:
+        the updated session
+
+    Raises:
+        UploadError: session closed, out-of-order offset, oversized or
+                     truncated chunk
+    """
+    if length <= 0:
+        raise UploadError('Empty chunk (Content-Length required)')
+    if length > settings.J1939_UPLOAD_MAX_CHUNK_BYTES:
+        raise UploadError(f'Chunk larger than {settings.J1939_UPLOAD_MAX_CHUNK_BYTES} bytes', status_code=413)
+
+    # Reject what is already known to fail before reading the body
+    session = UploadSession.objects.get(pk=session_id)
+    if _check_chunk(session, offset, length):
+        return session
+
+    spool_path = default_storage.path(session.spool_file)
+    with tempfile.TemporaryFile(dir=os.path.dirname(spool_path), suffix='.chunk') as chunk:
+        received = _copy(stream, chunk, length)
+        if received != length:
+            # The client went away; the next attempt resends from the same offset
+            raise UploadError(f'Chunk truncated after {received} of {length} bytes')
+        chunk.seek(0)
+
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session_id)
+            if _check_chunk(session, offset, length):
+                # Another PUT of the same chunk got there first
+                return session
+            with open(spool_path, 'r+b') as fh:
+                fh.seek(offset)
+                _copy(chunk, fh, length)
+            session.received_bytes = offset + length
+            session.save(update_fields=['received_bytes', 'updated_at'])
+    return session
+
+
+def _spool_sha256(path, size):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        remaining = size
+        while remaining:
+            data = fh.read(min(CHUNK_BYTES, remaining))
+            if not data:
+                break
+            digest.update(data)
+            remaining -= len(data)
+    return digest.hexdigest()
+
+
+def discard_spool(session):
+    """Remove a session's spool file, if it is still there."""
+    try:
+        os.remove(default_storage.path(session.spool_file))
+    except OSError:
+        pass
+
+
+def finalize_session(session_id, sha256=''):
+    """
+    Verify a fully received upload and queue its ingestion.
+
+    Returns:
+        tuple (session, detected format dict, pending IngestJob), the job
+        handed to jobs.schedule_ingest_job()
+
+    Raises:
+        UploadError: incomplete upload, hash mismatch or unsupported format
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session_id)
+        if session.status != UploadSession.STATUS_OPEN:
+            raise UploadError(f'Upload is {session.status}', status_code=409)
+        if session.received_bytes != session.total_size:
+            raise UploadError(
+                f'Upload incomplete: {session.received_bytes} of {session.total_size} bytes received',
+                status_code=409
+            )
+        expected = (sha256 or session.sha256).lower()
+        if not expected:
+            raise UploadError('sha256 is required to finalize')
+
+        spool_path = default_storage.path(session.spool_file)
+        with open(spool_path, 'rb') as fh:
+            head = fh.read(SNIFF_BYTES)
+        actual = _spool_sha256(spool_path, session.total_size)
+        detected = sniff_format(head, session.filename)
+        failure = None
+        if actual != expected:
+            failure = f'SHA-256 mismatch: expected {expected}, got {actual}'
+        elif detected['kind'] == KIND_UNSUPPORTED:
+            failure = f"Unsupported file format: {detected['label']}"
+        if failure:
+            session.status = UploadSession.STATUS_FAILED
+            session.error = failure
+            session.save(update_fields=['status', 'error', 'updated_at'])
+
+    if failure:
+        discard_spool(session)
+        raise UploadError(failure)
+
+    with transaction.atomic():
+        # Lock again: another request may have finalized in the meantime
+        session = UploadSession.objects.select_for_update().get(pk=session_id)
+        if session.status != UploadSession.STATUS_OPEN:
+            raise UploadError(f'Upload is {session.status}', status_code=409)
+
+        # Hand the spool file to the ingest pipeline by renaming it, not copying
+        today = timezone.now().date()
+        stored_name = default_storage.get_available_name(
+            f'j1939_uploads/{today.year}/{today.month:02d}/{today.day:02d}/{session.filename}'
+        )
+        stored_path = default_storage.path(stored_name)
+        os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+        os.replace(spool_path, stored_path)
+        register_stored_file(stored_name, actual)
+
+        template = get_template_by_id(session.template_id) if session.template_id else None
+        job = create_ingest_job(session.filename, stored_name, actual, session.uploaded_by, template)
+        session.sha256 = actual
+        session.status = UploadSession.STATUS_COMPLETE
+        session.ingest_job = job
+        session.save()
+    logger.info('Upload %s complete, queued as ingest job %s', session.id, job.id)
+
+    # Parsing a multi-gigabyte file would outlast the request; the job runs
+    # in the background and commits its own checkpoints
+    schedule_ingest_job(job)
+    return session, detected, job
@@ -1,11 +1,15 @@
 from django.urls import path
 from .views import (
-    J1939UploadView, VehicleListView, VehicleSpnsView, SpnVehiclesView, UploadAPIView,
+    J1939UploadView, VehicleListView, VehicleSpnsView, VehicleJ1939MappingView, SpnVehiclesView, UploadAPIView,
+    VehicleReanalyzeView, VehicleBatchReanalyzeView,
     StandardFileListView, StandardFileDetailView, AuxiliaryFileListView, AuxiliaryFileDetailView,
-    CategoryListView, CategoryDetailView, PGNListView, SPNListView,
+    CategoryListView, CategoryDetailView, PGNListView, SPNListView, ColumnTemplateListView,
+    IngestWatchStatusView, IngestJobDetailView, ChunkedUploadView, ChunkedUploadDetailView, ChunkedUploadChunkView,
+    ChunkedUploadCompleteView, StandardFileDownloadView, AuxiliaryFileDownloadView, VehicleUploadDownloadView,
     analyze_j1939_files,
     # J1939 Parameter Definition views
-    J1939ParameterDefinitionListView, J1939ParameterDefinitionDetailView,
+    J1939ParameterDefinitionListView, J1939ParameterDefinitionDetailView, DefinitionVersionListView,
+    DefinitionSnapshotView,
     DecodeSPNValueView, UniqueSPNCountView, PGNSummaryView,
     # New SPN mapping views
     PGNToSPNMappingView, UploadSPNMasterView, AnalyzePGNsFromFileView
@@ -14,9 +18,20 @@ from .views import (
 urlpatterns = [
     # Existing endpoints
     path('j1939/upload/', J1939UploadView.as_view(), name='j1939-upload'),
+    path('j1939/column-templates/', ColumnTemplateListView.as_view(), name='j1939-column-templates'),
+    path('j1939/uploads/', ChunkedUploadView.as_view(), name='j1939-chunked-upload'),
+    path('j1939/uploads/<uuid:upload_id>/', ChunkedUploadDetailView.as_view(), name='j1939-chunked-upload-detail'),
+    path('j1939/uploads/<uuid:upload_id>/chunk/', ChunkedUploadChunkView.as_view(), name='j1939-chunked-upload-chunk'),
+    path('j1939/uploads/<uuid:upload_id>/complete/', ChunkedUploadCompleteView.as_view(), name='j1939-chunked-upload-complete'),
+    path('j1939/ingest/jobs/<int:job_id>/', IngestJobDetailView.as_view(), name='j1939-ingest-job'),
+    path('j1939/ingest/watch-status/', IngestWatchStatusView.as_view(), name='j1939-ingest-watch-status'),
     path('upload/', UploadAPIView.as_view(), name='upload'),
     path('j1939/vehicles/', VehicleListView.as_view(), name='j1939-vehicles'),
     path('j1939/vehicle/<int:vehicle_id>/spns/', VehicleSpnsView.as_view(), name='j1939-vehicle-spns'),
+    path('j1939/vehicle/<int:vehicle_id>/j1939-mapping/', VehicleJ1939MappingView.as_view(), name='j1939-vehicle-j1939-mapping'),
+    path('j1939/vehicle/<int:vehicle_id>/reanalyze/', VehicleReanalyzeView.as_view(), name='j1939-vehicle-reanalyze'),
+    path('j1939/vehicle/<int:vehicle_id>/download/', VehicleUploadDownloadView.as_view(), name='j1939-vehicle-download'),
+    path('j1939/vehicles/reanalyze/', VehicleBatchReanalyzeView.as_view(), name='j1939-vehicles-reanalyze'),
     path('j1939/spn/<int:spn_number>/vehicles/', SpnVehiclesView.as_view(), name='j1939-spn-vehicles'),
 
     # CSV analysis endpoint
@@ -25,10 +40,12 @@ urlpatterns = [
     # Standard Files endpoints
     path('j1939/standard-files/', StandardFileListView.as_view(), name='standard-files-list'),
     path('j1939/standard-files/<int:pk>/', StandardFileDetailView.as_view(), name='standard-files-detail'),
+    path('j1939/standard-files/<int:pk>/download/', StandardFileDownloadView.as_view(), name='standard-files-download'),
 
     # Auxiliary Files endpoints
     path('j1939/auxiliary-files/', AuxiliaryFileListView.as_view(), name='auxiliary-files-list'),
     path('j1939/auxiliary-files/<int:pk>/', AuxiliaryFileDetailView.as_view(), name='auxiliary-files-detail'),
+    path('j1939/auxiliary-files/<int:pk>/download/', AuxiliaryFileDownloadView.as_view(), name='auxiliary-files-download'),
 
     # Categories endpoints
     path('j1939/categories/', CategoryListView.as_view(), name='categories-list'),
@@ -40,7 +57,9 @@ urlpatterns = [
 
     # J1939 Parameter Definitions endpoints
     path('j1939/parameter-definitions/', J1939ParameterDefinitionListView.as_view(), name='j1939-parameter-definitions-list'),
+    path('j1939/parameter-definitions/snapshot/', DefinitionSnapshotView.as_view(), name='j1939-parameter-definitions-snapshot'),
     path('j1939/parameter-definitions/<int:SPN_Number>/', J1939ParameterDefinitionDetailView.as_view(), name='j1939-parameter-definitions-detail'),
+    path('j1939/definition-versions/', DefinitionVersionListView.as_view(), name='j1939-definition-versions'),
     path('j1939/decode-spn/', DecodeSPNValueView.as_view(), name='j1939-decode-spn'),
     path('j1939/unique-spn-count/', UniqueSPNCountView.as_view(), name='j1939-unique-spn-count'),
     path('j1939/pgn-summary/', PGNSummaryView.as_view(), name='j1939-pgn-summary'),
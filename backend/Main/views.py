@@ -1,10 +1,12 @@
+import gzip
+import hashlib
 import io
 import logging
+import mmap
 import traceback
-import os
 import re
 import json
-from collections import defaultdict
+from collections import Counter, defaultdict
 from datetime import datetime, date
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -13,19 +15,45 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.utils import timezone
-from django.core.files.storage import default_storage
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags
+from django.urls import reverse
+from django.conf import settings
 
 from openpyxl import load_workbook
 
-from .models import Vehicle, SPN, PGN, VehicleSPN, VehiclePGN, StandardFile, AuxiliaryFile, Category, J1939ParameterDefinition
+from .log_analysis import (
+    analyze_lines, analyze_log_file, can_split_by_bytes, extraction_method,
+    analyze_increment, new_checkpoint
+)
+from .can_logs import CAN_LOG_FORMATS, analyze_can_log
+from .formats import sniff_upload, encodings_for, KIND_EXCEL, KIND_TEXT, KIND_UNSUPPORTED, FORMAT_XLS
+from .layouts import get_template_by_id
+from .ingest import (
+    read_sheets, extract_vehicle_data, store_upload, persist_vehicle, vehicle_result, reanalyze_vehicle,
+    upload_sha256, upload_summary, duplicate_vehicle, existing_vehicle_result, vehicle_j1939_mapping,
+    j1939_mapping_details
+)
+from .jobs import start_upload_job, schedule_ingest_job, job_status
+from .downloads import serve_stored_file
+from .j1939_map import load_map
+from .idempotency import idempotent
+from .spn_counts import UniqueSPNCounter
+from .definitions import current_definition_version, schedule_definition_publish, snapshot_blob
+from .definition_index import definition_index
+from .spn_master import parse_spn_master, import_spn_master
+from .dbc import parse_dbc
+from .upload_handlers import StreamingAnalysisUploadHandler
+from .uploads import UploadError, create_session, write_chunk, finalize_session, discard_spool, session_status
+from .models import Vehicle, SPN, PGN, VehicleSPN, VehiclePGN, StandardFile, AuxiliaryFile, Category, J1939ParameterDefinition, ColumnTemplate, LogCheckpoint, UploadSession, DefinitionVersion, IngestJob
 from rest_framework import generics
 from .serializers import (
     VehicleSerializer, VehicleSPNSerializer, StandardFileSerializer, AuxiliaryFileSerializer, 
     CategorySerializer, PGNSerializer, SPNSerializer, J1939ParameterDefinitionSerializer,
-    SPNDecodeRequestSerializer, SPNDecodeResponseSerializer
+    SPNDecodeRequestSerializer, SPNDecodeResponseSerializer, ColumnTemplateSerializer, DefinitionVersionSerializer
 )
-from django.db.models import Count
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.parsers import MultiPartParser, FormParser
 
 # Import pandas lazily inside methods to avoid import-time failures during
@@ -48,6 +76,20 @@ class J1939UploadView(APIView):
     
     Accepts multiple Excel files from the frontend, parses their content, and extracts
     structured vehicle, PGN, and SPN information.
+
+    Column layouts are learned per header row (see Main/layouts.py). Pass
+    `template_id` (form field or query param) to apply a stored ColumnTemplate
+    and skip layout detection entirely.
+
+    Send an `Idempotency-Key` header to make retries safe (see
+    Main/idempotency.py). With `dedupe=true` (or J1939_UPLOAD_DEDUPE), a file
+    whose SHA-256 matches an existing vehicle is not ingested again: that
+    vehicle's result is returned with `duplicate_of` set.
+
+    Files of at least J1939_CHECKPOINT_MIN_BYTES are not parsed in the
+    request: each is queued as an IngestJob and listed under `ingest_jobs`
+    with its `status_url` (GET /api/j1939/ingest/jobs/<id>/), and the
+    response is 202 Accepted.
     
     Returns:
     {
@@ -69,6 +111,13 @@ class J1939UploadView(APIView):
     permission_classes = [permissions.AllowAny]
     parser_classes = [MultiPartParser, FormParser]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Raw CAN captures are hashed and analyzed while they are received
+        if settings.J1939_STREAM_ANALYSIS:
+            request.upload_handlers = [StreamingAnalysisUploadHandler(request, analyze_text=False)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    @idempotent('j1939-upload')
     def post(self, request, format=None):
         """
         Process multiple Excel file uploads.
@@ -94,176 +143,92 @@ class J1939UploadView(APIView):
                 'errors': ['No files uploaded']
             }, status=status.HTTP_400_BAD_REQUEST)
 
+        # An explicit column template skips layout detection entirely
+        explicit_template = None
+        template_id = request.data.get('template_id') or request.query_params.get('template_id')
+        if template_id:
+            explicit_template = get_template_by_id(template_id)
+            if explicit_template is None:
+                return Response({
+                    'status': 'error',
+                    'vehicles': [],
+                    'errors': [f'Unknown template_id: {template_id}']
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+        dedupe = settings.J1939_UPLOAD_DEDUPE
+        dedupe_param = request.data.get('dedupe') or request.query_params.get('dedupe')
+        if dedupe_param:
+            dedupe = str(dedupe_param).lower() in ('1', 'true', 'yes')
+
         vehicles = []
         errors = []
+        ingest_jobs = []
         today = timezone.now().date()
 
         for f in files:
             fname = getattr(f, 'name', '<unknown>')
             logger.info('Processing file: %s', fname)
             
-            # Initialize PGN count variables for this file
-            total_pgn_count = 0
-            unique_pgn_count = 0
-            unique_pgn_list = []
-            # All file types are now accepted - we'll detect the format automatically
-            # Files without extensions or unknown extensions will be treated as CSV/text
+            # The format is detected from the file content, not the extension.
+            # Unsupported binaries are rejected before any parse attempt.
+            streamed = getattr(f, 'stream_analysis', None)
+            detected = streamed['detected'] if streamed else sniff_upload(f)
+            if detected['kind'] == KIND_UNSUPPORTED:
+                errors.append({
+                    'filename': fname,
+                    'error': f"Unsupported file format: {detected['label']}",
+                    'detected_format': detected['format']
+                })
+                logger.warning('Rejected %s: detected %s', fname, detected['label'])
+                continue
 
             try:
-                # Read file content
-                f.seek(0)
-                file_content = f.read()
-                f.seek(0)
+                # Get or create user
+                try:
+                    uploaded_by = request.user if getattr(request, 'user', None) and request.user.is_authenticated else None
+                except Exception:
+                    uploaded_by = None
+
+                content_hash = streamed['sha256'] if streamed else None
+                if dedupe:
+                    # Same bytes as an existing vehicle: answer from its links
+                    content_hash = content_hash or upload_sha256(f)
+                    duplicate = duplicate_vehicle(content_hash)
+                    if duplicate is not None:
+                        vehicles.append(existing_vehicle_result(duplicate, detected))
+                        logger.info('File %s duplicates vehicle %s, not ingested again', fname, duplicate.id)
+                        continue
+
+                # Large uploads are ingested by a checkpointed job that commits in
+                # chunks and can be resumed if the worker dies. It runs after the
+                # response, so the request never waits on the parse
+                if f.size >= settings.J1939_CHECKPOINT_MIN_BYTES:
+                    job = schedule_ingest_job(
+                        start_upload_job(f, fname, today, uploaded_by, explicit_template, content_hash)
+                    )
+                    ingest_jobs.append({
+                        'filename': fname,
+                        'ingest_job_id': job.id,
+                        'status': job.status,
+                        'status_url': request.build_absolute_uri(reverse('j1939-ingest-job', args=[job.id]))
+                    })
+                    logger.info('Queued file %s as ingest job %s', fname, job.id)
+                    continue
+
+                can_analysis = streamed['analysis'] if streamed and detected['format'] in CAN_LOG_FORMATS else None
+                if can_analysis is not None:
+                    # Already hashed and decoded while it was received: nothing to re-read
+                    file_content = b''
+                else:
+                    # Read file content
+                    f.seek(0)
+                    file_content = f.read()
+                    f.seek(0)
+                    content_hash = content_hash or hashlib.sha256(file_content).hexdigest()
 
                 # Parse file (Excel or text-based)
                 try:
-                    # Only .xlsx and .xls are treated as Excel files
-                    # Everything else (including files without extensions) is treated as CSV/text
-                    excel_extensions = ('.xlsx', '.xls')
-                    is_excel_file = fname.lower().endswith(excel_extensions)
-                    
-                    if not is_excel_file:
-                        # CSV/TXT/LOG: read as single-sheet structure with multi-encoding support
-                        f.seek(0)
-                        
-                        # Try multiple encodings for CSV files
-                        encodings_to_try = ['utf-8', 'utf-8-sig', 'gb2312', 'gbk', 'gb18030', 
-                                           'big5', 'utf-16', 'utf-16-le', 'latin1', 'cp1252', 'iso-8859-1']
-                        
-                        df = None
-                        decoded_text = None
-                        encoding_used = None
-                        
-                        if pd is not None:
-                            # Try pandas with multiple encodings
-                            for encoding in encodings_to_try:
-                                try:
-                                    df = pd.read_csv(io.BytesIO(file_content), encoding=encoding)
-                                    encoding_used = encoding
-                                    logger.info(f"CSV {fname} parsed successfully with encoding: {encoding}")
-                                    break
-                                except (UnicodeDecodeError, UnicodeError):
-                                    continue
-                                except Exception as enc_err:
-                                    # Try next encoding
-                                    continue
-                            
-                            # Last resort: use latin1 which accepts any byte
-                            if df is None:
-                                try:
-                                    df = pd.read_csv(io.BytesIO(file_content), encoding='latin1', on_bad_lines='skip')
-                                    encoding_used = 'latin1-fallback'
-                                    logger.info(f"CSV {fname} parsed with latin1 fallback")
-                                except Exception as final_err:
-                                    logger.error(f"All encoding attempts failed for {fname}: {final_err}")
-                                    raise
-                            
-                            # Calculate PGN counts using pandas (matching the exact Python logic)
-                            # Filter for main message rows where Index is not NaN
-                            total_pgn_count = 0
-                            unique_pgn_count = 0
-                            unique_pgn_list = []
-                            
-                            if df is not None and 'Index' in df.columns and 'PGN(H)' in df.columns:
-                                # Filter for rows where Index is not NaN (main message rows only)
-                                message_df = df[df['Index'].notna()]
-                                # Total: count of non-null PGN(H) values in filtered rows
-                                total_pgn_count = int(message_df['PGN(H)'].count())
-                                # Unique: count of distinct PGN(H) values
-                                unique_pgn_count = int(message_df['PGN(H)'].nunique())
-                                # Get list of unique PGN values
-                                unique_pgn_list = message_df['PGN(H)'].dropna().unique().tolist()
-                                unique_pgn_list = [str(x).upper() for x in unique_pgn_list if pd.notna(x)]
-                                logger.info(f"PGN counts for {fname}: Total={total_pgn_count}, Unique={unique_pgn_count}")
-                            
-                            df_dict = {os.path.splitext(fname)[0]: df}
-                        else:
-                            # Fallback CSV parser with multi-encoding support
-                            for encoding in encodings_to_try:
-                                try:
-                                    decoded_text = file_content.decode(encoding)
-                                    encoding_used = encoding
-                                    break
-                                except (UnicodeDecodeError, UnicodeError):
-                                    continue
-                            
-                            # Final fallback
-                            if decoded_text is None:
-                                decoded_text = file_content.decode('latin1', errors='replace')
-                                encoding_used = 'latin1-fallback'
-                            
-                            import csv as _csv
-                            rows = list(_csv.reader(decoded_text.splitlines()))
-                            if not rows:
-                                df_dict = {os.path.splitext(fname)[0]: {}}
-                            else:
-                                headers = rows[0]
-                                data_rows = rows[1:]
-                                sheet_data = {}
-                                for col_idx, header in enumerate(headers):
-                                    sheet_data[header] = [r[col_idx] if col_idx < len(r) else None for r in data_rows]
-                                df_dict = {os.path.splitext(fname)[0]: sheet_data}
-                    else:
-                        # Excel file (.xlsx, .xls)
-                        if pd is not None:
-                            # Use pandas for better Excel parsing
-                            # Try openpyxl first for .xlsx, xlrd for .xls
-                            try:
-                                if fname.lower().endswith('.xls') and not fname.lower().endswith('.xlsx'):
-                                    # Old .xls format - try xlrd engine
-                                    try:
-                                        df_dict = pd.read_excel(io.BytesIO(file_content), sheet_name=None, engine='xlrd')
-                                    except Exception:
-                                        # Fallback to openpyxl
-                                        df_dict = pd.read_excel(io.BytesIO(file_content), sheet_name=None, engine='openpyxl')
-                                else:
-                                    # .xlsx format
-                                    df_dict = pd.read_excel(io.BytesIO(file_content), sheet_name=None, engine='openpyxl')
-                                
-                                logger.info(f"Excel {fname} parsed successfully")
-                                
-                                # Calculate PGN counts for Excel files (same logic as CSV)
-                                for sheet_name, sheet_df in df_dict.items():
-                                    if sheet_df is not None and not sheet_df.empty:
-                                        if 'Index' in sheet_df.columns and 'PGN(H)' in sheet_df.columns:
-                                            # Filter for rows where Index is not NaN (main message rows only)
-                                            message_df = sheet_df[sheet_df['Index'].notna()]
-                                            # Total: count of non-null PGN(H) values in filtered rows
-                                            total_pgn_count = int(message_df['PGN(H)'].count())
-                                            # Unique: count of distinct PGN(H) values
-                                            unique_pgn_count = int(message_df['PGN(H)'].nunique())
-                                            # Get list of unique PGN values
-                                            unique_pgn_list = message_df['PGN(H)'].dropna().unique().tolist()
-                                            unique_pgn_list = [str(x).upper() for x in unique_pgn_list if pd.notna(x)]
-                                            logger.info(f"PGN counts for {fname} (sheet: {sheet_name}): Total={total_pgn_count}, Unique={unique_pgn_count}")
-                                            break  # Use first sheet with valid data
-                                            
-                            except Exception as excel_err:
-                                logger.error(f"Excel parsing error for {fname}: {excel_err}")
-                                raise
-                        else:
-                            # Fallback to openpyxl - convert to simple data structure
-                            wb = load_workbook(filename=io.BytesIO(file_content), data_only=True)
-                            df_dict = {}
-                            for sheet_name in wb.sheetnames:
-                                sheet = wb[sheet_name]
-                                # Convert sheet to list of lists for processing
-                                data = []
-                                headers = None
-                                for row_idx, row in enumerate(sheet.iter_rows(values_only=True)):
-                                    if row_idx == 0:
-                                        headers = [str(cell) if cell is not None else f'Col{i}' for i, cell in enumerate(row)]
-                                    else:
-                                        data.append(list(row))
-                                # Create a simple dict-like structure for compatibility
-                                if headers and data:
-                                    # Store as dict with column names as keys
-                                    sheet_data = {}
-                                    for col_idx, header in enumerate(headers):
-                                        sheet_data[header] = [row[col_idx] if col_idx < len(row) else None for row in data]
-                                    df_dict[sheet_name] = sheet_data
-                                else:
-                                    df_dict[sheet_name] = {}
+                    sheets = read_sheets(fname, file_content, detected, can_analysis)
                 except Exception as parse_exc:
                     error_msg = f'Failed to parse file: {str(parse_exc)}'
                     errors.append({
@@ -274,446 +239,27 @@ class J1939UploadView(APIView):
                     continue
 
                 # Extract vehicle information
-                vehicle_name = None
-                brand = None
-                pgns = set()
-                spns_data = {}  # {(pgn, spn): description}
-
-                # Try to extract from all sheets
-                for sheet_name, df in df_dict.items():
-                    # Handle both pandas DataFrame and dict structure
-                    if df is None:
-                        continue
-                    
-                    # Check if it's a pandas DataFrame
-                    is_dataframe = pd is not None and isinstance(df, pd.DataFrame)
-                    if is_dataframe and df.empty:
-                        continue
-                    
-                    # For dict structure, check if it's empty
-                    if not is_dataframe and (not df or len(df) == 0):
-                        continue
-
-                    # Extract vehicle name and brand
-                    vehicle_name_aliases = ['vehicle name', 'veh name', 'vehicle', 'veh', 'unit name', 'name']
-                    brand_aliases = ['brand', 'make', 'manufacturer', 'manufacturer name']
-
-                    # Search in first few rows and columns
-                    max_rows = len(df) if is_dataframe else max([len(v) for v in df.values()] if isinstance(df, dict) else [0])
-                    max_cols = len(df.columns) if is_dataframe else len(df) if isinstance(df, dict) else 0
-                    
-                    for row_idx in range(min(10, max_rows)):
-                        for col_idx in range(min(10, max_cols)):
-                            try:
-                                if is_dataframe:
-                                    cell_value = str(df.iloc[row_idx, col_idx]).strip().lower()
-                                else:
-                                    # For dict structure, access by column name
-                                    col_names = list(df.keys()) if isinstance(df, dict) else []
-                                    if col_idx < len(col_names):
-                                        col_name = col_names[col_idx]
-                                        cell_value = str(df[col_name][row_idx] if row_idx < len(df[col_name]) else '').strip().lower()
-                                    else:
-                                        continue
-                                
-                                # Check for vehicle name
-                                if not vehicle_name:
-                                    for alias in vehicle_name_aliases:
-                                        if alias in cell_value:
-                                            # Try to get value from adjacent cell or next row
-                                            try:
-                                                if col_idx + 1 < max_cols:
-                                                    if is_dataframe:
-                                                        candidate = str(df.iloc[row_idx, col_idx + 1]).strip()
-                                                    else:
-                                                        next_col = col_names[col_idx + 1] if col_idx + 1 < len(col_names) else None
-                                                        candidate = str(df[next_col][row_idx] if next_col and row_idx < len(df[next_col]) else '').strip()
-                                                    if candidate and candidate.lower() not in ['nan', 'none', '']:
-                                                        vehicle_name = candidate
-                                                        break
-                                            except:
-                                                pass
-                                
-                                # Check for brand
-                                if not brand:
-                                    for alias in brand_aliases:
-                                        if alias in cell_value:
-                                            try:
-                                                if col_idx + 1 < max_cols:
-                                                    if is_dataframe:
-                                                        candidate = str(df.iloc[row_idx, col_idx + 1]).strip()
-                                                    else:
-                                                        next_col = col_names[col_idx + 1] if col_idx + 1 < len(col_names) else None
-                                                        candidate = str(df[next_col][row_idx] if next_col and row_idx < len(df[next_col]) else '').strip()
-                                                    if candidate and candidate.lower() not in ['nan', 'none', '']:
-                                                        brand = candidate
-                                                        break
-                                            except:
-                                                pass
-                            except:
-                                continue
-
-                    # Extract PGNs and SPNs
-                    # Priority: 'PGN(H)' column for hex PGN values, then other aliases
-                    pgn_h_aliases = ['pgn(h)', 'pgn_h', 'pgn h', 'pgn(hex)', 'pgn_hex']
-                    pgn_aliases = ['pgn', 'pgn number', 'pgn_no', 'pgn_number', 'parameter group number']
-                    spn_aliases = ['spn', 'spn number', 'spn_no', 'spn_number', 'suspect parameter number']
-                    index_aliases = ['index', 'idx', 'no', 'no.', 'row', 'row_no']
-
-                    # Find column indices/names
-                    index_col_idx = None  # For Index column to identify main message rows
-                    index_col_name = None
-                    pgn_h_col_idx = None  # For PGN(H) hex column
-                    pgn_h_col_name = None
-                    pgn_col_idx = None
-                    pgn_col_name = None
-                    spn_col_idx = None
-                    spn_col_name = None
-                    desc_col_idx = None
-                    desc_col_name = None
-
-                    # Lists to track PGN(H) values for counting
-                    all_pgn_h_values = []  # All non-empty PGN(H) values (for total count)
-                    unique_pgn_h_values = set()  # Unique PGN(H) values
-
-                    # Check header row
-                    if is_dataframe:
-                        columns = df.columns
-                        for col_idx, col_name in enumerate(columns):
-                            col_str = str(col_name).strip().lower()
-                            # Check for Index column (to identify main message rows)
-                            if col_str in index_aliases or col_str == 'index':
-                                index_col_idx = col_idx
-                            # Check for PGN(H) column first (priority)
-                            if any(alias == col_str for alias in pgn_h_aliases):
-                                pgn_h_col_idx = col_idx
-                            elif any(alias in col_str for alias in pgn_aliases):
-                                pgn_col_idx = col_idx
-                            if any(alias in col_str for alias in spn_aliases):
-                                spn_col_idx = col_idx
-                            if 'description' in col_str or 'desc' in col_str:
-                                desc_col_idx = col_idx
-                    else:
-                        # For dict structure
-                        for col_name in df.keys():
-                            col_str = str(col_name).strip().lower()
-                            # Check for Index column
-                            if col_str in index_aliases or col_str == 'index':
-                                index_col_name = col_name
-                            # Check for PGN(H) column first (priority)
-                            if any(alias == col_str for alias in pgn_h_aliases):
-                                pgn_h_col_name = col_name
-                            elif any(alias in col_str for alias in pgn_aliases):
-                                pgn_col_name = col_name
-                            if any(alias in col_str for alias in spn_aliases):
-                                spn_col_name = col_name
-                            if 'description' in col_str or 'desc' in col_str:
-                                desc_col_name = col_name
-
-                    # Extract data from rows
-                    num_rows = len(df) if is_dataframe else max([len(v) for v in df.values()] if isinstance(df, dict) else [0])
-                    current_pgn = None  # Track current PGN for rows without explicit PGN
-                    
-                    for row_idx in range(num_rows):
-                        try:
-                            pgn_value = None
-                            pgn_h_value = None  # For PGN(H) hex value
-                            spn_value = None
-                            desc_value = ''
-                            
-                            # Check if this is a main message row (Index column has value)
-                            # In J1939 log files, only rows with Index value are main messages
-                            # Detail rows (SPNs) have NaN in the Index column
-                            is_main_message_row = True  # Default to True if no Index column
-                            
-                            if is_dataframe and index_col_idx is not None:
-                                try:
-                                    index_val = df.iloc[row_idx, index_col_idx]
-                                    is_main_message_row = pd is not None and pd.notna(index_val)
-                                except:
-                                    pass
-                            elif not is_dataframe and index_col_name and index_col_name in df:
-                                try:
-                                    index_val = df[index_col_name][row_idx] if row_idx < len(df[index_col_name]) else None
-                                    is_main_message_row = index_val is not None and str(index_val).strip().lower() not in ['', 'nan', 'none', 'null']
-                                except:
-                                    pass
-
-                            # Get PGN(H) - hex PGN column (priority)
-                            # Only count for PGN stats if this is a main message row
-                            if is_dataframe:
-                                if pgn_h_col_idx is not None:
-                                    try:
-                                        pgn_h_val = df.iloc[row_idx, pgn_h_col_idx]
-                                        if pd is not None and pd.notna(pgn_h_val):
-                                            pgn_h_str = str(pgn_h_val).strip().upper()
-                                            if pgn_h_str and pgn_h_str.lower() not in ['', 'nan', 'none', 'null', 'n/a', 'pgn(h)', 'pgn']:
-                                                # Only count PGN for stats if this is a main message row
-                                                if is_main_message_row:
-                                                    all_pgn_h_values.append(pgn_h_str)
-                                                    unique_pgn_h_values.add(pgn_h_str)
-                                                # Also convert to decimal for PGN set
-                                                try:
-                                                    pgn_dec = int(pgn_h_str, 16)
-                                                    if is_main_message_row:
-                                                        pgns.add(pgn_dec)
-                                                    current_pgn = pgn_dec
-                                                    pgn_value = pgn_dec
-                                                except ValueError:
-                                                    pass
-                                    except:
-                                        pass
-                            else:
-                                if pgn_h_col_name and pgn_h_col_name in df:
-                                    try:
-                                        pgn_h_val = df[pgn_h_col_name][row_idx] if row_idx < len(df[pgn_h_col_name]) else None
-                                        if pgn_h_val is not None:
-                                            pgn_h_str = str(pgn_h_val).strip().upper()
-                                            if pgn_h_str and pgn_h_str.lower() not in ['', 'nan', 'none', 'null', 'n/a', 'pgn(h)', 'pgn']:
-                                                if is_main_message_row:
-                                                    all_pgn_h_values.append(pgn_h_str)
-                                                    unique_pgn_h_values.add(pgn_h_str)
-                                                try:
-                                                    pgn_dec = int(pgn_h_str, 16)
-                                                    if is_main_message_row:
-                                                        pgns.add(pgn_dec)
-                                                    current_pgn = pgn_dec
-                                                    pgn_value = pgn_dec
-                                                except ValueError:
-                                                    pass
-                                    except:
-                                        pass
-
-                            # Get PGN (decimal column, fallback if no PGN(H))
-                            if pgn_value is None:
-                                if is_dataframe:
-                                    if pgn_col_idx is not None:
-                                        try:
-                                            pgn_val = df.iloc[row_idx, pgn_col_idx]
-                                            if pd is not None and pd.notna(pgn_val):
-                                                pgn_value = int(float(str(pgn_val)))
-                                                if 100 <= pgn_value <= 999999:
-                                                    if is_main_message_row:
-                                                        pgns.add(pgn_value)
-                                                    current_pgn = pgn_value
-                                            elif pgn_val is not None:
-                                                pgn_value = int(float(str(pgn_val)))
-                                                if 100 <= pgn_value <= 999999:
-                                                    if is_main_message_row:
-                                                        pgns.add(pgn_value)
-                                                    current_pgn = pgn_value
-                                        except:
-                                            pass
-                                else:
-                                    if pgn_col_name and pgn_col_name in df:
-                                        try:
-                                            pgn_val = df[pgn_col_name][row_idx] if row_idx < len(df[pgn_col_name]) else None
-                                            if pgn_val is not None:
-                                                pgn_value = int(float(str(pgn_val)))
-                                                if 100 <= pgn_value <= 999999:
-                                                    if is_main_message_row:
-                                                        pgns.add(pgn_value)
-                                                    current_pgn = pgn_value
-                                        except:
-                                            pass
-
-                            # Get SPN
-                            if is_dataframe:
-                                if spn_col_idx is not None:
-                                    try:
-                                        spn_val = df.iloc[row_idx, spn_col_idx]
-                                        if pd is not None and pd.notna(spn_val):
-                                            spn_value = int(float(str(spn_val)))
-                                        elif spn_val is not None:
-                                            spn_value = int(float(str(spn_val)))
-                                    except:
-                                        pass
-                            else:
-                                if spn_col_name and spn_col_name in df:
-                                    try:
-                                        spn_val = df[spn_col_name][row_idx] if row_idx < len(df[spn_col_name]) else None
-                                        if spn_val is not None:
-                                            spn_value = int(float(str(spn_val)))
-                                    except:
-                                        pass
-
-                            # Get description
-                            if is_dataframe:
-                                if desc_col_idx is not None:
-                                    try:
-                                        desc_val = df.iloc[row_idx, desc_col_idx]
-                                        if pd is not None and pd.notna(desc_val):
-                                            desc_value = str(desc_val).strip()
-                                        elif desc_val is not None:
-                                            desc_value = str(desc_val).strip()
-                                    except:
-                                        pass
-                            else:
-                                if desc_col_name and desc_col_name in df:
-                                    try:
-                                        desc_val = df[desc_col_name][row_idx] if row_idx < len(df[desc_col_name]) else None
-                                        if desc_val is not None:
-                                            desc_value = str(desc_val).strip()
-                                    except:
-                                        pass
-
-                            # Store SPN with PGN relationship
-                            if spn_value is not None:
-                                # Use PGN from current row, or fallback to last seen PGN
-                                final_pgn = pgn_value if pgn_value else current_pgn
-                                
-                                if final_pgn:
-                                    spns_data[(final_pgn, spn_value)] = desc_value
-                                else:
-                                    # Store without PGN if not found
-                                    spns_data[(None, spn_value)] = desc_value
-
-                        except Exception as row_exc:
-                            logger.debug('Error processing row %d: %s', row_idx, str(row_exc))
-                            continue
-
-                # Fallback: extract from filename if vehicle name not found
-                if not vehicle_name:
-                    # Try to extract from filename (remove extension)
-                    vehicle_name = os.path.splitext(fname)[0].strip()
-                    if not vehicle_name or vehicle_name == '<unknown>':
-                        vehicle_name = 'Unknown'
-
-                # Default brand if not found
-                if not brand:
-                    brand = ''
-
-                # Allow repeated uploads of the same vehicle on the same day (no duplicate blocking)
-
-                # Get or create user
-                try:
-                    uploaded_by = request.user if getattr(request, 'user', None) and request.user.is_authenticated else None
-                except Exception:
-                    uploaded_by = None
+                parsed = extract_vehicle_data(fname, sheets['df_dict'], detected, sheets['unique_pgn_list'], explicit_template)
 
                 # Save Excel file for auditing (optional)
-                excel_file_path = None
-                try:
-                    # Save file to media storage
-                    file_path = f'j1939_uploads/{today.year}/{today.month:02d}/{today.day:02d}/{fname}'
-                    saved_path = default_storage.save(file_path, f)
-                    excel_file_path = saved_path
-                    logger.info('Saved Excel file for auditing: %s', saved_path)
-                except Exception as save_exc:
-                    logger.warning('Failed to save Excel file for auditing: %s', str(save_exc))
-                    # Continue processing even if file save fails
-
-                # Create vehicle record
-                vehicle = Vehicle.objects.create(
-                    name=str(vehicle_name),
-                    brand=str(brand),
-                    uploaded_by=uploaded_by,
-                    source_file=fname,
-                    excel_file=excel_file_path if excel_file_path else None
-                )
-
-                # Create PGN records and associations
-                vehicle_pgns = []
-                for pgn_num in sorted(pgns):
-                    pgn_obj, _ = PGN.objects.get_or_create(pgn_number=int(pgn_num))
-                    VehiclePGN.objects.get_or_create(vehicle=vehicle, pgn=pgn_obj)
-                    vehicle_pgns.append(pgn_num)
-
-                # Create SPN records and associations with PGN relationships
-                vehicle_spns = []
-                for (pgn_num, spn_num), description in spns_data.items():
-                    try:
-                        pgn_obj = None
-                        if pgn_num:
-                            pgn_obj, _ = PGN.objects.get_or_create(pgn_number=int(pgn_num))
-
-                        spn_obj, _ = SPN.objects.get_or_create(
-                            spn_number=int(spn_num),
-                            defaults={'description': description or ''}
-                        )
-                        # Update description if it was empty
-                        if description and not spn_obj.description:
-                            spn_obj.description = description
-                            spn_obj.save()
-
-                        vspn, created = VehicleSPN.objects.get_or_create(
-                            vehicle=vehicle,
-                            spn=spn_obj,
-                            defaults={'pgn': pgn_obj}
-                        )
-                        if not created and pgn_obj and vspn.pgn != pgn_obj:
-                            vspn.pgn = pgn_obj
-                        if description:
-                            vspn.value = description
-                            vspn.supported = True
-                        if pgn_obj and not vspn.pgn:
-                            vspn.pgn = pgn_obj
-                        vspn.save()
-
-                        # Store for response (use PGN if available, otherwise None)
-                        vehicle_spns.append({
-                            'pgn': pgn_num if pgn_num else None,
-                            'spn': spn_num,
-                            'description': description or spn_obj.description or ''
-                        })
-                    except Exception as spn_exc:
-                        logger.error('Error creating SPN %d: %s', spn_num, str(spn_exc))
-                        continue
-
-                # Map PGNs to SPNs from J1939ParameterDefinition table (J1939 Standard)
-                j1939_mapped_spns = set()
-                j1939_spn_details = []
-                
-                # Get all available PGNs from J1939ParameterDefinition for comparison
-                available_pgns = set(J1939ParameterDefinition.objects.values_list('PGN_DEC', flat=True).distinct())
-                matching_pgns = set(vehicle_pgns) & available_pgns
-                logger.info('SPN Mapping: %d vehicle PGNs, %d in DB, %d matching', 
-                           len(vehicle_pgns), len(available_pgns), len(matching_pgns))
-                
-                for pgn_num in vehicle_pgns:
-                    # Get all SPNs defined for this PGN in the J1939 standard
-                    spn_definitions = J1939ParameterDefinition.objects.filter(PGN_DEC=pgn_num)
-                    for spn_def in spn_definitions:
-                        j1939_mapped_spns.add(spn_def.SPN_Number)
-                        j1939_spn_details.append({
-                            'pgn': pgn_num,
-                            'pgn_hex': spn_def.PGN_HEX,
-                            'spn': spn_def.SPN_Number,
-                            'description': spn_def.SPN_Description,
-                            'unit': spn_def.Unit,
-                            'resolution': float(spn_def.Resolution) if spn_def.Resolution else None,
-                            'offset': float(spn_def.Offset) if spn_def.Offset else 0,
-                            'start_byte': spn_def.Start_Byte,
-                            'start_bit': spn_def.Start_Bit,
-                            'bit_length': spn_def.Bit_Length,
-                            'data_length_bytes': spn_def.Data_Length_Bytes
-                        })
-                
-                logger.info('SPN Mapping Result: %d unique SPNs found from %d matching PGNs', 
-                           len(j1939_mapped_spns), len(matching_pgns))
+                excel_file_path = store_upload(fname, f, today)
+
+                # Create the vehicle and its PGN/SPN records in one transaction, so a
+                # failure part way never leaves a half-created vehicle behind
+                template_source = 'explicit' if explicit_template else ('cached' if parsed['templates_used'] else 'detected')
+                with transaction.atomic():
+                    vehicle, template_ids, vehicle_pgns, vehicle_spns = persist_vehicle(
+                        fname, parsed, excel_file_path, uploaded_by, content_hash,
+                        upload_summary(detected, sheets, template_source)
+                    )
 
-                # Build response data
-                vehicles.append({
-                    'id': vehicle.id,
-                    'name': vehicle.name,
-                    'brand': vehicle.brand,
-                    'source_file': vehicle.source_file,
-                    'pgns': vehicle_pgns,
-                    'spns': vehicle_spns,
-                    'pgn_count': len(vehicle_pgns),
-                    'spn_count': len(vehicle_spns),
-                    # PGN(H) column stats - calculated from pandas filtering by Index column
-                    'total_pgn_messages': total_pgn_count,
-                    'unique_pgn_count': unique_pgn_count,
-                    'unique_pgn_list': unique_pgn_list,
-                    # J1939 Standard SPN mapping (based on PGNs in file)
-                    'j1939_unique_spn_count': len(j1939_mapped_spns),
-                    'j1939_spn_list': sorted(list(j1939_mapped_spns)),
-                    'j1939_spn_details': j1939_spn_details
-                })
+                # Build response data, including the J1939 standard SPN mapping
+                vehicles.append(vehicle_result(
+                    vehicle, detected, sheets, template_ids, template_source, vehicle_pgns, vehicle_spns
+                ))
 
                 logger.info('Successfully processed file %s: Vehicle=%s, Total PGN Messages=%d, Unique PGNs=%d',
-                           fname, vehicle.name, total_pgn_count, unique_pgn_count)
+                           fname, vehicle.name, sheets['total_pgn_count'], sheets['unique_pgn_count'])
 
             except Exception as exc:
                 error_msg = f'Error processing file: {str(exc)}'
@@ -737,6 +283,8 @@ class J1939UploadView(APIView):
             'status': 'success',
             'vehicles': vehicles,
             'errors': errors,
+            # Large files still being ingested; poll their status_url
+            'ingest_jobs': ingest_jobs,
             'totals': {
                 'total_vehicles': len(vehicles),
                 'total_pgn_messages': total_pgn_messages_all,  # Sum of all PGN messages across all files
@@ -755,6 +303,9 @@ class J1939UploadView(APIView):
             # If no vehicles were processed and there are errors, still return 200
             # but the errors array will contain the issues
             status_code = status.HTTP_200_OK
+        if ingest_jobs:
+            # Accepted: some files are ingested in the background
+            status_code = status.HTTP_202_ACCEPTED
 
         return Response(response_data, status=status_code)
 
@@ -769,6 +320,7 @@ class UploadAPIView(APIView):
     permission_classes = [permissions.AllowAny]
     parser_classes = [MultiPartParser, FormParser]
 
+    @idempotent('upload')
     def post(self, request, format=None):
         files = request.FILES.getlist('file') or request.FILES.getlist('files[]') or list(request.FILES.values())
         if not files:
@@ -783,14 +335,20 @@ class UploadAPIView(APIView):
 
         for f in files:
             fname = getattr(f, 'name', 'unknown')
-            # validate extension
-            if not (isinstance(fname, str) and (fname.lower().endswith('.xlsx') or fname.lower().endswith('.xls'))):
-                responses.append({'filename': fname, 'error': 'Invalid file extension'})
+            # validate content: only Excel workbooks are accepted here, whatever the extension
+            detected = sniff_upload(f)
+            if detected['kind'] != KIND_EXCEL:
+                responses.append({
+                    'filename': fname,
+                    'error': f"Unsupported file format: {detected['label']}",
+                    'detected_format': detected['format']
+                })
                 continue
             try:
                 # Try openpyxl via pandas for robust sheet reading
                 try:
-                    xl = pd.read_excel(f, sheet_name=None, engine='openpyxl')
+                    engine = 'xlrd' if detected['format'] == FORMAT_XLS else 'openpyxl'
+                    xl = pd.read_excel(f, sheet_name=None, engine=engine)
                 except Exception:
                     # fallback: read via openpyxl directly
                     f.seek(0)
@@ -958,6 +516,7 @@ class UploadAPIView(APIView):
                 responses.append({
                     'vehicle': vehicle.name,
                     'brand': vehicle.brand,
+                    'detected_format': detected['format'],
                     'spn_count': total_spns,
                     'pgn_count': total_pgns,
                     'source_file': vehicle.source_file,
@@ -1021,11 +580,133 @@ class VehicleSpnsView(APIView):
             }
             for s in spns
         ]
+        mapping = vehicle_j1939_mapping(vehicle)
         return Response({
             'vehicle_id': vehicle.id,
             'vehicle': vehicle.name,
             'brand': vehicle.brand,
-            'spns': spn_payload
+            'spns': spn_payload,
+            # SPNs the J1939 standard defines for the vehicle's PGNs
+            'j1939_mapping': {
+                'definition_version': mapping.definition_version_id,
+                'spn_count': len(mapping.spns),
+                'spns': mapping.spns,
+            }
+        })
+
+
+class VehicleJ1939MappingView(APIView):
+    """
+    GET /api/j1939/vehicle/<vehicle_id>/j1939-mapping/
+
+    The vehicle's stored J1939 standard mapping with SPN details, as in the
+    upload response. `stale` is true when the definitions changed after the
+    vehicle was mapped; re-analyzing the vehicle maps it again.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, vehicle_id):
+        try:
+            vehicle = Vehicle.objects.get(pk=vehicle_id)
+        except Vehicle.DoesNotExist:
+            return Response({'detail': 'Vehicle not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        mapping = vehicle_j1939_mapping(vehicle)
+        current = current_definition_version()
+        return Response({
+            'vehicle_id': vehicle.id,
+            'definition_version': mapping.definition_version_id,
+            'current_definition_version': current.id,
+            'stale': mapping.definition_version_id != current.id,
+            'pgn_count': mapping.pgn_count,
+            'j1939_unique_spn_count': len(set(mapping.spns)),
+            'j1939_spn_list': sorted(set(mapping.spns)),
+            'j1939_spn_details': j1939_mapping_details(mapping),
+        })
+
+
+class VehicleReanalyzeView(APIView):
+    """
+    POST /api/j1939/vehicle/<vehicle_id>/reanalyze/
+
+    Re-run extraction on the vehicle's stored upload (memory-mapped from
+    MEDIA_ROOT) and update its PGN/SPN links in place. Useful after the
+    parsers or column templates change; nothing is re-uploaded.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request, vehicle_id):
+        try:
+            vehicle = Vehicle.objects.get(pk=vehicle_id)
+        except Vehicle.DoesNotExist:
+            return Response({'detail': 'Vehicle not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            result = reanalyze_vehicle(vehicle)
+        except FileNotFoundError as exc:
+            logger.warning('Stored upload missing for vehicle %s: %s', vehicle_id, str(exc))
+            return Response({'detail': 'Stored upload not found for this vehicle'}, status=status.HTTP_404_NOT_FOUND)
+        except ValueError as exc:
+            logger.error('Re-analysis failed for vehicle %s: %s', vehicle_id, str(exc))
+            return Response({'status': 'error', 'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'status': 'success', 'vehicle': result})
+
+
+class VehicleBatchReanalyzeView(APIView):
+    """
+    POST /api/j1939/vehicles/reanalyze/
+
+    Batch form of VehicleReanalyzeView.
+
+    Request body: {"vehicle_ids": [1, 2, 3]} or {"all": true}
+    Failures are reported per vehicle in 'errors'.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        reanalyze_all = request.data.get('all') in (True, 'true', '1', 1)
+        if reanalyze_all:
+            vehicle_ids = []
+            vehicles = Vehicle.objects.exclude(excel_file='').exclude(excel_file__isnull=True).order_by('id')
+        else:
+            vehicle_ids = request.data.get('vehicle_ids')
+            if not isinstance(vehicle_ids, list) or not vehicle_ids:
+                return Response({
+                    'status': 'error',
+                    'errors': ['Provide a non-empty "vehicle_ids" list or "all": true']
+                }, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                vehicle_ids = [int(v) for v in vehicle_ids]
+            except (TypeError, ValueError):
+                return Response({
+                    'status': 'error',
+                    'errors': ['"vehicle_ids" must contain integers']
+                }, status=status.HTTP_400_BAD_REQUEST)
+            vehicles = Vehicle.objects.filter(pk__in=vehicle_ids).order_by('id')
+
+        results = []
+        errors = []
+        found_ids = set()
+        for vehicle in vehicles:
+            found_ids.add(vehicle.id)
+            try:
+                results.append(reanalyze_vehicle(vehicle))
+            except FileNotFoundError:
+                errors.append({'vehicle_id': vehicle.id, 'error': 'Stored upload not found for this vehicle'})
+            except Exception as exc:
+                errors.append({'vehicle_id': vehicle.id, 'error': str(exc)})
+                logger.error('Re-analysis failed for vehicle %s: %s', vehicle.id, str(exc), exc_info=True)
+
+        if not reanalyze_all:
+            for missing_id in sorted(set(vehicle_ids) - found_ids):
+                errors.append({'vehicle_id': missing_id, 'error': 'Vehicle not found'})
+
+        return Response({
+            'status': 'success',
+            'vehicles': results,
+            'errors': errors,
+            'reanalyzed_count': len(results)
         })
 
 
@@ -1064,6 +745,26 @@ class SpnVehiclesView(APIView):
 
 
 # Standard Files and Auxiliary Files Views
+class StoredFileMixin:
+    """
+    Release a record's stored `File` when it is replaced or the record is
+    deleted, so the content-addressed store (Main/storage.py) can drop
+    blobs nobody references any more.
+    """
+
+    def perform_update(self, serializer):
+        replaced = serializer.instance.File.name
+        instance = serializer.save()
+        if replaced and instance.File.name != replaced:
+            instance.File.storage.delete(replaced)
+
+    def perform_destroy(self, instance):
+        stored = instance.File.name
+        instance.delete()
+        if stored:
+            instance.File.storage.delete(stored)
+
+
 class StandardFileListView(generics.ListCreateAPIView):
     """List and create standard files"""
     queryset = StandardFile.objects.all()
@@ -1075,7 +776,7 @@ class StandardFileListView(generics.ListCreateAPIView):
         serializer.save(uploaded_by=self.request.user if self.request.user.is_authenticated else None)
 
 
-class StandardFileDetailView(generics.RetrieveUpdateDestroyAPIView):
+class StandardFileDetailView(StoredFileMixin, generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, delete standard files"""
     queryset = StandardFile.objects.all()
     serializer_class = StandardFileSerializer
@@ -1094,7 +795,7 @@ class AuxiliaryFileListView(generics.ListCreateAPIView):
         serializer.save(uploaded_by=self.request.user if self.request.user.is_authenticated else None)
 
 
-class AuxiliaryFileDetailView(generics.RetrieveUpdateDestroyAPIView):
+class AuxiliaryFileDetailView(StoredFileMixin, generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, delete auxiliary files"""
     queryset = AuxiliaryFile.objects.all()
     serializer_class = AuxiliaryFileSerializer
@@ -1102,6 +803,55 @@ class AuxiliaryFileDetailView(generics.RetrieveUpdateDestroyAPIView):
     parser_classes = [MultiPartParser, FormParser]
 
 
+class StoredFileDownloadView(APIView):
+    """
+    GET /api/j1939/<standard-files|auxiliary-files>/<pk>/download/
+
+    Stream a record's `File` with Range, If-None-Match and content-hash
+    ETag support, or hand it to the front proxy (see Main/downloads.py).
+    """
+    permission_classes = [permissions.AllowAny]
+    model = None
+
+    def get(self, request, pk):
+        record = self.model.objects.filter(pk=pk).first()
+        if record is None:
+            return Response({'detail': f'{self.model._meta.verbose_name.capitalize()} not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            return serve_stored_file(request, record.File.name)
+        except FileNotFoundError:
+            return Response({'detail': 'Stored file not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class StandardFileDownloadView(StoredFileDownloadView):
+    model = StandardFile
+
+
+class AuxiliaryFileDownloadView(StoredFileDownloadView):
+    model = AuxiliaryFile
+
+
+class VehicleUploadDownloadView(APIView):
+    """
+    GET /api/j1939/vehicle/<vehicle_id>/download/
+
+    Stream the vehicle's original upload, decompressed when it is stored
+    compressed (see Main/compression.py).
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, vehicle_id):
+        vehicle = Vehicle.objects.filter(pk=vehicle_id).first()
+        if vehicle is None:
+            return Response({'detail': 'Vehicle not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            return serve_stored_file(
+                request, vehicle.excel_file.name, vehicle.source_file or None, vehicle.content_hash or None
+            )
+        except FileNotFoundError:
+            return Response({'detail': 'Stored upload not found for this vehicle'}, status=status.HTTP_404_NOT_FOUND)
+
+
 class CategoryListView(generics.ListCreateAPIView):
     """List and create categories"""
     queryset = Category.objects.all()
@@ -1119,6 +869,166 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.AllowAny]  # Allow unauthenticated access for now
 
 
+class ColumnTemplateListView(generics.ListAPIView):
+    """List learned column-layout templates (use the id as `template_id` on upload)"""
+    queryset = ColumnTemplate.objects.all()
+    serializer_class = ColumnTemplateSerializer
+    permission_classes = [permissions.AllowAny]
+
+
+def _request_user(request):
+    try:
+        return request.user if getattr(request, 'user', None) and request.user.is_authenticated else None
+    except Exception:
+        return None
+
+
+class ChunkedUploadView(APIView):
+    """
+    POST /api/j1939/uploads/
+
+    Open a chunked, resumable upload (see Main/uploads.py) for files too
+    large to send in one request.
+
+    Request body: {"filename": "truck.asc", "size": 5368709120,
+                   "sha256": "<optional, may be sent on complete>",
+                   "template_id": <optional ColumnTemplate id>}
+    Returns the session with its upload_id and the suggested chunk_size.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    @idempotent('j1939-chunked-upload')
+    def post(self, request):
+        try:
+            session = create_session(
+                request.data.get('filename'),
+                request.data.get('size'),
+                request.data.get('sha256', ''),
+                request.data.get('template_id', ''),
+                _request_user(request),
+            )
+        except UploadError as exc:
+            return Response({'status': 'error', 'error': str(exc)}, status=exc.status_code)
+        return Response(session_status(session), status=status.HTTP_201_CREATED)
+
+
+class ChunkedUploadDetailView(APIView):
+    """
+    GET    /api/j1939/uploads/<upload_id>/   progress (received_bytes) for resuming
+    DELETE /api/j1939/uploads/<upload_id>/   abort and remove the spool file
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, upload_id):
+        session = UploadSession.objects.filter(pk=upload_id).first()
+        if session is None:
+            return Response({'detail': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(session_status(session))
+
+    def delete(self, request, upload_id):
+        session = UploadSession.objects.filter(pk=upload_id).first()
+        if session is None:
+            return Response({'detail': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        if session.status == UploadSession.STATUS_COMPLETE:
+            return Response({'status': 'error', 'error': 'Upload is complete'}, status=status.HTTP_409_CONFLICT)
+        discard_spool(session)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ChunkedUploadChunkView(APIView):
+    """
+    PUT /api/j1939/uploads/<upload_id>/chunk/?offset=<byte offset>
+
+    The request body is the raw chunk (any content type). It is streamed
+    into the spool file, never parsed or buffered. A 409 response carries
+    the session, whose received_bytes is the offset to continue from.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def put(self, request, upload_id):
+        if not UploadSession.objects.filter(pk=upload_id).exists():
+            return Response({'detail': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            offset = int(request.query_params.get('offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response({'status': 'error', 'error': 'offset must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            session = write_chunk(upload_id, offset, request.stream, length)
+        except UploadError as exc:
+            session = UploadSession.objects.get(pk=upload_id)
+            return Response(dict(session_status(session), error=str(exc)), status=exc.status_code)
+        return Response(session_status(session))
+
+
+class ChunkedUploadCompleteView(APIView):
+    """
+    POST /api/j1939/uploads/<upload_id>/complete/
+
+    Verify the whole-file SHA-256 and queue the assembled file as a
+    checkpointed IngestJob. Answers 202 with the job id and its status_url
+    (GET /api/j1939/ingest/jobs/<id>/), which returns the vehicle once the
+    job is done.
+
+    Request body: {"sha256": "<hex>"} (optional if given when opening)
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request, upload_id):
+        if not UploadSession.objects.filter(pk=upload_id).exists():
+            return Response({'detail': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            session, detected, job = finalize_session(upload_id, request.data.get('sha256', ''))
+        except UploadError as exc:
+            session = UploadSession.objects.get(pk=upload_id)
+            return Response(dict(session_status(session), error=str(exc)), status=exc.status_code)
+
+        return Response({
+            'status': 'accepted',
+            'upload': session_status(session),
+            'detected_format': detected['format'],
+            'ingest_job_id': job.id,
+            'status_url': request.build_absolute_uri(reverse('j1939-ingest-job', args=[job.id])),
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class IngestJobDetailView(APIView):
+    """
+    GET /api/j1939/ingest/jobs/<job_id>/
+
+    Progress of a background ingest job (see Main/jobs.py). Once its status
+    is `done`, `vehicle` holds the same per-vehicle result as the upload view.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, job_id):
+        job = IngestJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({'detail': 'Ingest job not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job_status(job))
+
+
+class IngestWatchStatusView(APIView):
+    """
+    GET /api/j1939/ingest/watch-status/
+
+    Latest queue depth and lag reported by the watch_j1939 command.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            with open(settings.J1939_WATCH_STATUS_FILE) as fh:
+                return Response(json.load(fh))
+        except FileNotFoundError:
+            return Response({'detail': 'The watcher has not reported yet'}, status=status.HTTP_404_NOT_FOUND)
+        except (OSError, ValueError) as exc:
+            logger.error('Could not read watch status: %s', str(exc))
+            return Response({'detail': 'Watch status is unreadable'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
 class PGNListView(generics.ListAPIView):
     """List all PGNs"""
     queryset = PGN.objects.all()
@@ -1141,32 +1051,38 @@ _J1939_MAP_CACHE = None
 
 def load_j1939_map():
     """
-    Load J1939 PGN→SPN map from Main/j1939_map.json if available.
-    Expected shape:
-    {
-      "61444": {
-        "pgn_name": "...",
-        "spns": [ {"spn": 190, "name": "Engine Speed"}, ... ]
-      },
-      "F004": { ... }  # hex keys also allowed
-    }
+    Load the compiled J1939 PGN→SPN map (see Main/j1939_map.py).
+
+    The map is memory-mapped from Main/j1939_map.bin, built from
+    Main/j1939_map.json by `manage.py compile_j1939_map`, so its pages are
+    shared by every worker.
+
+    Returns:
+        J1939Map, or None if there is no map
     """
     global _J1939_MAP_CACHE
-    if _J1939_MAP_CACHE is not None:
-        return _J1939_MAP_CACHE
+    if _J1939_MAP_CACHE is None:
+        _J1939_MAP_CACHE = load_map() or False
+    return _J1939_MAP_CACHE or None
+
+
+def _pgn_number(p):
+    """Integer PGN of a PGN dict (pgn_dec, else pgn_hex), or None."""
+    if p.get('pgn_dec') not in (None, ''):
+        try:
+            return int(p['pgn_dec'])
+        except (TypeError, ValueError):
+            pass
     try:
-        map_path = os.path.join(os.path.dirname(__file__), "j1939_map.json")
-        with open(map_path, "r", encoding="utf-8") as fh:
-            _J1939_MAP_CACHE = json.load(fh)
-    except Exception:
-        _J1939_MAP_CACHE = {}
-    return _J1939_MAP_CACHE
+        return int(str(p.get('pgn_hex') or ''), 16)
+    except ValueError:
+        return None
 
 
 def summarize_pgns_with_map(pgn_list, j1939_map):
     """
-    Given a list of PGN dicts (with pgn_hex/pgn_dec) and a J1939 map,
-    return per-PGN SPN mapping and counts.
+    Given a list of PGN dicts (with pgn_hex/pgn_dec) and a compiled J1939
+    map, return per-PGN SPN mapping and counts.
     """
     if not j1939_map:
         return {
@@ -1182,34 +1098,19 @@ def summarize_pgns_with_map(pgn_list, j1939_map):
 
     for p in pgn_list:
         pgn_hex = str(p.get('pgn_hex') or '').upper()
-        pgn_dec = p.get('pgn_dec')
-
-        # Try matching by hex then dec string
-        entry = None
-        if pgn_hex and pgn_hex in j1939_map:
-            entry = j1939_map[pgn_hex]
-        elif pgn_dec is not None and str(pgn_dec) in j1939_map:
-            entry = j1939_map[str(pgn_dec)]
-
+        pgn = _pgn_number(p)
+        entry = j1939_map.lookup(pgn) if pgn is not None else None
         if not entry:
             continue
 
-        spns = entry.get("spns", [])
-        spn_items = []
-        for s in spns:
-            spn_num = s.get("spn")
-            if spn_num in (None, 0):
-                continue
-            unique_spns.add(spn_num)
-            total_spn_occurrences += 1
-            spn_items.append({
-                "spn": spn_num,
-                "name": s.get("name", f"SPN_{spn_num}")
-            })
+        pgn_name, spns = entry
+        spn_items = [{"spn": spn_num, "name": name} for spn_num, name in spns]
+        unique_spns.update(spn_num for spn_num, _ in spns)
+        total_spn_occurrences += len(spn_items)
 
         pgn_spn_mapping[str(p.get('pgn_dec') or pgn_hex)] = {
             "pgn": p.get('pgn_dec') if p.get('pgn_dec') else pgn_hex,
-            "name": entry.get("pgn_name", p.get("name", "")),
+            "name": pgn_name or p.get("name", ""),
             "spns": spn_items,
             "spn_count": len(spn_items)
         }
@@ -1227,15 +1128,17 @@ def summarize_pgns_with_map(pgn_list, j1939_map):
 # Parses uploaded CSVs, maps PGNs/SPNs, and returns aggregates.
 # ---------------------------------------------------------------------------
 
-def detect_encoding_and_read(file_content):
+def detect_encoding_and_read(file_content, detected=None):
     """
     Detect encoding and read file content.
-    Try multiple encodings in order of likelihood.
+    Try multiple encodings in order of likelihood, starting with the
+    encoding sniffed by sniff_format() when one is given.
     Returns tuple: (decoded_text, encoding_used, errors_list)
     """
-    encodings_to_try = ['utf-8', 'utf-8-sig', 'utf-16', 'utf-16-le', 'utf-16-be', 
-                        'gb2312', 'gbk', 'gb18030', 'big5', 'latin1', 'cp1252', 
-                        'iso-8859-1', 'ascii']
+    encodings_to_try = encodings_for(detected, [
+        'utf-8', 'utf-8-sig', 'utf-16', 'utf-16-le', 'utf-16-be',
+        'gb2312', 'gbk', 'gb18030', 'big5', 'latin1', 'cp1252',
+        'iso-8859-1', 'ascii'])
     
     errors_list = []
     
@@ -1265,161 +1168,37 @@ def detect_encoding_and_read(file_content):
         return decoded, 'latin1-fallback', errors_list
 
 
-def extract_pgn_from_can_id(can_id_value):
-    """
-    Extract PGN from CAN ID according to J1939 specification.
-    PGN = (CAN_ID >> 8) & 0x3FFFF for extended frames
-    
-    For standard J1939:
-    - 29-bit CAN ID: Priority (3 bits) + Reserved (1 bit) + Data Page (1 bit) + PDU Format (8 bits) + 
-                     PDU Specific/Destination (8 bits) + Source Address (8 bits)
-    - PGN = bits 8-25 (18 bits max), but commonly 16 bits: (CAN_ID >> 8) & 0xFFFF
-    
-    Args:
-        can_id_value: CAN ID as int, hex string, or decimal string
-        
-    Returns:
-        tuple: (pgn_int, pgn_hex_str) or (None, None) if invalid
+def analyze_with_checkpoint(file, source, encoding):
     """
-    try:
-        # Convert to integer
-        if isinstance(can_id_value, int):
-            can_id = can_id_value
-        elif isinstance(can_id_value, str):
-            can_id_str = can_id_value.strip().upper()
-            # Remove common prefixes
-            for prefix in ['0X', '0H', 'H', 'X']:
-                if can_id_str.startswith(prefix):
-                    can_id_str = can_id_str[len(prefix):]
-            
-            if not can_id_str:
-                return None, None
-            
-            # Try hex first if it looks like hex
-            if re.match(r'^[0-9A-F]+$', can_id_str):
-                # Determine if it's hex or decimal
-                # If contains A-F, definitely hex
-                if re.search(r'[A-F]', can_id_str):
-                    can_id = int(can_id_str, 16)
-                # If length > 8 digits, likely hex
-                elif len(can_id_str) > 8:
-                    can_id = int(can_id_str, 16)
-                # Try as decimal first for pure numeric
-                else:
-                    try:
-                        can_id = int(can_id_str, 10)
-                        # If result is unreasonably large, try hex
-                        if can_id > 0x1FFFFFFF:  # Max 29-bit CAN ID
-                            can_id = int(can_id_str, 16)
-                    except ValueError:
-                        can_id = int(can_id_str, 16)
-            else:
-                # Pure decimal
-                can_id = int(can_id_str, 10)
-        else:
-            return None, None
-        
-        # Validate CAN ID range (29-bit max)
-        if can_id < 0 or can_id > 0x1FFFFFFF:
-            return None, None
-        
-        # Extract PGN: (CAN_ID >> 8) & 0xFFFF (16-bit PGN)
-        # For J1939, PGN is typically in bits 8-23
-        pgn = (can_id >> 8) & 0xFFFF
-        
-        # Format as hex string (uppercase, no prefix)
-        pgn_hex = f"{pgn:04X}"
-        
-        return pgn, pgn_hex
-        
-    except (ValueError, TypeError) as e:
-        return None, None
+    Incrementally analyze an upload of a growing log.
 
+    Only the bytes appended since the stored LogCheckpoint for `source` are
+    parsed; the checkpoint is updated afterwards. Uploads spooled to disk
+    are memory-mapped instead of read.
 
-def find_can_id_column(headers):
-    """
-    Find the column index that likely contains CAN ID.
-    Returns column index or None.
-    """
-    can_id_patterns = [
-        r'^can\s*id$', r'^canid$', r'^id$', r'^can_id$',
-        r'^message\s*id$', r'^msg\s*id$', r'^msgid$',
-        r'^arbitration\s*id$', r'^arb\s*id$',
-        r'^identifier$', r'^frame\s*id$',
-        r'^id\(h\)$', r'^id_h$', r'^id\s*\(hex\)$'
-    ]
-    
-    for idx, header in enumerate(headers):
-        header_clean = header.strip().lower()
-        for pattern in can_id_patterns:
-            if re.match(pattern, header_clean):
-                return idx
-    return None
-
-
-def find_pgn_column(headers):
-    """
-    Find the column index that contains PGN values directly.
-    Returns column index or None.
+    Returns:
+        dict shaped like analyze_lines() plus 'start_offset',
+        'bytes_processed' and 'reset' (see log_analysis.analyze_increment)
     """
-    pgn_patterns = [
-        r'^pgn\s*\(h\)$', r'^pgn_h$', r'^pgn\s*\(hex\)$', r'^pgn\s*hex$',
-        r'^pgn$', r'^pgn_dec$', r'^pgn\s*\(d\)$', r'^pgn\s*\(dec\)$'
-    ]
-    
-    for idx, header in enumerate(headers):
-        header_clean = header.strip().lower()
-        for pattern in pgn_patterns:
-            if re.match(pattern, header_clean):
-                return idx
-    return None
+    with transaction.atomic():
+        checkpoint, _ = LogCheckpoint.objects.select_for_update().get_or_create(
+            source=source, defaults={'encoding': encoding}
+        )
+        state = checkpoint.state()
+        if state['encoding'] != encoding:
+            state = new_checkpoint(encoding)
+
+        temp_path = getattr(file, 'temporary_file_path', None)
+        if temp_path and file.size:
+            with open(temp_path(), 'rb') as fh:
+                with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    analysis, state = analyze_increment(mm, state)
+        else:
+            analysis, state = analyze_increment(file.read(), state)
+            file.seek(0)
 
-
-def parse_line_for_can_id(line, delimiter=None):
-    """
-    Parse a line and try to extract CAN ID from various formats.
-    Handles CSV, space-separated, and raw CAN frame formats.
-    
-    Returns list of potential CAN IDs found.
-    """
-    can_ids = []
-    
-    # Try different delimiters
-    delimiters_to_try = [delimiter] if delimiter else [',', ';', '\t', ' ', '|']
-    
-    for delim in delimiters_to_try:
-        if delim is None:
-            continue
-        parts = [p.strip() for p in line.split(delim) if p.strip()]
-        
-        for part in parts:
-            # Check if part looks like a CAN ID (hex or decimal)
-            part_clean = part.upper().strip()
-            
-            # Remove common prefixes
-            for prefix in ['0X', '0H', 'H']:
-                if part_clean.startswith(prefix):
-                    part_clean = part_clean[len(prefix):]
-            
-            # Check if it's a valid hex/decimal number in CAN ID range
-            if re.match(r'^[0-9A-F]+$', part_clean):
-                try:
-                    # Try as hex first
-                    if re.search(r'[A-F]', part_clean):
-                        val = int(part_clean, 16)
-                    else:
-                        # Pure numeric - could be decimal or hex
-                        val = int(part_clean, 10)
-                        if val > 0x1FFFFFFF:
-                            val = int(part_clean, 16)
-                    
-                    # CAN ID reasonable range (J1939 29-bit extended)
-                    if 0x100 <= val <= 0x1FFFFFFF:
-                        can_ids.append(val)
-                except ValueError:
-                    continue
-    
-    return can_ids
+        checkpoint.update_from(state)
+    return analysis
 
 
 @csrf_exempt
@@ -1429,12 +1208,18 @@ def analyze_j1939_files(request):
     Analyze J1939 data log files and extract PGNs.
     
     Supports:
-    - .csv, .txt, .log, and binary log files
+    - .csv, .txt, .log text logs, detected from content rather than extension
+    - Binary captures and workbooks are rejected up front with a clear error
     - Automatic encoding detection (UTF-8, UTF-16, latin1, cp1252, GB2312, etc.)
     - PGN extraction from CAN ID: PGN = (ID >> 8) & 0xFFFF
     - Handles CAN ID in hex or decimal format
     - CSV, space-separated, and raw frame formats
-    - Large file handling with streaming
+    - Logs are parsed while the upload is received (StreamingAnalysisUploadHandler,
+      J1939_STREAM_ANALYSIS); otherwise large files spooled to disk are split into newline-aligned
+      byte ranges and parsed in a process pool (J1939_PARALLEL_MIN_BYTES/_WORKERS)
+    - incremental=1: growing logs keep a per-source checkpoint (LogCheckpoint)
+      and only newly appended bytes are parsed on each call; `source` names
+      the log (defaults to the file name), reset_checkpoint=1 starts over
     - Graceful error handling for encoding issues
     
     Returns JSON:
@@ -1447,6 +1232,9 @@ def analyze_j1939_files(request):
         "errors": [...]                 # Any parsing errors
     }
     """
+    # Logs are analyzed while they are received (see Main/upload_handlers.py)
+    if settings.J1939_STREAM_ANALYSIS:
+        request.upload_handlers = [StreamingAnalysisUploadHandler(request)]
     files = request.FILES.getlist('files')
     if not files:
         files = request.FILES.getlist('file')
@@ -1459,115 +1247,90 @@ def analyze_j1939_files(request):
             'unique_pgn_list': []
         }, status=400)
     
+    incremental = request.POST.get('incremental', '').lower() in ('1', 'true', 'yes')
+    source_prefix = request.POST.get('source', '').strip()
+    if request.POST.get('reset_checkpoint', '').lower() in ('1', 'true', 'yes'):
+        sources = [f'{source_prefix}:{f.name}' if source_prefix else f.name for f in files]
+        LogCheckpoint.objects.filter(source__in=sources).delete()
+
     vehicles = []
     errors = []
     
     # Aggregate counters across all files
-    all_pgn_occurrences = []  # List of all PGN hex values (with duplicates)
-    all_unique_pgns = set()   # Set of unique PGN hex values
+    all_pgn_counts = Counter()  # PGN hex value -> number of occurrences
     
     for file in files:
         file_errors = []
-        file_pgn_occurrences = []
-        file_unique_pgns = set()
+
+        # Only text logs can be analysed here; reject anything else up front
+        streamed = getattr(file, 'stream_analysis', None)
+        detected = streamed['detected'] if streamed else sniff_upload(file)
+        if detected['kind'] != KIND_TEXT:
+            message = f"Unsupported file format: {detected['label']}"
+            if detected['kind'] == KIND_EXCEL:
+                message += ' (upload workbooks through /api/j1939/upload/)'
+            errors.append({
+                'filename': file.name,
+                'error': message,
+                'detected_format': detected['format']
+            })
+            vehicles.append({
+                'id': len(vehicles) + 1,
+                'name': file.name.split('.')[0],
+                'filename': file.name,
+                'detected_format': detected['format'],
+                'total_pgn_count': 0,
+                'unique_pgn_count': 0,
+                'unique_pgn_list': [],
+                'error': message
+            })
+            continue
         
         try:
-            # Read file content
-            file_content = file.read()
-            file.seek(0)  # Reset for potential re-read
-            
-            # Detect encoding and decode
-            decoded_text, encoding_used, encoding_errors = detect_encoding_and_read(file_content)
-            
-            if encoding_errors:
-                file_errors.append(f"Encoding detection tried: {', '.join(encoding_errors[:3])}")
-            
-            logger.info(f"File {file.name}: Using encoding {encoding_used}")
-            
-            # Split into lines
-            lines = decoded_text.split('\n')
-            
-            # Detect file format and find relevant columns
-            headers = []
-            pgn_col_idx = None
-            can_id_col_idx = None
-            delimiter = ','
-            
-            # Find header row and column indices
-            for i, line in enumerate(lines[:20]):  # Check first 20 lines for header
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Detect delimiter
-                for delim in [',', ';', '\t', '|']:
-                    if delim in line:
-                        delimiter = delim
-                        break
-                
-                columns = [col.strip() for col in line.split(delimiter)]
-                
-                # Check if this looks like a header row
-                pgn_idx = find_pgn_column(columns)
-                can_idx = find_can_id_column(columns)
-                
-                if pgn_idx is not None or can_idx is not None:
-                    headers = columns
-                    pgn_col_idx = pgn_idx
-                    can_id_col_idx = can_idx
-                    # Start processing from next line
-                    lines = lines[i+1:]
-                    break
-            
-            # Process data lines
-            for line_num, line in enumerate(lines):
-                try:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    columns = [col.strip() for col in line.split(delimiter)]
-                    
-                    # Method 1: Direct PGN column
-                    if pgn_col_idx is not None and pgn_col_idx < len(columns):
-                        pgn_value = columns[pgn_col_idx].strip()
-                        if pgn_value and pgn_value.lower() not in ['', 'null', 'none', 'n/a', 'pgn', 'pgn(h)']:
-                            # Normalize PGN value to hex
-                            pgn_clean = pgn_value.upper()
-                            for prefix in ['0X', '0H', 'H']:
-                                if pgn_clean.startswith(prefix):
-                                    pgn_clean = pgn_clean[len(prefix):]
-                            
-                            if re.match(r'^[0-9A-F]+$', pgn_clean):
-                                # Pad to at least 4 characters
-                                pgn_hex = pgn_clean.zfill(4).upper()
-                                file_pgn_occurrences.append(pgn_hex)
-                                file_unique_pgns.add(pgn_hex)
-                    
-                    # Method 2: Extract PGN from CAN ID column
-                    elif can_id_col_idx is not None and can_id_col_idx < len(columns):
-                        can_id_value = columns[can_id_col_idx].strip()
-                        pgn_int, pgn_hex = extract_pgn_from_can_id(can_id_value)
-                        if pgn_hex:
-                            file_pgn_occurrences.append(pgn_hex)
-                            file_unique_pgns.add(pgn_hex)
-                    
-                    # Method 3: Try to find CAN ID anywhere in the line
-                    else:
-                        can_ids = parse_line_for_can_id(line, delimiter)
-                        for can_id in can_ids[:1]:  # Take first valid CAN ID per line
-                            pgn_int, pgn_hex = extract_pgn_from_can_id(can_id)
-                            if pgn_hex:
-                                file_pgn_occurrences.append(pgn_hex)
-                                file_unique_pgns.add(pgn_hex)
-                                break
-                
-                except Exception as line_error:
-                    # Log but continue processing
-                    if len(file_errors) < 10:
-                        file_errors.append(f"Line {line_num}: {str(line_error)[:50]}")
-                    continue
-            
+            temp_path = getattr(file, 'temporary_file_path', None)
+            if streamed and streamed['analysis'] is not None and not incremental:
+                # Analyzed while it was received; the file is not read again
+                encoding_used = detected['encoding']
+                analysis = streamed['analysis']
+                logger.info(f"File {file.name}: analyzed while uploading ({file.size} bytes)")
+            elif detected['format'] in CAN_LOG_FORMATS:
+                # Raw CAN captures are decoded frame by frame, streamed in chunks
+                encoding_used = detected['encoding']
+                analysis = analyze_can_log(file.chunks(), detected['format'], encoding_used)
+                file.seek(0)
+                logger.info(f"File {file.name}: parsed {analysis['frames']} {detected['format']} frames")
+            elif incremental and can_split_by_bytes(detected['encoding']):
+                # Growing log: resume from the checkpoint and parse only new bytes
+                encoding_used = detected['encoding']
+                source = f'{source_prefix}:{file.name}' if source_prefix else file.name
+                analysis = analyze_with_checkpoint(file, source, encoding_used)
+                analysis['source'] = source
+                logger.info(f"File {file.name}: parsed {analysis['bytes_processed']} new bytes from offset {analysis['start_offset']}")
+            elif (temp_path and file.size >= settings.J1939_PARALLEL_MIN_BYTES
+                    and can_split_by_bytes(detected['encoding'])):
+                # Large upload already on disk: parse byte ranges in a process pool
+                encoding_used = detected['encoding']
+                analysis = analyze_log_file(temp_path(), encoding_used, settings.J1939_PARALLEL_WORKERS)
+                logger.info(f"File {file.name}: parsed {file.size} bytes with {analysis['workers']} workers")
+            else:
+                # Read file content
+                file_content = file.read()
+                file.seek(0)  # Reset for potential re-read
+
+                # Detect encoding and decode
+                decoded_text, encoding_used, encoding_errors = detect_encoding_and_read(file_content, detected)
+
+                if encoding_errors:
+                    file_errors.append(f"Encoding detection tried: {', '.join(encoding_errors[:3])}")
+
+                logger.info(f"File {file.name}: Using encoding {encoding_used}")
+
+                # Find the header row, then count PGNs in the data lines
+                analysis = analyze_lines(decoded_text)
+
+            file_pgn_counts = analysis['counter']
+            file_errors.extend(analysis['warnings'][:max(0, 10 - len(file_errors))])
+
             # Build vehicle/file result
             vehicle_name = file.name.split('.')[0].replace('_', ' ').replace('-', ' ')
             
@@ -1576,23 +1339,29 @@ def analyze_j1939_files(request):
                 'name': vehicle_name,
                 'brand': extract_brand(file.name),
                 'filename': file.name,
+                'detected_format': detected['format'],
                 'encoding_used': encoding_used,
-                'total_pgn_count': len(file_pgn_occurrences),
-                'unique_pgn_count': len(file_unique_pgns),
-                'unique_pgn_list': sorted(list(file_unique_pgns)),
+                'total_pgn_count': sum(file_pgn_counts.values()),
+                'unique_pgn_count': len(file_pgn_counts),
+                'unique_pgn_list': sorted(file_pgn_counts),
                 'analysis_summary': {
-                    'total_lines_processed': len(lines),
-                    'pgn_extraction_method': 'pgn_column' if pgn_col_idx is not None else 
-                                            'can_id_column' if can_id_col_idx is not None else 
-                                            'auto_detect'
+                    'total_lines_processed': analysis['lines'],
+                    'pgn_extraction_method': analysis.get('method') or extraction_method(analysis['layout']),
+                    'parallel_workers': analysis.get('workers', 1)
                 }
             }
+            if 'source' in analysis:
+                vehicle['analysis_summary']['incremental'] = {
+                    'source': analysis['source'],
+                    'start_offset': analysis['start_offset'],
+                    'bytes_processed': analysis['bytes_processed'],
+                    'checkpoint_reset': analysis['reset']
+                }
             
             vehicles.append(vehicle)
             
             # Add to aggregates
-            all_pgn_occurrences.extend(file_pgn_occurrences)
-            all_unique_pgns.update(file_unique_pgns)
+            all_pgn_counts.update(file_pgn_counts)
             
             if file_errors:
                 errors.append({
@@ -1618,20 +1387,21 @@ def analyze_j1939_files(request):
             })
     
     # Build response
+    total_pgn_count = sum(all_pgn_counts.values())
     return JsonResponse({
         'status': 'success',
-        'total_pgn_count': len(all_pgn_occurrences),
-        'unique_pgn_count': len(all_unique_pgns),
-        'unique_pgn_list': sorted(list(all_unique_pgns)),
+        'total_pgn_count': total_pgn_count,
+        'unique_pgn_count': len(all_pgn_counts),
+        'unique_pgn_list': sorted(all_pgn_counts),
         'vehicles': vehicles,
         'errors': errors,
         'totals': {
             'total_vehicles': len(vehicles),
-            'total_pgn_count': len(all_pgn_occurrences),
-            'unique_pgn_count': len(all_unique_pgns),
+            'total_pgn_count': total_pgn_count,
+            'unique_pgn_count': len(all_pgn_counts),
             'pgn_h_column_stats': {
-                'total_pgn_count': len(all_pgn_occurrences),
-                'unique_pgn_count': len(all_unique_pgns)
+                'total_pgn_count': total_pgn_count,
+                'unique_pgn_count': len(all_pgn_counts)
             }
         }
     })
@@ -1661,7 +1431,23 @@ def extract_brand(filename):
 # J1939 Parameter Definitions API Views
 # =============================================================================
 
-class J1939ParameterDefinitionListView(generics.ListCreateAPIView):
+class DefinitionVersionMixin:
+    """Publish a new DefinitionVersion after writes, coalesced (see Main/definitions.py)."""
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        schedule_definition_publish('api')
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        schedule_definition_publish('api')
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        schedule_definition_publish('api')
+
+
+class J1939ParameterDefinitionListView(DefinitionVersionMixin, generics.ListCreateAPIView):
     """
     GET: List all J1939 parameter definitions
     POST: Create a new parameter definition
@@ -1679,7 +1465,7 @@ class J1939ParameterDefinitionListView(generics.ListCreateAPIView):
         return queryset
 
 
-class J1939ParameterDefinitionDetailView(generics.RetrieveUpdateDestroyAPIView):
+class J1939ParameterDefinitionDetailView(DefinitionVersionMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     GET: Retrieve a specific parameter definition by SPN number
     PUT/PATCH: Update a parameter definition
@@ -1691,6 +1477,78 @@ class J1939ParameterDefinitionDetailView(generics.RetrieveUpdateDestroyAPIView):
     lookup_field = 'SPN_Number'
 
 
+class DefinitionVersionListView(generics.ListAPIView):
+    """
+    GET /api/j1939/definition-versions/
+
+    Published parameter definition snapshots, newest first. Vehicles record
+    the version they were mapped against (`definition_version`).
+    """
+    queryset = DefinitionVersion.objects.defer('definitions')
+    serializer_class = DefinitionVersionSerializer
+    permission_classes = [permissions.AllowAny]
+
+
+class DefinitionSnapshotView(APIView):
+    """
+    GET /api/j1939/parameter-definitions/snapshot/
+
+    The complete parameter dictionary of the current DefinitionVersion as one
+    gzip-compressed JSON document:
+
+    {
+        "version": 7,
+        "content_hash": "...",
+        "since": null,
+        "fields": ["SPN_Number", "PGN_DEC", ...],
+        "definitions": [[84, 65265, ...], ...],
+        "deleted": []
+    }
+
+    With `?since=<version>` only the rows added or changed after that
+    version are returned, plus the deleted SPNs. An unknown `since` (e.g. a
+    version the client made up) returns the full dictionary with
+    "since": null.
+
+    The ETag is the version's content hash, so clients keep the dictionary
+    locally and revalidate with If-None-Match, getting 304 until the
+    definitions change.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        try:
+            since = int(since) if since not in (None, '') else None
+        except ValueError:
+            return Response({'detail': 'since must be a definition version id'}, status=status.HTTP_400_BAD_REQUEST)
+
+        version = current_definition_version()
+        since_version = None
+        if since is not None:
+            since_version = DefinitionVersion.objects.filter(pk=since).defer('definitions').first()
+
+        etag = f'"{version.content_hash}"'
+        if since_version is not None:
+            etag = f'"{version.content_hash}-{since_version.content_hash[:16]}"'
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+            'X-Definition-Version': str(version.id),
+        }
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and etag in parse_etags(if_none_match):
+            return HttpResponseNotModified(headers=headers)
+
+        blob = snapshot_blob(version, since_version)
+        if re.search(r'\bgzip\b', request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            headers['Content-Encoding'] = 'gzip'
+        else:
+            blob = gzip.decompress(blob)
+        return HttpResponse(blob, content_type='application/json', headers=headers)
+
+
 class DecodeSPNValueView(APIView):
     """
     POST /api/j1939/decode-spn/
@@ -1771,6 +1629,15 @@ class UniqueSPNCountView(APIView):
         "spn_numbers": [84, 182, 959, 960, 961, 962, 963, 964, 4191],
         "pgn_filter": null
     }
+
+    POST /api/j1939/unique-spn-count/
+
+    Count the unique SPNs in an uploaded message stream, either
+    - JSON {"messages": [{"pgn": 65265}, {"pgn": 61444, "spns": [190]}, ...]}, or
+    - multipart `file`: a raw CAN capture (candump, ASC, TRC, ...), parsed
+      in chunks into PGN counts.
+
+    Response: J1939ParameterDefinition.count_unique_spns() plus "messages".
     """
     permission_classes = [permissions.AllowAny]
 
@@ -1795,16 +1662,57 @@ class UniqueSPNCountView(APIView):
             'pgn_filter': pgn
         })
 
+    def post(self, request):
+        counter = UniqueSPNCounter()
+        uploaded = request.FILES.get('file')
+        if uploaded is not None:
+            detected = sniff_upload(uploaded)
+            if detected['format'] not in CAN_LOG_FORMATS:
+                return Response({
+                    'error': f"Unsupported message stream format: {detected['label']}"
+                }, status=status.HTTP_400_BAD_REQUEST)
+            analysis = analyze_can_log(uploaded.chunks(), detected['format'], detected['encoding'])
+            counter.add_pgn_counts({int(pgn_hex, 16): count for pgn_hex, count in analysis['counter'].items()})
+        else:
+            messages = request.data.get('messages')
+            if not isinstance(messages, list) or not all(isinstance(message, dict) for message in messages):
+                return Response({
+                    'error': 'Provide "messages" as a list of objects or a CAN log "file"'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                # pgn must be a number and spns a list of numbers
+                counter.update(messages)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = counter.result()
+        result['messages'] = counter.messages
+        return Response(result)
+
+
+class PGNSummaryPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
 
 class PGNSummaryView(APIView):
     """
     GET /api/j1939/pgn-summary/
     
     Get summary of all PGNs with their associated SPNs from parameter definitions.
+
+    The summary is built once per definition version from the shared
+    definition index (Main/definition_index.py) and answered from memory.
+
+    Query Parameters:
+    - pgn_min, pgn_max (optional): Only PGNs in this range (inclusive)
+    - page, page_size (optional): Paginate ({"count", "next", "previous",
+      "results"}); without them every PGN is returned
     
     Response:
     {
         "pgn_count": 4,
+        "definition_version": 7,
         "pgns": [
             {
                 "pgn": 0,
@@ -1818,24 +1726,27 @@ class PGNSummaryView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
-        # Group SPNs by PGN
-        pgn_data = J1939ParameterDefinition.objects.values('PGN_DEC').annotate(
-            spn_count=Count('SPN_Number')
-        ).order_by('PGN_DEC')
-
-        pgns = []
-        for item in pgn_data:
-            spns = list(J1939ParameterDefinition.objects.filter(
-                PGN_DEC=item['PGN_DEC']
-            ).values_list('SPN_Number', flat=True))
-            pgns.append({
-                'pgn': item['PGN_DEC'],
-                'spn_count': item['spn_count'],
-                'spns': sorted(spns)
-            })
+        try:
+            pgn_min, pgn_max = (
+                int(request.query_params[name]) if request.query_params.get(name, '') != '' else None
+                for name in ('pgn_min', 'pgn_max')
+            )
+        except ValueError:
+            return Response({'detail': 'pgn_min and pgn_max must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        version = current_definition_version()
+        pgns = definition_index(version.id).pgn_summary(pgn_min, pgn_max)
+
+        if 'page' in request.query_params or 'page_size' in request.query_params:
+            paginator = PGNSummaryPagination()
+            page = paginator.paginate_queryset(pgns, request, view=self)
+            response = paginator.get_paginated_response(page)
+            response.data['definition_version'] = version.id
+            return response
 
         return Response({
             'pgn_count': len(pgns),
+            'definition_version': version.id,
             'pgns': pgns
         })
 
@@ -1984,6 +1895,13 @@ class UploadSPNMasterView(APIView):
     
     Optional columns:
     Resolution, Offset, Min_Value, Max_Value
+
+    A DBC file (.dbc) is accepted as well: its signals with a J1939 `SPN`
+    attribute are loaded as definitions (see Main/dbc.py).
+
+    The file is diffed against the stored definitions and applied in one
+    transaction with bulk inserts/updates (see Main/spn_master.py). Pass
+    `dry_run=true` to get the counts and diff without writing anything.
     """
     permission_classes = [permissions.AllowAny]
     parser_classes = [MultiPartParser, FormParser]
@@ -1998,96 +1916,46 @@ class UploadSPNMasterView(APIView):
         file = request.FILES['file']
         
         # Check file extension
-        if not file.name.endswith('.csv'):
+        is_dbc = file.name.lower().endswith('.dbc')
+        if not is_dbc and not file.name.endswith('.csv'):
             return Response({
                 'error': 'Invalid file type',
-                'message': 'Only CSV files are supported'
+                'message': 'Only CSV and DBC files are supported'
             }, status=status.HTTP_400_BAD_REQUEST)
 
+        dry_run = str(request.data.get('dry_run') or request.query_params.get('dry_run') or '').lower() in ('1', 'true', 'yes')
         try:
-            # Read CSV file
-            import csv
-            import io
-            
-            content = file.read().decode('utf-8')
-            reader = csv.DictReader(io.StringIO(content))
-            
-            created_count = 0
-            updated_count = 0
-            errors = []
-
-            for row_num, row in enumerate(reader, start=2):
-                try:
-                    # Parse required fields
-                    spn_number = int(row.get('SPN_Number', row.get('SPN', 0)))
-                    pgn_dec = int(row.get('PGN_DEC', row.get('PGN', 0)))
-                    pgn_hex = row.get('PGN_HEX', f"0x{pgn_dec:04X}")
-                    spn_name = row.get('SPN_Name', row.get('Description', ''))
-                    unit = row.get('Unit', '')
-                    
-                    # Parse byte/bit info
-                    data_length = int(row.get('DL', row.get('Data_Length', 1)))
-                    spb = row.get('SPB', row.get('Start_Byte', '1'))
-                    
-                    # Parse SPB which could be "1-2" or just "1"
-                    if '-' in str(spb):
-                        start_byte = int(str(spb).split('-')[0])
-                    else:
-                        start_byte = int(spb)
-                    
-                    length_bits = int(row.get('Length_Bits', row.get('Bit_Length', 8)))
-                    
-                    # Parse optional fields
-                    resolution = float(row.get('Resolution', 1.0))
-                    offset = float(row.get('Offset', 0.0))
-                    min_value = row.get('Min_Value')
-                    max_value = row.get('Max_Value')
-                    
-                    min_value = float(min_value) if min_value else None
-                    max_value = float(max_value) if max_value else None
-
-                    # Create or update
-                    obj, created = J1939ParameterDefinition.objects.update_or_create(
-                        SPN_Number=spn_number,
-                        defaults={
-                            'PGN_DEC': pgn_dec,
-                            'PGN_HEX': pgn_hex,
-                            'SPN_Description': spn_name,
-                            'Unit': unit,
-                            'Data_Length_Bytes': data_length,
-                            'Start_Byte': start_byte,
-                            'Start_Bit': 0,
-                            'Bit_Length': length_bits,
-                            'Resolution': resolution,
-                            'Offset': offset,
-                            'Min_Value': min_value,
-                            'Max_Value': max_value
-                        }
-                    )
-
-                    if created:
-                        created_count += 1
-                    else:
-                        updated_count += 1
-
-                except Exception as e:
-                    errors.append(f"Row {row_num}: {str(e)}")
-
+            if is_dbc:
+                # Streamed line by line
+                definitions, errors = parse_dbc(file)
+            else:
+                definitions, errors = parse_spn_master(file.read())
+        except UnicodeDecodeError as e:
             return Response({
-                'status': 'success',
-                'created': created_count,
-                'updated': updated_count,
-                'total_processed': created_count + updated_count,
-                'errors': errors if errors else None,
-                'message': f"Successfully processed {created_count + updated_count} SPN definitions"
-            })
+                'error': 'Invalid file encoding',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            result = import_spn_master(definitions, dry_run=dry_run)
         except Exception as e:
+            logger.error('SPN master import failed: %s', str(e), exc_info=True)
             return Response({
                 'error': 'Failed to process file',
                 'message': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        processed = result['created'] + result['updated'] + result['unchanged']
+        verb = 'Would process' if dry_run else 'Successfully processed'
+        return Response(dict(
+            result,
+            status='success',
+            total_processed=processed,
+            errors=errors if errors else None,
+            message=f"{verb} {processed} SPN definitions "
+                    f"({result['created']} created, {result['updated']} updated, {result['unchanged']} unchanged)"
+        ))
+
 
 class AnalyzePGNsFromFileView(APIView):
     """
@@ -0,0 +1,199 @@
+"""
+Drop-directory watching for the watch_j1939 command.
+
+Gateways rsync logs into a shared directory. rsync writes to a hidden temp
+file and renames it into place, other tools write the final name directly,
+so a file is treated as complete when either:
+
+- inotify reports it closed after writing or moved into place, or
+- its size and mtime have not changed for `settle_seconds` (polling).
+
+On Linux inotify is used through libc via ctypes, so no extra package is
+needed; elsewhere, or when inotify is unavailable, the directory is polled.
+Either way every wake-up rescans the tree, so a missed event only delays a
+file until it settles.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify:
+    """Minimal inotify binding: watch directories, read completed-file events."""
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or not libc_name:
+            raise OSError('inotify is not available on this platform')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._dirs = {}
+
+    def add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {path}')
+        self._dirs[wd] = path
+
+    def read(self, timeout):
+        """
+        Wait up to `timeout` seconds for events.
+
+        Returns:
+            tuple (completed file paths, new directory paths)
+        """
+        completed, new_dirs = set(), set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return completed, new_dirs
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return completed, new_dirs
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, pos)
+            name = data[pos + _EVENT_HEADER.size:pos + _EVENT_HEADER.size + name_len].rstrip(b'\0')
+            pos += _EVENT_HEADER.size + name_len
+            if wd not in self._dirs or not name:
+                continue
+            path = os.path.join(self._dirs[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    new_dirs.add(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                completed.add(path)
+        return completed, new_dirs
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """
+    Report files in a drop directory once they are completely written.
+
+    Hidden files and directories (rsync temp files) and the excluded paths
+    (e.g. an archive tree inside the drop directory) are ignored.
+    """
+
+    def __init__(self, directory, settle_seconds=5.0, poll_interval=2.0, exclude=(), use_inotify=True):
+        self.directory = os.path.abspath(directory)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.exclude = tuple(os.path.abspath(path) for path in exclude)
+        # path -> (size, mtime, time the pair was first seen unchanged)
+        self._seen = {}
+        self._closed = set()
+        self._inotify = None
+        if use_inotify:
+            try:
+                self._inotify = _Inotify()
+                for path in self._walk_dirs():
+                    self._inotify.add_watch(path)
+            except OSError as exc:
+                logger.info('inotify unavailable (%s), polling %s every %.1fs', exc, directory, poll_interval)
+                self._inotify = None
+
+    @property
+    def mode(self):
+        return 'inotify' if self._inotify else 'polling'
+
+    def _excluded(self, path):
+        return any(path == ex or path.startswith(ex + os.sep) for ex in self.exclude)
+
+    def _walk_dirs(self):
+        for root, dirs, _ in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if not d.startswith('.') and not self._excluded(os.path.join(root, d))]
+            yield root
+
+    def _scan(self):
+        for root in self._walk_dirs():
+            try:
+                names = os.listdir(root)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(root, name)
+                if name.startswith('.') or not os.path.isfile(path):
+                    continue
+                yield path
+
+    def wait(self, timeout=None):
+        """Block until something may have changed (an event or the poll interval)."""
+        timeout = self.poll_interval if timeout is None else timeout
+        if self._inotify is None:
+            time.sleep(timeout)
+            return
+        completed, new_dirs = self._inotify.read(timeout)
+        self._closed.update(completed)
+        for path in new_dirs:
+            if not os.path.basename(path).startswith('.') and not self._excluded(path):
+                try:
+                    self._inotify.add_watch(path)
+                except OSError as exc:
+                    logger.warning('Cannot watch %s: %s', path, exc)
+
+    def completed_files(self, now=None):
+        """
+        Rescan the directory.
+
+        Returns:
+            tuple (completed paths sorted by mtime, number of files still
+            being written)
+        """
+        now = time.time() if now is None else now
+        ready, writing = [], 0
+        current = {}
+        for path in self._scan():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            key = (stat.st_size, stat.st_mtime)
+            previous = self._seen.get(path)
+            if previous is None:
+                # A file has not changed since its mtime
+                since = min(stat.st_mtime, now)
+            else:
+                since = previous[2] if previous[:2] == key else now
+            current[path] = key + (since,)
+            if path in self._closed or now - since >= self.settle_seconds:
+                ready.append((stat.st_mtime, path))
+            else:
+                writing += 1
+        self._seen = current
+        self._closed &= set(current)
+        return [path for _, path in sorted(ready)], writing
+
+    def forget(self, path):
+        """Drop state for a file that has been moved away."""
+        self._seen.pop(path, None)
+        self._closed.discard(path)
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
@@ -154,6 +154,83 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Store media bodies once per SHA-256 (Main/storage.py); FileField paths
+# become hard links, so identical uploads cost no extra disk
+CONTENT_ADDRESSED_MEDIA = env.bool('CONTENT_ADDRESSED_MEDIA', default=True)
+if CONTENT_ADDRESSED_MEDIA:
+    DEFAULT_FILE_STORAGE = 'Main.storage.ContentAddressedStorage'
+# Download endpoints (Main/downloads.py): hand the transfer to the front
+# proxy with X-Accel-Redirect ('nginx', served from an internal location at
+# MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or X-Sendfile ('sendfile');
+# empty streams from Django
+MEDIA_ACCEL_REDIRECT = env.str('MEDIA_ACCEL_REDIRECT', default='')
+MEDIA_ACCEL_PREFIX = env.str('MEDIA_ACCEL_PREFIX', default='/protected-media/')
+DOWNLOAD_CHUNK_BYTES = env.int('DOWNLOAD_CHUNK_BYTES', default=256 * 1024)
+
+# -------------------------
+# J1939 LOG ANALYSIS
+# -------------------------
+# Analyze logs while the upload is received (Main/upload_handlers.py); when
+# off, large spooled uploads are parsed afterwards in a process pool
+J1939_STREAM_ANALYSIS = env.bool('J1939_STREAM_ANALYSIS', default=True)
+# Uploads at least this large (and already spooled to disk) are split into
+# byte ranges and parsed in a process pool
+J1939_PARALLEL_MIN_BYTES = env.int('J1939_PARALLEL_MIN_BYTES', default=64 * 1024 * 1024)
+# Worker processes for parallel parsing (defaults to the CPU count)
+J1939_PARALLEL_WORKERS = env.int('J1939_PARALLEL_WORKERS', default=os.cpu_count() or 1)
+# Uploads at least this large are ingested as a checkpointed IngestJob that
+# commits every J1939_INGEST_CHUNK_BYTES and can resume after a crash
+J1939_CHECKPOINT_MIN_BYTES = env.int('J1939_CHECKPOINT_MIN_BYTES', default=128 * 1024 * 1024)
+J1939_INGEST_CHUNK_BYTES = env.int('J1939_INGEST_CHUNK_BYTES', default=16 * 1024 * 1024)
+# Run ingest jobs in a background thread after the upload request returns
+# (Main/jobs.py); when off, `manage.py resume_ingest_jobs` runs them
+J1939_INGEST_IN_BACKGROUND = env.bool('J1939_INGEST_IN_BACKGROUND', default=True)
+# A running ingest job whose heartbeat (refreshed after every chunk) is
+# older than this was left by a dead worker and may be resumed; keep it
+# well above the time one J1939_INGEST_CHUNK_BYTES chunk takes
+J1939_INGEST_STALE_SECONDS = env.int('J1939_INGEST_STALE_SECONDS', default=600)
+# Chunked uploads (/api/j1939/uploads/): suggested and largest accepted chunk
+J1939_UPLOAD_CHUNK_BYTES = env.int('J1939_UPLOAD_CHUNK_BYTES', default=8 * 1024 * 1024)
+J1939_UPLOAD_MAX_CHUNK_BYTES = env.int('J1939_UPLOAD_MAX_CHUNK_BYTES', default=64 * 1024 * 1024)
+# Keep archived text logs gzip-compressed at rest (Main/compression.py);
+# `manage.py compress_uploads` compresses the existing archive
+J1939_COMPRESS_UPLOADS = env.bool('J1939_COMPRESS_UPLOADS', default=True)
+J1939_UPLOAD_COMPRESSION_LEVEL = env.int('J1939_UPLOAD_COMPRESSION_LEVEL', default=6)
+# Answer uploads whose SHA-256 matches an existing vehicle with that
+# vehicle instead of ingesting them again (per request: `dedupe=true`)
+J1939_UPLOAD_DEDUPE = env.bool('J1939_UPLOAD_DEDUPE', default=False)
+# How long an Idempotency-Key response is kept for replay (Main/idempotency.py)
+IDEMPOTENCY_KEY_TTL_HOURS = env.int('IDEMPOTENCY_KEY_TTL_HOURS', default=24)
+# A key still pending after this long was claimed by a worker that died; a
+# retry takes it over. Keep it above the gunicorn/proxy request timeout
+IDEMPOTENCY_PENDING_TIMEOUT_SECONDS = env.int('IDEMPOTENCY_PENDING_TIMEOUT_SECONDS', default=300)
+# Memory-mapped parameter definition indexes shared by the workers
+# (Main/definition_index.py); empty uses MEDIA_ROOT/definition_index, a
+# /dev/shm directory keeps them in shared memory
+J1939_DEFINITION_INDEX_DIR = env.str('J1939_DEFINITION_INDEX_DIR', default='')
+# Re-map the stored vehicle mappings affected by a new definition version in
+# a background thread (Main/remap.py); when off, `manage.py remap_vehicles`
+# runs the queued jobs
+J1939_REMAP_IN_BACKGROUND = env.bool('J1939_REMAP_IN_BACKGROUND', default=True)
+# Single-row definition edits (admin, API) are published as one new
+# DefinitionVersion this many seconds after the first of them; 0 publishes
+# after every edit. Imports always publish at once
+J1939_DEFINITION_PUBLISH_DELAY_SECONDS = env.int('J1939_DEFINITION_PUBLISH_DELAY_SECONDS', default=30)
+
+# -------------------------
+# J1939 WATCH-FOLDER INGESTION (manage.py watch_j1939)
+# -------------------------
+# Drop directory the gateways sync logs into
+J1939_WATCH_DIR = env.str('J1939_WATCH_DIR', default='')
+# Ingested files are moved here under <Y>/<M>/<D>/, failures under failed/
+J1939_WATCH_ARCHIVE_DIR = env.str('J1939_WATCH_ARCHIVE_DIR', default='')
+# Parser processes; at most this many files are parsed at once
+J1939_WATCH_WORKERS = env.int('J1939_WATCH_WORKERS', default=2)
+# A file is complete once unchanged for this long (when no inotify event says so)
+J1939_WATCH_SETTLE_SECONDS = env.float('J1939_WATCH_SETTLE_SECONDS', default=5.0)
+J1939_WATCH_POLL_SECONDS = env.float('J1939_WATCH_POLL_SECONDS', default=2.0)
+# Queue depth / lag metrics written by the watcher, served at /api/j1939/ingest/watch-status/
+J1939_WATCH_STATUS_FILE = env.str('J1939_WATCH_STATUS_FILE', default=str(BASE_DIR / 'j1939_watch_status.json'))
 
 # -------------------------
 # DEFAULT AUTO FIELD
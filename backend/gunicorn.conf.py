@@ -0,0 +1,37 @@
+"""
+Gunicorn configuration, read automatically when gunicorn is started from
+the backend directory:
+
+    gunicorn SwiSysBackend.wsgi:application
+
+The application is preloaded in the master, which maps the parameter
+definition index (Main/definition_index.py) before forking, so workers
+start warm and share its pages. `kill -HUP <master pid>` re-warms the
+master after a new SPN master import, for the workers it forks next.
+"""
+
+import logging
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+
+
+def _warm_definition_index(server):
+    from Main.definition_index import warm_definition_index
+    try:
+        warm_definition_index()
+    except Exception:
+        # A database that is not migrated yet must not stop the server;
+        # workers build the index on first use instead
+        logging.getLogger('gunicorn.error').exception('Could not warm the definition index')
+
+
+def when_ready(server):
+    _warm_definition_index(server)
+
+
+def on_reload(server):
+    _warm_definition_index(server)
@@ -0,0 +1,110 @@
+"""
+Tests for the candump, Vector ASC and PCAN TRC parsers.
+"""
+
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from Main.can_logs import (
+    iter_lines, parse_candump, parse_vector_asc, parse_pcan_trc, count_pgns_in_batches, analyze_can_log
+)
+
+CANDUMP_LOG = (
+    b'(1609459200.000100) can0 18FEF100#FFFFFFFF20FFFFFF\n'
+    b'(1609459200.000200) can0 0CF00400#F07D7D000000F07D\n'
+    b'(1609459200.000300) can0 123#DEAD\n'
+    b'(1609459200.000400) can0 18FEF100#FFFFFFFF21FFFFFF\n'
+)
+
+VECTOR_ASC = (
+    b'date Mon Jan 4 10:00:00.000 am 2021\n'
+    b'base hex  timestamps absolute\n'
+    b'Begin Triggerblock Mon Jan 4 10:00:00.000 am 2021\n'
+    b'   0.015991 1  18FEF100x       Rx   d 8 FF FF FF FF 20 FF FF FF  Length = 0 BitCount = 0\n'
+    b'   0.016500 1  CF00400x        Rx   d 8 F0 7D 7D 00 00 00 F0 7D\n'
+    b'   0.017000 1  1A0             Rx   d 2 DE AD\n'
+    b'End TriggerBlock\n'
+)
+
+PCAN_TRC = (
+    b';$FILEVERSION=1.1\n'
+    b';$STARTTIME=44197.4166666667\n'
+    b';   Message Number\n'
+    b'     1)      1059.9  Rx     18FEF100  8  FF FF FF FF 20 FF FF FF\n'
+    b'     2)      1060.4  Rx     0CF00400  8  F0 7D 7D 00 00 00 F0 7D\n'
+    b'     3)      1061.0  Rx         0300  2  DE AD\n'
+)
+
+
+class CanLogParserTest(SimpleTestCase):
+    """Test frame decoding into NumPy batches."""
+
+    def test_iter_lines_carries_partial_lines(self):
+        chunks = [b'ab', b'c\nde', b'f\n', b'g']
+        self.assertEqual(list(iter_lines(chunks)), ['abc', 'def', 'g'])
+
+    def test_candump_frames(self):
+        batches = list(parse_candump(iter_lines([CANDUMP_LOG])))
+        self.assertEqual(len(batches), 1)
+        batch = batches[0]
+        self.assertEqual(batch['can_id'].tolist(), [0x18FEF100, 0x0CF00400, 0x123, 0x18FEF100])
+        self.assertEqual(batch['extended'].tolist(), [True, True, False, True])
+        self.assertEqual(batch['dlc'].tolist(), [8, 8, 2, 8])
+        self.assertEqual(batch['data'][0].tolist(), [0xFF, 0xFF, 0xFF, 0xFF, 0x20, 0xFF, 0xFF, 0xFF])
+        self.assertAlmostEqual(batch['timestamp'][1], 1609459200.0002)
+
+    def test_small_batches(self):
+        batches = list(parse_candump(iter_lines([CANDUMP_LOG]), batch_size=3))
+        self.assertEqual([len(b['can_id']) for b in batches], [3, 1])
+
+    def test_vector_asc_frames(self):
+        batch = next(parse_vector_asc(iter_lines([VECTOR_ASC])))
+        self.assertEqual(batch['can_id'].tolist(), [0x18FEF100, 0x0CF00400, 0x1A0])
+        self.assertEqual(batch['extended'].tolist(), [True, True, False])
+
+    def test_pcan_trc_frames(self):
+        batch = next(parse_pcan_trc(iter_lines([PCAN_TRC])))
+        self.assertEqual(batch['can_id'].tolist(), [0x18FEF100, 0x0CF00400, 0x300])
+        self.assertAlmostEqual(batch['timestamp'][0], 1.0599)
+
+    def test_pgn_counts_skip_standard_frames(self):
+        counter, frames = count_pgns_in_batches(parse_candump(iter_lines([CANDUMP_LOG])))
+        self.assertEqual(frames, 4)
+        self.assertEqual(dict(counter), {'FEF1': 2, 'F004': 1})
+
+    def test_analyze_can_log(self):
+        result = analyze_can_log([PCAN_TRC], 'pcan_trc')
+        self.assertEqual(dict(result['counter']), {'FEF1': 1, 'F004': 1})
+
+
+class CanLogUploadAPITest(APITestCase):
+    """Test that raw captures plug into the analysis endpoints."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_analyze_candump(self):
+        upload = SimpleUploadedFile('capture.log', CANDUMP_LOG)
+        data = self.client.post(reverse('analyze_j1939'), {'files': upload}, format='multipart').json()
+        self.assertEqual(data['total_pgn_count'], 3)
+        self.assertEqual(data['unique_pgn_list'], ['F004', 'FEF1'])
+        self.assertEqual(data['vehicles'][0]['analysis_summary']['pgn_extraction_method'], 'candump')
+
+    def test_upload_vector_asc_creates_vehicle_pgns(self):
+        upload = SimpleUploadedFile('truck.asc', VECTOR_ASC)
+        response = self.client.post(reverse('j1939-upload'), {'file': upload}, format='multipart')
+        vehicle = response.data['vehicles'][0]
+        self.assertEqual(vehicle['detected_format'], 'vector_asc')
+        self.assertEqual(vehicle['pgns'], [0xF004, 0xFEF1])
+        self.assertEqual(vehicle['total_pgn_messages'], 2)
@@ -0,0 +1,139 @@
+"""
+Tests for the chunked, resumable upload API.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main.models import IngestJob, UploadSession, Vehicle
+from Main.uploads import create_session, write_chunk
+
+CSV_CONTENT = (
+    b'Index,PGN(H),SPN,Description\n'
+    b'1,FEF1,84,Wheel Speed\n'
+    b'2,F004,190,Engine Speed\n'
+    b'3,FEEE,110,Coolant Temperature\n'
+)
+
+
+class ChunkedUploadAPITest(APITestCase):
+    """Test init, chunk PUTs, resume and finalize."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, J1939_INGEST_IN_BACKGROUND=False)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def open_upload(self, content=CSV_CONTENT, **extra):
+        data = {'filename': 'truck.csv', 'size': len(content)}
+        data.update(extra)
+        response = self.client.post(reverse('j1939-chunked-upload'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['upload_id']
+
+    def put_chunk(self, upload_id, offset, data):
+        return self.client.put(
+            reverse('j1939-chunked-upload-chunk', args=[upload_id]) + f'?offset={offset}',
+            data, content_type='application/octet-stream'
+        )
+
+    def complete(self, upload_id, sha256):
+        return self.client.post(
+            reverse('j1939-chunked-upload-complete', args=[upload_id]), {'sha256': sha256}, format='json'
+        )
+
+    def test_upload_in_chunks(self):
+        upload_id = self.open_upload()
+        for offset in range(0, len(CSV_CONTENT), 20):
+            response = self.put_chunk(upload_id, offset, CSV_CONTENT[offset:offset + 20])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['received_bytes'], len(CSV_CONTENT))
+
+        response = self.complete(upload_id, hashlib.sha256(CSV_CONTENT).hexdigest())
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = IngestJob.objects.get(pk=response.data['ingest_job_id'])
+        self.assertEqual(job.status, IngestJob.STATUS_PENDING)
+        with open(job.stored_file.path, 'rb') as fh:
+            self.assertEqual(fh.read(), CSV_CONTENT)
+        self.assertEqual(os.listdir(default_storage.path('j1939_spool')), [])
+
+        call_command('resume_ingest_jobs', stdout=io.StringIO(), stderr=io.StringIO())
+        vehicle = self.client.get(response.data['status_url']).data['vehicle']
+        self.assertEqual(vehicle['pgns'], [0xF004, 0xFEEE, 0xFEF1])
+        self.assertEqual(Vehicle.objects.get(pk=vehicle['id']).content_hash, hashlib.sha256(CSV_CONTENT).hexdigest())
+
+    def test_out_of_order_chunk_is_rejected_and_retry_is_ignored(self):
+        upload_id = self.open_upload()
+        self.put_chunk(upload_id, 0, CSV_CONTENT[:30])
+
+        response = self.put_chunk(upload_id, 40, CSV_CONTENT[40:60])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['received_bytes'], 30)
+
+        # A lost response: the client re-sends the first chunk
+        response = self.put_chunk(upload_id, 0, CSV_CONTENT[:30])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['received_bytes'], 30)
+
+        progress = self.client.get(reverse('j1939-chunked-upload-detail', args=[upload_id]))
+        self.assertEqual(progress.data['received_bytes'], 30)
+
+    def test_chunk_is_read_before_locking(self):
+        session = create_session('truck.csv', len(CSV_CONTENT))
+        body = io.BytesIO(CSV_CONTENT)
+        locks_during_read = []
+
+        def read(size=-1):
+            locks_during_read.append(lock.call_count)
+            return body.read(size)
+
+        with mock.patch.object(UploadSession.objects, 'select_for_update',
+                               wraps=UploadSession.objects.select_for_update) as lock:
+            session = write_chunk(session.id, 0, mock.Mock(read=read), len(CSV_CONTENT))
+        # A slow client never holds the session row
+        self.assertEqual(set(locks_during_read), {0})
+        self.assertEqual(lock.call_count, 1)
+        self.assertEqual(session.received_bytes, len(CSV_CONTENT))
+        with open(default_storage.path(session.spool_file), 'rb') as fh:
+            self.assertEqual(fh.read(), CSV_CONTENT)
+
+    def test_incomplete_upload_cannot_finalize(self):
+        upload_id = self.open_upload()
+        self.put_chunk(upload_id, 0, CSV_CONTENT[:30])
+        response = self.complete(upload_id, hashlib.sha256(CSV_CONTENT).hexdigest())
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_hash_mismatch_fails_upload(self):
+        upload_id = self.open_upload(sha256='0' * 64)
+        self.put_chunk(upload_id, 0, CSV_CONTENT)
+        response = self.complete(upload_id, '')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).status, UploadSession.STATUS_FAILED)
+        self.assertEqual(Vehicle.objects.count(), 0)
+
+    def test_chunk_past_declared_size(self):
+        upload_id = self.open_upload(content=CSV_CONTENT[:10])
+        response = self.put_chunk(upload_id, 0, CSV_CONTENT[:20])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_abort_removes_spool(self):
+        upload_id = self.open_upload()
+        self.put_chunk(upload_id, 0, CSV_CONTENT[:30])
+        response = self.client.delete(reverse('j1939-chunked-upload-detail', args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(os.listdir(default_storage.path('j1939_spool')), [])
@@ -0,0 +1,175 @@
+"""
+Tests for compression at rest of archived J1939 uploads.
+"""
+
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main.compression import (
+    TEMP_DIR, FrameReader, compress_stored, compress_stream, mapped_stored_file, open_stored, save_compressed
+)
+from Main.models import CompressedFile, ContentBlob, Vehicle, VehiclePGN
+from Main.storage import stored_content_hash
+
+CSV = b'Index,PGN(H),SPN,Description\n1,FEF1,84,Wheel Speed\n2,F004,190,Engine Speed\n'
+
+
+class FrameIndex:
+    """Stand-in for a CompressedFile row."""
+
+    def __init__(self, index, frame_bytes):
+        self.size = index['size']
+        self.compressed_size = index['compressed_size']
+        self.frame_offsets = index['frame_offsets']
+        self.frame_bytes = frame_bytes
+
+
+class FrameReaderTest(SimpleTestCase):
+    """Test framed gzip members and seeking through them."""
+
+    body = b''.join(b'%06d,FEF1,84\n' % i for i in range(500))
+
+    def compressed(self, frame_bytes):
+        out = io.BytesIO()
+        index = compress_stream(io.BytesIO(self.body), out, frame_bytes=frame_bytes)
+        return out, FrameIndex(index, frame_bytes)
+
+    def test_output_is_plain_gzip(self):
+        out, entry = self.compressed(1000)
+        self.assertEqual(len(entry.frame_offsets), 8)
+        self.assertEqual(gzip.decompress(out.getvalue()), self.body)
+
+    def test_seek_reads_one_frame(self):
+        out, entry = self.compressed(1000)
+        out.seek(0)
+        reader = io.BufferedReader(FrameReader(out, entry))
+        reader.seek(2995)
+        self.assertEqual(reader.read(10), self.body[2995:3005])
+        reader.seek(-5, os.SEEK_END)
+        self.assertEqual(reader.read(), self.body[-5:])
+        reader.seek(0)
+        self.assertEqual(reader.read(), self.body)
+
+
+class CompressedUploadTest(APITestCase):
+    """Test that uploads are stored compressed and still re-analyzed."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_upload_compressed_and_reanalyzed(self):
+        response = self.client.post(
+            reverse('j1939-upload'),
+            {'file': SimpleUploadedFile('truck.csv', CSV)},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        vehicle = Vehicle.objects.get(pk=response.data['vehicles'][0]['id'])
+        name = vehicle.excel_file.name
+        self.assertTrue(CompressedFile.objects.filter(name=name, size=len(CSV)).exists())
+        with default_storage.open(name) as fh:
+            self.assertEqual(gzip.decompress(fh.read()), CSV)
+        with open_stored(name) as fh:
+            self.assertEqual(fh.read(), CSV)
+
+        VehiclePGN.objects.filter(vehicle=vehicle).delete()
+        response = self.client.post(reverse('j1939-vehicle-reanalyze', args=[vehicle.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(VehiclePGN.objects.filter(vehicle=vehicle).count(), 2)
+
+    def test_compressed_body_moved_into_storage(self):
+        # The compressed temp file is renamed into the blob store with its
+        # hash, not spooled and hashed once more by the storage
+        with mock.patch('Main.storage.tempfile.NamedTemporaryFile') as spool:
+            name = save_compressed('j1939_uploads/truck.csv', io.BytesIO(CSV))
+        spool.assert_not_called()
+        with default_storage.open(name) as fh:
+            body = fh.read()
+        self.assertEqual(gzip.decompress(body), CSV)
+        self.assertEqual(stored_content_hash(name), hashlib.sha256(body).hexdigest())
+        self.assertEqual(os.listdir(default_storage.path(TEMP_DIR)), [])
+
+    @override_settings(J1939_COMPRESS_UPLOADS=False)
+    def test_compression_disabled(self):
+        self.client.post(
+            reverse('j1939-upload'),
+            {'file': SimpleUploadedFile('truck.csv', CSV)},
+            format='multipart'
+        )
+        self.assertFalse(CompressedFile.objects.exists())
+
+
+class CompressUploadsCommandTest(TestCase):
+    """Test compressing an existing archive in place."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_compresses_plain_uploads(self):
+        name = default_storage.save('j1939_uploads/2026/01/01/truck.csv', ContentFile(CSV * 100))
+        default_storage.save('j1939_uploads/2026/01/01/truck.xlsx', ContentFile(b'PK\x03\x04' + b'\0' * 100))
+
+        out = io.StringIO()
+        call_command('compress_uploads', '--dry-run', stdout=out)
+        self.assertIn('Would compress 1 files', out.getvalue())
+        self.assertFalse(CompressedFile.objects.exists())
+
+        out = io.StringIO()
+        call_command('compress_uploads', stdout=out)
+        self.assertIn('Compressed 1 files, 0 failed', out.getvalue())
+        entry = CompressedFile.objects.get()
+        self.assertEqual(entry.name, name)
+        self.assertLess(default_storage.size(name), len(CSV * 100))
+        with mapped_stored_file(name) as content:
+            self.assertEqual(content[:], CSV * 100)
+
+        out = io.StringIO()
+        call_command('compress_uploads', stdout=out)
+        self.assertIn('Compressed 0 files', out.getvalue())
+
+    def test_swap_updates_content_address(self):
+        name = default_storage.save('j1939_uploads/2026/01/01/truck.csv', ContentFile(CSV * 100))
+        old_hash = stored_content_hash(name)
+        compress_stored(name)
+        new_hash = stored_content_hash(name)
+        self.assertNotEqual(new_hash, old_hash)
+        self.assertFalse(ContentBlob.objects.filter(sha256=old_hash).exists())
+        self.assertFalse(os.path.exists(default_storage.path(default_storage.blob_name(old_hash))))
+        self.assertEqual(os.listdir(os.path.dirname(default_storage.path(name))), ['truck.csv'])
+
+    def test_failure_keeps_original(self):
+        name = default_storage.save('j1939_uploads/2026/01/01/truck.csv', ContentFile(CSV * 100))
+        old_hash = stored_content_hash(name)
+        with mock.patch.object(CompressedFile.objects, 'create', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                compress_stored(name)
+        with default_storage.open(name, 'rb') as fh:
+            self.assertEqual(fh.read(), CSV * 100)
+        self.assertEqual(stored_content_hash(name), old_hash)
+        self.assertEqual(os.listdir(os.path.dirname(default_storage.path(name))), ['truck.csv'])
@@ -0,0 +1,105 @@
+"""
+Tests for DBC definition import.
+"""
+
+import io
+import os
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main.dbc import parse_dbc, pgn_from_message_id
+from Main.models import J1939ParameterDefinition
+from Main.spn_master import import_spn_master
+
+DBC = (
+    'VERSION ""\n'
+    '\n'
+    'BO_ 2364540158 EEC1: 8 Vector__XXX\n'
+    ' SG_ EngineSpeed : 24|16@1+ (0.125,0) [0|8031.875] "rpm" Vector__XXX\n'
+    ' SG_ EngTorqueMode : 0|4@1+ (1,0) [0|15] "" Vector__XXX\n'
+    ' SG_ Proprietary : 56|8@1+ (1,0) [0|0] "" Vector__XXX\n'
+    '\n'
+    'BO_ 2565808638 PropA: 8 Vector__XXX\n'
+    ' SG_ PropA_Motorola : 7|8@0+ (1,0) [0|0] "" Vector__XXX\n'
+    ' SG_ PropA_Value : 8|8@1- (0.5,-10) [0|0] "%" Vector__XXX\n'
+    '\n'
+    'BO_ 100 Standard: 8 Vector__XXX\n'
+    ' SG_ StandardSig : 0|8@1+ (1,0) [0|0] "" Vector__XXX\n'
+    '\n'
+    'CM_ SG_ 2364540158 EngineSpeed "Actual engine speed \xb0";\n'
+    'BA_ "SPN" SG_ 2364540158 EngineSpeed 190;\n'
+    'BA_ "SPN" SG_ 2364540158 EngTorqueMode 899;\n'
+    'BA_ "SPN" SG_ 2565808638 PropA_Motorola 520192;\n'
+    'BA_ "SPN" SG_ 2565808638 PropA_Value 520193;\n'
+    'BA_ "SPN" SG_ 100 StandardSig 520194;\n'
+)
+
+
+class ParseDbcTest(SimpleTestCase):
+    """Test DBC parsing."""
+
+    def test_pgn_from_message_id(self):
+        self.assertEqual(pgn_from_message_id(2364540158), 61444)
+        # PDU1: destination address 0x21 is not part of the PGN
+        self.assertEqual(pgn_from_message_id(2565808638), 61184)
+        self.assertIsNone(pgn_from_message_id(100))
+
+    def test_parse(self):
+        # Windows-1252 encoded, as written by CANdb++
+        definitions, errors = parse_dbc(io.BytesIO(DBC.encode('cp1252')))
+        self.assertEqual(sorted(definitions), [190, 899, 520193])
+        self.assertEqual(definitions[190], {
+            'PGN_DEC': 61444, 'PGN_HEX': '0xF004', 'SPN_Description': 'EngineSpeed', 'Unit': 'rpm',
+            'Data_Length_Bytes': 8, 'Start_Byte': 4, 'Start_Bit': 0, 'Bit_Length': 16,
+            'Resolution': 0.125, 'Offset': 0.0, 'Min_Value': 0.0, 'Max_Value': 8031.875,
+        })
+        value = definitions[520193]
+        self.assertEqual((value['PGN_DEC'], value['Start_Byte'], value['Offset']), (61184, 2, -10.0))
+        self.assertIsNone(value['Min_Value'])
+        self.assertEqual(len(errors), 1)
+        self.assertIn('PropA_Motorola', errors[0])
+        self.assertTrue(errors[0].startswith('Line 9:'))
+
+
+class ImportDbcTest(TestCase):
+    """Test the DBC import through the bulk upsert."""
+
+    def test_import_and_reimport(self):
+        definitions, _ = parse_dbc(DBC.splitlines())
+        self.assertEqual(import_spn_master(definitions)['created'], 3)
+        self.assertEqual(J1939ParameterDefinition.objects.get(pk=190).Resolution, 0.125)
+        result = import_spn_master(parse_dbc(DBC.splitlines())[0])
+        self.assertEqual((result['created'], result['updated'], result['unchanged']), (0, 0, 3))
+
+    def test_command(self):
+        fd, path = tempfile.mkstemp(suffix='.dbc')
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            fh.write(DBC)
+        try:
+            out, err = io.StringIO(), io.StringIO()
+            call_command('import_spn_master', path, stdout=out, stderr=err)
+        finally:
+            os.unlink(path)
+        self.assertIn('3 created', out.getvalue())
+        self.assertIn('PropA_Motorola', err.getvalue())
+
+
+class UploadDbcAPITest(APITestCase):
+    """Test DBC uploads to the SPN master endpoint."""
+
+    def test_upload(self):
+        response = self.client.post(
+            reverse('j1939-upload-spn-master'),
+            {'file': SimpleUploadedFile('vehicle.dbc', DBC.encode('utf-8'))},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(len(response.data['errors']), 1)
+        self.assertEqual(J1939ParameterDefinition.objects.get(pk=520193).PGN_DEC, 61184)
@@ -0,0 +1,254 @@
+"""
+Tests for versioned parameter-definition snapshots.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main.definition_index import definition_index, warm_definition_index
+from Main.definitions import current_definition_version, publish_definition_version
+from Main.models import DefinitionVersion, J1939ParameterDefinition, Vehicle, VehicleJ1939Mapping
+from Main.spn_master import parse_spn_master, import_spn_master
+
+MASTER = (
+    'PGN_DEC,PGN_HEX,SPN_Number,SPN_Name,DL,SPB,Length_Bits,Unit\n'
+    '65265,0xFEF1,84,Wheel-Based Vehicle Speed,8,2-3,16,km/h\n'
+)
+CSV = b'Index,PGN(H),SPN,Description\n1,FEF1,84,Wheel Speed\n'
+
+
+def add_definition(spn_number, pgn_dec, description):
+    return J1939ParameterDefinition.objects.create(
+        SPN_Number=spn_number, PGN_DEC=pgn_dec, PGN_HEX=f'0x{pgn_dec:04X}', SPN_Description=description,
+        Unit='', Data_Length_Bytes=8, Start_Byte=1, Bit_Length=8, Resolution=1.0, Offset=0.0
+    )
+
+
+class PublishDefinitionVersionTest(TestCase):
+    """Test publishing snapshots."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_publish_only_on_change(self):
+        first = publish_definition_version('test')
+        self.assertEqual(publish_definition_version('test').id, first.id)
+
+        add_definition(190, 61444, 'Engine Speed')
+        second = publish_definition_version('test')
+        self.assertNotEqual(second.id, first.id)
+        self.assertEqual(second.definition_count, 1)
+        self.assertEqual(second.definitions[0][0], 190)
+        self.assertEqual(current_definition_version().id, second.id)
+
+    def test_index_follows_version(self):
+        add_definition(190, 61444, 'Engine Speed')
+        old = publish_definition_version('test')
+        add_definition(84, 65265, 'Wheel Speed')
+        J1939ParameterDefinition.objects.filter(pk=84).update(Unit='km/h', Min_Value=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            new = publish_definition_version('test')
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'definition_index', new.content_hash + '.npy')))
+
+        self.assertFalse(definition_index(old.id).has_pgn(65265))
+        index = definition_index(new.id)
+        self.assertEqual(index.pgn_count(), 2)
+        definition = index.definitions_for_pgn(65265)[0]
+        self.assertEqual((definition['SPN_Description'], definition['Unit']), ('Wheel Speed', 'km/h'))
+        self.assertEqual((definition['Min_Value'], definition['Max_Value']), (0.0, None))
+        self.assertEqual(index.definition(190)['PGN_HEX'], '0xF004')
+        self.assertIsNone(index.definition(191))
+        self.assertEqual(warm_definition_index().content_hash, new.content_hash)
+
+    def test_import_publishes(self):
+        definitions, _ = parse_spn_master(MASTER)
+        result = import_spn_master(definitions)
+        version = DefinitionVersion.objects.get(pk=result['definition_version']['id'])
+        self.assertEqual(version.source, 'import')
+        self.assertEqual(import_spn_master(definitions)['definition_version']['id'], version.id)
+
+
+class DefinitionVersionAPITest(APITestCase):
+    """Test that uploads record the version they were mapped against."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    @override_settings(J1939_DEFINITION_PUBLISH_DELAY_SECONDS=0)
+    def test_api_edit_publishes(self):
+        add_definition(84, 65265, 'Wheel Speed')
+        response = self.client.patch(
+            reverse('j1939-parameter-definitions-detail', args=[84]), {'Unit': 'km/h'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(DefinitionVersion.objects.latest('id').source, 'api')
+
+        response = self.client.get(reverse('j1939-definition-versions'))
+        self.assertEqual(response.data['results'][0]['definition_count'], 1)
+
+    @override_settings(J1939_DEFINITION_PUBLISH_DELAY_SECONDS=30)
+    def test_api_edits_are_coalesced(self):
+        add_definition(84, 65265, 'Wheel Speed')
+        first = publish_definition_version('test')
+        with mock.patch('Main.definitions.threading.Timer') as timer:
+            for unit in ('km/h', 'mph', 'm/s'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.patch(
+                        reverse('j1939-parameter-definitions-detail', args=[84]), {'Unit': unit}, format='json'
+                    )
+        # One timer for the three edits, nothing published yet
+        self.assertEqual(timer.call_count, 1)
+        self.assertEqual(DefinitionVersion.objects.latest('id').id, first.id)
+
+        delay, publish = timer.call_args[0]
+        self.assertEqual(delay, 30)
+        with mock.patch('Main.definitions.connection'):
+            publish(*timer.call_args[1]['args'])
+        version = DefinitionVersion.objects.latest('id')
+        self.assertEqual((version.source, version.definitions[0][4]), ('api', 'm/s'))
+        self.assertEqual(DefinitionVersion.objects.count(), 2)
+
+    def test_vehicle_keeps_its_version(self):
+        add_definition(84, 65265, 'Wheel Speed')
+        response = self.client.post(
+            reverse('j1939-upload'), {'file': SimpleUploadedFile('truck.csv', CSV)}, format='multipart'
+        )
+        result = response.data['vehicles'][0]
+        vehicle = Vehicle.objects.get(pk=result['id'])
+        self.assertEqual(result['definition_version'], vehicle.definition_version_id)
+        self.assertEqual(result['j1939_spn_list'], [84])
+
+        # Later edits do not change how the stored vehicle is mapped
+        J1939ParameterDefinition.objects.filter(pk=84).delete()
+        publish_definition_version('test')
+        response = self.client.post(
+            reverse('j1939-upload'), {'file': SimpleUploadedFile('truck.csv', CSV), 'dedupe': 'true'},
+            format='multipart'
+        )
+        result = response.data['vehicles'][0]
+        self.assertEqual(result['duplicate_of'], vehicle.id)
+        self.assertEqual(result['definition_version'], vehicle.definition_version_id)
+        self.assertEqual(result['j1939_spn_list'], [84])
+
+
+    def test_mapping_is_stored(self):
+        add_definition(84, 65265, 'Wheel Speed')
+        response = self.client.post(
+            reverse('j1939-upload'), {'file': SimpleUploadedFile('truck.csv', CSV)}, format='multipart'
+        )
+        vehicle_id = response.data['vehicles'][0]['id']
+        mapping = VehicleJ1939Mapping.objects.get(vehicle_id=vehicle_id)
+        self.assertEqual((mapping.spns, mapping.pgn_count), ([84], 1))
+
+        J1939ParameterDefinition.objects.filter(pk=84).update(Unit='km/h')
+        publish_definition_version('test')
+        response = self.client.get(reverse('j1939-vehicle-j1939-mapping', args=[vehicle_id]))
+        self.assertTrue(response.data['stale'])
+        self.assertEqual(response.data['j1939_spn_details'][0]['unit'], '')
+
+        # Vehicles without a stored mapping are mapped on first read
+        mapping.delete()
+        response = self.client.get(reverse('j1939-vehicle-spns', args=[vehicle_id]))
+        self.assertEqual(response.data['j1939_mapping']['spns'], [84])
+        self.assertTrue(VehicleJ1939Mapping.objects.filter(vehicle_id=vehicle_id).exists())
+
+
+class DefinitionSnapshotAPITest(APITestCase):
+    """Test the compressed dictionary snapshot and its delta mode."""
+
+    def get(self, **params):
+        headers = params.pop('headers', {})
+        return self.client.get(reverse('j1939-parameter-definitions-snapshot'), params, **headers)
+
+    def test_full_snapshot_and_revalidation(self):
+        add_definition(84, 65265, 'Wheel Speed')
+        response = self.get(headers={'HTTP_ACCEPT_ENCODING': 'gzip, br'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        payload = json.loads(gzip.decompress(response.content))
+        self.assertEqual(payload['fields'][0], 'SPN_Number')
+        self.assertEqual([row[0] for row in payload['definitions']], [84])
+
+        response = self.get(headers={'HTTP_IF_NONE_MATCH': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_since_returns_changes(self):
+        add_definition(84, 65265, 'Wheel Speed')
+        add_definition(190, 61444, 'Engine Speed')
+        old = publish_definition_version('test')
+        J1939ParameterDefinition.objects.filter(pk=84).update(Unit='km/h')
+        J1939ParameterDefinition.objects.filter(pk=190).delete()
+        add_definition(959, 65254, 'Seconds')
+        new = publish_definition_version('test')
+
+        response = self.get(since=old.id)
+        payload = json.loads(response.content)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual((payload['version'], payload['since']), (new.id, old.id))
+        self.assertEqual([row[0] for row in payload['definitions']], [84, 959])
+        self.assertEqual(payload['deleted'], [190])
+
+        payload = json.loads(self.get(since=new.id).content)
+        self.assertEqual((payload['definitions'], payload['deleted']), ([], []))
+        payload = json.loads(self.get(since=9999).content)
+        self.assertIsNone(payload['since'])
+        self.assertEqual(len(payload['definitions']), 2)
+        self.assertEqual(self.get(since='x').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PGNSummaryAPITest(APITestCase):
+    """Test the PGN summary served from the definition index."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        add_definition(84, 65265, 'Wheel Speed')
+        add_definition(70, 65265, 'Parking Brake')
+        add_definition(190, 61444, 'Engine Speed')
+        add_definition(959, 65254, 'Seconds')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_summary(self):
+        self.client.get(reverse('j1939-pgn-summary'))
+        # Later requests only look up the current version
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('j1939-pgn-summary'))
+        self.assertEqual(response.data['pgn_count'], 3)
+        self.assertEqual(response.data['pgns'][-1], {'pgn': 65265, 'spn_count': 2, 'spns': [70, 84]})
+
+        response = self.client.get(reverse('j1939-pgn-summary'), {'pgn_min': 65000, 'pgn_max': 65254})
+        self.assertEqual([item['pgn'] for item in response.data['pgns']], [65254])
+
+    def test_pagination(self):
+        response = self.client.get(reverse('j1939-pgn-summary'), {'page_size': 2})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([item['pgn'] for item in response.data['results']], [61444, 65254])
+        response = self.client.get(reverse('j1939-pgn-summary'), {'page_size': 2, 'page': 2})
+        self.assertEqual([item['pgn'] for item in response.data['results']], [65265])
+        self.assertEqual(self.client.get(reverse('j1939-pgn-summary'), {'pgn_min': 'x'}).status_code, 400)
@@ -0,0 +1,112 @@
+"""
+Tests for streaming downloads with Range and ETag support.
+"""
+
+import hashlib
+import shutil
+import tempfile
+from datetime import date
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main.downloads import parse_range
+from Main.models import StandardFile, Vehicle
+
+BODY = b''.join(b'%05d,FEF1,84,Wheel Speed\n' % i for i in range(2000))
+SHA = hashlib.sha256(BODY).hexdigest()
+
+
+class ParseRangeTest(SimpleTestCase):
+    """Test Range header parsing."""
+
+    def test_forms(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=500-5000', 1000), (500, 999))
+
+    def test_whole_file(self):
+        self.assertIsNone(parse_range(None, 1000))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_range('items=0-1', 1000))
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(ValueError):
+            parse_range('bytes=1000-', 1000)
+        with self.assertRaises(ValueError):
+            parse_range('bytes=9-5', 1000)
+
+
+class StoredFileDownloadAPITest(APITestCase):
+    """Test the standard file and vehicle upload download endpoints."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.standard = StandardFile.objects.create(
+            Standard_No='J1939-71', Standard_Name='Vehicle Application Layer', Issued_Date=date(2011, 3, 1),
+            File=SimpleUploadedFile('j1939-71.csv', BODY)
+        )
+        self.url = reverse('standard-files-download', args=[self.standard.pk])
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), BODY)
+        self.assertEqual(response['ETag'], f'"{SHA}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], str(len(BODY)))
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_if_none_match(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{SHA}"')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), BODY[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(BODY)}')
+
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=100-199', HTTP_IF_RANGE='"other"')
+        self.assertEqual(stale.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(BODY)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='nginx', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.standard.File.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_list_includes_download_url(self):
+        response = self.client.get(reverse('standard-files-list'))
+        self.assertTrue(response.data['results'][0]['download_url'].endswith(self.url))
+
+    def test_missing(self):
+        response = self.client.get(reverse('standard-files-download', args=[9999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_compressed_vehicle_upload(self):
+        response = self.client.post(
+            reverse('j1939-upload'),
+            {'file': SimpleUploadedFile('truck.csv', BODY)},
+            format='multipart'
+        )
+        vehicle = Vehicle.objects.get(pk=response.data['vehicles'][0]['id'])
+        url = reverse('j1939-vehicle-download', args=[vehicle.id])
+        with override_settings(MEDIA_ACCEL_REDIRECT='nginx'):
+            response = self.client.get(url, HTTP_RANGE='bytes=-30')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), BODY[-30:])
+        self.assertEqual(response['ETag'], f'"{SHA}"')
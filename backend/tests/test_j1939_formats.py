@@ -0,0 +1,110 @@
+"""
+Tests for content-based upload format detection.
+"""
+
+import io
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from openpyxl import Workbook
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main.formats import sniff_format, KIND_EXCEL, KIND_TEXT, KIND_UNSUPPORTED
+
+
+def make_xlsx_bytes():
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['Index', 'PGN(H)'])
+    ws.append([1, 'FEF1'])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+class SniffFormatTest(SimpleTestCase):
+    """Test magic-byte and text heuristics in sniff_format."""
+
+    def test_xlsx_detected_regardless_of_name(self):
+        result = sniff_format(make_xlsx_bytes(), 'export.csv')
+        self.assertEqual(result['format'], 'xlsx')
+        self.assertEqual(result['kind'], KIND_EXCEL)
+
+    def test_ole2_is_legacy_excel(self):
+        head = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\x00' * 100
+        self.assertEqual(sniff_format(head, 'log.txt')['format'], 'xls')
+
+    def test_utf16_bom_sets_encoding(self):
+        head = 'Index,PGN(H)\r\n1,FEF1\r\n'.encode('utf-16')
+        result = sniff_format(head)
+        self.assertEqual(result['kind'], KIND_TEXT)
+        self.assertEqual(result['encoding'], 'utf-16')
+        self.assertEqual(result['format'], 'csv')
+
+    def test_blf_is_unsupported(self):
+        result = sniff_format(b'LOGG' + b'\x00' * 200, 'trace.csv')
+        self.assertEqual(result['kind'], KIND_UNSUPPORTED)
+        self.assertEqual(result['format'], 'vector_blf')
+
+    def test_random_binary_is_unsupported(self):
+        head = bytes(range(256)) * 4
+        self.assertEqual(sniff_format(head)['kind'], KIND_UNSUPPORTED)
+
+    def test_candump_text(self):
+        head = b'(1609459200.123456) can0 18FEF100#FFFFFFFF20FFFFFF\n' * 5
+        self.assertEqual(sniff_format(head)['format'], 'candump')
+
+    def test_vector_asc_text(self):
+        head = b'date Mon Jan 4 10:00:00.000 am 2021\nbase hex  timestamps absolute\n'
+        self.assertEqual(sniff_format(head)['format'], 'vector_asc')
+
+    def test_pcan_trc_text(self):
+        head = b';$FILEVERSION=1.1\n;$STARTTIME=44197.41\n     1)      1.2  Rx     18FEF100  8  FF FF FF FF 20 FF FF FF\n'
+        self.assertEqual(sniff_format(head)['format'], 'pcan_trc')
+
+    def test_plain_csv(self):
+        head = b'Time,ID,DLC,Data\n0.001,18FEF100,8,FF FF\n'
+        self.assertEqual(sniff_format(head)['format'], 'csv')
+
+
+class UploadFormatRoutingAPITest(APITestCase):
+    """Test that upload endpoints fail fast on unsupported binaries."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_j1939_upload_rejects_binary(self):
+        upload = SimpleUploadedFile('capture.csv', b'LOGG' + b'\x00' * 64)
+        response = self.client.post(reverse('j1939-upload'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['vehicles'], [])
+        self.assertEqual(response.data['errors'][0]['detected_format'], 'vector_blf')
+
+    def test_j1939_upload_routes_misnamed_workbook_to_excel(self):
+        upload = SimpleUploadedFile('truck.txt', make_xlsx_bytes())
+        response = self.client.post(reverse('j1939-upload'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['vehicles'][0]['detected_format'], 'xlsx')
+        self.assertEqual(response.data['vehicles'][0]['pgns'], [0xFEF1])
+
+    def test_upload_api_rejects_text(self):
+        upload = SimpleUploadedFile('fake.xlsx', b'Index,PGN\n1,65265\n')
+        response = self.client.post(reverse('upload'), {'file': upload}, format='multipart')
+        self.assertEqual(response.data['results'][0]['detected_format'], 'csv')
+
+    def test_analyze_records_detected_format(self):
+        upload = SimpleUploadedFile('log.dat', b'Index,PGN(H)\n1,FEF1\n2,F004\n')
+        response = self.client.post(reverse('analyze_j1939'), {'files': upload}, format='multipart')
+        data = response.json()
+        self.assertEqual(data['vehicles'][0]['detected_format'], 'csv')
+        self.assertEqual(data['unique_pgn_list'], ['F004', 'FEF1'])
@@ -0,0 +1,92 @@
+"""
+Tests for Idempotency-Key replay and content-fingerprint deduplication of uploads.
+"""
+
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main.models import IdempotencyKey, Vehicle, VehiclePGN, VehicleSPN
+
+CSV = b'Index,PGN(H),SPN,Description\n1,FEF1,84,Wheel Speed\n2,F004,190,Engine Speed\n3,FEF1,84,Wheel Speed\n'
+
+
+class UploadIdempotencyAPITest(APITestCase):
+    """Test replaying uploads by Idempotency-Key."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, key=None, content=CSV, **extra):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            reverse('j1939-upload'),
+            dict({'file': SimpleUploadedFile('truck.csv', content)}, **extra),
+            format='multipart', **headers
+        )
+
+    def test_retry_is_replayed(self):
+        first = self.upload('retry-1')
+        second = self.upload('retry-1')
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['vehicles'][0]['id'], first.data['vehicles'][0]['id'])
+        self.assertEqual(Vehicle.objects.count(), 1)
+
+    def test_without_key_creates_new_vehicle(self):
+        self.upload()
+        self.upload()
+        self.assertEqual(Vehicle.objects.count(), 2)
+
+    def test_key_reused_for_other_request(self):
+        self.upload('reused')
+        response = self.upload('reused', content=CSV + b'4,F004,190,Engine Speed\n')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_pending_key_conflicts(self):
+        IdempotencyKey.objects.create(scope='j1939-upload', key='busy', request_fingerprint='x')
+        response = self.upload('busy')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Vehicle.objects.count(), 0)
+
+    def test_abandoned_pending_key_is_reclaimed(self):
+        IdempotencyKey.objects.create(
+            scope='j1939-upload', key='crashed', request_fingerprint='x',
+            claimed_at=timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_PENDING_TIMEOUT_SECONDS + 1)
+        )
+        response = self.upload('crashed')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Vehicle.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get(key='crashed').status, IdempotencyKey.STATUS_COMPLETE)
+
+    def test_dedupe_returns_existing_vehicle(self):
+        first = self.upload()
+        response = self.upload(dedupe='true')
+        vehicle = response.data['vehicles'][0]
+        self.assertEqual(vehicle['duplicate_of'], first.data['vehicles'][0]['id'])
+        self.assertEqual(vehicle['total_pgn_messages'], first.data['vehicles'][0]['total_pgn_messages'])
+        self.assertEqual(sorted(vehicle['pgns']), sorted(first.data['vehicles'][0]['pgns']))
+        self.assertEqual(Vehicle.objects.count(), 1)
+        self.assertEqual(VehiclePGN.objects.count(), 2)
+        self.assertEqual(VehicleSPN.objects.count(), 2)
+
+    @override_settings(J1939_UPLOAD_DEDUPE=True)
+    def test_dedupe_setting(self):
+        self.upload()
+        self.upload()
+        self.upload(content=CSV + b'4,F004,190,Engine Speed\n')
+        self.assertEqual(Vehicle.objects.count(), 2)
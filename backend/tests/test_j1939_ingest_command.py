@@ -0,0 +1,87 @@
+"""
+Tests for the ingest_j1939 bulk ingestion command.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from Main import ingest
+from Main.ingest import BatchWriter, parse_path
+from Main.models import Vehicle, VehiclePGN
+
+
+class IngestCommandTest(TestCase):
+    """Test bulk ingestion of a directory."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.source_dir = tempfile.mkdtemp()
+        self.write('truck_a.csv', b'Index,PGN(H),SPN,Description\n1,FEF1,84,Wheel Speed\n')
+        os.makedirs(os.path.join(self.source_dir, 'depot'))
+        self.write('depot/truck_b.csv', b'Index,PGN(H),SPN,Description\n1,F004,190,Engine Speed\n')
+        self.write('capture.blf', b'LOGG' + b'\x00' * 64)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        shutil.rmtree(self.source_dir, ignore_errors=True)
+
+    def write(self, name, content):
+        with open(os.path.join(self.source_dir, name), 'wb') as fh:
+            fh.write(content)
+
+    def ingest(self, *args):
+        out = io.StringIO()
+        call_command('ingest_j1939', self.source_dir, '--workers', '1', *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_ingests_directory(self):
+        output = self.ingest('--batch-size', '1')
+        self.assertEqual(sorted(Vehicle.objects.values_list('source_file', flat=True)), ['truck_a.csv', 'truck_b.csv'])
+        self.assertEqual(VehiclePGN.objects.count(), 2)
+        self.assertIn('Failed: 1', output)
+        self.assertIn('files/s', output)
+        self.assertTrue(all(v.excel_file for v in Vehicle.objects.all()))
+
+    def test_rerun_skips_ingested_files(self):
+        self.ingest()
+        output = self.ingest()
+        self.assertEqual(Vehicle.objects.count(), 2)
+        self.assertIn('Skipped (already ingested): 2', output)
+
+    def test_duplicate_content_ingested_once(self):
+        self.write('copy_of_a.csv', b'Index,PGN(H),SPN,Description\n1,FEF1,84,Wheel Speed\n')
+        self.ingest('--no-recursive')
+        self.assertEqual(Vehicle.objects.count(), 1)
+
+    def test_failed_batch_stores_each_file_once(self):
+        results = [parse_path(os.path.join(self.source_dir, name)) for name in ('truck_a.csv', 'depot/truck_b.csv')]
+        persist = ingest.persist_vehicle
+
+        def fail_truck_b(fname, *args, **kwargs):
+            if fname == 'truck_b.csv':
+                raise RuntimeError('constraint failed')
+            return persist(fname, *args, **kwargs)
+
+        writer = BatchWriter(batch_size=10)
+        with mock.patch.object(ingest, 'persist_vehicle', side_effect=fail_truck_b):
+            writer.add(results[0])
+            writer.add(results[1])
+            written, failed = writer.flush()
+        self.assertEqual([r['fname'] for r in written], ['truck_a.csv'])
+        self.assertEqual([r['fname'] for r in failed], ['truck_b.csv'])
+        # The retry reused the file stored for the batch; the failed one was removed
+        stored = []
+        for directory, _, files in os.walk(default_storage.path('j1939_uploads')):
+            stored.extend(files)
+        self.assertEqual(stored, ['truck_a.csv'])
+        self.assertEqual(Vehicle.objects.get().excel_file.name, written[0]['stored_path'])
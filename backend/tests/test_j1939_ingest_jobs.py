@@ -0,0 +1,226 @@
+"""
+Tests for checkpointed, resumable ingestion of large uploads.
+"""
+
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main import jobs
+from Main.jobs import IngestJobBusy, create_ingest_job, resumable_jobs, run_ingest_job, job_sheets
+from Main.models import IngestJob, Vehicle, VehiclePGN, VehicleSPN
+
+CSV_CONTENT = b'Index,PGN(H),SPN,Description\n' + b''.join(
+    f'{i},{pgn},{spn},Parameter {spn}\n'.encode()
+    for i, (pgn, spn) in enumerate([('FEF1', 84), ('F004', 190), ('FEEE', 110), ('FEF1', 70),
+                                    ('FEF5', 171), ('F004', 513), ('FEEF', 100), ('FEF2', 183)], 1)
+)
+
+VECTOR_ASC = (
+    b'date Mon Jan 4 10:00:00.000 am 2021\n'
+    b'base hex  timestamps absolute\n'
+    b'Begin Triggerblock Mon Jan 4 10:00:00.000 am 2021\n'
+    b'   0.015991 1  18FEF100x       Rx   d 8 FF FF FF FF 20 FF FF FF\n'
+    b'   0.016500 1  CF00400x        Rx   d 8 F0 7D 7D 00 00 00 F0 7D\n'
+    b'   0.017000 1  1A0             Rx   d 2 DE AD\n'
+    b'   0.018000 1  18FEEE00x       Rx   d 8 FF FF FF FF FF FF FF FF\n'
+    b'   0.019000 1  18FEF100x       Rx   d 8 FF FF FF FF 21 FF FF FF\n'
+    b'End TriggerBlock\n'
+)
+
+
+class IngestJobTest(TestCase):
+    """Test chunked ingestion, checkpoints and resume."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def make_job(self, fname, content, chunk_bytes):
+        path = default_storage.save(f'j1939_uploads/{fname}', ContentFile(content))
+        with override_settings(J1939_INGEST_CHUNK_BYTES=chunk_bytes):
+            return create_ingest_job(fname, path)
+
+    def links(self, vehicle):
+        pgns = set(VehiclePGN.objects.filter(vehicle=vehicle).values_list('pgn__pgn_number', flat=True))
+        spns = set(VehicleSPN.objects.filter(vehicle=vehicle).values_list('spn__spn_number', flat=True))
+        return pgns, spns
+
+    def test_interrupted_job_resumes_to_same_result(self):
+        whole = run_ingest_job(self.make_job('whole.csv', CSV_CONTENT, 1024 * 1024))
+        self.assertEqual(whole.chunks_done, 1)
+
+        job = self.make_job('truck.csv', CSV_CONTENT, 60)
+        run_ingest_job(job, max_chunks=2)
+        job = IngestJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, IngestJob.STATUS_RUNNING)
+        self.assertEqual(job.chunks_done, 2)
+        self.assertEqual(CSV_CONTENT[job.byte_offset - 1:job.byte_offset], b'\n')
+        # No vehicle until the job finishes
+        self.assertEqual(Vehicle.objects.filter(source_file='truck.csv').count(), 0)
+
+        run_ingest_job(job)
+        self.assertEqual(job.status, IngestJob.STATUS_DONE)
+        self.assertGreater(job.chunks_done, 2)
+        self.assertEqual(job.byte_offset, len(CSV_CONTENT))
+        self.assertEqual(job.rows_consumed, 8)
+        self.assertEqual(self.links(job.vehicle), self.links(whole.vehicle))
+        self.assertEqual(job_sheets(job), job_sheets(whole))
+
+    def test_digit_only_pgn_in_own_chunk(self):
+        content = b'Index,PGN(H),SPN,Description\n' + b''.join(
+            f'{i},{pgn},{i},Parameter {i}\n'.encode()
+            for i, pgn in enumerate(['FEF1', 'F004', '0100', '1000', '0100', 'FEEE'], 1)
+        )
+        whole = run_ingest_job(self.make_job('whole.csv', content, 1024 * 1024))
+        job = run_ingest_job(self.make_job('truck.csv', content, 30))
+        self.assertGreater(job.chunks_done, 2)
+        self.assertEqual(job_sheets(whole)['unique_pgn_count'], 5)
+        self.assertEqual(job_sheets(job), job_sheets(whole))
+
+    def test_can_log_chunks_keep_header(self):
+        whole = run_ingest_job(self.make_job('whole.asc', VECTOR_ASC, 1024 * 1024))
+        job = run_ingest_job(self.make_job('truck.asc', VECTOR_ASC, 70))
+        self.assertGreater(job.chunks_done, 1)
+        self.assertEqual(job.detected_format, 'vector_asc')
+        self.assertEqual(job_sheets(job), job_sheets(whole))
+        self.assertEqual(job_sheets(job)['total_pgn_count'], 4)
+        self.assertEqual(self.links(job.vehicle), self.links(whole.vehicle))
+
+    def test_unsupported_file_fails_job(self):
+        job = self.make_job('capture.blf', b'LOGG' + b'\x00' * 64, 1024)
+        with self.assertRaises(ValueError):
+            run_ingest_job(job)
+        self.assertEqual(IngestJob.objects.get(pk=job.pk).status, IngestJob.STATUS_FAILED)
+        self.assertEqual(Vehicle.objects.count(), 0)
+
+    def test_resume_command(self):
+        job = self.make_job('truck.csv', CSV_CONTENT, 60)
+        run_ingest_job(job, max_chunks=1)
+        call_command('resume_ingest_jobs', stdout=io.StringIO(), stderr=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, IngestJob.STATUS_DONE)
+        self.assertEqual(job.vehicle.source_file, 'truck.csv')
+
+    def run_twice(self, job):
+        """Start a second run of the job while the first one parses its first chunk."""
+        read_sheets = jobs.read_sheets
+        second = []
+
+        def read_and_race(*args, **kwargs):
+            if not second:
+                second.append(None)
+                try:
+                    second[0] = run_ingest_job(IngestJob.objects.get(pk=job.pk))
+                except IngestJobBusy as exc:
+                    second[0] = exc
+            return read_sheets(*args, **kwargs)
+
+        with mock.patch('Main.jobs.read_sheets', side_effect=read_and_race):
+            try:
+                first = run_ingest_job(job)
+            except IngestJobBusy as exc:
+                first = exc
+        return first, second[0]
+
+    def test_concurrent_run_is_refused(self):
+        job = self.make_job('truck.csv', CSV_CONTENT, 60)
+        first, second = self.run_twice(job)
+        self.assertIsInstance(second, IngestJobBusy)
+        self.assertEqual(first.status, IngestJob.STATUS_DONE)
+        self.assertEqual(first.rows_consumed, 8)
+        self.assertEqual(Vehicle.objects.count(), 1)
+        self.assertEqual(first.claimed_by, '')
+
+    @override_settings(J1939_INGEST_STALE_SECONDS=0)
+    def test_stale_run_is_taken_over(self):
+        job = self.make_job('truck.csv', CSV_CONTENT, 60)
+        first, second = self.run_twice(job)
+        # The second run took the stale job over and finished it; the first
+        # stops at its next checkpoint without writing
+        self.assertEqual(second.status, IngestJob.STATUS_DONE)
+        self.assertIsInstance(first, IngestJobBusy)
+        job.refresh_from_db()
+        self.assertEqual(job.rows_consumed, 8)
+        self.assertEqual(Vehicle.objects.count(), 1)
+
+    def test_resumable_jobs_skip_live_runs(self):
+        job = self.make_job('truck.csv', CSV_CONTENT, 60)
+        run_ingest_job(job, max_chunks=1)
+        self.assertEqual(list(resumable_jobs()), [job])
+        IngestJob.objects.filter(pk=job.pk).update(claimed_by='other', heartbeat_at=timezone.now())
+        self.assertEqual(list(resumable_jobs()), [])
+        with override_settings(J1939_INGEST_STALE_SECONDS=0):
+            self.assertEqual(list(resumable_jobs()), [job])
+
+
+class LargeUploadAPITest(APITestCase):
+    """Test that large uploads are handed to an ingest job."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, J1939_CHECKPOINT_MIN_BYTES=1, J1939_INGEST_CHUNK_BYTES=60,
+            J1939_INGEST_IN_BACKGROUND=False
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        # The polling requests must not use up the anonymous throttle of later tests
+        cache.clear()
+
+    def upload(self):
+        return self.client.post(
+            reverse('j1939-upload'),
+            {'file': SimpleUploadedFile('truck.csv', CSV_CONTENT)},
+            format='multipart'
+        )
+
+    def test_upload_queues_job(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['vehicles'], [])
+        queued = response.data['ingest_jobs'][0]
+        job = IngestJob.objects.get(pk=queued['ingest_job_id'])
+        self.assertEqual(job.status, IngestJob.STATUS_PENDING)
+
+        progress = self.client.get(queued['status_url'])
+        self.assertEqual(progress.data['status'], IngestJob.STATUS_PENDING)
+        self.assertIsNone(progress.data['vehicle'])
+
+        call_command('resume_ingest_jobs', stdout=io.StringIO(), stderr=io.StringIO())
+        progress = self.client.get(reverse('j1939-ingest-job', args=[job.id]))
+        self.assertEqual(progress.data['status'], IngestJob.STATUS_DONE)
+        vehicle = progress.data['vehicle']
+        self.assertEqual(vehicle['id'], progress.data['vehicle_id'])
+        self.assertEqual(sorted(vehicle['pgns']), [0xF004, 0xFEEE, 0xFEEF, 0xFEF1, 0xFEF2, 0xFEF5])
+
+    def test_background_thread_starts_on_commit(self):
+        with override_settings(J1939_INGEST_IN_BACKGROUND=True):
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_unknown_job(self):
+        response = self.client.get(reverse('j1939-ingest-job', args=[999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
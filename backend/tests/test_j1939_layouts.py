@@ -0,0 +1,82 @@
+"""
+Tests for the column-layout template cache.
+"""
+
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main.layouts import header_signature, resolve_column_roles, scan_metadata_cells
+from Main.models import ColumnTemplate
+
+
+class ColumnRoleTest(SimpleTestCase):
+    """Test header hashing and role resolution."""
+
+    def test_signature_ignores_case_and_whitespace(self):
+        self.assertEqual(header_signature(['Index', ' PGN(H) ']), header_signature(['index', 'pgn(h)']))
+        self.assertNotEqual(header_signature(['Index', 'PGN(H)']), header_signature(['PGN(H)', 'Index']))
+
+    def test_resolve_roles(self):
+        roles = resolve_column_roles(['Index', 'Time', 'PGN(H)', 'SPN', 'Description'])
+        self.assertEqual(roles, {'index': 0, 'pgn_h': 2, 'pgn': None, 'spn': 3, 'desc': 4})
+
+    def test_scan_metadata_cells(self):
+        sheet = {'Info': ['Vehicle Name', 'Brand'], 'Value': ['Truck A', 'Volvo']}
+        cells = scan_metadata_cells(sheet, is_dataframe=False)
+        self.assertEqual(cells, {'vehicle_name': [0, 1], 'brand': [1, 1]})
+
+
+class ColumnTemplateAPITest(APITestCase):
+    """Test that layouts are learned on upload and reused afterwards."""
+
+    csv_content = b'Index,PGN(H),SPN,Description\n1,FEF1,84,Wheel Speed\n2,F004,190,Engine Speed\n'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.upload_url = reverse('j1939-upload')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, data=None):
+        payload = {'file': SimpleUploadedFile('truck.csv', self.csv_content)}
+        payload.update(data or {})
+        return self.client.post(self.upload_url, payload, format='multipart')
+
+    def test_first_upload_learns_template(self):
+        response = self.upload()
+        vehicle = response.data['vehicles'][0]
+        self.assertEqual(vehicle['template_source'], 'detected')
+        template = ColumnTemplate.objects.get()
+        self.assertEqual(vehicle['template_ids'], [template.id])
+        self.assertEqual(template.column_roles['pgn_h'], 1)
+
+    def test_second_upload_uses_cached_template(self):
+        first = self.upload().data['vehicles'][0]
+        second = self.upload().data['vehicles'][0]
+        self.assertEqual(second['template_source'], 'cached')
+        self.assertEqual(second['pgns'], first['pgns'])
+        self.assertEqual(ColumnTemplate.objects.get().hit_count, 1)
+
+    def test_explicit_template_id(self):
+        template = ColumnTemplate.objects.create(
+            signature='manual',
+            column_roles={'index': 0, 'pgn_h': 1, 'pgn': None, 'spn': 2, 'desc': 3},
+        )
+        response = self.upload({'template_id': template.id})
+        vehicle = response.data['vehicles'][0]
+        self.assertEqual(vehicle['template_source'], 'explicit')
+        self.assertEqual(sorted(vehicle['pgns']), [0xF004, 0xFEF1])
+
+    def test_unknown_template_id(self):
+        response = self.upload({'template_id': 999})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
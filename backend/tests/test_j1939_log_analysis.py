@@ -0,0 +1,143 @@
+"""
+Tests for line-oriented PGN extraction, parallel byte-range parsing and
+incremental analysis of growing logs.
+"""
+
+import os
+import random
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from Main.log_analysis import (
+    analyze_lines, analyze_log_file, split_byte_ranges, analyze_increment, new_checkpoint
+)
+from Main.models import LogCheckpoint
+
+
+def make_log(rows=5000, seed=7):
+    rng = random.Random(seed)
+    pgns = ['FEF1', 'F004', 'FEE6', 'FEE9', 'F00A']
+    lines = ['Comment line', 'Time,Index,PGN(H),Data']
+    for i in range(rows):
+        lines.append(f'{i * 0.01:.2f},{i},{rng.choice(pgns)},FF FF FF FF')
+        if i % 97 == 0:
+            lines.append('')
+    return '\n'.join(lines) + '\n'
+
+
+class ByteRangeParsingTest(SimpleTestCase):
+    """Test that parallel parsing matches a sequential scan exactly."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.text = make_log()
+        self.path = os.path.join(self.tmpdir, 'log.csv')
+        with open(self.path, 'w', encoding='utf-8', newline='') as fh:
+            fh.write(self.text)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_ranges_start_on_line_boundaries(self):
+        import mmap
+        with open(self.path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ranges = split_byte_ranges(mm, 0, len(mm), 7)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], len(mm))
+            for (_, end), (start, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(end, start)
+                self.assertEqual(mm[start - 1:start], b'\n')
+
+    def test_parallel_matches_sequential(self):
+        expected = analyze_lines(self.text)
+        for workers in (1, 3, 8):
+            result = analyze_log_file(self.path, 'utf-8', workers=workers)
+            self.assertEqual(result['counter'], expected['counter'])
+            self.assertEqual(result['lines'], expected['lines'])
+            self.assertEqual(result['layout'], expected['layout'])
+
+    def test_empty_file(self):
+        path = os.path.join(self.tmpdir, 'empty.csv')
+        open(path, 'wb').close()
+        result = analyze_log_file(path, 'utf-8', workers=4)
+        self.assertEqual(sum(result['counter'].values()), 0)
+
+
+class ParallelAnalyzeAPITest(APITestCase):
+    """Test that large spooled uploads take the parallel path."""
+
+    @override_settings(J1939_PARALLEL_MIN_BYTES=1, J1939_PARALLEL_WORKERS=2, FILE_UPLOAD_MAX_MEMORY_SIZE=0,
+                       J1939_STREAM_ANALYSIS=False)
+    def test_spooled_upload_uses_workers(self):
+        text = make_log(rows=500)
+        upload = SimpleUploadedFile('big.csv', text.encode('utf-8'))
+        response = self.client.post(reverse('analyze_j1939'), {'files': upload}, format='multipart')
+        data = response.json()
+        expected = analyze_lines(text)['counter']
+        self.assertEqual(data['total_pgn_count'], sum(expected.values()))
+        self.assertEqual(data['unique_pgn_list'], sorted(expected))
+        self.assertEqual(data['vehicles'][0]['analysis_summary']['parallel_workers'], 2)
+
+
+class IncrementalAnalysisTest(SimpleTestCase):
+    """Test that checkpointed analysis matches a full re-scan."""
+
+    def test_appends_match_full_scan(self):
+        data = make_log(rows=800).encode('utf-8')
+        rng = random.Random(3)
+        for _ in range(20):
+            checkpoint = new_checkpoint('utf-8')
+            for cut in sorted(rng.sample(range(1, len(data)), 6)) + [len(data)]:
+                result, checkpoint = analyze_increment(data[:cut], checkpoint)
+                expected = analyze_lines(data[:cut].decode('utf-8'))
+                self.assertEqual(result['counter'], expected['counter'])
+                self.assertEqual(result['lines'], expected['lines'])
+
+    def test_only_new_bytes_are_parsed(self):
+        data = make_log(rows=100).encode('utf-8')
+        _, checkpoint = analyze_increment(data, new_checkpoint('utf-8'))
+        grown = data + b'9.99,100,FEF1,FF FF FF FF\n'
+        result, checkpoint = analyze_increment(grown, checkpoint)
+        self.assertEqual(result['start_offset'], len(data))
+        self.assertEqual(result['bytes_processed'], len(grown) - len(data))
+        self.assertFalse(result['reset'])
+
+    def test_partial_line_is_reparsed(self):
+        _, checkpoint = analyze_increment(b'Time,PGN(H)\n1,FEF1\n2,F0', new_checkpoint('utf-8'))
+        self.assertEqual(checkpoint['partial_line'], '2,F0')
+        result, _ = analyze_increment(b'Time,PGN(H)\n1,FEF1\n2,F004\n', checkpoint)
+        self.assertEqual(result['counter'], {'FEF1': 1, 'F004': 1})
+
+    def test_rotated_file_resets(self):
+        _, checkpoint = analyze_increment(b'Time,PGN(H)\n1,FEF1\n2,F004\n', new_checkpoint('utf-8'))
+        result, _ = analyze_increment(b'Time,PGN(H)\n1,FEE6\n', checkpoint)
+        self.assertTrue(result['reset'])
+        self.assertEqual(result['counter'], {'FEE6': 1})
+
+
+class IncrementalAnalyzeAPITest(APITestCase):
+    """Test the incremental mode of the analyze endpoint."""
+
+    def analyze(self, content, **extra):
+        payload = {'files': SimpleUploadedFile('gateway.csv', content), 'incremental': '1'}
+        payload.update(extra)
+        return self.client.post(reverse('analyze_j1939'), payload, format='multipart').json()
+
+    def test_checkpoint_is_kept_per_source(self):
+        first = b'Time,PGN(H)\n1,FEF1\n'
+        self.analyze(first, source='gw1')
+        data = self.analyze(first + b'2,F004\n', source='gw1')
+        summary = data['vehicles'][0]['analysis_summary']['incremental']
+        self.assertEqual(summary['start_offset'], len(first))
+        self.assertEqual(data['unique_pgn_list'], ['F004', 'FEF1'])
+        self.assertEqual(LogCheckpoint.objects.get().source, 'gw1:gateway.csv')
+
+    def test_reset_checkpoint(self):
+        self.analyze(b'Time,PGN(H)\n1,FEF1\n')
+        data = self.analyze(b'Time,PGN(H)\n1,FEF1\n', reset_checkpoint='1')
+        self.assertEqual(data['vehicles'][0]['analysis_summary']['incremental']['start_offset'], 12)
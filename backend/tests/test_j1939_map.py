@@ -0,0 +1,74 @@
+"""
+Tests for the compiled, memory-mapped J1939 PGN→SPN map.
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from Main.j1939_map import J1939Map, compile_map, load_map, open_map
+from Main.views import summarize_pgns_with_map
+
+SOURCE = {
+    '61444': {'pgn_name': 'EEC1 (decimal)', 'spns': [{'spn': 190, 'name': 'Engine Speed'}]},
+    'F004': {'pgn_name': 'EEC1', 'spns': [{'spn': 190, 'name': 'Engine Speed'}, {'spn': 0}, {'spn': 513}]},
+    '0xFEF1': {'pgn_name': 'CCVS', 'spns': [{'spn': 84, 'name': 'Wheel-Based Vehicle Speed'}]},
+    'not a pgn': {'spns': []},
+}
+
+
+class CompileMapTest(SimpleTestCase):
+    """Test compiling and looking up the binary map."""
+
+    def test_lookup(self):
+        data, skipped = compile_map(SOURCE)
+        j1939_map = J1939Map(data)
+        self.assertEqual(skipped, ['not a pgn'])
+        self.assertEqual(j1939_map.pgns(), [61444, 65265])
+        # The hex key wins over the decimal one
+        self.assertEqual(j1939_map.lookup(61444), ('EEC1', [(190, 'Engine Speed'), (513, 'SPN_513')]))
+        self.assertEqual(j1939_map.lookup(65265), ('CCVS', [(84, 'Wheel-Based Vehicle Speed')]))
+        self.assertIsNone(j1939_map.lookup(1))
+        with self.assertRaises(ValueError):
+            J1939Map(data[:-3])
+
+    def test_summarize(self):
+        summary = summarize_pgns_with_map(
+            [{'pgn_hex': 'F004'}, {'pgn_dec': 65265, 'pgn_hex': 'FEF1'}, {'pgn_hex': 'FFFF'}],
+            J1939Map(compile_map(SOURCE)[0])
+        )
+        self.assertEqual(summary['pgn_count'], 2)
+        self.assertEqual(summary['spn_occurrences'], 3)
+        self.assertEqual(summary['pgn_spn_mapping']['65265']['name'], 'CCVS')
+        self.assertEqual(summarize_pgns_with_map([{'pgn_hex': 'F004'}], None)['pgn_count'], 0)
+
+
+class CompileMapFileTest(SimpleTestCase):
+    """Test the build step and the mmap loader."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, 'map.json')
+        self.compiled = os.path.join(self.tmpdir, 'map.bin')
+        with open(self.source, 'w', encoding='utf-8') as fh:
+            json.dump(SOURCE, fh)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_command_and_open(self):
+        self.assertIsNone(open_map(self.compiled))
+        out = io.StringIO()
+        call_command('compile_j1939_map', self.source, '--output', self.compiled, stdout=out, stderr=io.StringIO())
+        self.assertIn('2 PGNs, 3 SPNs', out.getvalue())
+        self.assertEqual(open_map(self.compiled).lookup(65265)[0], 'CCVS')
+
+    def test_load_compiles_stale_map(self):
+        j1939_map = load_map(self.source, self.compiled)
+        self.assertEqual(len(j1939_map), 2)
+        self.assertIsNone(load_map(os.path.join(self.tmpdir, 'missing.json'), os.path.join(self.tmpdir, 'missing.bin')))
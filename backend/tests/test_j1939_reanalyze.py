@@ -0,0 +1,104 @@
+"""
+Tests for memory-mapped re-analysis of stored uploads.
+"""
+
+import mmap
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main.ingest import MappedFile, as_file, iter_chunks
+from Main.models import Vehicle, VehiclePGN, VehicleSPN
+
+
+class MappedFileTest(SimpleTestCase):
+    """Test the file adapter used to hand an mmap to pandas."""
+
+    def test_pandas_reads_mmap(self):
+        with tempfile.TemporaryFile() as fh:
+            fh.write(b'Index,PGN(H)\n1,FEF1\n2,F004\n')
+            fh.flush()
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                df = pd.read_csv(as_file(mm))
+            finally:
+                mm.close()
+        self.assertEqual(df['PGN(H)'].tolist(), ['FEF1', 'F004'])
+
+    def test_seek_and_read(self):
+        reader = MappedFile(b'abcdef')
+        reader.seek(-2, os.SEEK_END)
+        self.assertEqual(reader.read(), b'ef')
+        self.assertEqual(reader.tell(), 6)
+
+    def test_iter_chunks(self):
+        self.assertEqual(list(iter_chunks(b'abcde', size=2)), [b'ab', b'cd', b'e'])
+
+
+class VehicleReanalyzeAPITest(APITestCase):
+    """Test re-analysis of stored uploads by vehicle id."""
+
+    csv_content = b'Index,PGN(H),SPN,Description\n1,FEF1,84,Wheel Speed\n2,F004,190,Engine Speed\n'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        # Stored plain so tests can rewrite the file (compressed re-analysis:
+        # test_j1939_compression.py)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, J1939_COMPRESS_UPLOADS=False)
+        self.settings_override.enable()
+        response = self.client.post(
+            reverse('j1939-upload'),
+            {'file': SimpleUploadedFile('truck.csv', self.csv_content)},
+            format='multipart'
+        )
+        self.vehicle = Vehicle.objects.get(pk=response.data['vehicles'][0]['id'])
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def reanalyze_url(self, vehicle_id):
+        return reverse('j1939-vehicle-reanalyze', args=[vehicle_id])
+
+    def test_reanalyze_restores_links(self):
+        VehiclePGN.objects.filter(vehicle=self.vehicle).delete()
+        response = self.client.post(self.reanalyze_url(self.vehicle.id))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(response.data['vehicle']['pgns']), [0xF004, 0xFEF1])
+        self.assertEqual(VehiclePGN.objects.filter(vehicle=self.vehicle).count(), 2)
+
+    def test_reanalyze_removes_stale_links(self):
+        # Rewrite the stored file so one PGN/SPN pair disappears
+        with open(self.vehicle.excel_file.path, 'wb') as fh:
+            fh.write(b'Index,PGN(H),SPN,Description\n1,FEF1,84,Wheel Speed\n')
+        response = self.client.post(self.reanalyze_url(self.vehicle.id))
+        self.assertEqual(response.data['vehicle']['removed_pgn_links'], 1)
+        self.assertEqual(response.data['vehicle']['removed_spn_links'], 1)
+        self.assertEqual(list(VehicleSPN.objects.filter(vehicle=self.vehicle).values_list('spn__spn_number', flat=True)), [84])
+
+    def test_missing_vehicle(self):
+        response = self.client.post(self.reanalyze_url(9999))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_missing_stored_file(self):
+        os.remove(self.vehicle.excel_file.path)
+        response = self.client.post(self.reanalyze_url(self.vehicle.id))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_batch_reanalyze(self):
+        response = self.client.post(
+            reverse('j1939-vehicles-reanalyze'), {'vehicle_ids': [self.vehicle.id, 9999]}, format='json'
+        )
+        self.assertEqual(response.data['reanalyzed_count'], 1)
+        self.assertEqual(response.data['errors'], [{'vehicle_id': 9999, 'error': 'Vehicle not found'}])
+
+    def test_batch_requires_ids(self):
+        response = self.client.post(reverse('j1939-vehicles-reanalyze'), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,133 @@
+"""
+Tests for incremental re-mapping of vehicles after a definition change.
+"""
+
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from Main.definitions import publish_definition_version
+from Main.ingest import save_j1939_mapping
+from Main.models import J1939ParameterDefinition, PGN, RemapJob, Vehicle, VehicleJ1939Mapping, VehiclePGN
+from Main import remap
+from Main.remap import changed_pgns, create_remap_job, run_remap_job, schedule_remap
+
+
+def add_definition(spn_number, pgn_dec, description):
+    return J1939ParameterDefinition.objects.create(
+        SPN_Number=spn_number, PGN_DEC=pgn_dec, PGN_HEX=f'0x{pgn_dec:04X}', SPN_Description=description,
+        Unit='', Data_Length_Bytes=8, Start_Byte=1, Bit_Length=8, Resolution=1.0, Offset=0.0
+    )
+
+
+def add_vehicle(name, pgns):
+    vehicle = Vehicle.objects.create(name=name)
+    for pgn_num in pgns:
+        VehiclePGN.objects.create(vehicle=vehicle, pgn=PGN.objects.get_or_create(pgn_number=pgn_num)[0])
+    save_j1939_mapping(vehicle, sorted(pgns))
+    return vehicle
+
+
+@override_settings(J1939_REMAP_IN_BACKGROUND=False)
+class RemapJobTest(TestCase):
+    """Test that only vehicles carrying changed PGNs are re-mapped."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        add_definition(84, 65265, 'Wheel Speed')
+        add_definition(190, 61444, 'Engine Speed')
+        self.old = publish_definition_version('test')
+        self.wheels = add_vehicle('wheels', [65265])
+        self.engine = add_vehicle('engine', [61444])
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_changed_pgns(self):
+        add_definition(1234, 61444, 'Engine Demand')
+        J1939ParameterDefinition.objects.filter(pk=84).update(PGN_DEC=65266)
+        new = publish_definition_version('test')
+        self.assertEqual(changed_pgns(self.old, new), {61444, 65265, 65266})
+
+    def test_only_affected_vehicles_are_remapped(self):
+        add_definition(1234, 61444, 'Engine Demand')
+        new = publish_definition_version('test')
+        job = schedule_remap(new, self.old)
+        self.assertEqual(job.changed_pgns, [61444])
+        self.assertEqual(job.status, RemapJob.STATUS_PENDING)
+
+        run_remap_job(job)
+        self.assertEqual((job.status, job.vehicles_remapped, job.vehicles_retagged), (RemapJob.STATUS_DONE, 1, 1))
+        self.assertEqual(VehicleJ1939Mapping.objects.get(vehicle=self.engine).spns, [190, 1234])
+        self.assertEqual(VehicleJ1939Mapping.objects.get(vehicle=self.wheels).spns, [84])
+        self.assertEqual(set(VehicleJ1939Mapping.objects.values_list('definition_version', flat=True)), {new.id})
+        self.assertEqual(set(Vehicle.objects.values_list('definition_version', flat=True)), {new.id})
+
+    def test_publish_queues_job(self):
+        J1939ParameterDefinition.objects.filter(pk=190).update(Unit='rpm')
+        with self.captureOnCommitCallbacks(execute=True):
+            new = publish_definition_version('test')
+        job = RemapJob.objects.get()
+        self.assertEqual((job.definition_version_id, job.changed_pgns), (new.id, [61444]))
+
+    def test_command_runs_queued_jobs(self):
+        J1939ParameterDefinition.objects.filter(pk=84).delete()
+        publish_definition_version('test')
+        out = io.StringIO()
+        call_command('remap_vehicles', '--current', stdout=out)
+        self.assertIn('Remap jobs done: 1, failed: 0', out.getvalue())
+        self.assertEqual(VehicleJ1939Mapping.objects.get(vehicle=self.wheels).spns, [])
+
+    def test_newer_job_supersedes_running_one(self):
+        add_definition(1234, 61444, 'Engine Demand')
+        v2 = publish_definition_version('test')
+        older = create_remap_job(v2, self.old)
+        add_definition(5678, 65265, 'Wheel Slip')
+        v3 = publish_definition_version('test')
+        newer = []
+        definition_index = remap.definition_index
+
+        def index_and_publish(version_id):
+            # A newer version is published while the older job starts
+            if not newer:
+                newer.append(create_remap_job(v3, v2))
+            return definition_index(version_id)
+
+        with mock.patch('Main.remap.definition_index', side_effect=index_and_publish):
+            run_remap_job(older)
+        self.assertEqual((older.status, older.vehicles_remapped), (RemapJob.STATUS_SUPERSEDED, 0))
+        self.assertEqual(list(remap.unfinished_jobs()), newer)
+        run_remap_job(newer[0])
+        self.assertEqual(VehicleJ1939Mapping.objects.get(vehicle=self.wheels).spns, [84, 5678])
+        self.assertEqual(set(VehicleJ1939Mapping.objects.values_list('definition_version', flat=True)), {v3.id})
+
+    def test_older_job_never_downgrades(self):
+        add_definition(1234, 61444, 'Engine Demand')
+        v2 = publish_definition_version('test')
+        older = create_remap_job(v2, self.old)
+        add_definition(5678, 61444, 'Engine Load')
+        v3 = publish_definition_version('test')
+        newer = create_remap_job(v3, v2)
+        # The older job got past its supersede check, and the newer one
+        # finishes while the older one is about to write its first batch
+        RemapJob.objects.filter(pk=older.pk).update(status=RemapJob.STATUS_RUNNING)
+        check_current = remap._check_current
+
+        def newer_job_runs_first(job):
+            if job.pk == older.pk and newer.status != RemapJob.STATUS_DONE:
+                run_remap_job(newer)
+            return check_current(job)
+
+        with mock.patch('Main.remap._check_current', side_effect=newer_job_runs_first):
+            run_remap_job(older)
+        self.assertEqual(newer.status, RemapJob.STATUS_DONE)
+        self.assertEqual(older.vehicles_remapped, 0)
+        self.assertEqual(VehicleJ1939Mapping.objects.get(vehicle=self.engine).spns, [190, 1234, 5678])
+        self.assertEqual(set(VehicleJ1939Mapping.objects.values_list('definition_version', flat=True)), {v3.id})
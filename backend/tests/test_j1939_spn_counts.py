@@ -0,0 +1,91 @@
+"""
+Tests for batch unique-SPN counting over message streams.
+"""
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main.models import J1939ParameterDefinition
+from Main.spn_counts import UniqueSPNCounter
+
+CANDUMP_LOG = (
+    b'(1609459200.000100) can0 18FEF100#FFFFFFFF20FFFFFF\n'
+    b'(1609459200.000200) can0 0CF00400#F07D7D000000F07D\n'
+    b'(1609459200.000400) can0 18FEF100#FFFFFFFF21FFFFFF\n'
+)
+
+
+def add_definitions():
+    for spn_number, pgn_dec, description in [
+        (84, 65265, 'Wheel Speed'), (70, 65265, 'Parking Brake'), (190, 61444, 'Engine Speed')
+    ]:
+        J1939ParameterDefinition.objects.create(
+            SPN_Number=spn_number, PGN_DEC=pgn_dec, PGN_HEX=f'0x{pgn_dec:04X}', SPN_Description=description,
+            Unit='', Data_Length_Bytes=8, Start_Byte=1, Bit_Length=8, Resolution=1.0, Offset=0.0
+        )
+
+
+class UniqueSPNCounterTest(TestCase):
+    """Test counting in batches with one definition query."""
+
+    def setUp(self):
+        add_definitions()
+
+    def test_batches_resolve_in_one_query(self):
+        counter = UniqueSPNCounter()
+        counter.update([{'pgn': 65265}] * 1000)
+        counter.update([{'pgn': 61444, 'spns': [190, {'spn': 9999}]}, {'pgn': 1}])
+        with self.assertNumQueries(1):
+            result = counter.result()
+        self.assertEqual(result['unique_spns'], [70, 84, 190, 9999])
+        self.assertEqual(result['spn_occurrences'], {70: 1000, 84: 1000, 190: 1, 9999: 1})
+        self.assertEqual(result['spn_details'][2]['pgn'], 61444)
+        self.assertEqual(result['spn_details'][3]['description'], 'Unknown SPN')
+        self.assertEqual(counter.messages, 1002)
+
+    def test_string_keys_match_definitions(self):
+        result = J1939ParameterDefinition.count_unique_spns([{'pgn': '65265'}, {'pgn': 61444, 'spns': ['190']}])
+        self.assertEqual(result['spn_occurrences'], {70: 1, 84: 1, 190: 1})
+
+    def test_invalid_values(self):
+        counter = UniqueSPNCounter()
+        for message in ({'pgn': 'FEF1'}, {'spns': 5}, {'spns': [{'spn': 'x'}]}, {'pgn': True}):
+            with self.assertRaises(ValueError):
+                counter.add(message)
+        self.assertEqual(counter.messages, 0)
+
+    def test_model_wrapper(self):
+        result = J1939ParameterDefinition.count_unique_spns(iter([{'pgn': 61444}, {'pgn': 61444}]))
+        self.assertEqual((result['count'], result['spn_occurrences']), (1, {190: 2}))
+
+
+class UniqueSPNCountAPITest(APITestCase):
+    """Test counting uploaded message streams."""
+
+    def setUp(self):
+        add_definitions()
+
+    def test_post_messages(self):
+        response = self.client.post(
+            reverse('j1939-unique-spn-count'), {'messages': [{'pgn': 65265}, {'pgn': 65265}]}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['count'], response.data['messages']), (2, 2))
+
+    def test_post_can_log(self):
+        response = self.client.post(
+            reverse('j1939-unique-spn-count'),
+            {'file': SimpleUploadedFile('capture.log', CANDUMP_LOG)}, format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['unique_spns'], [70, 84, 190])
+        self.assertEqual(response.data['spn_occurrences'][84], 2)
+
+    def test_post_invalid(self):
+        for messages in ('x', [{'spns': 5}], [{'pgn': 'abc'}]):
+            response = self.client.post(reverse('j1939-unique-spn-count'), {'messages': messages}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Message 0', response.data['error'])
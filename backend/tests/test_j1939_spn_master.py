@@ -0,0 +1,98 @@
+"""
+Tests for the bulk SPN master import.
+"""
+
+import io
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main.models import J1939ParameterDefinition
+from Main.spn_master import parse_spn_master, import_spn_master
+
+HEADER = 'PGN_DEC,PGN_HEX,SPN_Number,SPN_Name,DL,SPB,Length_Bits,Unit,Resolution,Offset\n'
+CSV = HEADER + (
+    '65265,0xFEF1,84,Wheel-Based Vehicle Speed,8,2-3,16,km/h,0.00390625,0\n'
+    '65254,0xFEE6,959,Seconds,8,1,8,s,0.25,0\n'
+)
+
+
+class ParseSpnMasterTest(SimpleTestCase):
+    """Test CSV parsing."""
+
+    def test_parse(self):
+        definitions, errors = parse_spn_master(('\ufeff' + CSV + '1,0x1,bad,X,8,1,8,s,1,0\n').encode('utf-8'))
+        self.assertEqual(sorted(definitions), [84, 959])
+        self.assertEqual(definitions[84]['Start_Byte'], 2)
+        self.assertEqual(definitions[84]['Resolution'], 0.00390625)
+        self.assertIsNone(definitions[84]['Min_Value'])
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith('Row 4:'))
+
+
+    def test_overlong_text_is_a_row_error(self):
+        content = CSV + '65254,0xFEE6,960,' + 'x' * 256 + ',8,1,8,s,1,0\n' + '65254,0xFEE6,961,Hours,8,1,8,' + 'h' * 51 + ',1,0\n'
+        definitions, errors = parse_spn_master(content)
+        self.assertEqual(sorted(definitions), [84, 959])
+        self.assertEqual(errors, [
+            'Row 4: SPN_Description is longer than 255 characters',
+            'Row 5: Unit is longer than 50 characters',
+        ])
+
+
+class ImportSpnMasterTest(TestCase):
+    """Test diffing and bulk writes."""
+
+    def test_created_updated_unchanged(self):
+        definitions, _ = parse_spn_master(CSV)
+        self.assertEqual(import_spn_master(definitions)['created'], 2)
+
+        changed = CSV.replace('Seconds', 'Seconds (clock)') + '65254,0xFEE6,960,Minutes,8,2,8,min,1,0\n'
+        definitions, _ = parse_spn_master(changed)
+        result = import_spn_master(definitions)
+        self.assertEqual((result['created'], result['updated'], result['unchanged']), (1, 1, 1))
+        self.assertEqual(result['changes'][959], {'SPN_Description': ['Seconds', 'Seconds (clock)']})
+        self.assertEqual(J1939ParameterDefinition.objects.get(pk=959).SPN_Description, 'Seconds (clock)')
+
+    def test_dry_run_writes_nothing(self):
+        definitions, _ = parse_spn_master(CSV)
+        result = import_spn_master(definitions, dry_run=True)
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(result['created_spns'], [84, 959])
+        self.assertFalse(J1939ParameterDefinition.objects.exists())
+
+    def test_command_loads_bundled_master(self):
+        out = io.StringIO()
+        call_command('import_spn_master', stdout=out)
+        count = J1939ParameterDefinition.objects.count()
+        self.assertGreater(count, 100)
+        out = io.StringIO()
+        call_command('import_spn_master', '--dry-run', stdout=out)
+        self.assertIn(f'0 created, 0 updated, {count} unchanged', out.getvalue())
+
+
+class UploadSpnMasterAPITest(APITestCase):
+    """Test the upload endpoint on top of the bulk import."""
+
+    def post(self, content, **extra):
+        return self.client.post(
+            reverse('j1939-upload-spn-master'),
+            dict({'file': SimpleUploadedFile('master.csv', content.encode('utf-8'))}, **extra),
+            format='multipart'
+        )
+
+    def test_upload_and_dry_run(self):
+        response = self.post(CSV, dry_run='true')
+        self.assertEqual(response.data['created'], 2)
+        self.assertTrue(response.data['dry_run'])
+        self.assertFalse(J1939ParameterDefinition.objects.exists())
+
+        response = self.post(CSV)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_processed'], 2)
+        response = self.post(CSV)
+        self.assertEqual((response.data['created'], response.data['unchanged']), (0, 2))
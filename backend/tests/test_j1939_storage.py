@@ -0,0 +1,77 @@
+"""
+Tests for content-addressed media storage.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from Main.models import ContentBlob, ContentName
+from Main.storage import ContentAddressedStorage
+
+BODY = b'Index,PGN(H),SPN,Description\n1,FEF1,84,Wheel Speed\n'
+SHA = hashlib.sha256(BODY).hexdigest()
+
+
+class ContentAddressedStorageTest(TestCase):
+    """Test deduplication, reference counting and adoption."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_default_storage(self):
+        self.assertIsInstance(default_storage._wrapped, ContentAddressedStorage)
+
+    def test_duplicates_share_one_blob(self):
+        first = default_storage.save('j1939_uploads/2026/01/01/truck.csv', ContentFile(BODY))
+        second = default_storage.save('standard_files/2026/01/02/copy.csv', ContentFile(BODY))
+        self.assertTrue(os.path.samefile(default_storage.path(first), default_storage.path(second)))
+        self.assertEqual(ContentBlob.objects.get().ref_count, 2)
+        self.assertEqual(default_storage.content_hash(second), SHA)
+        with default_storage.open(first) as fh:
+            self.assertEqual(fh.read(), BODY)
+
+    def test_name_collision_keeps_both(self):
+        first = default_storage.save('j1939_uploads/truck.csv', ContentFile(BODY))
+        second = default_storage.save('j1939_uploads/truck.csv', ContentFile(b'other'))
+        self.assertNotEqual(first, second)
+        self.assertEqual(ContentBlob.objects.count(), 2)
+
+    def test_blob_removed_with_last_reference(self):
+        first = default_storage.save('a/truck.csv', ContentFile(BODY))
+        second = default_storage.save('b/truck.csv', ContentFile(BODY))
+        blob_path = default_storage.path(default_storage.blob_name(SHA))
+
+        default_storage.delete(first)
+        self.assertFalse(default_storage.exists(first))
+        self.assertTrue(os.path.exists(blob_path))
+        self.assertEqual(ContentBlob.objects.get().ref_count, 1)
+
+        default_storage.delete(second)
+        self.assertFalse(os.path.exists(blob_path))
+        self.assertFalse(ContentBlob.objects.exists())
+
+    def test_dedupe_command_adopts_existing_files(self):
+        for name in ('old/one.csv', 'old/two.csv'):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as fh:
+                fh.write(BODY)
+        out = io.StringIO()
+        call_command('dedupe_media', stdout=out)
+        self.assertIn('Adopted 2 files, 1 duplicates', out.getvalue())
+        self.assertEqual(ContentName.objects.count(), 2)
+        self.assertTrue(os.path.samefile(default_storage.path('old/one.csv'), default_storage.path('old/two.csv')))
@@ -0,0 +1,118 @@
+"""
+Tests for analyzing uploads while they are received.
+"""
+
+import hashlib
+import random
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from Main.can_logs import StreamingCanLogAnalyzer, analyze_can_log
+from Main.compression import open_stored
+from Main.log_analysis import StreamingLogAnalyzer, analyze_lines
+from Main.models import Vehicle
+from Main.upload_handlers import StreamingAnalysisUploadHandler
+
+VECTOR_ASC = (
+    b'date Mon Jan 4 10:00:00.000 am 2021\n'
+    b'base dec  timestamps absolute\n'
+    b'Begin Triggerblock Mon Jan 4 10:00:00.000 am 2021\n'
+    + b''.join(
+        f'   {i * 0.001:.6f} 1  {can_id}x       Rx   d 8 FF FF FF FF 20 FF FF FF\n'.encode()
+        for i, can_id in enumerate([419361024, 217056256, 419360256] * 200)
+    )
+    + b'End TriggerBlock\n'
+)
+
+
+def make_log(rows, seed=5):
+    rng = random.Random(seed)
+    lines = ['Comment line', 'Time,Index,PGN(H),Data']
+    for i in range(rows):
+        lines.append(f'{i * 0.01:.2f},{i},{rng.choice(["FEF1", "F004", "FEE6"])},FF FF FF FF')
+    return '\n'.join(lines) + '\n'
+
+
+def pieces(data, seed=1):
+    rng = random.Random(seed)
+    pos = 0
+    while pos < len(data):
+        size = rng.randint(1, 5000)
+        yield data[pos:pos + size]
+        pos += size
+
+
+class StreamingAnalyzerTest(SimpleTestCase):
+    """Test that push-style analysis matches a whole-file scan."""
+
+    def test_text_log_matches_full_scan(self):
+        for rows in (10, 5000):
+            text = make_log(rows)
+            analyzer = StreamingLogAnalyzer('utf-8')
+            for piece in pieces(text.encode('utf-8')):
+                analyzer.feed(piece)
+            result = analyzer.close()
+            expected = analyze_lines(text)
+            self.assertEqual(result['counter'], expected['counter'])
+            self.assertEqual(result['lines'], expected['lines'])
+
+    def test_can_log_keeps_header_state(self):
+        analyzer = StreamingCanLogAnalyzer('vector_asc')
+        for piece in pieces(VECTOR_ASC):
+            analyzer.feed(piece)
+        result = analyzer.close()
+        expected = analyze_can_log([VECTOR_ASC], 'vector_asc')
+        self.assertEqual(result['counter'], expected['counter'])
+        self.assertEqual((result['frames'], result['lines']), (expected['frames'], expected['lines']))
+        self.assertEqual(sorted(result['counter']), ['F004', 'FEEE', 'FEF1'])
+
+    def test_handler_attaches_analysis(self):
+        handler = StreamingAnalysisUploadHandler()
+        handler.new_file('file', 'truck.asc', 'text/plain', len(VECTOR_ASC))
+        for start, piece in enumerate(pieces(VECTOR_ASC)):
+            handler.receive_data_chunk(piece, start)
+        uploaded = handler.file_complete(len(VECTOR_ASC))
+        streamed = uploaded.stream_analysis
+        self.assertEqual(streamed['detected']['format'], 'vector_asc')
+        self.assertEqual(streamed['sha256'], hashlib.sha256(VECTOR_ASC).hexdigest())
+        self.assertEqual(streamed['analysis']['frames'], 600)
+        uploaded.seek(0)
+        self.assertEqual(uploaded.read(), VECTOR_ASC)
+        uploaded.close()
+
+
+class StreamingUploadAPITest(APITestCase):
+    """Test that the upload endpoints use the streamed analysis."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_analyze_text_log(self):
+        text = make_log(2000)
+        upload = SimpleUploadedFile('big.csv', text.encode('utf-8'))
+        data = self.client.post(reverse('analyze_j1939'), {'files': upload}, format='multipart').json()
+        expected = analyze_lines(text)['counter']
+        self.assertEqual(data['total_pgn_count'], sum(expected.values()))
+        self.assertEqual(data['unique_pgn_list'], sorted(expected))
+
+    def test_upload_can_log(self):
+        upload = SimpleUploadedFile('truck.asc', VECTOR_ASC)
+        response = self.client.post(reverse('j1939-upload'), {'file': upload}, format='multipart')
+        vehicle = response.data['vehicles'][0]
+        self.assertEqual(vehicle['total_pgn_messages'], 600)
+        self.assertEqual(vehicle['pgns'], [0xF004, 0xFEEE, 0xFEF1])
+        stored = Vehicle.objects.get(pk=vehicle['id'])
+        self.assertEqual(stored.content_hash, hashlib.sha256(VECTOR_ASC).hexdigest())
+        with open_stored(stored.excel_file.name) as fh:
+            self.assertEqual(fh.read(), VECTOR_ASC)
@@ -0,0 +1,149 @@
+"""
+Tests for the drop-directory watcher and the watch_j1939 command.
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from Main.models import Vehicle
+from Main.watcher import DirectoryWatcher
+
+CSV_CONTENT = b'Index,PGN(H),SPN,Description\n1,FEF1,84,Wheel Speed\n'
+
+
+class DirectoryWatcherTest(SimpleTestCase):
+    """Test completed-file detection."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, content=b'data', age=0):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fh:
+            fh.write(content)
+        if age:
+            past = time.time() - age
+            os.utime(path, (past, past))
+        return path
+
+    def test_settled_files_are_ready(self):
+        old = self.write('old.csv', age=60)
+        self.write('fresh.csv')
+        self.write('.fresh.csv.Xa81c')
+        watcher = DirectoryWatcher(self.directory, settle_seconds=5, use_inotify=False)
+        ready, writing = watcher.completed_files()
+        self.assertEqual(ready, [old])
+        self.assertEqual(writing, 1)
+
+    def test_growing_file_waits(self):
+        path = self.write('growing.csv', age=60)
+        watcher = DirectoryWatcher(self.directory, settle_seconds=5, use_inotify=False)
+        now = time.time()
+        with open(path, 'ab') as fh:
+            fh.write(b'more')
+        watcher._seen[path] = (0, 0, now - 60)
+        self.assertEqual(watcher.completed_files(now)[0], [])
+        self.assertEqual(watcher.completed_files(now + 6)[0], [path])
+
+    def test_archive_is_excluded(self):
+        self.write('archive/2026/01/01/done.csv', age=60)
+        watcher = DirectoryWatcher(self.directory, settle_seconds=0, use_inotify=False,
+                                   exclude=[os.path.join(self.directory, 'archive')])
+        self.assertEqual(watcher.completed_files()[0], [])
+
+    def test_inotify_reports_closed_files(self):
+        watcher = DirectoryWatcher(self.directory, settle_seconds=60)
+        if watcher.mode != 'inotify':
+            self.skipTest('inotify not available')
+        path = self.write('closed.csv')
+        watcher.wait(timeout=1)
+        self.assertEqual(watcher.completed_files()[0], [path])
+        watcher.close()
+
+
+class WatchCommandTest(TestCase):
+    """Test a single pass of the watch command."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.drop = tempfile.mkdtemp()
+        self.status_file = os.path.join(self.media_root, 'status.json')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        shutil.rmtree(self.drop, ignore_errors=True)
+
+    def drop_file(self, name, content):
+        path = os.path.join(self.drop, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fh:
+            fh.write(content)
+        past = time.time() - 60
+        os.utime(path, (past, past))
+
+    def watch_once(self):
+        call_command(
+            'watch_j1939', self.drop, '--once', '--poll', '--workers', '1',
+            '--settle-seconds', '5', '--status-file', self.status_file,
+            stdout=io.StringIO(), stderr=io.StringIO()
+        )
+
+    def test_ingests_and_archives(self):
+        self.drop_file('gw1/truck.csv', CSV_CONTENT)
+        self.drop_file('capture.blf', b'LOGG' + b'\x00' * 64)
+        self.watch_once()
+
+        self.assertEqual(Vehicle.objects.get().source_file, 'truck.csv')
+        archived = [os.path.relpath(os.path.join(root, name), self.drop)
+                    for root, _, names in os.walk(self.drop) for name in names]
+        day = time.strftime('%Y/%m/%d', time.gmtime())
+        self.assertCountEqual(archived, [f'archive/{day}/gw1/truck.csv', f'archive/failed/{day}/capture.blf'])
+
+        with open(self.status_file) as fh:
+            report = json.load(fh)
+        self.assertEqual(report['queue_depth'], 0)
+        self.assertEqual((report['ingested'], report['failed']), (1, 1))
+
+    def test_already_ingested_content_is_archived_only(self):
+        self.drop_file('truck.csv', CSV_CONTENT)
+        self.watch_once()
+        self.drop_file('truck_again.csv', CSV_CONTENT)
+        self.watch_once()
+        self.assertEqual(Vehicle.objects.count(), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.drop, 'truck_again.csv')))
+
+
+class WatchStatusAPITest(APITestCase):
+    """Test the watch status endpoint."""
+
+    def test_status_not_reported(self):
+        with override_settings(J1939_WATCH_STATUS_FILE=os.path.join(tempfile.gettempdir(), 'missing-status.json')):
+            response = self.client.get(reverse('j1939-ingest-watch-status'))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_status_reported(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as fh:
+            json.dump({'queue_depth': 3, 'lag_seconds': 12.5}, fh)
+        try:
+            with override_settings(J1939_WATCH_STATUS_FILE=fh.name):
+                response = self.client.get(reverse('j1939-ingest-watch-status'))
+        finally:
+            os.remove(fh.name)
+        self.assertEqual(response.data['queue_depth'], 3)